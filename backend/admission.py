@@ -0,0 +1,260 @@
+import os
+import math
+import time
+import uuid
+import logging
+import threading
+
+from flask import request, jsonify
+
+from auth import BATCH_AUTH_KEY
+from cache import KEY_PREFIX, NullCache, MemoryCache, get_cache
+from db import pool_stats
+from idempotency import MUTATING_METHODS
+from server_config import load_server_config
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# ADMISSION CONTROL
+# =============================================================================
+#
+# Every request is put in a class by its endpoint and, before it reaches
+# authentication or the database, must get past three checks:
+#
+#   1. Load shedding. While this worker's pool has a queue of waiting
+#      threads, or the socket's listen queue is long, low-priority classes
+#      get 503 at once, normal ones at twice the threshold. Circulation
+#      (scans, checkouts, returns) is never shed.
+#   2. Rate limits. Token buckets per X-User-Email: one over all of the
+#      user's requests and one per class. Over either, 429.
+#   3. Expensive queries (search, reporting) take one of a fixed number of
+#      slots for the duration of the request; reporting may use only half of
+#      them, so searches always find room. No slot, 503.
+#
+# Rejections carry Retry-After. Buckets and slots live in the shared cache
+# (ZOELIBRARYAPP_CACHE_URL), so the limits hold across workers. Without a
+# shared cache each worker enforces its share (rate / workers), which with
+# sync workers cannot bound concurrency: set a cache URL in production.
+# Cache errors admit the request.
+#
+# Each item of an /api/batch is admitted like a request of its own: it is
+# charged to the user's buckets and takes its own expensive slot, so a
+# batch cannot carry more searches than separate requests could. Only load
+# shedding is skipped for items; the batch itself went through it.
+
+ENABLED = os.getenv('ZOELIBRARYAPP_ADMISSION', 'on').lower() not in ('off', 'false', '0')
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+CLASS_ENDPOINTS = {
+    'circulation': (
+        'circulation.create_checkout', 'circulation.return_checkout',
+        'books.get_book_by_barcode', 'audits.add_audit_scans',
+    ),
+    'search': (
+        'books.get_books', 'borrowers.get_borrowers',
+        'circulation.get_checkouts', 'circulation.get_checkout_history',
+    ),
+    'reporting': (
+        'analytics.get_loan_series', 'analytics.get_genre_breakdown', 'analytics.get_top_titles',
+        'analytics.get_top_borrowers', 'analytics.get_dashboard_trends', 'dashboard.get_dashboard_stats',
+        'audits.get_audit_results', 'follow_ups.preview_reminders', 'labels.create_label_sheet',
+        'sync.sync_changes',
+    ),
+}
+_CLASS_OF = {endpoint: name for name, endpoints in CLASS_ENDPOINTS.items() for endpoint in endpoints}
+
+# Health and metrics must answer under load; events and covers limit themselves
+EXEMPT_ENDPOINTS = ('system.health_check', 'system.get_worker_metrics', 'events.stream_events',
+                    'covers.get_cover', 'static')
+EXEMPT_PREFIXES = ('profiler.',)
+
+PRIORITY = {'circulation': HIGH, 'read': NORMAL, 'write': NORMAL, 'search': LOW, 'reporting': LOW}
+EXPENSIVE = ('search', 'reporting')
+# Share of the expensive slots reporting may hold
+REPORTING_SHARE = 0.5
+
+# Requests per second and burst, per user; 'user' covers all of a user's requests
+DEFAULT_LIMITS = {
+    'user': (30, 90),
+    'circulation': (20, 60),
+    'read': (10, 40),
+    'write': (10, 30),
+    'search': (2, 10),
+    'reporting': (1, 5),
+}
+
+SHED_RETRY_SECONDS = 2
+BACKLOG_CHECK_SECONDS = 0.5
+# Batch items share the batch's g, so a slot is kept on the request's environ
+SLOT_KEY = 'zoelibraryapp.admission_slot'
+
+
+def parse_limits(spec):
+    """
+    Limits from ZOELIBRARYAPP_RATE_LIMITS, e.g. 'search=5/20,user=50/150'
+    (rate per second / burst), over DEFAULT_LIMITS. A rate of 0 turns the
+    bucket off.
+    """
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in limits:
+            raise ValueError(f"ZOELIBRARYAPP_RATE_LIMITS: unknown class {name!r}")
+        rate, _, burst = value.partition('/')
+        rate = float(rate)
+        limits[name] = (rate, float(burst) if burst else max(1.0, rate * 3))
+    return limits
+
+
+def _settings():
+    config = load_server_config()
+    return {
+        'limits': parse_limits(os.getenv('ZOELIBRARYAPP_RATE_LIMITS', '')),
+        'workers': config['workers'],
+        'expensive_slots': int(os.getenv('ZOELIBRARYAPP_EXPENSIVE_MAX_CONCURRENT', '0'))
+                           or max(2, config['connection_budget'] // 4),
+        'shed_pool_waiting': int(os.getenv('ZOELIBRARYAPP_SHED_POOL_WAITING', '0')) or config['pool_size'],
+        'shed_backlog': int(os.getenv('ZOELIBRARYAPP_SHED_BACKLOG', '0'))
+                        or config['workers'] * config['threads'],
+        'slot_ttl': max(60, config['timeout'] * 2),
+    }
+
+
+_config = None
+_local = MemoryCache()
+_lock = threading.Lock()
+_counters = {}
+_backlog = (0.0, None)
+
+
+def _count(name, outcome):
+    with _lock:
+        counters = _counters.setdefault(name, {'admitted': 0, 'rate_limited': 0, 'no_slot': 0, 'shed': 0})
+        counters[outcome] += 1
+
+
+def route_class():
+    """The admission class of the current request, or None if it is exempt."""
+    endpoint = request.endpoint
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS or endpoint.startswith(EXEMPT_PREFIXES):
+        return None
+    name = _CLASS_OF.get(endpoint)
+    if name is None:
+        name = 'write' if request.method in MUTATING_METHODS else 'read'
+    return name
+
+
+def _store():
+    """(backend, per-worker share): the shared cache, or this worker's own buckets."""
+    backend = get_cache()
+    if isinstance(backend, NullCache):
+        return _local, _config['workers']
+    return backend, 1
+
+
+def _listen_backlog():
+    """The socket's listen queue depth, read at most every BACKLOG_CHECK_SECONDS."""
+    global _backlog
+    from metrics import listen_queue_depth
+
+    checked_at, depth = _backlog
+    if time.monotonic() - checked_at >= BACKLOG_CHECK_SECONDS:
+        depth = listen_queue_depth(os.getenv('ZOELIBRARYAPP_BACKEND_PORT', '5002'))
+        _backlog = (time.monotonic(), depth)
+    return depth
+
+
+def _overloaded(priority):
+    if priority == HIGH:
+        return False
+    factor = 1 if priority == LOW else 2
+    pool = pool_stats()
+    if pool is not None and pool['waiting'] >= _config['shed_pool_waiting'] * factor:
+        return True
+    backlog = _listen_backlog()
+    return backlog is not None and backlog >= _config['shed_backlog'] * factor
+
+
+def _throttle(backend, share, bucket, key):
+    """Seconds until `key` may pass its `bucket` limit (0.0 now)."""
+    rate, burst = _config['limits'][bucket]
+    if not rate:
+        return 0.0
+    interval = share / rate
+    return backend.throttle(f'{KEY_PREFIX}:rate:{bucket}:{key}', interval, burst * interval)
+
+
+def _reject(status, name, outcome, retry_after, message):
+    _count(name, outcome)
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def admit():
+    """before_request hook: shed, rate-limit and bound expensive requests."""
+    global _config
+    if not ENABLED or request.method == 'OPTIONS':
+        return None
+    name = route_class()
+    if name is None:
+        return None
+    if _config is None:
+        _config = _settings()
+
+    batch_item = request.environ.get(BATCH_AUTH_KEY) is not None
+    if not batch_item and _overloaded(PRIORITY[name]):
+        return _reject(503, name, 'shed', SHED_RETRY_SECONDS, 'Server busy; please retry shortly')
+
+    backend, share = _store()
+    try:
+        email = request.headers.get('X-User-Email', '').strip().lower()
+        if email:
+            wait = _throttle(backend, share, 'user', email) or _throttle(backend, share, name, email)
+            if wait:
+                return _reject(429, name, 'rate_limited', wait, 'Too many requests; please slow down')
+
+        if name in EXPENSIVE:
+            limit = max(1, _config['expensive_slots'] // share)
+            if name == 'reporting':
+                limit = max(1, int(limit * REPORTING_SHARE))
+            token = f'{os.getpid()}:{uuid.uuid4().hex}'
+            if not backend.acquire_slot(f'{KEY_PREFIX}:slots:expensive', token, limit, _config['slot_ttl']):
+                return _reject(503, name, 'no_slot', SHED_RETRY_SECONDS,
+                               'Too many searches and reports running; please retry shortly')
+            request.environ[SLOT_KEY] = (backend, token)
+    except Exception as e:
+        logger.warning(f"Admission check failed, admitting: {str(e)}")
+
+    _count(name, 'admitted')
+    return None
+
+
+def release(exc=None):
+    """teardown_request hook: give back the request's expensive-query slot."""
+    slot = request.environ.pop(SLOT_KEY, None)
+    if slot is None:
+        return
+    backend, token = slot
+    try:
+        backend.release_slot(f'{KEY_PREFIX}:slots:expensive', token)
+    except Exception as e:
+        # The slot expires after slot_ttl
+        logger.warning(f"Could not release admission slot: {str(e)}")
+
+
+def admission_stats():
+    """Per-class admission outcomes in this worker."""
+    with _lock:
+        classes = {name: dict(counters) for name, counters in _counters.items()}
+    return {
+        'enabled': ENABLED,
+        'shared': not isinstance(get_cache(), NullCache),
+        'expensive_slots': _config['expensive_slots'] if _config else None,
+        'classes': classes,
+    }
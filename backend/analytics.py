@@ -0,0 +1,244 @@
+import os
+import time
+import logging
+
+from purge import TOMBSTONE_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# CIRCULATION ANALYTICS
+# =============================================================================
+#
+# /api/analytics answers from daily rollups (database/migrations/
+# add_analytics.sql) rather than grouping the checkouts join on every
+# request. The job worker calls refresh_analytics() on each shard every
+# ZOELIBRARYAPP_ANALYTICS_INTERVAL_SECONDS. A pass:
+#
+#   1. takes the checkouts changed since the watermark (updated_at, index
+#      scan) and deleted since then (sync_tombstones);
+#   2. replaces their loan_facts rows, noting each (tenant, day) an old or
+#      new fact falls on;
+#   3. recomputes the loan_rollups rows of only those days, from loan_facts;
+#   4. once a day, snapshots every tenant's dashboard stats.
+#
+# Work per pass is proportional to what changed, not to history. The
+# watermark is held back to the oldest open transaction (as in /api/sync),
+# so rows committed late with an earlier updated_at are still seen; a row
+# seen twice is harmless because facts are replaced, not added. If passes
+# stop for longer than sync tombstones are kept, deletions could be missed,
+# so the next pass rebuilds the shard from scratch instead.
+#
+# Tenants being moved, or living on another shard, are skipped
+# (jobs.tenants_away); move_tenant.py rebuilds a tenant's analytics wherever
+# it ends up.
+
+INTERVAL_SECONDS = int(os.getenv('ZOELIBRARYAPP_ANALYTICS_INTERVAL_SECONDS', '300'))
+# Transaction-level advisory lock: one pass per shard at a time
+LOCK_KEY = 0x616E616C  # 'anal'
+DIMENSIONS = ('all', 'genre', 'borrower', 'book')
+UNSPECIFIED_GENRE = 'Unspecified'
+
+FACTS_SELECT = f'''
+    SELECT co.id AS checkout_id, co.user_id, co.checkout_date::date AS day,
+           bc.book_id, co.borrower_id,
+           COALESCE(NULLIF(TRIM(b.genre), ''), '{UNSPECIFIED_GENRE}') AS genre,
+           co.return_date IS NOT NULL AS returned,
+           CASE WHEN co.return_date IS NOT NULL
+                THEN EXTRACT(DAY FROM (co.return_date - co.checkout_date))::int
+           END AS duration_days
+    FROM checkouts co
+    JOIN book_copies bc ON co.copy_id = bc.id
+    JOIN books b ON bc.book_id = b.id
+'''
+
+ROLLUP_INSERT = '''
+    INSERT INTO loan_rollups (user_id, dimension, key, day, loans, returns, loan_days)
+    SELECT f.user_id, d.dimension, d.key, f.day,
+           COUNT(*), COUNT(*) FILTER (WHERE f.returned), COALESCE(SUM(f.duration_days), 0)
+    FROM loan_facts f
+    CROSS JOIN LATERAL (VALUES
+        ('all', ''), ('genre', f.genre), ('borrower', f.borrower_id::text), ('book', f.book_id::text)
+    ) AS d(dimension, key)
+'''
+
+SNAPSHOT_COLUMNS = ('total_books', 'total_copies', 'available_copies', 'active_checkouts',
+                    'overdue_checkouts', 'total_borrowers', 'wishlist_items', 'pending_follow_ups')
+
+
+def _safe_watermark(cur):
+    """NOW(), held back to the start of the oldest other open transaction."""
+    cur.execute('''
+        SELECT LEAST(
+                   NOW(),
+                   (SELECT MIN(xact_start) FROM pg_stat_activity
+                    WHERE datname = current_database()
+                      AND backend_type = 'client backend'
+                      AND pid <> pg_backend_pid())
+               )::timestamp AS watermark,
+               (NOW() - make_interval(days => %s))::timestamp AS horizon
+    ''', (TOMBSTONE_RETENTION_DAYS,))
+    return cur.fetchone()
+
+
+def _update_facts(cur, since, skip_users):
+    """
+    Replace the facts of checkouts changed or deleted since `since`, except
+    for tenants in `skip_users`; fills dirty_days.
+    """
+    cur.execute('CREATE TEMP TABLE dirty_days (user_id UUID, day DATE) ON COMMIT DROP')
+    cur.execute('''
+        WITH gone AS (
+            DELETE FROM loan_facts f
+            USING sync_tombstones t
+            WHERE t.table_name = 'checkouts' AND t.deleted_at >= %s
+              AND t.user_id <> ALL(%s::uuid[])
+              AND f.checkout_id = t.row_id
+            RETURNING f.user_id, f.day
+        )
+        INSERT INTO dirty_days SELECT user_id, day FROM gone
+    ''', (since, skip_users))
+    deleted = cur.rowcount
+
+    cur.execute(f'''
+        CREATE TEMP TABLE changed_facts ON COMMIT DROP AS {FACTS_SELECT}
+        WHERE co.updated_at >= %s AND co.user_id <> ALL(%s::uuid[])
+    ''', (since, skip_users))
+    changed = cur.rowcount
+    cur.execute('''
+        WITH old AS (
+            DELETE FROM loan_facts f
+            USING changed_facts c
+            WHERE f.checkout_id = c.checkout_id
+            RETURNING f.user_id, f.day
+        )
+        INSERT INTO dirty_days SELECT user_id, day FROM old
+    ''')
+    cur.execute('INSERT INTO loan_facts SELECT * FROM changed_facts')
+    cur.execute('INSERT INTO dirty_days SELECT user_id, day FROM changed_facts')
+    return changed, deleted
+
+
+def _recompute_days(cur):
+    """Rebuild the rollup rows of every (tenant, day) in dirty_days; returns the day count."""
+    cur.execute('CREATE TEMP TABLE dirty ON COMMIT DROP AS SELECT DISTINCT user_id, day FROM dirty_days')
+    days = cur.rowcount
+    if days:
+        cur.execute('''
+            DELETE FROM loan_rollups r
+            USING dirty d
+            WHERE r.user_id = d.user_id AND r.day = d.day
+        ''')
+        cur.execute(ROLLUP_INSERT + '''
+            JOIN dirty x ON f.user_id = x.user_id AND f.day = x.day
+            GROUP BY f.user_id, d.dimension, d.key, f.day
+        ''')
+    return days
+
+
+def _rebuild(cur, user_id=None, skip_users=()):
+    """
+    Recompute facts and rollups from checkouts: the whole shard but the
+    tenants in `skip_users`, or one tenant.
+    """
+    if user_id is None:
+        tenant, params = ' <> ALL(%s::uuid[])', (list(skip_users),)
+    else:
+        tenant, params = ' = %s', (user_id,)
+    cur.execute(f'DELETE FROM loan_rollups WHERE user_id{tenant}', params)
+    cur.execute(f'DELETE FROM loan_facts WHERE user_id{tenant}', params)
+    cur.execute(f'INSERT INTO loan_facts {FACTS_SELECT} WHERE co.user_id{tenant}', params)
+    facts = cur.rowcount
+    cur.execute(ROLLUP_INSERT + f'''
+        WHERE f.user_id{tenant}
+        GROUP BY f.user_id, d.dimension, d.key, f.day
+    ''', params)
+    return facts
+
+
+def snapshot_dashboards(cur, skip_users=()):
+    """Today's dashboard stats for every tenant with data on this shard, but those in `skip_users`."""
+    cur.execute(f'''
+        INSERT INTO dashboard_snapshots (user_id, day, {', '.join(SNAPSHOT_COLUMNS)})
+        SELECT t.user_id, CURRENT_DATE,
+               COALESCE(bk.n, 0), COALESCE(cp.total, 0), COALESCE(cp.available, 0),
+               COALESCE(co.active, 0), COALESCE(co.overdue, 0), COALESCE(br.n, 0),
+               COALESCE(wl.n, 0), COALESCE(fu.n, 0)
+        FROM (SELECT user_id FROM books UNION SELECT user_id FROM borrowers) t
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM books
+                   WHERE deleted_at IS NULL GROUP BY user_id) bk ON bk.user_id = t.user_id
+        LEFT JOIN (SELECT bc.user_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE bc.status = 'Available') AS available
+                   FROM book_copies bc JOIN books b ON bc.book_id = b.id
+                   WHERE b.deleted_at IS NULL GROUP BY bc.user_id) cp ON cp.user_id = t.user_id
+        LEFT JOIN (SELECT c.user_id, COUNT(*) AS active,
+                          COUNT(*) FILTER (WHERE c.due_date < CURRENT_DATE) AS overdue
+                   FROM checkouts c
+                   JOIN book_copies bc ON c.copy_id = bc.id
+                   JOIN books b ON bc.book_id = b.id
+                   WHERE c.status = 'Checked Out' AND b.deleted_at IS NULL
+                   GROUP BY c.user_id) co ON co.user_id = t.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM borrowers
+                   WHERE deleted_at IS NULL GROUP BY user_id) br ON br.user_id = t.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM book_wishlist
+                   WHERE status = 'Requested' GROUP BY user_id) wl ON wl.user_id = t.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS n FROM follow_ups
+                   WHERE status IN ('Pending', 'Contacted') GROUP BY user_id) fu ON fu.user_id = t.user_id
+        WHERE t.user_id <> ALL(%s::uuid[])
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            {', '.join(f'{column} = EXCLUDED.{column}' for column in SNAPSHOT_COLUMNS)}
+    ''', (list(skip_users),))
+    return cur.rowcount
+
+
+def refresh_analytics(cur, min_interval=INTERVAL_SECONDS, skip_users=()):
+    """
+    One incremental pass on the cursor's shard, in the caller's transaction
+    (commit afterwards), leaving the tenants in `skip_users` alone (moving
+    or moved away; a move rebuilds them). Returns a summary, or None if
+    another process holds the pass or one ran less than `min_interval`
+    seconds ago.
+    """
+    cur.execute('SELECT pg_try_advisory_xact_lock(%s) AS locked', (LOCK_KEY,))
+    if not cur.fetchone()['locked']:
+        return None
+    cur.execute('INSERT INTO analytics_state (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING')
+    cur.execute('''
+        SELECT watermark, snapshot_day, refreshed_at,
+               refreshed_at > NOW() - make_interval(secs => %s) AS recent,
+               snapshot_day IS DISTINCT FROM CURRENT_DATE AS snapshot_due
+        FROM analytics_state
+    ''', (min_interval,))
+    state = cur.fetchone()
+    if state['recent']:
+        return None
+
+    started = time.monotonic()
+    bounds = _safe_watermark(cur)
+    summary = {'changed': 0, 'deleted': 0, 'days': 0, 'rebuilt': False, 'snapshots': 0}
+    if state['watermark'] is None or state['watermark'] < bounds['horizon']:
+        # First pass, or tombstones older than the watermark are gone
+        summary['changed'] = _rebuild(cur, skip_users=skip_users)
+        summary['rebuilt'] = True
+    else:
+        summary['changed'], summary['deleted'] = _update_facts(cur, state['watermark'], list(skip_users))
+        summary['days'] = _recompute_days(cur)
+
+    if state['snapshot_due']:
+        summary['snapshots'] = snapshot_dashboards(cur, skip_users)
+    cur.execute('''
+        UPDATE analytics_state
+        SET watermark = %s, refreshed_at = NOW(),
+            snapshot_day = CASE WHEN %s THEN CURRENT_DATE ELSE snapshot_day END
+    ''', (bounds['watermark'], state['snapshot_due']))
+    summary['watermark'] = bounds['watermark'].isoformat()
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return summary
+
+
+def rebuild_tenant(cur, user_id):
+    """
+    Recompute one tenant's facts and rollups from its checkouts, e.g. after
+    moving it to a shard whose watermark is past its rows' updated_at.
+    Returns the number of loans.
+    """
+    return _rebuild(cur, str(user_id))
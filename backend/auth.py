@@ -0,0 +1,156 @@
+from flask import request, jsonify, g
+from functools import wraps
+import json
+import logging
+import os
+import uuid
+
+from cache import USERS
+from db import get_db_connection
+from idempotency import run_idempotent, MUTATING_METHODS
+from shards import DEFAULT_SHARD, new_tenant_shard
+from statements import PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# AUTHENTICATION DECORATORS
+# =============================================================================
+
+# WSGI environ key carrying (user_id, email, shard) into batch sub-requests, which
+# were already authenticated by the batch request (see routes/batch.py).
+# Clients cannot set environ keys, only HTTP_* headers.
+BATCH_AUTH_KEY = 'library.batch_auth'
+
+# Users allowed on the operator endpoints under /api/admin (comma-separated)
+ADMIN_EMAILS = frozenset(
+    email.strip().lower()
+    for email in os.getenv('ZOELIBRARYAPP_ADMIN_EMAILS', '').split(',')
+    if email.strip()
+)
+
+USER_BY_EMAIL = PreparedStatement('user_by_email', '''
+    SELECT u.id, u.email,
+           COALESCE(d.shard, %s) AS shard,
+           COALESCE(d.status, 'active') AS status
+    FROM users u
+    LEFT JOIN tenant_directory d ON d.user_id = u.id
+    WHERE u.email = %s
+''')
+
+
+def create_user(cur, email):
+    """
+    Create a user on the default shard and place them on the new-tenant
+    shard. On another shard the users row is written there first, so the
+    tenant's foreign keys are satisfied before the directory points at it.
+    """
+    username = email.split('@')[0]
+    shard = new_tenant_shard()
+    if shard == DEFAULT_SHARD:
+        cur.execute(
+            'INSERT INTO users (email, username) VALUES (%s, %s) RETURNING id, email',
+            (email, username)
+        )
+        user = cur.fetchone()
+    else:
+        user_id = str(uuid.uuid4())
+        shard_conn = get_db_connection(primary=True, shard=shard)
+        shard_cur = shard_conn.cursor()
+        # An orphan row left by a failed earlier attempt takes the new id
+        shard_cur.execute('''
+            INSERT INTO users (id, email, username) VALUES (%s, %s, %s)
+            ON CONFLICT (email) DO UPDATE SET id = EXCLUDED.id
+        ''', (user_id, email, username))
+        shard_conn.commit()
+        shard_cur.close()
+        shard_conn.close()
+
+        cur.execute(
+            'INSERT INTO users (id, email, username) VALUES (%s, %s, %s) RETURNING id, email',
+            (user_id, email, username)
+        )
+        user = cur.fetchone()
+        cur.execute(
+            'INSERT INTO tenant_directory (user_id, shard) VALUES (%s, %s)',
+            (user_id, shard)
+        )
+    return {**user, 'shard': shard, 'status': 'active'}
+
+
+def token_required(f):
+    """
+    Simple authentication decorator using X-User-Email header.
+    Creates user if not exists. Sets g.user_id, g.user_email and g.shard.
+    Mutating requests honour an Idempotency-Key header (idempotency.py).
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        batch_auth = request.environ.get(BATCH_AUTH_KEY)
+        if batch_auth:
+            g.user_id, g.user_email, g.shard = batch_auth
+            return run_idempotent(f, *args, **kwargs)
+
+        email = request.headers.get('X-User-Email')
+
+        if not email:
+            return jsonify({'error': 'Authentication required'}), 401
+
+        try:
+            cache_key = USERS.key(email)
+            cached = USERS.get(cache_key)
+            if cached is not None:
+                user = json.loads(cached)
+            else:
+                # The directory lives on the default shard's primary; this
+                # may also insert the user
+                conn = get_db_connection(primary=True, shard=DEFAULT_SHARD)
+                cur = conn.cursor()
+
+                # Get or create user, with their shard
+                USER_BY_EMAIL.execute(cur, (DEFAULT_SHARD, email))
+                user = cur.fetchone()
+
+                if not user:
+                    user = create_user(cur, email)
+                    conn.commit()
+
+                cur.close()
+                conn.close()
+
+                user = {'id': str(user['id']), 'email': user['email'], 'shard': user['shard'], 'status': user['status']}
+                # A tenant being moved is looked up on every request until it lands
+                if user['status'] == 'active':
+                    USERS.set(cache_key, json.dumps(user))
+
+            g.user_id = user['id']
+            g.user_email = user['email']
+            g.shard = user.get('shard', DEFAULT_SHARD)
+
+            if user.get('status') == 'moving' and request.method in MUTATING_METHODS:
+                response = jsonify({'error': 'This library is being moved; please retry shortly'})
+                response.headers['Retry-After'] = '5'
+                return response, 503
+
+            return run_idempotent(f, *args, **kwargs)
+
+        except Exception as e:
+            logger.error(f"Authentication error: {str(e)}")
+            return jsonify({'error': 'Authentication failed'}), 401
+
+    return decorated
+
+
+def is_admin(email):
+    return bool(email) and email.strip().lower() in ADMIN_EMAILS
+
+
+def admin_required(f):
+    """Restrict an endpoint to ZOELIBRARYAPP_ADMIN_EMAILS. Apply below token_required."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not is_admin(g.user_email):
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+
+    return decorated
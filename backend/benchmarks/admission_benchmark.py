@@ -0,0 +1,94 @@
+"""
+Admission control benchmark: per-request cost, and a bulk script vs a desk.
+
+Calls admission.admit() and release() directly, in a request context for
+each endpoint, so no database is needed:
+
+  cost    microseconds spent in admission per admitted request, for a
+          search and a checkout
+  mix     for --seconds, one user's script sends searches as fast as it can
+          while another user searches every 500 ms and scans a barcode
+          every 100 ms; prints what each was let through
+
+--cache-url points the buckets at a shared cache (e.g. redis://localhost:6379);
+the default is the in-process memory:// backend.
+
+    python benchmarks/admission_benchmark.py
+    python benchmarks/admission_benchmark.py --cache-url redis://localhost:6379/0
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+CALLS = {
+    'search': ('/api/books?search=tolkien', 'GET'),
+    'checkout': ('/api/checkouts', 'POST'),
+    'scan': ('/api/books/by-barcode/B0001', 'GET'),
+}
+
+
+def call(app, admission, name, email):
+    """One request through admission: (admitted, seconds spent in admit and release)."""
+    path, method = CALLS[name]
+    with app.test_request_context(path, method=method, headers={'X-User-Email': email}):
+        started = time.perf_counter()
+        rejected = admission.admit()
+        admission.release()
+        return rejected is None, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cache-url', default='memory://')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    os.environ['ZOELIBRARYAPP_CACHE_URL'] = args.cache_url
+    logging.disable(logging.WARNING)
+
+    import admission
+    from app import create_app
+
+    app = create_app()
+    print(f"Cache: {args.cache_url}\n")
+
+    limits = admission.parse_limits('')
+    call(app, admission, 'search', 'warm@example.com')
+    # Buckets too large to reject, so the cost runs measure every lookup
+    admission._config['limits'] = {name: (1e6, 1e6) for name in limits}
+    for name in ('search', 'checkout'):
+        samples = [call(app, admission, name, f'cost{i % 50}@example.com')[1] for i in range(args.repeat)]
+        print(f"  {name:<9} {statistics.median(samples) * 1e6:7.1f} us per request")
+
+    admission._config['limits'] = limits
+    admitted, sent = Counter(), Counter()
+    started = time.monotonic()
+    next_search = next_scan = started
+    while time.monotonic() - started < args.seconds:
+        now = time.monotonic()
+        sent['script search'] += 1
+        admitted['script search'] += call(app, admission, 'search', 'script@example.com')[0]
+        if now >= next_search:
+            next_search += 0.5
+            sent['desk search'] += 1
+            admitted['desk search'] += call(app, admission, 'search', 'desk@example.com')[0]
+        if now >= next_scan:
+            next_scan += 0.1
+            sent['desk scan'] += 1
+            admitted['desk scan'] += call(app, admission, 'scan', 'desk@example.com')[0]
+
+    print(f"\n  {args.seconds:.0f} s, default limits (search {limits['search'][0]:g}/s, burst {limits['search'][1]:g})")
+    print(f"  {'traffic':<15} {'sent':>8} {'admitted':>9}")
+    for name in ('script search', 'desk search', 'desk scan'):
+        print(f"  {name:<15} {sent[name]:8d} {admitted[name]:9d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Analytics benchmark: ad-hoc GROUP BYs over checkouts vs the rollup tables.
+
+For one tenant on a shard, times the year-long reports /api/analytics
+serves (loans per month, per genre, top titles, top borrowers, average
+loan duration) two ways: as GROUP BYs over the checkouts join, and as the
+endpoints' queries over loan_rollups. It then times incremental passes of
+analytics.refresh_analytics after --touch checkouts changed, and a rebuild
+of the tenant's rollups for comparison.
+
+--seed N first adds N returned loans over three years (with books,
+copies and borrowers to match) to the tenant; use a scratch database.
+
+    python benchmarks/analytics_benchmark.py --email bench@example.com --seed 200000
+    python benchmarks/analytics_benchmark.py --email bench@example.com --touch 100 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+from analytics import rebuild_tenant, refresh_analytics  # noqa: E402
+from db import connect_direct  # noqa: E402
+
+GENRES = ('Fiction', 'Mystery', 'Science', 'History', 'Biography', 'Fantasy',
+          'Poetry', 'Travel', 'Children', 'Cooking', 'Art', '')
+
+ADHOC = {
+    'loans per month': '''
+        SELECT date_trunc('month', co.checkout_date) AS period, COUNT(*),
+               AVG(EXTRACT(DAY FROM (co.return_date - co.checkout_date))) FILTER (WHERE co.return_date IS NOT NULL)
+        FROM checkouts co
+        JOIN book_copies bc ON co.copy_id = bc.id
+        JOIN books b ON bc.book_id = b.id
+        WHERE co.user_id = %(user)s AND co.checkout_date >= CURRENT_DATE - 365
+        GROUP BY 1 ORDER BY 1
+    ''',
+    'per genre': '''
+        SELECT b.genre, COUNT(*) FROM checkouts co
+        JOIN book_copies bc ON co.copy_id = bc.id
+        JOIN books b ON bc.book_id = b.id
+        WHERE co.user_id = %(user)s AND co.checkout_date >= CURRENT_DATE - 365
+        GROUP BY 1 ORDER BY 2 DESC
+    ''',
+    'top titles': '''
+        SELECT b.id, b.title, COUNT(*) FROM checkouts co
+        JOIN book_copies bc ON co.copy_id = bc.id
+        JOIN books b ON bc.book_id = b.id
+        WHERE co.user_id = %(user)s AND co.checkout_date >= CURRENT_DATE - 365
+        GROUP BY 1, 2 ORDER BY 3 DESC LIMIT 10
+    ''',
+    'top borrowers': '''
+        SELECT br.id, br.last_name, COUNT(*) FROM checkouts co
+        JOIN borrowers br ON co.borrower_id = br.id
+        WHERE co.user_id = %(user)s AND co.checkout_date >= CURRENT_DATE - 365
+        GROUP BY 1, 2 ORDER BY 3 DESC LIMIT 10
+    ''',
+}
+
+ROLLUP = {
+    'loans per month': '''
+        SELECT date_trunc('month', day), SUM(loans), SUM(loan_days) / NULLIF(SUM(returns), 0)
+        FROM loan_rollups
+        WHERE user_id = %(user)s AND dimension = 'all' AND key = '' AND day >= CURRENT_DATE - 365
+        GROUP BY 1 ORDER BY 1
+    ''',
+    'per genre': '''
+        SELECT key, SUM(loans) FROM loan_rollups
+        WHERE user_id = %(user)s AND dimension = 'genre' AND day >= CURRENT_DATE - 365
+        GROUP BY 1 ORDER BY 2 DESC
+    ''',
+    'top titles': '''
+        SELECT top.key, b.title, top.loans FROM (
+            SELECT key, SUM(loans) AS loans FROM loan_rollups
+            WHERE user_id = %(user)s AND dimension = 'book' AND day >= CURRENT_DATE - 365
+            GROUP BY 1 ORDER BY 2 DESC LIMIT 10
+        ) top LEFT JOIN books b ON b.id = top.key::uuid
+    ''',
+    'top borrowers': '''
+        SELECT top.key, br.last_name, top.loans FROM (
+            SELECT key, SUM(loans) AS loans FROM loan_rollups
+            WHERE user_id = %(user)s AND dimension = 'borrower' AND day >= CURRENT_DATE - 365
+            GROUP BY 1 ORDER BY 2 DESC LIMIT 10
+        ) top LEFT JOIN borrowers br ON br.id = top.key::uuid
+    ''',
+}
+
+
+def seed(cur, user_id, loans):
+    """Add `loans` returned checkouts over three years, with books, copies and borrowers."""
+    books = max(50, loans // 100)
+    borrowers = max(50, loans // 200)
+    cur.execute('''
+        INSERT INTO books (user_id, title, author, genre)
+        SELECT %s, 'Seeded title ' || i, 'Seeded author ' || (i %% 97), (%s::text[])[1 + i %% %s]
+        FROM generate_series(1, %s) i
+        RETURNING id
+    ''', (user_id, list(GENRES), len(GENRES), books))
+    book_ids = [str(row['id']) for row in cur.fetchall()]
+    cur.execute('''
+        INSERT INTO book_copies (user_id, book_id, copy_number, status)
+        SELECT %s, id, 1, 'Available' FROM unnest(%s::uuid[]) id
+    ''', (user_id, book_ids))
+    cur.execute('''
+        INSERT INTO borrowers (user_id, first_name, last_name, email, phone)
+        SELECT %s, 'Seeded', 'Borrower ' || i, 'seeded' || i || '@example.com', '555-0000'
+        FROM generate_series(1, %s) i
+    ''', (user_id, borrowers))
+    # Skewed towards a few popular titles, like real circulation
+    cur.execute('''
+        WITH copies AS (SELECT array_agg(id) AS ids FROM book_copies WHERE user_id = %(user)s),
+             people AS (SELECT array_agg(id) AS ids FROM borrowers WHERE user_id = %(user)s),
+             loans AS (
+                 SELECT NOW() - make_interval(days => 31 + (random() * 1095)::int) AS out_at,
+                        (1 + random() * 30)::int AS days,
+                        power(random(), 3) AS pick, random() AS who
+                 FROM generate_series(1, %(loans)s)
+             )
+        INSERT INTO checkouts (user_id, copy_id, borrower_id, checkout_date, due_date, return_date, status)
+        SELECT %(user)s, copies.ids[1 + (pick * (array_length(copies.ids, 1) - 1))::int],
+               people.ids[1 + (who * (array_length(people.ids, 1) - 1))::int],
+               out_at, (out_at + INTERVAL '14 days')::date, out_at + make_interval(days => days), 'Returned'
+        FROM loans, copies, people
+    ''', {'user': user_id, 'loans': loans})
+
+
+def timed(cur, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True, help='tenant whose checkouts are reported on')
+    parser.add_argument('--shard', default='default')
+    parser.add_argument('--seed', type=int, default=0, help='add this many synthetic loans first')
+    parser.add_argument('--touch', type=int, default=100, help='checkouts changed before each incremental pass')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = connect_direct(args.shard)
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM users WHERE email = %s', (args.email,))
+    row = cur.fetchone()
+    if row is None:
+        sys.exit(f"No user {args.email} on shard {args.shard}")
+    user_id = str(row['id'])
+
+    if args.seed:
+        started = time.perf_counter()
+        seed(cur, user_id, args.seed)
+        conn.commit()
+        print(f"Seeded {args.seed} loans in {time.perf_counter() - started:.1f} s")
+
+    # Bring the shard's rollups up to date (a full rebuild on the first pass)
+    summary = refresh_analytics(cur, min_interval=0)
+    conn.commit()
+    started = time.perf_counter()
+    loans = rebuild_tenant(cur, user_id)
+    conn.commit()
+    rebuild = time.perf_counter() - started
+    cur.execute('SELECT COUNT(*) AS rows FROM loan_rollups WHERE user_id = %s', (user_id,))
+    rollup_rows = cur.fetchone()['rows']
+    print(f"Tenant has {loans} loans in {rollup_rows} rollup rows "
+          f"(first pass: {summary}; tenant rebuild {rebuild:.2f} s)\n")
+
+    print(f"  {'report (last 365 days)':<24} {'ad hoc ms':>10} {'rollup ms':>10}")
+    for name in ADHOC:
+        adhoc = timed(cur, ADHOC[name], {'user': user_id}, args.repeat)
+        rollup = timed(cur, ROLLUP[name], {'user': user_id}, args.repeat)
+        print(f"  {name:<24} {adhoc:10.1f} {rollup:10.1f}")
+    conn.commit()
+
+    samples = []
+    for _ in range(args.repeat):
+        cur.execute('''
+            UPDATE checkouts SET notes = notes
+            WHERE id IN (SELECT id FROM checkouts WHERE user_id = %s ORDER BY random() LIMIT %s)
+        ''', (user_id, args.touch))
+        conn.commit()
+        started = time.perf_counter()
+        summary = refresh_analytics(cur, min_interval=0)
+        conn.commit()
+        samples.append(time.perf_counter() - started)
+    print(f"\n  incremental pass, {args.touch} changed: {statistics.median(samples) * 1000:.1f} ms "
+          f"({summary['days'] if summary else '?'} days recomputed)")
+    print(f"  tenant rebuild:               {rebuild * 1000:.1f} ms")
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Batch endpoint benchmark: one /api/batch round trip vs separate requests.
+
+As --email, through the Flask test client against a real database:
+
+  check     a batch whose first item fails inside its route (PUT of a book
+            with a malformed id, which aborts the shared transaction)
+            followed by a read that runs on the same shared connection;
+            the read must still answer 200
+  timing    --items GETs of --path sent as one batch and as separate
+            requests, median of --repeat rounds
+
+    python benchmarks/batch_benchmark.py --email bench@example.com
+    python benchmarks/batch_benchmark.py --email bench@example.com --items 10 --path /api/borrowers
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+
+def check_failed_item(client, headers):
+    """A failing sequential item must not poison the items after it."""
+    response = client.post('/api/batch', headers=headers, json={'requests': [
+        {'id': 'bad', 'method': 'PUT', 'path': '/api/books/not-a-uuid', 'body': {'title': 'x', 'author': 'y'}},
+        {'id': 'good', 'method': 'GET', 'path': '/api/follow-ups'},
+    ]})
+    statuses = {item['id']: item['status'] for item in response.get_json()['responses']}
+    ok = statuses['bad'] >= 400 and statuses['good'] == 200
+    print(f"  failing item, then a read: {statuses} -> {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--path', default='/api/dashboard/stats')
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    # No rate limits, so only the batching is measured
+    os.environ['ZOELIBRARYAPP_ADMISSION'] = 'off'
+    logging.disable(logging.WARNING)
+
+    from app import create_app
+
+    client = create_app().test_client()
+    headers = {'X-User-Email': args.email}
+    client.get(args.path, headers=headers)  # warm the pool and caches
+
+    print(f"{args.email}\n")
+    ok = check_failed_item(client, headers)
+
+    batch = {'requests': [{'id': i, 'method': 'GET', 'path': args.path} for i in range(args.items)]}
+    separate, batched = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for _ in range(args.items):
+            client.get(args.path, headers=headers)
+        separate.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        client.post('/api/batch', headers=headers, json=batch)
+        batched.append(time.perf_counter() - started)
+    print(f"\n  {args.items} x GET {args.path}, median of {args.repeat}")
+    print(f"  separate: {statistics.median(separate) * 1000:8.1f} ms")
+    print(f"  batch:    {statistics.median(batched) * 1000:8.1f} ms")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Cover image benchmark: first view, disk and in-memory serving of thumbnails.
+
+Writes --count synthetic cover scans (--width x 1.5 --width JPEGs) to a
+scratch directory, points the local provider at it and requests every cover
+through the Flask test client three times:
+
+  cold   fetch from the provider, derive thumbnails, store, serve
+  disk   thumbnails on disk, per-worker LRU empty
+  memory served from the LRU
+
+With --accel the app answers disk reads with X-Accel-Redirect instead, as
+it does behind nginx; the time then is only the worker's share. No database
+is needed.
+
+    python benchmarks/cover_benchmark.py --count 200
+    python benchmarks/cover_benchmark.py --count 200 --size s --accel
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def isbn13(n):
+    digits = f'978{n:09d}'
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def make_sources(directory, count, width):
+    from PIL import Image
+
+    isbns = []
+    for i in range(count):
+        isbn = isbn13(i)
+        # Noise compresses like a real scan, unlike a flat colour
+        image = Image.effect_noise((width, width * 3 // 2), 64).convert('RGB')
+        image.save(os.path.join(directory, f'{isbn}.jpg'), 'JPEG', quality=90)
+        isbns.append(isbn)
+    return isbns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200, help='covers (default 200)')
+    parser.add_argument('--width', type=int, default=800, help='source image width (default 800)')
+    parser.add_argument('--size', default='m', help='thumbnail size to request (default m)')
+    parser.add_argument('--accel', action='store_true', help='serve disk reads with X-Accel-Redirect')
+    args = parser.parse_args()
+
+    source_dir = tempfile.mkdtemp(prefix='cover-source-')
+    os.environ['ZOELIBRARYAPP_COVER_PROVIDER'] = 'local'
+    os.environ['ZOELIBRARYAPP_COVER_SOURCE_DIR'] = source_dir
+    os.environ['ZOELIBRARYAPP_COVER_DIR'] = tempfile.mkdtemp(prefix='cover-store-')
+    os.environ['ZOELIBRARYAPP_COVER_FETCH_RATE'] = '0'
+    if args.accel:
+        os.environ['ZOELIBRARYAPP_COVER_ACCEL_PREFIX'] = '/_covers/'
+
+    from app import create_app  # noqa: E402 (reads the cover settings on import)
+    from covers import thumbnail_cache  # noqa: E402
+
+    isbns = make_sources(source_dir, args.count, args.width)
+    client = create_app().test_client()
+    print(f"{args.count} covers of {args.width}x{args.width * 3 // 2}, size {args.size}"
+          f"{', X-Accel-Redirect' if args.accel else ''}\n")
+    print(f"  {'pass':<8} {'p50 ms':>8} {'p95 ms':>8} {'covers/s':>9} {'bytes':>8}")
+
+    for name in ('cold', 'disk', 'memory'):
+        if name == 'disk':
+            thumbnail_cache.clear()
+        random.shuffle(isbns)
+        samples = []
+        sent = 0
+        started = time.perf_counter()
+        for isbn in isbns:
+            t = time.perf_counter()
+            response = client.get(f'/api/covers/{isbn}.jpg?size={args.size}')
+            samples.append(time.perf_counter() - t)
+            if response.status_code != 200:
+                sys.exit(f"{isbn}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+            sent += len(response.data)
+        elapsed = time.perf_counter() - started
+        samples.sort()
+        print(f"  {name:<8} {statistics.median(samples) * 1000:8.2f} "
+              f"{samples[int(len(samples) * 0.95) - 1] * 1000:8.2f} {len(isbns) / elapsed:9.0f} "
+              f"{sent // len(isbns):8}")
+
+    print(f"\n  LRU: {thumbnail_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Statement timeout and disconnect cancellation benchmark.
+
+  watcher   no database: how long the disconnect watcher takes to notice a
+            client that closed its socket, and what one check of an open
+            socket costs (paid per in-flight request every check interval)
+  --email   end to end against a real server on a random port and a real
+            database: a slow --path with a small statement budget answers
+            504 (time to the answer), and the same request abandoned by its
+            client after --abandon-after seconds (time until its query is
+            gone from pg_stat_activity)
+
+Use a tenant and a --path slow enough to outlast --statement-timeout and
+--abandon-after (e.g. a history search after analytics_benchmark.py --seed).
+
+    python benchmarks/deadlines_benchmark.py
+    python benchmarks/deadlines_benchmark.py --email bench@example.com --path '/api/checkout-history?search=zz'
+"""
+import argparse
+import http.client
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+
+class Request:
+    """Stands in for a request's g: a watched request holding no connections."""
+
+
+def watcher_latency(deadlines, rounds):
+    listener = socket.create_server(('127.0.0.1', 0))
+    latencies = []
+    for _ in range(rounds):
+        client = socket.create_connection(listener.getsockname())
+        server_side, _ = listener.accept()
+        watch = deadlines.watcher.watch(server_side, Request())
+        time.sleep(deadlines.WATCH_INTERVAL * 1.5)
+        closed = time.perf_counter()
+        client.close()
+        while not watch.disconnected:
+            time.sleep(0.001)
+        latencies.append(time.perf_counter() - closed)
+        deadlines.watcher.unwatch(watch)
+        server_side.close()
+
+    client = socket.create_connection(listener.getsockname())
+    server_side, _ = listener.accept()
+    started = time.perf_counter()
+    for _ in range(10000):
+        deadlines.client_gone(server_side)
+    check_us = (time.perf_counter() - started) / 10000 * 1e6
+    client.close()
+    server_side.close()
+    listener.close()
+    return statistics.median(latencies) * 1000, max(latencies) * 1000, check_us
+
+
+def active_queries(conn, text):
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT COUNT(*) AS n FROM pg_stat_activity
+        WHERE state = 'active' AND pid <> pg_backend_pid() AND query ILIKE %s
+    """, ('%' + text + '%',))
+    count = cur.fetchone()['n']
+    cur.close()
+    return count
+
+
+def end_to_end(app, args):
+    import deadlines
+    from db import connect_direct
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    headers = {'X-User-Email': args.email}
+
+    deadlines._timeouts = deadlines.parse_timeouts(f'search={args.statement_timeout},reporting={args.statement_timeout}')
+    started = time.perf_counter()
+    http_conn = http.client.HTTPConnection('127.0.0.1', port)
+    http_conn.request('GET', args.path, headers=headers)
+    response = http_conn.getresponse()
+    response.read()
+    print(f"  budget {args.statement_timeout:g} s:   {response.status} after {time.perf_counter() - started:.2f} s")
+
+    deadlines._timeouts = deadlines.parse_timeouts('search=0,reporting=0')
+    monitor = connect_direct()
+    monitor.autocommit = True
+    client = socket.create_connection(('127.0.0.1', port))
+    client.sendall(f"GET {args.path} HTTP/1.1\r\nHost: localhost\r\nX-User-Email: {args.email}\r\n\r\n".encode())
+    time.sleep(args.abandon_after)
+    if not active_queries(monitor, args.query_text):
+        print(f"  abandoned: query had already finished after {args.abandon_after:g} s; use a slower --path")
+        return
+    closed = time.perf_counter()
+    client.close()
+    while active_queries(monitor, args.query_text):
+        if time.perf_counter() - closed > 60:
+            print("  abandoned: query still running after 60 s")
+            return
+        time.sleep(0.01)
+    print(f"  abandoned after {args.abandon_after:g} s: query gone {(time.perf_counter() - closed) * 1000:.0f} ms "
+          f"after the client closed")
+    monitor.close()
+    server.shutdown()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--email')
+    parser.add_argument('--path', default='/api/checkout-history?search=zz')
+    parser.add_argument('--query-text', default='FROM checkouts',
+                        help='text identifying the query in pg_stat_activity')
+    parser.add_argument('--statement-timeout', type=float, default=0.1)
+    parser.add_argument('--abandon-after', type=float, default=0.5)
+    args = parser.parse_args()
+    # Buffered responses and no rate limits, so only the deadlines are measured
+    os.environ['ZOELIBRARYAPP_RESPONSE_MEMORY_MB'] = '0'
+    os.environ['ZOELIBRARYAPP_ADMISSION'] = 'off'
+    logging.disable(logging.WARNING)
+
+    import deadlines
+
+    median_ms, max_ms, check_us = watcher_latency(deadlines, args.rounds)
+    print(f"Disconnect watcher, checking every {deadlines.WATCH_INTERVAL * 1000:.0f} ms\n")
+    print(f"  noticed a closed client:  median {median_ms:.0f} ms, max {max_ms:.0f} ms")
+    print(f"  one check of an open socket: {check_us:.1f} us")
+
+    if args.email:
+        from app import create_app
+
+        print(f"\n{args.path} as {args.email}\n")
+        end_to_end(create_app(), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Hold queue concurrency check against a running backend.
+
+Creates a book with --copies copies, checks every copy out, then from
+--threads concurrent clients returns the copies while placing --holds
+holds (and cancelling every --cancel-every'th one) on the same book.
+While holds still wait, it then takes copies through the other ways a
+copy's status changes: adding a copy, setting a Reserved copy Available,
+Damaged and Lost, deleting a Reserved copy, and an audit that finds the
+Lost copy. After the returns and again after those, it checks the
+invariants the hold queue must keep:
+
+  - waiting positions are exactly 1..N in ticket order and N matches the
+    queue length reported by the API
+  - every Ready hold has its own copy, and that copy is Reserved
+  - no copy is Available while holds are still waiting
+  - Ready holds = min(copies in circulation, holds still open)
+
+and prints request latencies. Exits non-zero if an invariant fails.
+
+    python benchmarks/holds_concurrency.py --url http://localhost:5002 \\
+        --email bench@example.com --copies 20 --holds 200 --threads 16
+"""
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+
+class Client:
+    def __init__(self, url, email):
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers['X-User-Email'] = email
+
+    def call(self, method, path, **kwargs):
+        response = self.session.request(method, self.url + path, timeout=60, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path}: {response.status_code} {response.text[:200]}")
+        return response.json()
+
+
+def setup(client, copies, holds):
+    tag = uuid.uuid4().hex[:8]
+    book = client.call('POST', '/api/books', json={
+        'title': f'Hold queue check {tag}', 'author': 'Benchmark', 'barcode': f'HQ-{tag}',
+    })
+    copy_ids = [client.call('POST', '/api/book-copies', json={'book_id': book['id']})['id'] for _ in range(copies)]
+
+    def borrower(i):
+        return client.call('POST', '/api/borrowers', json={
+            'first_name': f'Reader{i}', 'last_name': tag,
+            'email': f'reader{i}.{tag}@example.com', 'phone': f'555-{i:04d}',
+        })['id']
+
+    readers = [borrower(i) for i in range(copies)]
+    holders = [borrower(copies + i) for i in range(holds)]
+    checkouts = [
+        client.call('POST', '/api/checkouts', json={'copy_id': copy_id, 'borrower_id': reader})['id']
+        for copy_id, reader in zip(copy_ids, readers)
+    ]
+    return book['id'], book['barcode'], checkouts, holders
+
+
+def run(url, email, checkouts, book_id, holders, threads, cancel_every):
+    """Return every checkout and place every hold concurrently."""
+    work = [('return', checkout_id) for checkout_id in checkouts]
+    work += [('hold', borrower_id) for borrower_id in holders]
+    random.shuffle(work)
+    lock = threading.Lock()
+    latencies = {'return': [], 'hold': [], 'cancel': []}
+    errors = []
+    cancelled = []
+
+    def worker():
+        client = Client(url, email)
+        while True:
+            with lock:
+                if not work:
+                    return
+                kind, item = work.pop()
+            started = time.perf_counter()
+            try:
+                if kind == 'return':
+                    client.call('PUT', f'/api/checkouts/{item}/return')
+                else:
+                    hold = client.call('POST', '/api/holds', json={'book_id': book_id, 'borrower_id': item})
+                    if cancel_every and holders.index(item) % cancel_every == 0:
+                        with lock:
+                            latencies[kind].append(time.perf_counter() - started)
+                        kind, started = 'cancel', time.perf_counter()
+                        client.call('PUT', f"/api/holds/{hold['id']}/cancel")
+                        with lock:
+                            cancelled.append(hold['id'])
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies[kind].append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors, len(cancelled)
+
+
+def reserved_copy(client, book_id):
+    for copy in client.call('GET', f'/api/books/{book_id}/copies'):
+        if copy['status'] == 'Reserved':
+            return copy
+    raise RuntimeError('no Reserved copy left to exercise; use more --copies')
+
+
+def copy_paths(client, book_id, barcode):
+    """
+    Change copies outside returns while holds wait. Returns how many copies
+    this took out of circulation (net).
+    """
+    # A new copy goes to the next hold, not the shelf
+    client.call('POST', '/api/book-copies', json={'book_id': book_id})
+    # Set Available by hand: back to the hold it was reserved for
+    copy = reserved_copy(client, book_id)
+    client.call('PUT', f"/api/book-copies/{copy['id']}", json={**copy, 'status': 'Available'})
+    # Damaged, and deleted: their holds go back to the head of the queue
+    copy = reserved_copy(client, book_id)
+    client.call('PUT', f"/api/book-copies/{copy['id']}", json={**copy, 'status': 'Damaged'})
+    client.call('DELETE', f"/api/book-copies/{reserved_copy(client, book_id)['id']}")
+    # Lost, then found by an audit: the copy goes to the next hold again
+    lost = reserved_copy(client, book_id)
+    client.call('PUT', f"/api/book-copies/{lost['id']}", json={**lost, 'status': 'Lost'})
+    audit = client.call('POST', '/api/audits', json={'name': 'Hold queue check'})
+    client.call('POST', f"/api/audits/{audit['id']}/scans", json={
+        'chunk': 0, 'location': 'Hold queue shelf',
+        'scans': [{'barcode': barcode, 'copy_number': lost['copy_number']}],
+    })
+    client.call('POST', f"/api/audits/{audit['id']}/finish")
+    client.call('POST', f"/api/audits/{audit['id']}/apply", json={'missing_status': None, 'relocate_misplaced': False})
+    return 1
+
+
+def check(client, book_id, returned, placed, cancelled):
+    failures = []
+    queue = {'waiting': [], 'waiting_count': 0}
+    after = 0
+    while after is not None:
+        page = client.call('GET', f'/api/books/{book_id}/holds', params={'after': after, 'limit': 500})
+        queue['waiting'] += page['waiting']
+        queue['waiting_count'] = page['waiting_count']
+        queue['ready'] = page['ready']
+        after = page['next_after']
+    copies = {copy['id']: copy['status'] for copy in client.call('GET', f'/api/books/{book_id}/copies')}
+
+    positions = [hold['position'] for hold in queue['waiting']]
+    if positions != list(range(1, len(positions) + 1)):
+        failures.append(f"waiting positions are not 1..{len(positions)}: {positions[:10]}...")
+    if queue['waiting_count'] != len(positions):
+        failures.append(f"queue length {queue['waiting_count']} but {len(positions)} waiting holds")
+
+    ready_copies = [hold['copy_id'] for hold in queue['ready']]
+    if len(set(ready_copies)) != len(ready_copies):
+        failures.append('a copy is reserved for more than one hold')
+    for copy_id in ready_copies:
+        if copies.get(copy_id) != 'Reserved':
+            failures.append(f"copy {copy_id} has a Ready hold but is {copies.get(copy_id)}")
+    reserved = sum(1 for status in copies.values() if status == 'Reserved')
+    if reserved != len(ready_copies):
+        failures.append(f"{reserved} copies Reserved but {len(ready_copies)} Ready holds")
+    available = sum(1 for status in copies.values() if status == 'Available')
+    if positions and available:
+        failures.append(f"{available} copies Available while {len(positions)} holds wait")
+
+    expected_ready = min(returned, placed - cancelled)
+    if len(ready_copies) != expected_ready:
+        failures.append(f"{len(ready_copies)} Ready holds, expected {expected_ready}")
+    if len(positions) != placed - cancelled - len(ready_copies):
+        failures.append(f"{len(positions)} waiting, expected {placed - cancelled - len(ready_copies)}")
+    return queue, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5002')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--holds', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--cancel-every', type=int, default=7, help='cancel every Nth hold right after placing it (0: never)')
+    args = parser.parse_args()
+
+    client = Client(args.url, args.email)
+    book_id, barcode, checkouts, holders = setup(client, args.copies, args.holds)
+    print(f"Book {book_id}: {args.copies} copies checked out, {args.holds} borrowers, {args.threads} threads")
+
+    elapsed, latencies, errors, cancelled = run(args.url, args.email, checkouts, book_id, holders,
+                                                args.threads, args.cancel_every)
+    print(f"\n  {'request':<8} {'count':>6} {'p50 ms':>8} {'max ms':>8}")
+    for kind, samples in latencies.items():
+        if samples:
+            print(f"  {kind:<8} {len(samples):6} {statistics.median(samples) * 1000:8.1f} {max(samples) * 1000:8.1f}")
+    print(f"\n  {elapsed:.2f} s, {len(errors)} errors")
+    for error in errors[:5]:
+        print(f"    {error}")
+
+    queue, failures = check(client, book_id, args.copies, args.holds, cancelled)
+    print(f"  {len(queue['ready'])} Ready, {len(queue['waiting'])} waiting, {cancelled} cancelled")
+    if queue['waiting'] and not failures:
+        try:
+            removed = copy_paths(client, book_id, barcode)
+        except Exception as e:
+            errors.append(str(e))
+            print(f"    {e}")
+        else:
+            queue, failures = check(client, book_id, args.copies - removed, args.holds, cancelled)
+            print(f"  after copy edits: {len(queue['ready'])} Ready, {len(queue['waiting'])} waiting")
+    if errors or failures:
+        for failure in failures:
+            print(f"  FAIL: {failure}")
+        sys.exit(1)
+    print('  OK: queue positions, reservations and copy statuses agree')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+ISBN benchmark: canonicalization cost, and ISBN search by LIKE vs by key.
+
+  normalize   no database: normalize_isbn() over --count generated ISBNs,
+              a mix of ISBN-10, ISBN-13, hyphenated, labelled and EAN
+              with a price add-on
+  --email     for that tenant, the book list search for one of its ISBNs
+              (hyphenated, as typed) done the old way, LIKE over isbn, title,
+              author and barcode, and the new way, by isbn_key; then
+              one run of the duplicate report
+
+Use a tenant with a large catalogue that has ISBNs and has been backfilled
+(tools/backfill_isbn_keys.py).
+
+    python benchmarks/isbn_benchmark.py
+    python benchmarks/isbn_benchmark.py --email bench@example.com --repeat 50
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+from isbn import find_duplicates, isbn10, isbn_forms, normalize_isbn  # noqa: E402
+
+LIKE_SEARCH = '''
+    SELECT b.id FROM books b
+    WHERE b.user_id = %s AND b.deleted_at IS NULL
+      AND (LOWER(b.title) LIKE LOWER(%s) OR LOWER(b.author) LIKE LOWER(%s)
+           OR LOWER(b.isbn) LIKE LOWER(%s) OR LOWER(b.barcode) LIKE LOWER(%s))
+'''
+KEY_SEARCH = '''
+    SELECT b.id FROM books b
+    WHERE b.user_id = %s AND b.deleted_at IS NULL
+      AND (b.isbn_key = %s
+           OR (b.isbn_key IS NULL AND b.isbn = ANY(%s))
+           OR LOWER(b.barcode) LIKE LOWER(%s))
+'''
+
+
+def random_isbn13():
+    body = '978' + ''.join(random.choice('0123456789') for _ in range(9))
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def variants(count):
+    forms = []
+    for _ in range(count):
+        isbn = random_isbn13()
+        forms.append(random.choice((
+            isbn,
+            isbn10(isbn),
+            f'{isbn[:3]}-{isbn[3]}-{isbn[4:7]}-{isbn[7:12]}-{isbn[12]}',
+            f'ISBN-13: {isbn}',
+            isbn + '52499',
+        )))
+    return forms
+
+
+def timed(cur, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--email')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    forms = variants(args.count)
+    started = time.perf_counter()
+    keys = [normalize_isbn(form) for form in forms]
+    elapsed = time.perf_counter() - started
+    assert all(keys)
+    print(f"normalize_isbn: {elapsed / args.count * 1e6:.2f} us per value over {args.count} mixed forms")
+
+    if not args.email:
+        return
+
+    from db import connect_direct
+
+    conn = connect_direct()
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM users WHERE email = %s', (args.email,))
+    user = cur.fetchone()
+    if not user:
+        sys.exit(f"No user {args.email}")
+    user_id = str(user['id'])
+    cur.execute('''
+        SELECT COUNT(*) AS books, MIN(isbn_key) AS isbn_key FROM books
+        WHERE user_id = %s AND deleted_at IS NULL
+    ''', (user_id,))
+    row = cur.fetchone()
+    if not row['isbn_key']:
+        sys.exit(f"{args.email} has no keyed ISBNs; run tools/backfill_isbn_keys.py first")
+    key = row['isbn_key']
+    typed = f'{key[:3]}-{key[3]}-{key[4:7]}-{key[7:12]}-{key[12]}'
+
+    like = timed(cur, LIKE_SEARCH, (user_id,) + (f'%{typed}%',) * 4, args.repeat)
+    key_params = (user_id, key, isbn_forms(typed, key), f'%{typed}%')
+    exact = timed(cur, KEY_SEARCH, key_params, args.repeat)
+    print(f"\n{args.email}: {row['books']} books, searching '{typed}'\n")
+    print(f"  LIKE search:     {like:8.2f} ms (matches only the spelling stored)")
+    print(f"  isbn_key search: {exact:8.2f} ms")
+
+    started = time.perf_counter()
+    report = find_duplicates(cur, user_id)
+    print(f"\n  duplicate report: {report['duplicate_groups']} groups, {report['duplicate_books']} books, "
+          f"{report['books_scanned']} scanned in {time.perf_counter() - started:.2f} s")
+    conn.rollback()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
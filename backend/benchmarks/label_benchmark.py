@@ -0,0 +1,86 @@
+"""
+Barcode label benchmark: time to render a label sheet.
+
+Renders N synthetic labels (a third EAN-13, the rest Code 128, as in a
+typical collection) with label_sheets.render_pages for each process count,
+then times the page cache: the same sheet again (document hit) and the
+sheet after a few copies moved (only the changed pages re-render). No
+database is needed.
+
+    python benchmarks/label_benchmark.py --count 5000 --processes 1,2,4
+    python benchmarks/label_benchmark.py --count 5000 --layout a4-21 --output /tmp/labels.pdf
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from label_sheets import LAYOUTS, ean13_check_digit, join_pages, paginate, render_pages  # noqa: E402
+
+
+def make_labels(count):
+    labels = []
+    for i in range(count):
+        if i % 3 == 0:
+            digits = f'978{i:09d}'
+            barcode = digits + ean13_check_digit(digits)
+        else:
+            barcode = f'LIB-{i:07d}'
+        labels.append({
+            'barcode': barcode,
+            'title': f'Collected Works, Volume {i}: An Unusually Long Subtitle',
+            'copy_number': i % 4 + 1,
+            'location': f'Stacks {i // 400 + 1}, Shelf {i % 40 + 1}',
+        })
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=5000, help='labels (default 5000)')
+    parser.add_argument('--layout', default='letter-30', choices=sorted(LAYOUTS))
+    parser.add_argument('--processes', default='1,2,4', help='process counts to try (default 1,2,4)')
+    parser.add_argument('--output', help='write the last rendered sheet here')
+    args = parser.parse_args()
+
+    labels = make_labels(args.count)
+    pages = paginate(args.layout, labels)
+    print(f"{args.count} labels, {len(pages)} pages ({args.layout}), {os.cpu_count()} CPUs\n")
+    print(f"  {'mode':<22} {'seconds':>8} {'pages/s':>8}")
+
+    document = None
+    for processes in (int(p) for p in args.processes.split(',')):
+        started = time.perf_counter()
+        rendered = render_pages(args.layout, pages, processes)
+        document = join_pages(rendered)
+        elapsed = time.perf_counter() - started
+        print(f"  {f'render, {processes} proc':<22} {elapsed:8.2f} {len(pages) / elapsed:8.0f}")
+
+    # The cache in labels.py, against a scratch directory
+    os.environ['ZOELIBRARYAPP_LABEL_CACHE_DIR'] = tempfile.mkdtemp(prefix='label-bench-')
+    from labels import build_sheet  # noqa: E402 (reads the cache dir on import)
+
+    processes = max(int(p) for p in args.processes.split(','))
+    for mode, sheet in (
+        ('cold cache', labels),
+        ('same sheet', labels),
+        ('10 copies moved', [dict(label, location='Returns cart') if i % (args.count // 10 or 1) == 0 else label
+                             for i, label in enumerate(labels)]),
+    ):
+        started = time.perf_counter()
+        summary = build_sheet('benchmark', args.layout, sheet, processes=processes)
+        elapsed = time.perf_counter() - started
+        print(f"  {mode:<22} {elapsed:8.2f} {'':>8}  {summary['pages_rendered']} pages rendered")
+
+    if args.output and document:
+        with open(args.output, 'wb') as f:
+            f.write(document)
+        print(f"\nWrote {args.output} ({len(document) // 1024} KiB)")
+
+
+if __name__ == '__main__':
+    main()
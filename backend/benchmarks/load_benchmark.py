@@ -0,0 +1,117 @@
+"""
+HTTP load benchmark against a running backend.
+
+Replays a read-heavy mix of the endpoints the React pages call on load
+(books, checkouts, borrowers, dashboard stats, history) from N concurrent
+clients, then reports throughput, latency percentiles and the worker
+saturation / queue depth sampled from /api/metrics/worker during the run.
+
+    python benchmarks/load_benchmark.py --url http://localhost:5002 \\
+        --email bench@example.com --concurrency 32 --duration 30
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+
+import requests
+
+# (weight, path) — roughly the page-load fan-out of Dashboard, CheckoutBooks
+# and BookSearch
+DEFAULT_MIX = [
+    (4, '/api/dashboard/stats'),
+    (4, '/api/checkouts'),
+    (3, '/api/books'),
+    (2, '/api/borrowers'),
+    (2, '/api/borrowers/autocomplete?q=a'),
+    (1, '/api/books?search=the'),
+    (1, '/api/checkout-history'),
+]
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def run_load(url, email, concurrency, duration, mix=DEFAULT_MIX):
+    """Run the mix for `duration` seconds and return a summary dict."""
+    paths = [path for weight, path in mix for _ in range(weight)]
+    headers = {'X-User-Email': email}
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < deadline:
+            path = random.choice(paths)
+            started = time.perf_counter()
+            try:
+                response = session.get(url + path, headers=headers, timeout=60)
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            local_latencies.append(time.perf_counter() - started)
+            local_errors += 0 if ok else 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    samples = []
+
+    def sampler():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            try:
+                samples.append(session.get(url + '/api/metrics/worker', headers=headers, timeout=5).json())
+            except (requests.RequestException, ValueError):
+                pass
+            time.sleep(0.5)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    threads.append(threading.Thread(target=sampler))
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    queue = [s['listen_queue'] for s in samples if s.get('listen_queue') is not None]
+    pool_waiting = [s['db_pool']['waiting'] for s in samples if s.get('db_pool')]
+    saturation = [s['saturation'] for s in samples if 'saturation' in s]
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(1000 * percentile(latencies, 50), 1),
+        'p95_ms': round(1000 * percentile(latencies, 95), 1),
+        'p99_ms': round(1000 * percentile(latencies, 99), 1),
+        'avg_saturation': round(statistics.mean(saturation), 2) if saturation else None,
+        'max_listen_queue': max(queue) if queue else None,
+        'max_pool_waiting': max(pool_waiting) if pool_waiting else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5002')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    print(json.dumps(run_load(args.url, args.email, args.concurrency, args.duration), indent=2))
+
+
+if __name__ == '__main__':
+    main()
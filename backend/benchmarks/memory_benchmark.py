@@ -0,0 +1,80 @@
+"""
+Response memory benchmark: a large list endpoint buffered vs streamed.
+
+Requests --path (default /api/checkout-history, which is not cached) as
+--email through the Flask test client, first with the response budget off
+(fetchall() + jsonify()), then with a budget of 1 byte so
+memory.rows_response() streams the rows from a server-side cursor. For each it reports the median time, the peak of
+Python allocations (tracemalloc) and the RSS growth of the first request.
+Run each mode in a fresh process (--mode) for comparable RSS figures;
+with no --mode both run here, buffered first.
+
+Use a tenant with many rows (e.g. after analytics_benchmark.py --seed, or
+copy a production-sized library into a scratch database).
+
+    python benchmarks/memory_benchmark.py --email bench@example.com --mode buffered
+    python benchmarks/memory_benchmark.py --email bench@example.com --mode streamed
+    python benchmarks/memory_benchmark.py --email bench@example.com --path /api/borrowers
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+
+def run(client, path, email, repeat):
+    import memory
+
+    rss_before = memory.rss_bytes()
+    times, peaks, size = [], [], 0
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        response = client.get(path, headers={'X-User-Email': email})
+        size = len(response.get_data())
+        times.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        if response.status_code != 200:
+            sys.exit(f"{path} answered {response.status_code}: {response.get_data()[:200]!r}")
+        if len(times) == 1:
+            rss_growth = memory.rss_bytes() - rss_before
+    return statistics.median(times) * 1000, max(peaks), rss_growth, size
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--path', default='/api/checkout-history')
+    parser.add_argument('--mode', choices=('buffered', 'streamed'))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    import memory
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    client.get(args.path, headers={'X-User-Email': args.email})  # warm the pool and caches
+    tracemalloc.start()
+
+    print(f"{args.path} as {args.email}, median of {args.repeat}\n")
+    print(f"  {'mode':<10} {'ms':>8} {'py peak MB':>11} {'RSS +MB':>8} {'body MB':>8}")
+    for mode in (args.mode,) if args.mode else ('buffered', 'streamed'):
+        memory.RESPONSE_BUDGET_BYTES = 0 if mode == 'buffered' else 1
+        ms, peak, rss_growth, size = run(client, args.path, args.email, args.repeat)
+        print(f"  {mode:<10} {ms:8.1f} {peak / 2**20:11.1f} {rss_growth / 2**20:8.1f} {size / 2**20:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
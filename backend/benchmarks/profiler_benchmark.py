@@ -0,0 +1,121 @@
+"""
+Profiler overhead benchmark: what profiling costs while on and while off.
+
+Runs a CPU-bound workload (JSON round trips of a book list, like a search
+response) in --threads threads for --seconds per mode, interleaving the
+modes for --rounds rounds, and reports median throughput:
+
+  off       no sampler running (the normal state)
+  N Hz      profiler.sample() at each --hz rate, sampling every thread
+
+It then times the per-request cProfile middleware on a request without
+X-Profile against the bare Flask app (a 404, so no database is needed),
+and the same request with X-Profile from an admin.
+
+    python benchmarks/profiler_benchmark.py
+    python benchmarks/profiler_benchmark.py --threads 8 --hz 100 1000
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ADMIN = 'bench-admin@example.com'
+
+BOOKS = [{'id': i, 'title': f'Title {i}', 'author': f'Author {i % 97}', 'genre': 'Fiction',
+          'copies': [{'id': i * 10 + c, 'status': 'Available'} for c in range(3)]}
+         for i in range(200)]
+
+
+def workload(stop, counts, index):
+    done = 0
+    while not stop.is_set():
+        json.loads(json.dumps(BOOKS))
+        done += 1
+    counts[index] = done
+
+
+def throughput(threads, seconds, hz=None):
+    import profiler
+
+    stop = threading.Event()
+    counts = [0] * threads
+    workers = [threading.Thread(target=workload, args=(stop, counts, i)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    samples = 0
+    if hz:
+        _, samples = profiler.sample(seconds, hz, all_threads=True)
+    else:
+        time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds, samples
+
+
+def time_calls(wsgi_app, environ, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for chunk in wsgi_app(dict(environ), lambda status, headers, exc_info=None: None):
+            pass
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--hz', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ['ZOELIBRARYAPP_ADMIN_EMAILS'] = ADMIN
+    os.environ['ZOELIBRARYAPP_PROFILE_DIR'] = tempfile.mkdtemp(prefix='profiler-bench-')
+    logging.disable(logging.CRITICAL)
+
+    modes = [None] + args.hz
+    rates = {hz: [] for hz in modes}
+    samples = {hz: [] for hz in modes}
+    for _ in range(args.rounds):
+        for hz in modes:
+            rate, taken = throughput(args.threads, args.seconds, hz)
+            rates[hz].append(rate)
+            samples[hz].append(taken)
+
+    baseline = statistics.median(rates[None])
+    print(f"Workload: {args.threads} threads, {args.seconds:.0f} s per mode, {args.rounds} rounds\n")
+    print(f"  {'mode':<10} {'ops/s':>10} {'vs off':>8} {'samples':>8}")
+    print(f"  {'off':<10} {baseline:10.0f} {'':>8} {'':>8}")
+    for hz in args.hz:
+        rate = statistics.median(rates[hz])
+        print(f"  {f'{hz} Hz':<10} {rate:10.0f} {(rate / baseline - 1) * 100:7.1f}% "
+              f"{statistics.median(samples[hz]):8.0f}")
+
+    from werkzeug.test import EnvironBuilder
+    from app import create_app
+
+    app = create_app()
+    environ = EnvironBuilder(path='/api/no-such-endpoint', headers={'X-User-Email': ADMIN}).get_environ()
+    profiled = dict(environ, HTTP_X_PROFILE='1')
+    bare = time_calls(app.wsgi_app.wsgi_app, environ, args.repeat)
+    wrapped = time_calls(app.wsgi_app, environ, args.repeat)
+    capture = time_calls(app.wsgi_app, profiled, max(1, args.repeat // 20))
+    print(f"\n  request without middleware: {bare:8.1f} us")
+    print(f"  request, no X-Profile:      {wrapped:8.1f} us ({wrapped - bare:+.1f} us)")
+    print(f"  request with X-Profile:     {capture:8.1f} us (profile saved)")
+
+
+if __name__ == '__main__':
+    main()
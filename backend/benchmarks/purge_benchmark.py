@@ -0,0 +1,116 @@
+"""
+Soft delete and purge benchmark: deleting a book with a long history.
+
+For the tenant --email, adds a book with one copy and --loans returned
+checkouts, then times:
+
+  hard     DELETE FROM books cascading through the whole history, in one
+           transaction (rolled back); this is how long its locks are held
+  soft     DELETE /api/books/<id>'s UPDATE ... SET deleted_at
+  purge    purge.purge_deleted() passes until the book is gone: batches,
+           and time per batch (each its own transaction)
+
+Use a scratch database; the book and its borrower are purged at the end.
+
+    python benchmarks/purge_benchmark.py --email bench@example.com --loans 50000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+
+def seed(cur, user_id, loans):
+    """A book with one copy and `loans` returned checkouts to one borrower."""
+    cur.execute('''
+        INSERT INTO books (user_id, title, author) VALUES (%s, 'Purge benchmark', 'Benchmark')
+        RETURNING id
+    ''', (user_id,))
+    book_id = str(cur.fetchone()['id'])
+    cur.execute('''
+        INSERT INTO book_copies (user_id, book_id, copy_number, status)
+        VALUES (%s, %s, 1, 'Available') RETURNING id
+    ''', (user_id, book_id))
+    copy_id = cur.fetchone()['id']
+    cur.execute('''
+        INSERT INTO borrowers (user_id, first_name, last_name, email, phone)
+        VALUES (%s, 'Purge', 'Benchmark', 'purge-benchmark@example.com', '555-0000') RETURNING id
+    ''', (user_id,))
+    borrower_id = cur.fetchone()['id']
+    cur.execute('''
+        INSERT INTO checkouts (user_id, copy_id, borrower_id, checkout_date, due_date, return_date, status)
+        SELECT %s, %s, %s, out_at, (out_at + INTERVAL '14 days')::date, out_at + INTERVAL '7 days', 'Returned'
+        FROM (SELECT NOW() - make_interval(days => i %% 1000 + 30) AS out_at
+              FROM generate_series(1, %s) i) loans
+    ''', (user_id, copy_id, borrower_id, loans))
+    return book_id, str(borrower_id)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--loans', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from db import connect_direct
+    from purge import pending_purge, purge_deleted
+
+    conn = connect_direct()
+    cur = conn.cursor()
+    cur.execute('SELECT id FROM users WHERE email = %s', (args.email,))
+    user = cur.fetchone()
+    if not user:
+        sys.exit(f"No user {args.email}")
+    user_id = str(user['id'])
+    book_id, borrower_id = seed(cur, user_id, args.loans)
+    conn.commit()
+    print(f"{args.email}: book with {args.loans} checkouts\n")
+
+    started = time.perf_counter()
+    cur.execute('DELETE FROM books WHERE id = %s', (book_id,))
+    hard = time.perf_counter() - started
+    conn.rollback()
+    print(f"  hard delete:  {hard * 1000:9.1f} ms in one transaction")
+
+    started = time.perf_counter()
+    cur.execute('UPDATE books SET deleted_at = NOW() WHERE id = %s AND deleted_at IS NULL', (book_id,))
+    conn.commit()
+    print(f"  soft delete:  {(time.perf_counter() - started) * 1000:9.1f} ms")
+    cur.execute('UPDATE borrowers SET deleted_at = NOW() WHERE id = %s', (borrower_id,))
+    conn.commit()
+
+    passes = batches = 0
+    seconds = 0.0
+    while True:
+        cur.execute('SELECT 1 FROM books WHERE id = %s', (book_id,))
+        if not cur.fetchone():
+            break
+        conn.rollback()
+        summary = purge_deleted(conn, batch_size=args.batch_size, pause=0)
+        if summary is None:
+            sys.exit("Another process is purging this shard; stop the job worker first")
+        passes += 1
+        batches += summary['batches']
+        seconds += summary['seconds']
+    conn.rollback()
+    per_batch = seconds / batches * 1000 if batches else 0
+    print(f"  purge:        {seconds * 1000:9.1f} ms in {batches} batches of {args.batch_size} "
+          f"over {passes} passes, {per_batch:.1f} ms per batch")
+
+    pending = pending_purge(cur)
+    conn.rollback()
+    print(f"\n  still pending on the shard: {pending['books']} books, {pending['borrowers']} borrowers")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
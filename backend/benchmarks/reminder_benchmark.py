@@ -0,0 +1,154 @@
+"""
+Reminder dispatch benchmark: SMTP throughput of the mailer pool.
+
+Sends N reminder-sized messages to an SMTP sink and compares:
+
+  per-message   a new SMTP connection (connect, EHLO, QUIT) for every
+                message, one at a time (what a naive loop does)
+  pool=K        mailer.SMTPPool with K persistent connections sending
+                concurrently, optionally rate-limited
+
+By default it starts its own in-process sink that accepts and discards
+mail, adding --latency-ms per SMTP command to mimic a relay across a
+network. Point --smtp at a real sink (e.g. the mailpit compose profile,
+localhost:1025) to measure that instead. No database is needed.
+
+    python benchmarks/reminder_benchmark.py --count 5000 --latency-ms 2
+    python benchmarks/reminder_benchmark.py --count 2000 --pools 4 --rate 100
+    python benchmarks/reminder_benchmark.py --smtp localhost:1025 --count 1000
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from email.message import EmailMessage
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import smtplib  # noqa: E402
+
+from mailer import RateLimiter, SMTPPool, send_all  # noqa: E402
+
+BODY = '\n'.join(
+    ['Dear Reader,', '', 'Our records show the following items are overdue:', '']
+    + [f'  - Book title number {i} by Some Author (copy {i}), due 2026-09-{i + 10:02d}' for i in range(3)]
+    + ['', 'Please return them at your earliest convenience.', '', 'Your library']
+)
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server that accepts every message and discards it."""
+
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                # One write: split replies stall on delayed ACKs
+                self.reply('250-sink\r\n250 8BITMIME')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                # MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), SinkHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.received = 0
+
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        message = EmailMessage()
+        message['From'] = 'Library <library@example.com>'
+        message['To'] = f'borrower{i}@example.com'
+        message['Subject'] = 'Overdue items: 3 books'
+        message.set_content(BODY)
+        messages.append((i, message))
+    return messages
+
+
+def run_per_message(host, port, messages):
+    started = time.perf_counter()
+    for _, message in messages:
+        with smtplib.SMTP(host, port) as conn:
+            conn.send_message(message)
+    return time.perf_counter() - started, len(messages)
+
+
+def run_pool(host, port, messages, size, rate):
+    pool = SMTPPool(host, port, size)
+    limiter = RateLimiter(rate) if rate else None
+    started = time.perf_counter()
+    failed = sum(1 for _, error in send_all(pool, messages, limiter) if error is not None)
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return elapsed, len(messages) - failed, pool.connects
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='messages per run (default 2000)')
+    parser.add_argument('--pools', default='1,2,4,8', help='pool sizes to try (default 1,2,4,8)')
+    parser.add_argument('--rate', type=float, default=0, help='messages per second cap (default unlimited)')
+    parser.add_argument('--latency-ms', type=float, default=1.0,
+                        help='built-in sink delay per SMTP reply (default 1 ms)')
+    parser.add_argument('--smtp', help='host:port of an external sink instead of the built-in one')
+    parser.add_argument('--skip-per-message', action='store_true', help='skip the connection-per-message baseline')
+    args = parser.parse_args()
+
+    sink = None
+    if args.smtp:
+        host, _, port = args.smtp.partition(':')
+        port = int(port or 25)
+    else:
+        sink = SinkServer(args.latency_ms / 1000)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        host, port = sink.server_address
+        print(f"Built-in SMTP sink on {host}:{port}, {args.latency_ms} ms per reply")
+
+    messages = make_messages(args.count)
+    print(f"Sending {args.count} messages per run\n")
+    print(f"  {'mode':<16} {'seconds':>9} {'msg/s':>9} {'sent':>7} {'connections':>12}")
+
+    if not args.skip_per_message:
+        elapsed, sent = run_per_message(host, port, messages)
+        print(f"  {'per-message':<16} {elapsed:9.2f} {sent / elapsed:9.0f} {sent:7} {sent:12}")
+
+    for size in (int(s) for s in args.pools.split(',')):
+        elapsed, sent, connects = run_pool(host, port, messages, size, args.rate)
+        print(f"  {f'pool={size}':<16} {elapsed:9.2f} {sent / elapsed:9.0f} {sent:7} {connects:12}")
+
+    if sink is not None:
+        sink.shutdown()
+
+
+if __name__ == '__main__':
+    main()
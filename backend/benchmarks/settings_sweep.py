@@ -0,0 +1,80 @@
+"""
+Run the load benchmark against gunicorn at several worker settings.
+
+Starts gunicorn (gunicorn_config.py) once per combination of worker class,
+workers and threads, waits for /api/health, runs load_benchmark.run_load and
+prints one table row per setting. Needs the ZOELIBRARYAPP_DB_* variables
+and a database seeded with representative data.
+
+    python benchmarks/settings_sweep.py --concurrency 32 --duration 20
+    python benchmarks/settings_sweep.py --settings sync:9:1 gthread:3:4 gthread:5:8
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from load_benchmark import run_load  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SETTINGS = ['sync:5:1', 'sync:9:1', 'gthread:3:4', 'gthread:5:4', 'gthread:3:8']
+
+
+def wait_for_health(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + '/api/health', timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--settings', nargs='+', default=DEFAULT_SETTINGS,
+                        help='worker_class:workers:threads combinations')
+    parser.add_argument('--port', default='5099')
+    parser.add_argument('--email', default='bench@example.com')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    url = f'http://127.0.0.1:{args.port}'
+    columns = ('setting', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'errors',
+               'avg_saturation', 'max_pool_waiting', 'max_listen_queue')
+    print(' | '.join(columns))
+    print(' | '.join('---' for _ in columns))
+
+    for setting in args.settings:
+        worker_class, workers, threads = setting.split(':')
+        env = dict(os.environ,
+                   ZOELIBRARYAPP_BACKEND_PORT=args.port,
+                   ZOELIBRARYAPP_WORKER_CLASS=worker_class,
+                   ZOELIBRARYAPP_WORKERS=workers,
+                   ZOELIBRARYAPP_THREADS=threads)
+        server = subprocess.Popen(
+            ['gunicorn', '--config', 'gunicorn_config.py', '--access-logfile', '/dev/null', 'wsgi:app'],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            if not wait_for_health(url):
+                print(f'{setting} | failed to start')
+                continue
+            result = run_load(url, args.email, args.concurrency, args.duration)
+            print(' | '.join([setting] + [str(result[c]) for c in columns[1:]]))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
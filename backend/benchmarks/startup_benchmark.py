@@ -0,0 +1,117 @@
+"""
+Startup-time benchmark: import-to-first-request latency.
+
+Compares the two ways a gunicorn worker can come up:
+
+  cold    a fresh interpreter imports the app, builds it and serves its
+          first request (what every recycled worker paid before preload_app)
+  forked  the app is built once in a parent process; each worker is a fork
+          that serves its first request, with and without warm_up()
+
+Run from the backend directory with the usual ZOELIBRARYAPP_DB_* variables:
+
+    python benchmarks/startup_benchmark.py --runs 20
+    python benchmarks/startup_benchmark.py --path /api/user --email bench@example.com
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import traceback
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+COLD_RUN = '''
+import json, sys, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+app = app_module.create_app()
+t2 = time.perf_counter()
+with app.test_client() as client:
+    client.get(sys.argv[1], headers=json.loads(sys.argv[2]))
+t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2, "total": t3 - t0}))
+'''
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    print(f"  {label:<28} median {statistics.median(samples) * 1000:8.1f} ms"
+          f"   p95 {p95 * 1000:8.1f} ms   max {samples[-1] * 1000:8.1f} ms")
+
+
+def run_cold(runs, path, headers):
+    results = {}
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', COLD_RUN, path, json.dumps(headers)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        for key, value in json.loads(out.stdout.strip().splitlines()[-1]).items():
+            results.setdefault(key, []).append(value)
+    return results
+
+
+def run_forked(runs, path, headers, warm):
+    from app import create_app, warm_up
+
+    app = create_app()
+    samples = []
+    for _ in range(runs):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Never return into the parent's loop, whatever happens here
+            status = 1
+            try:
+                os.close(read_fd)
+                if warm:
+                    warm_up(app)
+                t0 = time.perf_counter()
+                with app.test_client() as client:
+                    client.get(path, headers=headers)
+                os.write(write_fd, repr(time.perf_counter() - t0).encode())
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            sample = pipe.read()
+        _, status = os.waitpid(pid, 0)
+        if status or not sample:
+            raise RuntimeError(f"forked run failed (wait status {status})")
+        samples.append(float(sample))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--email', help='X-User-Email header for authenticated paths')
+    args = parser.parse_args()
+
+    headers = {'X-User-Email': args.email} if args.email else {}
+
+    print(f"Startup benchmark: {args.runs} runs, first request GET {args.path}")
+
+    print("cold interpreter (import + create_app + first request):")
+    cold = run_cold(args.runs, args.path, headers)
+    for key in ('import', 'create_app', 'first_request', 'total'):
+        summarize(key, cold[key])
+
+    print("forked from preloaded app:")
+    summarize('first request, no warm-up', run_forked(args.runs, args.path, headers, warm=False))
+    summarize('first request after warm_up', run_forked(args.runs, args.path, headers, warm=True))
+
+
+if __name__ == '__main__':
+    main()
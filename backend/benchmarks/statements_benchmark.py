@@ -0,0 +1,123 @@
+"""
+Prepared statement benchmark: per-query latency, plain vs prepared.
+
+Talks to the database directly (no Flask) as the user --email, and for each
+path times --repeat calls with plain cur.execute(sql) and with the
+PreparedStatement from the route, alternating for --rounds rounds:
+
+  scan      book_by_barcode for one of the user's barcodes
+  checkout  copy_status, insert_checkout and mark_copy_checked_out for one
+            of the user's available copies, rolled back after each call
+
+It then prints the server's generic/custom plan counts for the prepared
+statements (pg_prepared_statements, PostgreSQL 14+).
+
+Use a tenant that has books with copies and a borrower (e.g. after
+analytics_benchmark.py --seed).
+
+    python benchmarks/statements_benchmark.py --email bench@example.com
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+
+def fixtures(cur, email):
+    cur.execute('SELECT id FROM users WHERE email = %s', (email,))
+    user = cur.fetchone()
+    if not user:
+        sys.exit(f"No user {email}")
+    user_id = str(user['id'])
+    cur.execute('''
+        SELECT b.barcode, bc.id AS copy_id
+        FROM books b JOIN book_copies bc ON bc.book_id = b.id
+        WHERE b.user_id = %s AND b.barcode IS NOT NULL AND bc.status = 'Available'
+        LIMIT 1
+    ''', (user_id,))
+    book = cur.fetchone()
+    cur.execute('SELECT id FROM borrowers WHERE user_id = %s LIMIT 1', (user_id,))
+    borrower = cur.fetchone()
+    if not book or not borrower:
+        sys.exit(f"{email} needs a book with a barcode, an available copy and a borrower")
+    return user_id, book['barcode'], str(book['copy_id']), str(borrower['id'])
+
+
+def run_statement(cur, statement, params, prepared):
+    if prepared:
+        statement.execute(cur, params)
+    else:
+        cur.execute(statement.sql, params)
+
+
+def scan(conn, cur, prepared, f):
+    from routes.books import BOOK_BY_BARCODE
+
+    run_statement(cur, BOOK_BY_BARCODE, (f['barcode'], f['user_id']), prepared)
+    cur.fetchone()
+    conn.rollback()
+
+
+def checkout(conn, cur, prepared, f):
+    from routes.circulation import COPY_STATUS, INSERT_CHECKOUT, MARK_COPY_CHECKED_OUT
+
+    run_statement(cur, COPY_STATUS, (f['borrower_id'], f['copy_id'], f['user_id']), prepared)
+    cur.fetchone()
+    run_statement(cur, INSERT_CHECKOUT, (f['copy_id'], f['borrower_id'], f['user_id'], date.today(), None), prepared)
+    cur.fetchone()
+    run_statement(cur, MARK_COPY_CHECKED_OUT, (f['copy_id'],), prepared)
+    conn.rollback()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--repeat', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from db import connect_direct
+    from statements import server_plan_stats
+
+    conn = connect_direct()
+    cur = conn.cursor()
+    user_id, barcode, copy_id, borrower_id = fixtures(cur, args.email)
+    conn.rollback()
+    f = {'user_id': user_id, 'barcode': barcode, 'copy_id': copy_id, 'borrower_id': borrower_id}
+
+    paths = {'scan': scan, 'checkout': checkout}
+    times = {(name, prepared): [] for name in paths for prepared in (False, True)}
+    for _ in range(args.rounds):
+        for name, path in paths.items():
+            for prepared in (False, True):
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    path(conn, cur, prepared, f)
+                    times[(name, prepared)].append(time.perf_counter() - started)
+
+    print(f"{args.email}, median of {args.repeat * args.rounds} calls per path\n")
+    print(f"  {'path':<10} {'plain us':>10} {'prepared us':>12} {'change':>8}")
+    for name in paths:
+        plain = statistics.median(times[(name, False)]) * 1e6
+        prepared = statistics.median(times[(name, True)]) * 1e6
+        print(f"  {name:<10} {plain:10.0f} {prepared:12.0f} {(prepared / plain - 1) * 100:7.1f}%")
+
+    print(f"\n  {'statement':<24} {'generic plans':>14} {'custom plans':>13}")
+    for row in server_plan_stats(cur):
+        print(f"  {row['name']:<24} {row['generic_plans']:14d} {row['custom_plans']:13d}")
+    conn.rollback()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request, current_app
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# CACHE BACKENDS
+# =============================================================================
+#
+# ZOELIBRARYAPP_CACHE_URL selects the backend shared by all gunicorn workers:
+#
+#   (unset)            caching disabled
+#   memory://          in-process dict; for tests and single-process dev only,
+#                      since each worker would keep its own copy
+#   redis://host:port  any Redis-protocol server (Redis, Valkey, KeyDB, ...)
+#
+# Backends store bytes. Every cache failure is treated as a miss so the app
+# keeps working if the cache server goes away. They also hold the rate-limit
+# buckets and concurrency slots shared by all workers (admission.py).
+
+KEY_PREFIX = 'library'
+
+
+class NullCache:
+    """Cache that stores nothing."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def delete(self, key):
+        pass
+
+    def throttle(self, key, interval, tolerance):
+        return 0.0
+
+    def acquire_slot(self, key, token, limit, ttl):
+        return True
+
+    def release_slot(self, key, token):
+        pass
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache with per-key TTL. Counters (incr) are
+    kept apart and never evicted, like Redis with volatile-lru.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return str(self._counters[key]).encode()
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._counters.pop(key, None)
+
+    def throttle(self, key, interval, tolerance):
+        """
+        Generic cell rate algorithm: admit one event every `interval` seconds,
+        `tolerance` seconds ahead at most. Returns 0.0 if admitted, else the
+        seconds until it would be.
+        """
+        with self._lock:
+            now = time.monotonic()
+            item = self._data.get(key)
+            tat = item[1] if item is not None and item[0] >= now else now
+            tat = max(tat, now) + interval
+            wait = tat - tolerance - now
+            if wait > 0:
+                return wait
+            self._data[key] = (now + tolerance + interval, tat)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return 0.0
+
+    def acquire_slot(self, key, token, limit, ttl):
+        """Hold one of `limit` slots under `token`; slots not released expire after `ttl`."""
+        with self._lock:
+            now = time.monotonic()
+            slots = self._slots.setdefault(key, {})
+            for held, since in list(slots.items()):
+                if since < now - ttl:
+                    del slots[held]
+            if len(slots) >= limit:
+                return False
+            slots[token] = now
+            return True
+
+    def release_slot(self, key, token):
+        with self._lock:
+            self._slots.get(key, {}).pop(token, None)
+
+
+class RedisCache:
+    """Redis-protocol backend (requires the `redis` package)."""
+
+    # The same algorithms as MemoryCache, atomic on the server and timed by
+    # its clock, so every worker (and host) sees one bucket per key
+    THROTTLE_SCRIPT = '''
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local interval, tolerance = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + interval
+        local wait = tat - tolerance - now
+        if wait > 0 then return tostring(wait) end
+        redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tolerance + interval) * 1000))
+        return '0'
+    '''
+    ACQUIRE_SCRIPT = '''
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local limit, ttl = tonumber(ARGV[2]), tonumber(ARGV[3])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+        if redis.call('ZCARD', KEYS[1]) >= limit then return 0 end
+        redis.call('ZADD', KEYS[1], now, ARGV[1])
+        redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+        return 1
+    '''
+
+    def __init__(self, url):
+        import redis
+
+        # Short timeouts: a slow cache must never be slower than the database
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+        self._throttle = self._client.register_script(self.THROTTLE_SCRIPT)
+        self._acquire = self._client.register_script(self.ACQUIRE_SCRIPT)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, value, ex=ttl)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def throttle(self, key, interval, tolerance):
+        return float(self._throttle(keys=[key], args=[interval, tolerance]))
+
+    def acquire_slot(self, key, token, limit, ttl):
+        return bool(self._acquire(keys=[key], args=[token, limit, ttl]))
+
+    def release_slot(self, key, token):
+        self._client.zrem(key, token)
+
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_cache():
+    """Return this process's cache backend, creating it on first use."""
+    global _backend, _backend_pid
+
+    if _backend is not None and _backend_pid == os.getpid():
+        return _backend
+
+    with _backend_lock:
+        if _backend is None or _backend_pid != os.getpid():
+            url = os.getenv('ZOELIBRARYAPP_CACHE_URL', '').strip()
+            if not url:
+                _backend = NullCache()
+            elif url.startswith('memory://'):
+                _backend = MemoryCache()
+            elif url.startswith(('redis://', 'rediss://', 'unix://')):
+                _backend = RedisCache(url)
+            else:
+                raise ValueError(f"Unsupported ZOELIBRARYAPP_CACHE_URL: {url}")
+            _backend_pid = os.getpid()
+        return _backend
+
+# =============================================================================
+# CACHE REGIONS
+# =============================================================================
+
+class CacheRegion:
+    """A named slice of the cache with its own TTL and hit/miss counters."""
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def key(self, *parts):
+        return ':'.join([KEY_PREFIX, self.name] + [str(p) for p in parts])
+
+    def get(self, key):
+        try:
+            value = get_cache().get(key)
+        except Exception as e:
+            logger.warning(f"Cache get failed ({self.name}): {str(e)}")
+            self._count('errors')
+            return None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        try:
+            get_cache().set(key, value, self.ttl)
+        except Exception as e:
+            logger.warning(f"Cache set failed ({self.name}): {str(e)}")
+            self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+USERS = CacheRegion('users', ttl=300)
+DASHBOARD = CacheRegion('dashboard', ttl=60)
+BOOK_LISTS = CacheRegion('books', ttl=120)
+BARCODES = CacheRegion('barcodes', ttl=300)
+# Rollups change only when the job worker refreshes them (analytics.py)
+ANALYTICS = CacheRegion('analytics', ttl=300)
+# Each user's latest primary WAL position, for replica read-your-writes (db.py)
+WRITE_POSITIONS = CacheRegion('lsn', ttl=60)
+
+REGIONS = (USERS, DASHBOARD, BOOK_LISTS, BARCODES, ANALYTICS, WRITE_POSITIONS)
+
+
+def cache_stats():
+    """Per-region hit/miss counters for this worker."""
+    return {region.name: region.stats() for region in REGIONS}
+
+# =============================================================================
+# PER-USER NAMESPACES
+# =============================================================================
+#
+# Cached responses are keyed under the user's namespace version. A successful
+# write by the user bumps the version with one INCR on the shared backend, so
+# every worker's next read looks up fresh keys; stale entries expire by TTL.
+
+def _namespace_key(user_id):
+    return f'{KEY_PREFIX}:ns:{user_id}'
+
+
+def user_namespace(user_id):
+    """
+    Current namespace version for a user (memoized per request), or None
+    if the cache cannot be reached and should be bypassed.
+    """
+    if 'cache_namespace' not in g:
+        try:
+            version = get_cache().get(_namespace_key(user_id))
+            g.cache_namespace = int(version) if version is not None else 0
+        except Exception as e:
+            logger.warning(f"Cache namespace lookup failed: {str(e)}")
+            g.cache_namespace = None
+    return g.cache_namespace
+
+
+def bump_user_namespace(user_id):
+    """Invalidate every cached read for a user, in all workers."""
+    try:
+        get_cache().incr(_namespace_key(user_id))
+    except Exception as e:
+        logger.warning(f"Cache namespace bump failed: {str(e)}")
+    g.pop('cache_namespace', None)
+
+
+# POST endpoints that only dispatch other requests, which invalidate for themselves
+PASS_THROUGH_PATHS = ('/api/batch',)
+
+
+def invalidate_after_write(response):
+    """after_request hook: a successful write invalidates the user's namespace."""
+    if (request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and request.path not in PASS_THROUGH_PATHS
+            and response.status_code < 400
+            and g.get('user_id') is not None):
+        bump_user_namespace(g.user_id)
+    return response
+
+
+def cached_response(region, key_func=lambda *args, **kwargs: ''):
+    """
+    Cache a view's 200 JSON response body in `region`, under the current
+    user's namespace. Apply below @token_required so g.user_id is set.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            namespace = user_namespace(g.user_id)
+            if namespace is None:
+                return f(*args, **kwargs)
+            key = region.key(g.user_id, namespace, key_func(*args, **kwargs))
+
+            body = region.get(key)
+            if body is not None:
+                return current_app.response_class(body, mimetype='application/json')
+
+            response = current_app.make_response(f(*args, **kwargs))
+            # A streamed body (memory.rows_response) is too big to cache
+            if (response.status_code == 200 and response.mimetype == 'application/json'
+                    and not response.is_streamed):
+                region.set(key, response.get_data())
+            return response
+
+        return decorated
+    return decorator
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import queue
+import select
+import logging
+import threading
+
+import psycopg2.extensions
+
+from db import connect_direct, get_db_connection
+from server_config import load_server_config
+from shards import shard_addresses
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# CHANGE FEED
+# =============================================================================
+#
+# Triggers on books, book_copies, checkouts, borrowers and follow_ups record
+# each change in change_events and NOTIFY it on the library_changes channel
+# (database/migrations/add_change_events.sql). Each worker runs one listener
+# thread per shard on its own connection and fans notifications out to the
+# event streams of the user they belong to. Events are compact hints
+# ({id, table, op, row_id}); clients apply them idempotently. Event ids are
+# per shard, so the SSE id is '<shard>:<id>'; a client resuming with an id
+# from another shard (its tenant was moved) is told to reset.
+#
+# A stream that falls behind, or that was open while the listener was
+# reconnecting, replays what it missed from change_events by event id.
+# Ids are taken when a row is written but become visible at commit, so a
+# transaction can commit an event below an id the client has already seen.
+# Replays therefore re-read the REPLAY_OVERLAP_SECONDS before the resume
+# point as well; clients skip event ids they have already applied.
+
+CHANNEL = 'library_changes'
+SUBSCRIBER_QUEUE_SIZE = 1000
+POLL_SECONDS = 5.0
+PRUNE_INTERVAL_SECONDS = 600
+RETENTION_HOURS = int(os.getenv('ZOELIBRARYAPP_EVENTS_RETENTION_HOURS', '24'))
+# Longer than any transaction that writes to the change-tracked tables
+REPLAY_OVERLAP_SECONDS = int(os.getenv('ZOELIBRARYAPP_EVENTS_REPLAY_OVERLAP_SECONDS', '60'))
+
+
+class Subscription:
+    """One open event stream: a bounded queue plus a flag asking for a replay."""
+
+    def __init__(self, user_id, shard):
+        self.user_id = user_id
+        self.shard = shard
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.needs_replay = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Too slow to keep up: discard the backlog and replay from the table
+            self.request_replay()
+
+    def request_replay(self):
+        self.needs_replay = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        # Wake the stream so it notices the flag
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class ChangeListener:
+    """Per-worker LISTEN loop that dispatches notifications to subscriptions."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._pid = None
+        self.connected = {}
+        self.notifications = 0
+        self.reconnects = {}
+
+    def subscribe(self, user_id, shard):
+        self.start()
+        subscription = Subscription(user_id, shard)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def stream_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stats(self):
+        return {
+            'connected': dict(self.connected),
+            'streams': self.stream_count(),
+            'notifications': self.notifications,
+            'reconnects': dict(self.reconnects),
+        }
+
+    def _running(self):
+        return self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads.values())
+
+    def start(self):
+        """Start this process's listener threads (one per shard) if they are not running."""
+        # Threads do not survive a fork; start them once per worker process
+        if self._running():
+            return
+        with self._lock:
+            if self._running():
+                return
+            if self._pid != os.getpid():
+                self._subscribers = {}
+                self._threads = {}
+            self._pid = os.getpid()
+            for shard in shard_addresses():
+                if shard not in self._threads or not self._threads[shard].is_alive():
+                    thread = threading.Thread(target=self._run, args=(shard,), name=f'change-listener-{shard}', daemon=True)
+                    self._threads[shard] = thread
+                    thread.start()
+
+    def _dispatch(self, shard, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed change notification: {payload[:200]}")
+            return
+        self.notifications += 1
+        user_id = event.pop('user_id', None)
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            if subscription.shard == shard:
+                subscription.push(event)
+
+    def _request_replay_all(self):
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        for subscription in subscribers:
+            subscription.request_replay()
+
+    def _run(self, shard):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = connect_direct(shard)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {CHANNEL}')
+                if self.reconnects.get(shard):
+                    # Notifications sent while we were disconnected are lost
+                    self._request_replay_all()
+                self.connected[shard] = True
+                backoff = 1
+                logger.info(f"Change listener connected to shard {shard} (pid {os.getpid()})")
+
+                last_prune = 0.0
+                while True:
+                    if select.select([conn], [], [], POLL_SECONDS)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._dispatch(shard, conn.notifies.pop(0).payload)
+                    if time.monotonic() - last_prune > PRUNE_INTERVAL_SECONDS:
+                        prune_expired(cur)
+                        last_prune = time.monotonic()
+
+            except Exception as e:
+                logger.warning(f"Change listener for shard {shard} disconnected: {str(e)}")
+                self.connected[shard] = False
+                self.reconnects[shard] = self.reconnects.get(shard, 0) + 1
+                if conn is not None and not conn.closed:
+                    conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+def prune_expired(cur):
+    """Delete change events past their retention (other tables: purge.prune_retained)."""
+    cur.execute(
+        'DELETE FROM change_events WHERE created_at < NOW() - make_interval(hours => %s)',
+        (RETENTION_HOURS,)
+    )
+
+
+listener = ChangeListener()
+
+# =============================================================================
+# EVENT STREAMS
+# =============================================================================
+
+def latest_event_id():
+    """Id of the newest recorded event (the resume point for a new client)."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT COALESCE(MAX(id), 0) AS id FROM change_events')
+    event_id = cur.fetchone()['id']
+    cur.close()
+    conn.close()
+    return event_id
+
+
+def events_since(user_id, last_id):
+    """
+    The user's events after `last_id`, plus those created up to
+    REPLAY_OVERLAP_SECONDS before it (they may have committed after it), and
+    whether older events they may not have seen were already pruned (the
+    client must then refetch everything).
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT MIN(id) AS id FROM change_events')
+    oldest = cur.fetchone()['id']
+    cur.execute('''
+        SELECT id, table_name AS "table", operation AS op, row_id
+        FROM change_events
+        WHERE user_id = %s
+          AND (id > %s OR created_at >= (
+              SELECT created_at - make_interval(secs => %s) FROM change_events WHERE id = %s
+          ))
+        ORDER BY id
+    ''', (user_id, last_id, REPLAY_OVERLAP_SECONDS, last_id))
+    events = cur.fetchall()
+    cur.close()
+    conn.close()
+    return events, oldest is not None and oldest > last_id + 1
+
+
+def format_event_id(shard, event_id):
+    return f'{shard}:{event_id}'
+
+
+def parse_event_id(value, shard):
+    """
+    Numeric event id from a Last-Event-ID, or None if it was issued by
+    another shard. Raises ValueError if malformed.
+    """
+    event_shard, _, event_id = value.rpartition(':')
+    event_id = int(event_id)
+    return event_id if event_shard in ('', shard) else None
+
+
+def format_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def can_hold_stream():
+    """Whether this worker has a thread to spare for another open stream."""
+    return listener.stream_count() < load_server_config()['max_event_streams']
+
+
+def event_stream(user_id, shard, last_id, hold, retry_ms, reset_reason=None):
+    """
+    Generate Server-Sent Events for a user on their shard. Replays anything
+    after `last_id` first; when `hold` is set, then follows live
+    notifications until the stream lifetime ends (the client reconnects with
+    Last-Event-ID).
+    """
+    subscription = listener.subscribe(user_id, shard) if hold else None
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        if reset_reason:
+            yield format_event('reset', {'reason': reset_reason})
+
+        sent = set()
+        events, reset = events_since(user_id, last_id)
+        if reset:
+            yield format_event('reset', {'reason': 'events pruned'})
+        for event in events:
+            sent.add(event['id'])
+            last_id = max(last_id, event['id'])
+            yield format_event('change', event, format_event_id(shard, last_id))
+        yield format_event('ready', {'last_event_id': format_event_id(shard, last_id)}, format_event_id(shard, last_id))
+
+        if subscription is None:
+            return
+
+        deadline = time.monotonic() + load_server_config()['event_stream_seconds']
+        while time.monotonic() < deadline:
+            if subscription.needs_replay:
+                subscription.needs_replay = False
+                events, reset = events_since(user_id, last_id)
+                if reset:
+                    yield format_event('reset', {'reason': 'events pruned'})
+                for event in events:
+                    if event['id'] in sent:
+                        continue
+                    sent.add(event['id'])
+                    last_id = max(last_id, event['id'])
+                    yield format_event('change', event, format_event_id(shard, last_id))
+                continue
+
+            try:
+                event = subscription.queue.get(timeout=min(15.0, max(0.1, deadline - time.monotonic())))
+            except queue.Empty:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keepalive\n\n'
+                continue
+
+            if event is None or event['id'] in sent:
+                continue
+            sent.add(event['id'])
+            last_id = max(last_id, event['id'])
+            yield format_event('change', event, format_event_id(shard, last_id))
+    finally:
+        if subscription is not None:
+            listener.unsubscribe(subscription)
@@ -0,0 +1,333 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from isbn import isbn10
+from mailer import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# COVER IMAGES
+# =============================================================================
+#
+# Book covers are fetched once per ISBN from a provider, reduced to fixed
+# thumbnail sizes and stored on disk by the hash of the source image:
+#
+#   <cover dir>/isbn/<last 3 digits>/<isbn13>     hash of its cover ('' = none)
+#   <cover dir>/objects/<hash[:2]>/<hash>-<size>.jpg  one thumbnail
+#
+# Editions sharing an image share its thumbnails. Thumbnails never change
+# under a name, so they are served with long-lived cache headers: through
+# nginx (X-Accel-Redirect, so the kernel sends the file) when
+# ZOELIBRARYAPP_COVER_ACCEL_PREFIX is set, otherwise from the app, which
+# keeps the hottest ones in a per-worker LRU bounded by
+# ZOELIBRARYAPP_COVER_MEMORY_MB.
+#
+# ZOELIBRARYAPP_COVER_PROVIDER selects where covers come from:
+#
+#   openlibrary   covers.openlibrary.org (default)
+#   local         image files named <isbn>.jpg/.png in
+#                 ZOELIBRARYAPP_COVER_SOURCE_DIR; for tests and offline installs
+#   none          no covers
+
+CACHE_DIR = os.getenv('ZOELIBRARYAPP_COVER_DIR', '/tmp/library-covers')
+ACCEL_PREFIX = os.getenv('ZOELIBRARYAPP_COVER_ACCEL_PREFIX', '').strip()
+MEMORY_BYTES = int(float(os.getenv('ZOELIBRARYAPP_COVER_MEMORY_MB', '16')) * 1024 * 1024)
+# "No cover" is remembered this long before the provider is asked again
+MISS_TTL = int(os.getenv('ZOELIBRARYAPP_COVER_MISS_TTL_HOURS', '24')) * 3600
+# Provider requests per second per worker, and how long a request may wait for one
+FETCH_RATE = float(os.getenv('ZOELIBRARYAPP_COVER_FETCH_RATE', '1'))
+FETCH_WAIT = 2.0
+
+# Bounding boxes (width, height) in pixels; aspect ratio is kept
+SIZES = {
+    's': (60, 90),
+    'm': (120, 180),
+    'l': (240, 360),
+}
+DEFAULT_SIZE = 'm'
+JPEG_QUALITY = 85
+MIN_SOURCE_PIXELS = 16
+
+
+class CoverUnavailable(Exception):
+    """The provider could not be asked right now (network error, rate limit)."""
+
+# =============================================================================
+# PROVIDERS
+# =============================================================================
+#
+# A provider's fetch(isbn13) returns the source image bytes, None when it
+# has no cover for the ISBN, or raises CoverUnavailable when it cannot tell.
+
+class OpenLibraryProvider:
+    """Open Library's cover API (large size; `default=false` makes a missing cover a 404)."""
+
+    URL = 'https://covers.openlibrary.org/b/isbn/{isbn}-L.jpg?default=false'
+
+    def __init__(self, timeout=5):
+        import requests
+
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.headers['User-Agent'] = 'library-app cover cache'
+
+    def fetch(self, isbn):
+        try:
+            response = self._session.get(self.URL.format(isbn=isbn), timeout=self.timeout)
+        except Exception as e:
+            raise CoverUnavailable(f'Open Library: {str(e)}')
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise CoverUnavailable(f'Open Library: HTTP {response.status_code}')
+        return response.content
+
+
+class LocalDirectoryProvider:
+    """Image files named by ISBN-13 or ISBN-10 (.jpg, .jpeg or .png) in one directory."""
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, isbn):
+        for name in filter(None, (isbn, isbn10(isbn))):
+            for extension in self.EXTENSIONS:
+                path = os.path.join(self.directory, name + extension)
+                try:
+                    with open(path, 'rb') as f:
+                        return f.read()
+                except FileNotFoundError:
+                    continue
+        return None
+
+
+class NoProvider:
+    def fetch(self, isbn):
+        return None
+
+
+_provider = None
+_provider_pid = None
+_provider_lock = threading.Lock()
+_limiter = RateLimiter(FETCH_RATE, burst=max(1.0, FETCH_RATE * 5))
+
+
+def get_provider():
+    """This process's cover provider, created on first use."""
+    global _provider, _provider_pid
+
+    if _provider is not None and _provider_pid == os.getpid():
+        return _provider
+
+    with _provider_lock:
+        if _provider is None or _provider_pid != os.getpid():
+            name = os.getenv('ZOELIBRARYAPP_COVER_PROVIDER', 'openlibrary').strip().lower()
+            if name == 'openlibrary':
+                _provider = OpenLibraryProvider()
+            elif name == 'local':
+                _provider = LocalDirectoryProvider(os.getenv('ZOELIBRARYAPP_COVER_SOURCE_DIR', '/covers'))
+            elif name == 'none':
+                _provider = NoProvider()
+            else:
+                raise ValueError(f"Unsupported ZOELIBRARYAPP_COVER_PROVIDER: {name}")
+            _provider_pid = os.getpid()
+        return _provider
+
+# =============================================================================
+# THUMBNAILS
+# =============================================================================
+
+def derive_thumbnails(data):
+    """
+    JPEG thumbnails of every size from source image bytes. Raises ValueError
+    for data that is not an image (or is too small to be a real cover).
+    """
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder scale down while decoding: much faster than
+        # decoding a full-size scan and resizing it
+        image.draft('RGB', max(SIZES.values()))
+        image = image.convert('RGB')
+    except Exception as e:
+        raise ValueError(f'not an image: {str(e)}')
+    if min(image.size) < MIN_SOURCE_PIXELS:
+        raise ValueError(f'image too small ({image.size[0]}x{image.size[1]})')
+
+    thumbnails = {}
+    # Largest first; each smaller size is reduced from the one before
+    for size, box in sorted(SIZES.items(), key=lambda item: -item[1][0]):
+        image.thumbnail(box, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        thumbnails[size] = output.getvalue()
+    return thumbnails
+
+# =============================================================================
+# DISK STORE
+# =============================================================================
+
+def _index_path(isbn):
+    return os.path.join(CACHE_DIR, 'isbn', isbn[-3:], isbn)
+
+
+def object_path(digest, size):
+    """Thumbnail path relative to the cover directory (also the X-Accel-Redirect path)."""
+    return f'objects/{digest[:2]}/{digest}-{size}.jpg'
+
+
+def _write(path, data):
+    """Write atomically: readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_index(isbn):
+    """
+    The indexed hash for an ISBN, '' for a remembered "no cover", or None
+    when the ISBN has not been looked up (or its "no cover" has expired).
+    """
+    path = _index_path(isbn)
+    try:
+        with open(path) as f:
+            digest = f.read().strip()
+        if not digest and os.path.getmtime(path) < time.time() - MISS_TTL:
+            return None
+        return digest
+    except FileNotFoundError:
+        return None
+
+
+def _store(isbn, data):
+    """Derive and store thumbnails for an ISBN's source image; returns its hash ('' if unusable)."""
+    digest = ''
+    if data:
+        try:
+            thumbnails = derive_thumbnails(data)
+        except ValueError as e:
+            logger.warning(f"Cover for {isbn} not usable: {str(e)}")
+        else:
+            digest = hashlib.sha256(data).hexdigest()
+            for size, thumbnail in thumbnails.items():
+                path = os.path.join(CACHE_DIR, object_path(digest, size))
+                if not os.path.exists(path):
+                    _write(path, thumbnail)
+            for size, thumbnail in thumbnails.items():
+                thumbnail_cache.put((digest, size), thumbnail)
+    # The index last, so it never names thumbnails that are not on disk yet
+    _write(_index_path(isbn), digest.encode())
+    return digest
+
+
+def _indexed(isbn):
+    """The index entry for an ISBN if usable (its thumbnails still on disk), else None."""
+    digest = _read_index(isbn)
+    if digest and not os.path.exists(os.path.join(CACHE_DIR, object_path(digest, DEFAULT_SIZE))):
+        return None
+    return digest
+
+
+# Concurrent first requests for one ISBN fetch once per worker; other
+# workers may fetch it too, which is harmless since writes are atomic
+_fetch_locks = [threading.Lock() for _ in range(64)]
+
+
+def resolve_cover(isbn):
+    """
+    Hash of the cover for an ISBN-13, fetching and deriving it on first use;
+    '' if the provider has none. Raises CoverUnavailable if it cannot be
+    fetched now.
+    """
+    digest = _indexed(isbn)
+    if digest is not None:
+        return digest
+
+    with _fetch_locks[hash(isbn) % len(_fetch_locks)]:
+        digest = _indexed(isbn)
+        if digest is not None:
+            return digest
+        if not _limiter.acquire(timeout=FETCH_WAIT):
+            raise CoverUnavailable('cover fetch rate limit reached')
+        started = time.monotonic()
+        data = get_provider().fetch(isbn)
+        digest = _store(isbn, data)
+        logger.info(f"Cover for {isbn}: {'stored' if digest else 'none'} in {time.monotonic() - started:.2f} s")
+        return digest
+
+# =============================================================================
+# HOT THUMBNAIL CACHE
+# =============================================================================
+
+class ThumbnailCache:
+    """Thread-safe LRU of thumbnail bytes, bounded by total size rather than count."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._data[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+thumbnail_cache = ThumbnailCache(MEMORY_BYTES)
+
+
+def load_thumbnail(digest, size):
+    """Read a thumbnail from disk into the LRU and return it."""
+    with open(os.path.join(CACHE_DIR, object_path(digest, size)), 'rb') as f:
+        data = f.read()
+    thumbnail_cache.put((digest, size), data)
+    return data
@@ -0,0 +1,484 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.errors import QueryCanceled
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from flask import g, request, current_app, has_app_context, has_request_context
+
+from cache import WRITE_POSITIONS
+from server_config import load_server_config
+from shards import DEFAULT_SHARD, shard_addresses
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# CONNECTION POOL
+# =============================================================================
+#
+# One pool per shard per worker process (see shards.py; most installs only
+# have the default shard). Pools are never created at import time:
+# with gunicorn's preload_app the master imports the app and forks, and
+# sockets opened before the fork would be shared by every worker. Workers
+# open their pool in the post_fork hook (see gunicorn_config.py); anything
+# else (flask dev server, scripts) opens it on first use.
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_shard_pools = {}
+_replicas = []
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    Connection whose close() hands it back to the pool instead of closing
+    the socket, so existing `conn.close()` calls keep working unchanged.
+    While shared (see shared_connection) close() only ends the transaction.
+    `_owner` is the g of the request holding it (see deadlines.py); it is
+    cleared under `_owner_lock`, which a cancel holds while it checks the
+    owner and cancels, so no cancel reaches the connection's next request.
+    """
+    _pool = None
+    _shared = False
+    _owner = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._owner_lock = threading.Lock()
+
+    def close(self):
+        if self._shared:
+            self.rollback()
+            return
+        with self._owner_lock:
+            self._owner = None
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # putconn rolls back any open transaction; it may call close()
+            # again to really close a surplus or broken connection
+            pool.putconn(self)
+        else:
+            super().close()
+
+
+class RequestCursor(RealDictCursor):
+    """RealDictCursor that notes a cancelled statement on the request, which then answers 504."""
+
+    def execute(self, query, vars=None):
+        try:
+            return super().execute(query, vars)
+        except QueryCanceled as e:
+            if has_request_context():
+                g._query_canceled = str(e).strip()
+            raise
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """
+    Thread-safe pool that makes callers wait for a free connection (up to
+    `timeout` seconds) instead of failing immediately when all are in use,
+    and keeps counters for saturation and queue-depth reporting.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self.size = maxconn
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def getconn(self, key=None):
+        started = time.monotonic()
+        acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            with self._stats_lock:
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._stats_lock:
+                    self.waiting -= 1
+                    self.waits += 1
+                    self.wait_seconds += time.monotonic() - started
+            if not acquired:
+                with self._stats_lock:
+                    self.timeouts += 1
+                raise PoolError(f"Timed out after {self.timeout}s waiting for a database connection")
+
+        try:
+            conn = super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self.in_use += 1
+            self.checkouts += 1
+        return conn
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'saturation': round(self.in_use / self.size, 3),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'avg_wait_ms': round(1000 * self.wait_seconds / self.waits, 2) if self.waits else 0.0,
+                'timeouts': self.timeouts,
+            }
+
+
+def _connect_kwargs(host=None, port=None, database=None):
+    return dict(
+        host=host or os.getenv('ZOELIBRARYAPP_DB_HOST'),
+        port=port or os.getenv('ZOELIBRARYAPP_DB_PORT'),
+        database=database or os.getenv('ZOELIBRARYAPP_DB_NAME'),
+        user=os.getenv('ZOELIBRARYAPP_DB_USER'),
+        password=os.getenv('ZOELIBRARYAPP_DB_PASSWORD'),
+        cursor_factory=RequestCursor,
+        connection_factory=PooledConnection
+    )
+
+
+def _lazy_pool(size, timeout, **kwargs):
+    """
+    Pool that opens connections on first use (a secondary server being down
+    must not stop the worker) but keeps up to `size` idle ones once open.
+    """
+    pool = BlockingConnectionPool(0, size, timeout, connect_timeout=2, **kwargs)
+    pool.minconn = size
+    return pool
+
+
+def init_pool(size=None):
+    """
+    Open this process's connection pools (idempotent, fork-aware), with
+    `size` connections per pool instead of the configured pool_size.
+    """
+    global _pool, _pool_pid, _shard_pools, _replicas
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            return _pool
+
+        # A pool inherited from the parent process belongs to the parent;
+        # drop the reference without closing its sockets
+        config = load_server_config()
+        size = size or config['pool_size']
+        _pool = BlockingConnectionPool(size, size, config['pool_timeout'], **_connect_kwargs())
+        _shard_pools = {DEFAULT_SHARD: _pool}
+        for name, (host, port, database) in shard_addresses().items():
+            if name != DEFAULT_SHARD:
+                _shard_pools[name] = _lazy_pool(size, config['pool_timeout'], **_connect_kwargs(host, port, database))
+        _replicas = [Replica(address, size, config['pool_timeout']) for address in replica_addresses()]
+        _pool_pid = os.getpid()
+        logger.info(f"Opened database pool with {size} connections (pid {_pool_pid})")
+        return _pool
+
+
+def close_pool():
+    """Close every connection in this process's pools."""
+    global _pool, _pool_pid, _shard_pools, _replicas
+
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            for pool in _shard_pools.values():
+                pool.closeall()
+            for replica in _replicas:
+                replica.pool.closeall()
+        _pool = None
+        _pool_pid = None
+        _shard_pools = {}
+        _replicas = []
+
+# =============================================================================
+# READ REPLICAS
+# =============================================================================
+#
+# ZOELIBRARYAPP_DB_REPLICA_HOSTS lists streaming replicas of the default
+# shard as comma-separated host[:port] (same database, user and password as
+# the primary). GET requests for tenants on the default shard
+# read from a replica unless the view is marked @use_primary; everything else
+# uses the primary. A replica is skipped, falling back to the next one and
+# finally the primary, when it:
+#
+#   - lags more than ZOELIBRARYAPP_DB_REPLICA_MAX_LAG seconds (measured at
+#     most every LAG_CHECK_SECONDS, on the connection being handed out)
+#   - has not replayed the user's latest write yet (read-your-writes)
+#   - failed recently (retried after REPLICA_RETRY_SECONDS)
+#
+# After a successful write the primary's WAL position is returned in the
+# X-Write-LSN header and remembered per user in the cache tier. A read that
+# carries it back in X-Read-After-LSN, or comes from a user with a remembered
+# position, only uses replicas that have replayed at least that far.
+
+MAX_REPLICA_LAG = float(os.getenv('ZOELIBRARYAPP_DB_REPLICA_MAX_LAG', '5'))
+LAG_CHECK_SECONDS = 1.0
+REPLICA_RETRY_SECONDS = 10.0
+
+
+def replica_addresses():
+    addresses = []
+    for entry in os.getenv('ZOELIBRARYAPP_DB_REPLICA_HOSTS', '').split(','):
+        entry = entry.strip()
+        if entry:
+            host, _, port = entry.partition(':')
+            addresses.append((host, port or os.getenv('ZOELIBRARYAPP_DB_PORT')))
+    return addresses
+
+
+def parse_lsn(lsn):
+    """'16/B374D848' -> integer WAL position (0 for missing or invalid values)."""
+    try:
+        high, low = str(lsn).split('/')
+        return (int(high, 16) << 32) + int(low, 16)
+    except (ValueError, AttributeError):
+        return 0
+
+
+class Replica:
+    """A read replica's lazily opened pool and its last measured position."""
+
+    def __init__(self, address, size, timeout):
+        self.host, self.port = address
+        self.pool = _lazy_pool(size, timeout, **_connect_kwargs(self.host, self.port))
+        self.lag = None
+        self.replay_lsn = 0
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.reads = 0
+        self.skips = 0
+
+    def check(self, conn):
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT pg_last_wal_replay_lsn()::text AS replay_lsn,
+                   CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                        ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+                   END AS lag
+        ''')
+        row = cur.fetchone()
+        cur.close()
+        conn.rollback()
+        self.replay_lsn = parse_lsn(row['replay_lsn'])
+        self.lag = float(row['lag']) if row['lag'] is not None else None
+        self.checked_at = time.monotonic()
+
+    def mark_down(self, error):
+        logger.warning(f"Replica {self.host}:{self.port} unavailable: {str(error)}")
+        self.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def stats(self):
+        return {
+            'host': f'{self.host}:{self.port}',
+            'up': self.down_until <= time.monotonic(),
+            'lag_seconds': self.lag,
+            'reads': self.reads,
+            'skips': self.skips,
+            'pool': self.pool.stats(),
+        }
+
+
+def use_primary(f):
+    """Mark a GET view that must read from the primary."""
+    f.use_primary = True
+    return f
+
+
+def _wants_replica():
+    if not _replicas or not has_request_context() or request.method != 'GET':
+        return False
+    view = current_app.view_functions.get(request.endpoint)
+    return not getattr(view, 'use_primary', False)
+
+
+def _required_lsn():
+    """WAL position a replica must have replayed for this request's reads."""
+    required = parse_lsn(request.headers.get('X-Read-After-LSN'))
+    if g.get('user_id') is not None:
+        required = max(required, parse_lsn(WRITE_POSITIONS.get(WRITE_POSITIONS.key(g.user_id))))
+    return required
+
+
+def _replica_connection():
+    """A connection to a fresh-enough replica, or None to use the primary."""
+    required = _required_lsn()
+    # Rotate the starting replica to spread load
+    start = int(time.monotonic() * 1000) % len(_replicas)
+    for replica in _replicas[start:] + _replicas[:start]:
+        if replica.down_until > time.monotonic():
+            continue
+        conn = None
+        try:
+            conn = replica.pool.getconn()
+            if conn.closed:
+                replica.pool.putconn(conn, close=True)
+                conn = replica.pool.getconn()
+            if (time.monotonic() - replica.checked_at > LAG_CHECK_SECONDS
+                    or replica.replay_lsn < required):
+                replica.check(conn)
+        except Exception as e:
+            if conn is not None:
+                replica.pool.putconn(conn, close=True)
+            replica.mark_down(e)
+            continue
+
+        if (replica.lag is not None and replica.lag > MAX_REPLICA_LAG) or replica.replay_lsn < required:
+            replica.skips += 1
+            replica.pool.putconn(conn)
+            continue
+
+        replica.reads += 1
+        conn._pool = replica.pool
+        return conn
+    return None
+
+
+def record_write_position(response):
+    """
+    after_request hook: after a successful write, publish the primary's WAL
+    position so the user's next reads wait for replicas to catch up.
+    """
+    if (_replicas
+            and g.get('shard', DEFAULT_SHARD) == DEFAULT_SHARD
+            and request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and response.status_code < 400
+            and g.get('user_id') is not None):
+        try:
+            conn = get_db_connection(primary=True)
+            cur = conn.cursor()
+            cur.execute('SELECT pg_current_wal_lsn()::text AS lsn')
+            lsn = cur.fetchone()['lsn']
+            cur.close()
+            conn.close()
+            response.headers['X-Write-LSN'] = lsn
+            WRITE_POSITIONS.set(WRITE_POSITIONS.key(g.user_id), lsn)
+        except Exception as e:
+            logger.warning(f"Could not record write position: {str(e)}")
+    return response
+
+# =============================================================================
+# DATABASE CONNECTION
+# =============================================================================
+
+def get_db_connection(primary=False, shard=None):
+    """
+    Return a pooled database connection with RealDictCursor; close() returns
+    it. The shard defaults to the request's tenant shard (g.shard). Reads in
+    GET requests may be served by a replica unless `primary`.
+    """
+    if has_app_context() and g.get('_shared_connection') is not None:
+        conn = g._shared_connection
+        _set_statement_timeout(conn)
+        return conn
+
+    if _pool_pid != os.getpid():
+        init_pool()
+    if shard is None:
+        shard = g.get('shard', DEFAULT_SHARD) if has_app_context() else DEFAULT_SHARD
+    pool = _shard_pools.get(shard)
+    if pool is None:
+        raise PoolError(f"Unknown database shard: {shard}")
+
+    conn = None
+    if shard == DEFAULT_SHARD and not primary and _wants_replica():
+        conn = _replica_connection()
+    if conn is None:
+        conn = pool.getconn()
+        if conn.closed:
+            # Dropped by the server since it was pooled (e.g. postgres restart)
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        conn._pool = pool
+
+    if has_app_context():
+        conn._owner = g._get_current_object()
+        g.setdefault('_db_connections', []).append(conn)
+        _set_statement_timeout(conn)
+
+    return conn
+
+
+def _set_statement_timeout(conn):
+    """Apply the request's statement budget (deadlines.py) to the connection's transaction."""
+    timeout_ms = g.get('_statement_timeout_ms')
+    if timeout_ms:
+        cur = conn.cursor()
+        cur.execute('SET LOCAL statement_timeout = %s', (timeout_ms,))
+        cur.close()
+
+
+@contextmanager
+def shared_connection():
+    """
+    Serve every get_db_connection() in this app context from one pooled
+    connection (e.g. for the sub-requests of a batch), returning it at exit.
+    """
+    conn = get_db_connection()
+    conn._shared = True
+    g._shared_connection = conn
+    try:
+        yield conn
+    finally:
+        g.pop('_shared_connection', None)
+        conn._shared = False
+        conn.close()
+
+
+def release_request_connections(exc=None):
+    """
+    Teardown hook: return connections a request did not close itself
+    (e.g. when a route raised before reaching conn.close()).
+    """
+    for conn in g.pop('_db_connections', []):
+        if conn._pool is not None:
+            conn.close()
+
+
+def connect_direct(shard=DEFAULT_SHARD):
+    """Open a connection outside the pool, for long-lived sessions such as LISTEN."""
+    host, port, database = shard_addresses()[shard]
+    return psycopg2.connect(**_connect_kwargs(host, port, database))
+
+
+def pool_stats(shard=DEFAULT_SHARD):
+    """Counters for this process's pool on a shard, or None before it is opened."""
+    if _pool_pid != os.getpid() or shard not in _shard_pools:
+        return None
+    return _shard_pools[shard].stats()
+
+
+def shard_stats():
+    """Pool counters for every shard other than the default."""
+    if _pool_pid != os.getpid():
+        return {}
+    return {name: pool.stats() for name, pool in _shard_pools.items() if name != DEFAULT_SHARD}
+
+
+def replica_stats():
+    """Lag, availability and pool counters for each configured replica."""
+    if _pool_pid != os.getpid():
+        return []
+    return [replica.stats() for replica in _replicas]
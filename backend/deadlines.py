@@ -0,0 +1,215 @@
+import os
+import ssl
+import time
+import socket
+import logging
+import threading
+
+from flask import request, jsonify, g
+
+from admission import PRIORITY, route_class
+from auth import BATCH_AUTH_KEY
+from server_config import load_server_config
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# STATEMENT TIMEOUTS
+# =============================================================================
+#
+# Each admission class (see admission.py) has a statement_timeout budget.
+# get_db_connection() applies the request's with SET LOCAL, so it lasts
+# until the connection's transaction ends: a route that commits and then
+# queries again runs the later statements under the server default. A
+# cancelled statement answers 504 instead of the route's generic 500.
+# Budgets stay under the worker timeout, so Postgres gives up before
+# gunicorn kills the worker mid-query.
+
+# Seconds per class; 0 leaves the server's statement_timeout in place
+DEFAULT_TIMEOUTS = {
+    'circulation': 3,
+    'read': 5,
+    'write': 10,
+    'search': 10,
+    'reporting': 20,
+}
+WORKER_TIMEOUT_MARGIN = 2
+
+
+def parse_timeouts(spec):
+    """
+    Budgets from ZOELIBRARYAPP_STATEMENT_TIMEOUTS, e.g. 'search=15,reporting=25'
+    (seconds), over DEFAULT_TIMEOUTS, in milliseconds and capped below the
+    worker timeout.
+    """
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in PRIORITY:
+            raise ValueError(f"ZOELIBRARYAPP_STATEMENT_TIMEOUTS: unknown class {name!r}")
+        timeouts[name] = float(value)
+    cap = max(1, load_server_config()['timeout'] - WORKER_TIMEOUT_MARGIN)
+    return {name: int(min(seconds, cap) * 1000) for name, seconds in timeouts.items()}
+
+
+_timeouts = None
+_lock = threading.Lock()
+_counters = {'timed_out': 0, 'disconnected': 0, 'cancelled': 0}
+
+
+def _count(outcome):
+    with _lock:
+        _counters[outcome] += 1
+
+
+def request_started():
+    """before_request hook: pick the statement budget; watch the client socket."""
+    global _timeouts
+    name = route_class()
+    if name is None or request.method == 'OPTIONS':
+        return None
+    if _timeouts is None:
+        _timeouts = parse_timeouts(os.getenv('ZOELIBRARYAPP_STATEMENT_TIMEOUTS', ''))
+    g._statement_timeout_ms = _timeouts[name]
+    # Batch sub-requests share the batch's socket and its watch
+    if WATCH_INTERVAL > 0 and not request.environ.get(BATCH_AUTH_KEY):
+        sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+        if sock is not None:
+            g._disconnect_watch = watcher.watch(sock, g._get_current_object())
+    return None
+
+
+def timeout_response(response):
+    """after_request hook: a request whose statement was cancelled answers 504."""
+    reason = g.pop('_query_canceled', None)
+    if reason is None or response.status_code != 500:
+        return response
+    watch = g.get('_disconnect_watch')
+    if watch is not None and watch.disconnected:
+        # Nobody is listening; the response only reaches the access log
+        response = jsonify({'error': 'Client disconnected'})
+        response.status_code = 499
+        return response
+    _count('timed_out')
+    logger.warning(f"Statement timeout on {request.method} {request.full_path} "
+                   f"({g.get('_statement_timeout_ms')} ms): {reason}")
+    response = jsonify({'error': 'The query took too long and was stopped; narrow it down and try again'})
+    response.status_code = 504
+    return response
+
+
+def request_finished(exc=None):
+    """teardown_request hook: stop watching the request's socket."""
+    if request.environ.get(BATCH_AUTH_KEY):
+        return
+    watch = g.pop('_disconnect_watch', None)
+    if watch is not None:
+        watcher.unwatch(watch)
+
+# =============================================================================
+# CLIENT DISCONNECTS
+# =============================================================================
+#
+# A request blocked in a long query cannot notice that nginx or the browser
+# has gone away: gunicorn only finds out when it writes the response. One
+# thread per worker peeks at the sockets of in-flight requests every
+# ZOELIBRARYAPP_DISCONNECT_CHECK_MS; when a client has closed its end, it
+# cancels the statements running on that request's connections (libpq's
+# cancel, the same as pg_cancel_backend), so the connection and the worker
+# are freed at once. Streamed responses are watched until their last chunk.
+#
+# Only EOF counts as gone: a socket with unread data (a request body, a
+# pipelined request) is still alive. TLS sockets cannot be peeked and are
+# not watched; behind nginx the backend sees plain TCP.
+
+WATCH_INTERVAL = int(os.getenv('ZOELIBRARYAPP_DISCONNECT_CHECK_MS', '250')) / 1000
+
+
+class Watch:
+    """A request being watched: its client socket and its g (which lists its connections)."""
+    __slots__ = ('sock', 'owner', 'disconnected')
+
+    def __init__(self, sock, owner):
+        self.sock = sock
+        self.owner = owner
+        self.disconnected = False
+
+
+def client_gone(sock):
+    """True once the peer has closed the connection."""
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except OSError:
+        return True
+
+
+class DisconnectWatcher:
+    """Per-process thread that cancels the queries of requests whose client left."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watches = set()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def watch(self, sock, owner):
+        watch = Watch(sock, owner)
+        if isinstance(sock, ssl.SSLSocket):
+            return watch
+        with self._cond:
+            if self._pid != os.getpid():
+                # Not inherited across fork: start this process's own thread
+                self._watches = set()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='disconnect-watcher', daemon=True).start()
+            self._watches.add(watch)
+            self._cond.notify()
+        return watch
+
+    def unwatch(self, watch):
+        with self._cond:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._watches:
+                    self._cond.wait()
+                watches = list(self._watches)
+            for watch in watches:
+                if not watch.disconnected and client_gone(watch.sock):
+                    watch.disconnected = True
+                    self._cancel(watch)
+            time.sleep(self.interval)
+
+    def _cancel(self, watch):
+        _count('disconnected')
+        for conn in list(watch.owner.__dict__.get('_db_connections', ())):
+            # Only connections the request still holds; one it closed may
+            # already be serving another request. close() clears the owner
+            # under the same lock, so it waits for a cancel under way
+            with conn._owner_lock:
+                if conn._owner is not watch.owner or conn.closed:
+                    continue
+                try:
+                    conn.cancel()
+                    _count('cancelled')
+                except Exception as e:
+                    logger.warning(f"Could not cancel query for a disconnected client: {str(e)}")
+
+
+watcher = DisconnectWatcher(WATCH_INTERVAL)
+
+
+def deadline_stats():
+    """Statement timeouts and disconnect cancellations in this worker."""
+    with _lock:
+        counters = dict(_counters)
+    return {
+        'statement_timeouts_ms': _timeouts,
+        'disconnect_check_ms': int(WATCH_INTERVAL * 1000),
+        **counters,
+    }
@@ -1,20 +1,28 @@
 import os
-import multiprocessing
+
+from server_config import load_server_config
+
+# Worker, thread and pool sizes derived from the environment (server_config.py)
+server_config = load_server_config()
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('ZOELIBRARYAPP_BACKEND_PORT', '5002')}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
+workers = server_config['workers']
+worker_class = server_config['worker_class']
+threads = server_config['threads']
 worker_connections = 1000
-timeout = 30
-keepalive = 2
+timeout = server_config['timeout']
+graceful_timeout = server_config['graceful_timeout']
+keepalive = server_config['keepalive']
 
 # Request handling
-max_requests = 1000
-max_requests_jitter = 50
+# Workers are forked from a preloaded master, so a recycled worker is ready
+# almost immediately; the jitter spreads restarts so they never coincide.
+max_requests = server_config['max_requests']
+max_requests_jitter = server_config['max_requests_jitter']
 limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
@@ -25,6 +33,10 @@ errorlog = '-'
 loglevel = 'info'
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
 
+# Application loading
+# Import and build the app once in the master; workers inherit it on fork
+preload_app = True
+
 # Process naming
 proc_name = 'library_app_backend'
 
@@ -35,3 +47,37 @@ umask = 0
 user = None
 group = None
 tmp_upload_dir = None
+
+# Server hooks
+
+def when_ready(server):
+    server.log.info(
+        "Serving with %(workers)d %(worker_class)s workers x %(threads)d threads, "
+        "%(pool_size)d DB connections per worker (budget %(connection_budget)d)" % server_config
+    )
+
+
+def post_fork(server, worker):
+    """Open the worker's own database pool (never shared across forks)."""
+    from db import init_pool
+    try:
+        init_pool()
+    except Exception as e:
+        # The pool is opened lazily on first use if the database is not up yet
+        worker.log.warning(f"Could not open database pool: {e}")
+
+
+def post_worker_init(worker):
+    """Warm the worker before it accepts its first request."""
+    from app import warm_up
+    try:
+        warm_up(worker.wsgi)
+    except Exception as e:
+        worker.log.warning(f"Worker warm-up failed: {e}")
+
+
+def worker_exit(server, worker):
+    from db import close_pool
+    from profiler import uninstall
+    close_pool()
+    uninstall()
@@ -0,0 +1,20 @@
+def sanitize_input(value, field_type='str'):
+    """
+    Sanitize input values to handle empty strings for numeric fields.
+    Convert empty strings to None for integer and decimal fields.
+    """
+    if value == '' or value is None:
+        return None
+
+    if field_type == 'int':
+        try:
+            return int(value) if value else None
+        except (ValueError, TypeError):
+            return None
+    elif field_type == 'float' or field_type == 'decimal':
+        try:
+            return float(value) if value else None
+        except (ValueError, TypeError):
+            return None
+
+    return value
@@ -0,0 +1,281 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# HOLD QUEUES
+# =============================================================================
+#
+# Each book has a FIFO queue of holds. A waiting hold's ticket is dense
+# within its book: enqueueing takes hold_queues.last_ticket + 1 and
+# cancelling a waiting hold moves every later ticket up by one, so
+#
+#   position = ticket - MIN(waiting ticket) + 1
+#
+# is an index lookup (idx_holds_queue), not a count over the holds ahead.
+# The one exception: an allocation that skipped a locked head (below) and
+# whose head's own allocation then rolled back leaves a Waiting hold below
+# a Ready one. Positions behind that gap read one high until the book's
+# next allocation takes the stranded hold. The queue length is a count over
+# idx_holds_queue, so it is always exact.
+#
+# A copy freed by a return (or by a hold that is cancelled or expires while
+# Ready) goes to the lowest waiting ticket in the same transaction. The head
+# is claimed with FOR UPDATE SKIP LOCKED, so returns of several copies of
+# one book allocate the next holds side by side instead of queueing on the
+# first. The claimed hold becomes Ready and the copy Reserved until a
+# checkout to that borrower fulfils it or ZOELIBRARYAPP_HOLD_PICKUP_DAYS pass.
+#
+# Every copy that becomes shelvable (a return, a new copy, a found or
+# hand-edited one) goes through allocate_copy, and a Reserved copy that
+# stops being reserved puts its Ready hold back at the head of the queue
+# (requeue_ready_hold), so no copy is Available while holds wait.
+#
+# Writers that change tickets (enqueue, cancel, requeue) lock the book's
+# hold_queues row first. Allocation takes it only when it finds no hold to serve, so a
+# hold placed while a copy is being returned never waits beside an
+# Available copy.
+
+PICKUP_DAYS = int(os.getenv('ZOELIBRARYAPP_HOLD_PICKUP_DAYS', '7'))
+EXPIRE_BATCH_SIZE = 500
+OPEN_STATUSES = ('Waiting', 'Ready')
+
+HOLD_COLUMNS = '''
+    h.*,
+    CASE WHEN h.status = 'Waiting' THEN h.ticket - (
+        SELECT MIN(w.ticket) FROM holds w
+        WHERE w.book_id = h.book_id AND w.status = 'Waiting'
+    ) + 1 END AS position
+'''
+
+
+def get_hold(cur, user_id, hold_id):
+    """A hold with its queue position (None unless Waiting)."""
+    cur.execute(f'''
+        SELECT {HOLD_COLUMNS}, b.title, b.author, br.first_name, br.last_name, bc.copy_number
+        FROM holds h
+        JOIN books b ON h.book_id = b.id
+        JOIN borrowers br ON h.borrower_id = br.id
+        LEFT JOIN book_copies bc ON h.copy_id = bc.id
+        WHERE h.id = %s AND h.user_id = %s
+    ''', (hold_id, user_id))
+    return cur.fetchone()
+
+
+def queue_stats(cur, book_id):
+    """Waiting count and head ticket of a book's queue."""
+    cur.execute('''
+        SELECT COUNT(*) AS waiting, MIN(ticket) AS head
+        FROM holds
+        WHERE book_id = %s AND status = 'Waiting'
+    ''', (book_id,))
+    row = cur.fetchone()
+    return {'waiting': row['waiting'], 'head_ticket': row['head']}
+
+
+def enqueue_hold(cur, user_id, book_id, borrower_id, notes=None):
+    """Add a hold at the back of the book's queue and return its id."""
+    cur.execute('''
+        INSERT INTO hold_queues (book_id, user_id, last_ticket)
+        VALUES (%s, %s, 1)
+        ON CONFLICT (book_id) DO UPDATE SET last_ticket = hold_queues.last_ticket + 1
+        RETURNING last_ticket
+    ''', (book_id, user_id))
+    ticket = cur.fetchone()['last_ticket']
+    cur.execute('''
+        INSERT INTO holds (user_id, book_id, borrower_id, ticket, notes)
+        VALUES (%s, %s, %s, %s, %s)
+        RETURNING id
+    ''', (user_id, book_id, borrower_id, ticket, notes))
+    return cur.fetchone()['id']
+
+
+def allocate_copy(cur, user_id, copy_id, book_id):
+    """
+    Give a freed copy to the book's next waiting hold, or make it Available.
+    Returns the hold id the copy was reserved for, or None.
+    """
+    next_hold_sql = '''
+        SELECT id FROM holds
+        WHERE book_id = %s AND user_id = %s AND status = 'Waiting'
+        ORDER BY ticket
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    '''
+    cur.execute(next_hold_sql, (book_id, user_id))
+    hold = cur.fetchone()
+    if hold is None:
+        # Before shelving the copy, wait out any enqueue or cancel in flight
+        # (they hold the queue row until commit) and look again
+        cur.execute('''
+            INSERT INTO hold_queues (book_id, user_id)
+            VALUES (%s, %s)
+            ON CONFLICT (book_id) DO UPDATE SET last_ticket = hold_queues.last_ticket
+        ''', (book_id, user_id))
+        cur.execute(next_hold_sql, (book_id, user_id))
+        hold = cur.fetchone()
+
+    if hold is None:
+        cur.execute("UPDATE book_copies SET status = 'Available' WHERE id = %s", (copy_id,))
+        return None
+
+    cur.execute('''
+        UPDATE holds
+        SET status = 'Ready', copy_id = %s, ready_at = NOW(),
+            expires_at = NOW() + make_interval(days => %s)
+        WHERE id = %s
+    ''', (copy_id, PICKUP_DAYS, hold['id']))
+    cur.execute("UPDATE book_copies SET status = 'Reserved' WHERE id = %s", (copy_id,))
+    return hold['id']
+
+
+def allocate_available(cur, user_id, book_id):
+    """Reserve an Available copy of the book for its next hold, if there is one."""
+    cur.execute('''
+        SELECT id FROM book_copies
+        WHERE book_id = %s AND user_id = %s AND status = 'Available'
+        ORDER BY copy_number
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ''', (book_id, user_id))
+    copy = cur.fetchone()
+    if copy:
+        return allocate_copy(cur, user_id, copy['id'], book_id)
+    return None
+
+
+def close_hold(cur, user_id, hold_id, status):
+    """
+    Cancel or expire an open hold. A waiting hold leaves the queue (later
+    tickets move up); a Ready hold's copy goes to the next hold.
+    Returns the closed hold's previous row, or None if it was not open.
+    """
+    cur.execute('SELECT book_id FROM holds WHERE id = %s AND user_id = %s', (hold_id, user_id))
+    row = cur.fetchone()
+    if not row:
+        return None
+    # Queue row first, then the hold: the same order as enqueue_hold
+    cur.execute('SELECT last_ticket FROM hold_queues WHERE book_id = %s FOR UPDATE', (row['book_id'],))
+    cur.execute('SELECT * FROM holds WHERE id = %s FOR UPDATE', (hold_id,))
+    hold = cur.fetchone()
+    if hold['status'] not in OPEN_STATUSES:
+        return None
+
+    cur.execute('''
+        UPDATE holds SET status = %s, closed_at = NOW()
+        WHERE id = %s
+    ''', (status, hold_id))
+    if hold['status'] == 'Waiting':
+        cur.execute('''
+            UPDATE holds SET ticket = ticket - 1
+            WHERE book_id = %s AND status = 'Waiting' AND ticket > %s
+        ''', (hold['book_id'], hold['ticket']))
+        cur.execute('''
+            UPDATE hold_queues SET last_ticket = last_ticket - 1
+            WHERE book_id = %s
+        ''', (hold['book_id'],))
+    elif hold['copy_id']:
+        cur.execute('SELECT status FROM book_copies WHERE id = %s FOR UPDATE', (hold['copy_id'],))
+        copy = cur.fetchone()
+        if copy and copy['status'] == 'Reserved':
+            allocate_copy(cur, user_id, hold['copy_id'], hold['book_id'])
+    return hold
+
+
+def cancel_book_holds(cur, book_id):
+    """Cancel a deleted book's whole queue at once. Returns the count."""
+    cur.execute('SELECT last_ticket FROM hold_queues WHERE book_id = %s FOR UPDATE', (book_id,))
+    cur.execute('''
+        UPDATE holds SET status = 'Cancelled', closed_at = NOW()
+        WHERE book_id = %s AND status = ANY(%s)
+    ''', (book_id, list(OPEN_STATUSES)))
+    return cur.rowcount
+
+
+def cancel_borrower_holds(cur, user_id, borrower_id):
+    """Cancel a deleted borrower's open holds; their queues close up and Ready copies move on."""
+    cur.execute('''
+        SELECT id FROM holds
+        WHERE borrower_id = %s AND user_id = %s AND status = ANY(%s)
+        ORDER BY id
+    ''', (borrower_id, user_id, list(OPEN_STATUSES)))
+    cancelled = 0
+    for hold in cur.fetchall():
+        if close_hold(cur, user_id, hold['id'], 'Cancelled'):
+            cancelled += 1
+    return cancelled
+
+
+def requeue_ready_hold(cur, copy_id):
+    """
+    Put the Ready hold of a Reserved copy that is leaving its reservation
+    (deleted, lost, or edited by hand) back at the head of its queue, below
+    every waiting ticket. Returns the hold id, or None if there was none.
+    """
+    cur.execute("SELECT book_id FROM holds WHERE copy_id = %s AND status = 'Ready'", (copy_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    # Queue row first, then the hold: the same order as close_hold
+    cur.execute('SELECT last_ticket FROM hold_queues WHERE book_id = %s FOR UPDATE', (row['book_id'],))
+    cur.execute('''
+        UPDATE holds h
+        SET status = 'Waiting', copy_id = NULL, ready_at = NULL, expires_at = NULL,
+            ticket = LEAST(h.ticket, COALESCE((
+                SELECT MIN(w.ticket) FROM holds w
+                WHERE w.book_id = h.book_id AND w.status = 'Waiting'
+            ), h.ticket + 1) - 1)
+        WHERE h.copy_id = %s AND h.status = 'Ready'
+        RETURNING h.id
+    ''', (copy_id,))
+    hold = cur.fetchone()
+    return hold['id'] if hold else None
+
+
+def shelve_copy(cur, user_id, copy_id, book_id):
+    """
+    Put a copy that has become shelvable (new, found, or set Available by
+    hand) through the hold queue: it goes to the next hold, else Available.
+    Returns the hold id it was reserved for, or None.
+    """
+    requeue_ready_hold(cur, copy_id)
+    return allocate_copy(cur, user_id, copy_id, book_id)
+
+
+def ready_hold_for_copy(cur, copy_id):
+    """The Ready hold a Reserved copy is waiting to be collected for, locked."""
+    cur.execute('''
+        SELECT * FROM holds
+        WHERE copy_id = %s AND status = 'Ready'
+        FOR UPDATE
+    ''', (copy_id,))
+    return cur.fetchone()
+
+
+def fulfil_hold(cur, hold_id, checkout_id):
+    """Close a Ready hold collected by `checkout_id`."""
+    cur.execute('''
+        UPDATE holds SET status = 'Fulfilled', checkout_id = %s, closed_at = NOW()
+        WHERE id = %s
+    ''', (checkout_id, hold_id))
+
+
+def expire_holds(cur, skip_users=()):
+    """
+    Expire Ready holds past pickup, except those of tenants in `skip_users`,
+    and pass their copies on. Returns the count.
+    """
+    cur.execute('''
+        SELECT id, user_id FROM holds
+        WHERE status = 'Ready' AND expires_at < NOW() AND user_id <> ALL(%s::uuid[])
+        ORDER BY expires_at
+        LIMIT %s
+    ''', (list(skip_users), EXPIRE_BATCH_SIZE))
+    expired = 0
+    for hold in cur.fetchall():
+        if close_hold(cur, str(hold['user_id']), hold['id'], 'Expired'):
+            expired += 1
+    if expired:
+        logger.info(f"Expired {expired} uncollected holds")
+    return expired
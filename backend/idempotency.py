@@ -0,0 +1,159 @@
+import os
+import time
+import hashlib
+import logging
+
+from flask import request, jsonify, g, current_app
+
+from db import get_db_connection
+from server_config import load_server_config
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# IDEMPOTENCY KEYS
+# =============================================================================
+#
+# A mutating request carrying an Idempotency-Key header runs at most once per
+# user and key. The first request claims the key in idempotency_keys before
+# the view runs and stores the response afterwards; a retry with the same key
+# gets the stored response back (Idempotent-Replayed: true). A retry that
+# arrives while the first is still running waits for its result instead of
+# executing the write again. Server errors (5xx) are not stored, so those
+# requests can be retried for real.
+#
+# A claim is held for the worker timeout; if its owner died, the next retry
+# takes it over.
+
+MUTATING_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+MAX_KEY_LENGTH = 255
+TTL_HOURS = int(os.getenv('ZOELIBRARYAPP_IDEMPOTENCY_TTL_HOURS', '24'))
+WAIT_SECONDS = float(os.getenv('ZOELIBRARYAPP_IDEMPOTENCY_WAIT_SECONDS', '10'))
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _claim(key, request_hash, lease_seconds):
+    """Claim the key; returns None if claimed, otherwise the existing row."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO idempotency_keys (user_id, idempotency_key, request_hash, locked_until, expires_at)
+        VALUES (%s, %s, %s, NOW() + make_interval(secs => %s), NOW() + make_interval(hours => %s))
+        ON CONFLICT (user_id, idempotency_key) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash,
+                status_code = NULL,
+                content_type = NULL,
+                response_body = NULL,
+                created_at = NOW(),
+                locked_until = EXCLUDED.locked_until,
+                expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at < NOW()
+               OR (idempotency_keys.status_code IS NULL
+                   AND idempotency_keys.locked_until < NOW()
+                   AND idempotency_keys.request_hash = EXCLUDED.request_hash)
+        RETURNING idempotency_key
+    ''', (str(g.user_id), key, request_hash, lease_seconds, TTL_HOURS))
+    claimed = cur.fetchone() is not None
+
+    existing = None
+    if not claimed:
+        cur.execute('''
+            SELECT request_hash, status_code, content_type, response_body
+            FROM idempotency_keys
+            WHERE user_id = %s AND idempotency_key = %s
+        ''', (str(g.user_id), key))
+        existing = cur.fetchone()
+
+    conn.commit()
+    cur.close()
+    conn.close()
+    return existing
+
+
+def _store(key, response):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE idempotency_keys
+        SET status_code = %s, content_type = %s, response_body = %s
+        WHERE user_id = %s AND idempotency_key = %s
+    ''', (response.status_code, response.content_type, response.get_data(), str(g.user_id), key))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def _release(key):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        DELETE FROM idempotency_keys
+        WHERE user_id = %s AND idempotency_key = %s AND status_code IS NULL
+    ''', (str(g.user_id), key))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def _replay(row):
+    response = current_app.response_class(bytes(row['response_body']), status=row['status_code'])
+    response.headers['Content-Type'] = row['content_type']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_idempotent(f, *args, **kwargs):
+    """Run view `f`, honouring the request's Idempotency-Key header if any."""
+    key = request.headers.get('Idempotency-Key')
+    if not key or request.method not in MUTATING_METHODS:
+        return f(*args, **kwargs)
+    if len(key) > MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+    request_hash = _request_hash()
+    lease_seconds = load_server_config()['timeout']
+    deadline = time.monotonic() + WAIT_SECONDS
+    delay = 0.05
+
+    while True:
+        try:
+            existing = _claim(key, request_hash, lease_seconds)
+        except Exception as e:
+            logger.error(f"Error claiming idempotency key: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+        if existing is None:
+            break
+        if existing['request_hash'] != request_hash:
+            return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+        if existing['status_code'] is not None:
+            return _replay(existing)
+
+        # The original request is still running: wait for its result
+        if time.monotonic() >= deadline:
+            response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+            response.headers['Retry-After'] = '1'
+            return response, 409
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    try:
+        response = current_app.make_response(f(*args, **kwargs))
+    except Exception:
+        _release(key)
+        raise
+
+    try:
+        if response.status_code >= 500:
+            _release(key)
+        else:
+            _store(key, response)
+    except Exception as e:
+        # The write itself went through; a retry after the lease re-runs it
+        logger.error(f"Error storing idempotent response: {str(e)}")
+    return response
@@ -0,0 +1,239 @@
+import re
+import time
+
+from psycopg2.errors import UniqueViolation
+from psycopg2.extras import execute_values
+
+# =============================================================================
+# ISBN CANONICALIZATION
+# =============================================================================
+#
+# books.isbn is whatever was typed or scanned: '0-306-40615-2',
+# '978 0 306 40615 7', 'ISBN-13: 9780306406157' and a scanned EAN-13 with its
+# price add-on are all the same book. normalize_isbn() turns every valid
+# form into its ISBN-13, which is stored as books.isbn_key
+# (database/migrations/add_isbn_key.sql). A unique index on
+# (user_id, isbn_key) over live books stops a library from entering the
+# same title twice, and ISBN searches and scans become one index lookup
+# instead of a LIKE over the catalogue.
+#
+# Free text that is not shaped like an ISBN gets no key. Something shaped
+# like one whose check digit is wrong is a typo and is refused on entry.
+
+_LABEL = re.compile(r'^ISBN(?:-?1[03])?:?\s*')
+_SEPARATORS = str.maketrans('', '', '- ')
+
+BACKFILL_BATCH_SIZE = 1000
+DUPLICATES_BATCH_SIZE = 2000
+MAX_REPORT_GROUPS = 500
+
+
+class InvalidIsbn(ValueError):
+    """Shaped like an ISBN, but the check digit does not match."""
+
+
+def _compact(value):
+    return _LABEL.sub('', str(value or '').strip().upper()).translate(_SEPARATORS)
+
+
+def _isbn13_valid(digits):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return total % 10 == 0
+
+
+def normalize_isbn(value):
+    """
+    ISBN-13 for a valid ISBN-10 or ISBN-13 (hyphens, spaces and an 'ISBN'
+    label allowed; a scanned 2- or 5-digit price add-on is dropped), else None.
+    """
+    digits = _compact(value)
+    if len(digits) in (15, 18) and digits.isdigit() and digits[:3] in ('978', '979'):
+        digits = digits[:13]
+    if len(digits) == 10 and digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == 'X'):
+        total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(digits))
+        if total % 11:
+            return None
+        digits = '978' + digits[:9]
+        total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+        return digits + str((10 - total % 10) % 10)
+    if len(digits) == 13 and digits.isdigit() and digits[:3] in ('978', '979'):
+        return digits if _isbn13_valid(digits) else None
+    return None
+
+
+def isbn10(isbn13):
+    """The ISBN-10 form of a 978 ISBN-13, or None."""
+    if not isbn13.startswith('978'):
+        return None
+    body = isbn13[3:12]
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(body)) % 11) % 11
+    return body + ('X' if check == 10 else str(check))
+
+
+def isbn_forms(value, key):
+    """
+    Spellings to match against books.isbn for books without a key: as
+    entered, without separators, and the key's ISBN-13 and ISBN-10.
+    """
+    forms = {str(value).strip(), _compact(value), key, isbn10(key)}
+    return sorted(form for form in forms if form)
+
+
+def looks_like_isbn(value):
+    """True if the value has the shape of an ISBN-10, ISBN-13 or Bookland EAN, valid or not."""
+    digits = _compact(value)
+    if len(digits) == 10:
+        return digits[:9].isdigit() and (digits[9].isdigit() or digits[9] == 'X')
+    return len(digits) in (13, 15, 18) and digits.isdigit() and digits[:3] in ('978', '979')
+
+
+def isbn_key(value):
+    """books.isbn_key for an entered ISBN: its ISBN-13, or None for free text. Raises InvalidIsbn."""
+    key = normalize_isbn(value)
+    if key is None and looks_like_isbn(value):
+        raise InvalidIsbn(f"Invalid ISBN (check digit does not match): {value}")
+    return key
+
+# =============================================================================
+# BACKFILL
+# =============================================================================
+
+def backfill_isbn_keys(conn, batch_size=BACKFILL_BATCH_SIZE, pause=0.05, on_batch=None):
+    """
+    Key the live books on the connection's shard that have an ISBN but no
+    key yet, a batch per transaction. A book whose key another live book of
+    the library already holds keeps none; it is a duplicate (find_duplicates).
+    Triggers are off for the batches, so updated_at and the change feed do
+    not move. Returns {'scanned', 'keyed', 'duplicates', 'not_isbn'}.
+    """
+    cur = conn.cursor()
+    summary = {'scanned': 0, 'keyed': 0, 'duplicates': 0, 'not_isbn': 0}
+    after = '00000000-0000-0000-0000-000000000000'
+    while True:
+        cur.execute('''
+            SELECT id, user_id, isbn FROM books
+            WHERE id > %s AND isbn IS NOT NULL AND isbn_key IS NULL AND deleted_at IS NULL
+            ORDER BY id
+            LIMIT %s
+        ''', (after, batch_size))
+        rows = cur.fetchall()
+        conn.commit()
+        if not rows:
+            break
+        after = rows[-1]['id']
+
+        keys = {}
+        for row in rows:
+            key = normalize_isbn(row['isbn'])
+            if key is None:
+                summary['not_isbn'] += 1
+            elif (row['user_id'], key) in keys:
+                summary['duplicates'] += 1
+            else:
+                keys[(row['user_id'], key)] = row['id']
+        values = [(str(book_id), key) for (_, key), book_id in keys.items()]
+
+        for _ in range(3):
+            try:
+                cur.execute('SET LOCAL session_replication_role = replica')
+                if values:
+                    execute_values(cur, '''
+                        UPDATE books b SET isbn_key = v.isbn_key
+                        FROM (VALUES %s) AS v(id, isbn_key)
+                        WHERE b.id = v.id::uuid AND b.isbn_key IS NULL AND b.deleted_at IS NULL
+                          AND NOT EXISTS (
+                              SELECT 1 FROM books o
+                              WHERE o.user_id = b.user_id AND o.isbn_key = v.isbn_key AND o.deleted_at IS NULL
+                          )
+                    ''', values, page_size=len(values))
+                keyed = cur.rowcount if values else 0
+                conn.commit()
+                break
+            except UniqueViolation:
+                # A book with one of these keys was saved meanwhile; check again
+                conn.rollback()
+        else:
+            raise RuntimeError(f"Could not key books after {after}: they keep colliding with new books")
+
+        summary['scanned'] += len(rows)
+        summary['keyed'] += keyed
+        summary['duplicates'] += len(values) - keyed
+        if on_batch:
+            on_batch(summary)
+        time.sleep(pause)
+    cur.close()
+    return summary
+
+# =============================================================================
+# DUPLICATE REPORT
+# =============================================================================
+
+def find_duplicates(cur, user_id, on_progress=None):
+    """
+    A library's live books grouped by canonical ISBN, for the groups with
+    more than one book, largest first, with each book's copy count. The
+    catalogue is read in keyset batches over idx_books_live_user, and keys
+    are computed from books.isbn, so books never keyed are included.
+    """
+    cur.execute('SELECT COUNT(*) AS total FROM books WHERE user_id = %s AND deleted_at IS NULL', (user_id,))
+    total = cur.fetchone()['total']
+
+    groups = {}
+    invalid = []
+    scanned = 0
+    after = ('', '00000000-0000-0000-0000-000000000000')
+    while True:
+        cur.execute('''
+            SELECT id, title, author, isbn, barcode, created_at FROM books
+            WHERE user_id = %s AND deleted_at IS NULL AND (title, id) > (%s, %s)
+            ORDER BY title, id
+            LIMIT %s
+        ''', (user_id, after[0], after[1], DUPLICATES_BATCH_SIZE))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        after = (rows[-1]['title'], rows[-1]['id'])
+        scanned += len(rows)
+        for row in rows:
+            if not row['isbn']:
+                continue
+            key = normalize_isbn(row['isbn'])
+            if key:
+                groups.setdefault(key, []).append(row)
+            elif looks_like_isbn(row['isbn']) and len(invalid) < MAX_REPORT_GROUPS:
+                invalid.append({'id': str(row['id']), 'title': row['title'], 'isbn': row['isbn']})
+        if on_progress:
+            on_progress(scanned, total)
+
+    duplicates = sorted((books for books in groups.values() if len(books) > 1),
+                        key=lambda books: (-len(books), books[0]['title']))
+    reported = duplicates[:MAX_REPORT_GROUPS]
+    copies = {}
+    book_ids = [str(book['id']) for books in reported for book in books]
+    if book_ids:
+        cur.execute('''
+            SELECT book_id, COUNT(*) AS copies FROM book_copies
+            WHERE book_id = ANY(%s::uuid[])
+            GROUP BY book_id
+        ''', (book_ids,))
+        copies = {str(row['book_id']): row['copies'] for row in cur.fetchall()}
+
+    return {
+        'books_scanned': scanned,
+        'duplicate_groups': len(duplicates),
+        'duplicate_books': sum(len(books) for books in duplicates),
+        'truncated': len(duplicates) > len(reported),
+        'groups': [{
+            'isbn_key': normalize_isbn(books[0]['isbn']),
+            'books': [{
+                'id': str(book['id']),
+                'title': book['title'],
+                'author': book['author'],
+                'isbn': book['isbn'],
+                'barcode': book['barcode'],
+                'created_at': book['created_at'].isoformat() if book['created_at'] else None,
+                'copies': copies.get(str(book['id']), 0),
+            } for book in sorted(books, key=lambda book: str(book['created_at']))],
+        } for books in reported],
+        'invalid_isbns': invalid,
+    }
@@ -0,0 +1,236 @@
+"""
+Background job worker: runs the jobs queued by the API (see jobs.py).
+
+Starts a pool of worker processes that each claim jobs from every shard's
+jobs table with FOR UPDATE SKIP LOCKED, and restarts any that die. Idle
+processes sleep on LISTEN library_jobs, so a new job starts within
+milliseconds without polling the table in a tight loop.
+
+Run from the backend directory with the usual ZOELIBRARYAPP_* variables:
+
+    python job_worker.py                  # ZOELIBRARYAPP_JOBS_PROCESSES processes
+    python job_worker.py --processes 4
+    python job_worker.py --once           # drain due jobs in this process and exit
+
+Each process holds up to two connections per shard plus one listener
+connection per shard; count them against ZOELIBRARYAPP_DB_CONNECTION_BUDGET.
+SIGTERM lets running jobs finish before the processes exit.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import time
+
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+from analytics import INTERVAL_SECONDS as ANALYTICS_INTERVAL_SECONDS, refresh_analytics
+from app import create_app
+from db import connect_direct, get_db_connection, init_pool, close_pool
+from holds import expire_holds
+from jobs import JOB_CHANNEL, claim_job, run_job, prune_finished, tenants_away
+from labels import prune_label_cache
+from purge import INTERVAL_SECONDS as PURGE_INTERVAL_SECONDS, purge_deleted, prune_retained
+from shards import shard_addresses
+
+logger = logging.getLogger('job_worker')
+
+POLL_SECONDS = 5.0
+PRUNE_INTERVAL_SECONDS = 600
+POOL_SIZE = 2
+
+
+def _listen(shards):
+    """Open a LISTEN connection per shard; shards that are down are skipped."""
+    connections = []
+    for shard in shards:
+        try:
+            conn = connect_direct(shard)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f'LISTEN {JOB_CHANNEL}')
+            connections.append(conn)
+        except Exception as e:
+            logger.warning(f"Cannot listen for jobs on shard {shard}: {str(e)}")
+    return connections
+
+
+def _wait_for_work(connections, timeout):
+    """Sleep until a job is announced on any shard, or `timeout` passes."""
+    if not connections:
+        time.sleep(timeout)
+        return
+    readable = select.select(connections, [], [], timeout)[0]
+    for conn in readable:
+        conn.poll()
+        del conn.notifies[:]
+
+
+def _prune(shards):
+    for shard in shards:
+        conn = None
+        try:
+            away = tenants_away(shard)
+            conn = get_db_connection(primary=True, shard=shard)
+            cur = conn.cursor()
+            prune_finished(cur)
+            conn.commit()
+            expire_holds(cur, away)
+            conn.commit()
+            cur.close()
+            summary = prune_retained(conn)
+            if summary and summary['batches']:
+                logger.info(f"Retention on shard {shard}: {summary}")
+        except Exception as e:
+            logger.warning(f"Could not prune jobs, holds or expired rows on shard {shard}: {str(e)}")
+        finally:
+            # No request teardown here to return a connection left behind
+            if conn is not None:
+                conn.close()
+    try:
+        prune_label_cache()
+    except OSError as e:
+        logger.warning(f"Could not prune the label cache: {str(e)}")
+
+
+def _refresh_analytics(shards):
+    """Bring each shard's analytics rollups up to date (skipped where another process just did)."""
+    for shard in shards:
+        conn = None
+        try:
+            away = tenants_away(shard)
+            conn = get_db_connection(primary=True, shard=shard)
+            cur = conn.cursor()
+            summary = refresh_analytics(cur, skip_users=away)
+            conn.commit()
+            cur.close()
+            if summary:
+                logger.info(f"Analytics on shard {shard}: {summary}")
+        except Exception as e:
+            logger.warning(f"Could not refresh analytics on shard {shard}: {str(e)}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def _purge_deleted(shards):
+    """Purge soft-deleted books and borrowers in batches (skipped where another process is at it)."""
+    for shard in shards:
+        conn = None
+        try:
+            away = tenants_away(shard)
+            conn = get_db_connection(primary=True, shard=shard)
+            summary = purge_deleted(conn, skip_users=away)
+            if summary and summary['batches']:
+                logger.info(f"Purge on shard {shard}: {summary}")
+        except Exception as e:
+            logger.warning(f"Could not purge deleted rows on shard {shard}: {str(e)}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def work(once=False):
+    """Claim and run jobs until told to stop (or, with `once`, until none are due)."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    app = create_app()
+    init_pool(size=POOL_SIZE)
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    shards = list(shard_addresses())
+    listeners = [] if once else _listen(shards)
+    last_prune = 0.0
+    last_analytics = 0.0
+    last_purge = 0.0
+    logger.info(f"Job worker {worker_id} started on shards: {', '.join(shards)}")
+
+    try:
+        while not stopping:
+            ran = False
+            for shard in shards:
+                if stopping:
+                    break
+                try:
+                    with app.app_context():
+                        row = claim_job(shard, worker_id)
+                        if row is not None:
+                            run_job(shard, row, worker_id)
+                            ran = True
+                except Exception as e:
+                    logger.error(f"Job worker error on shard {shard}: {str(e)}")
+                    time.sleep(1)
+
+            if time.monotonic() - last_prune > PRUNE_INTERVAL_SECONDS:
+                _prune(shards)
+                last_prune = time.monotonic()
+
+            if time.monotonic() - last_analytics > ANALYTICS_INTERVAL_SECONDS:
+                _refresh_analytics(shards)
+                last_analytics = time.monotonic()
+
+            if time.monotonic() - last_purge > PURGE_INTERVAL_SECONDS:
+                _purge_deleted(shards)
+                last_purge = time.monotonic()
+
+            if ran:
+                continue
+            if once:
+                break
+            if any(conn.closed for conn in listeners) or len(listeners) < len(shards):
+                for conn in listeners:
+                    if not conn.closed:
+                        conn.close()
+                listeners = _listen(shards)
+            _wait_for_work(listeners, POLL_SECONDS)
+    finally:
+        for conn in listeners:
+            if not conn.closed:
+                conn.close()
+        close_pool()
+        logger.info(f"Job worker {worker_id} stopped")
+
+
+def supervise(processes):
+    """Run `processes` worker processes, replacing any that exit unexpectedly."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+
+    children = []
+    while not stopping:
+        children = [child for child in children if child.is_alive()]
+        while len(children) < processes:
+            child = multiprocessing.Process(target=work, name='job-worker')
+            child.start()
+            children.append(child)
+        time.sleep(1)
+
+    for child in children:
+        child.terminate()  # SIGTERM: finish the current job, then exit
+    for child in children:
+        child.join()
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=int(os.getenv('ZOELIBRARYAPP_JOBS_PROCESSES', '2')),
+                        help='worker processes (default ZOELIBRARYAPP_JOBS_PROCESSES or 2)')
+    parser.add_argument('--once', action='store_true', help='run due jobs in this process, then exit')
+    args = parser.parse_args()
+
+    if args.once:
+        work(once=True)
+    else:
+        supervise(max(1, args.processes))
+
+
+if __name__ == '__main__':
+    main()
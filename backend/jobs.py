@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import random
+import logging
+import traceback
+
+from flask import g, jsonify
+
+from cache import bump_user_namespace
+from db import get_db_connection
+from shards import DEFAULT_SHARD
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# JOB QUEUE
+# =============================================================================
+#
+# Operations too slow for a request are queued in the jobs table of the
+# tenant's shard (database/migrations/add_jobs.sql) and answered with
+# 202 Accepted and the job; clients poll GET /api/jobs/<id>. job_worker.py
+# runs the handlers registered here with @job(kind): worker processes claim
+# due jobs with FOR UPDATE SKIP LOCKED, so any number of them can share the
+# table without blocking each other.
+#
+# A handler receives a JobContext and the job's payload and runs with
+# g.user_id and g.shard set, so get_db_connection() and the cache helpers
+# work as they do in a request. It should be safe to run again: a failed
+# attempt is retried with exponential backoff until max_attempts, and a job
+# whose worker died is picked up again when its lease expires. Raise
+# PermanentJobError for failures that a retry cannot fix.
+
+JOB_CHANNEL = 'library_jobs'
+MAX_ATTEMPTS = int(os.getenv('ZOELIBRARYAPP_JOBS_MAX_ATTEMPTS', '5'))
+RETRY_BASE_SECONDS = float(os.getenv('ZOELIBRARYAPP_JOBS_RETRY_BASE_SECONDS', '10'))
+RETRY_MAX_SECONDS = 3600
+LEASE_SECONDS = int(os.getenv('ZOELIBRARYAPP_JOBS_LEASE_SECONDS', '300'))
+RETENTION_DAYS = int(os.getenv('ZOELIBRARYAPP_JOBS_RETENTION_DAYS', '7'))
+# Progress is written at most this often; each write also renews the lease
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """A job failure that retrying cannot fix (e.g. invalid payload)."""
+
+
+def job(kind, max_attempts=None):
+    """Register a function as the handler for jobs of `kind`."""
+    def decorator(f):
+        HANDLERS[kind] = (f, max_attempts or MAX_ATTEMPTS)
+        return f
+    return decorator
+
+
+def serialize_job(row):
+    return {
+        'id': str(row['id']),
+        'kind': row['kind'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'max_attempts': row['max_attempts'],
+        'progress': {
+            'done': row['progress_done'],
+            'total': row['progress_total'],
+            'message': row['progress_message'],
+        },
+        'result': row['result'],
+        'error': row['error'],
+        'run_at': row['run_at'].isoformat() if row['run_at'] else None,
+        'started_at': row['started_at'].isoformat() if row['started_at'] else None,
+        'finished_at': row['finished_at'].isoformat() if row['finished_at'] else None,
+        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+    }
+
+
+def enqueue(kind, payload=None, max_attempts=None):
+    """Queue a job for the current user and wake a worker; returns the job row."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    conn = get_db_connection(primary=True)
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO jobs (user_id, kind, payload, max_attempts)
+        VALUES (%s, %s, %s, %s)
+        RETURNING *
+    ''', (str(g.user_id), kind, json.dumps(payload or {}), max_attempts or HANDLERS[kind][1]))
+    row = cur.fetchone()
+    cur.execute('SELECT pg_notify(%s, %s)', (JOB_CHANNEL, kind))
+    conn.commit()
+    cur.close()
+    conn.close()
+    return row
+
+
+def accepted(row):
+    """202 response for a queued job, pointing at its status URL."""
+    response = jsonify({'job': serialize_job(row)})
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{row['id']}"
+    return response
+
+
+class JobContext:
+    """What a running handler sees of its job: ids and progress reporting."""
+
+    def __init__(self, row, worker_id):
+        self.id = str(row['id'])
+        self.user_id = str(row['user_id'])
+        self.attempt = row['attempts']
+        self.worker_id = worker_id
+        self._last_progress = 0.0
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Record progress (throttled) and renew the lease."""
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_progress = now
+        conn = get_db_connection(primary=True)
+        cur = conn.cursor()
+        cur.execute('''
+            UPDATE jobs
+            SET progress_done = %s,
+                progress_total = COALESCE(%s, progress_total),
+                progress_message = COALESCE(%s, progress_message),
+                locked_until = NOW() + make_interval(secs => %s)
+            WHERE id = %s AND locked_by = %s
+        ''', (done, total, message, LEASE_SECONDS, self.id, self.worker_id))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+# =============================================================================
+# WORKER SIDE
+# =============================================================================
+
+def claim_job(shard, worker_id):
+    """
+    Claim the next due job on a shard, or one whose worker's lease expired;
+    returns the job row or None.
+    """
+    conn = get_db_connection(primary=True, shard=shard)
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE jobs
+        SET status = 'running',
+            attempts = attempts + 1,
+            locked_by = %s,
+            locked_until = NOW() + make_interval(secs => %s),
+            started_at = COALESCE(started_at, NOW())
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status IN ('queued', 'running')
+              AND run_at <= NOW()
+              AND (status = 'queued' OR locked_until < NOW())
+            ORDER BY run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ''', (worker_id, LEASE_SECONDS))
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+    return row
+
+
+def tenant_status(user_id):
+    """(shard, status) of a tenant from the directory on the default shard."""
+    conn = get_db_connection(primary=True, shard=DEFAULT_SHARD)
+    cur = conn.cursor()
+    cur.execute('SELECT shard, status FROM tenant_directory WHERE user_id = %s', (user_id,))
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    conn.close()
+    return (row['shard'], row['status']) if row else (DEFAULT_SHARD, 'active')
+
+
+def tenants_away(shard):
+    """
+    Tenants whose rows on `shard` must not be changed: being moved, or
+    living on another shard (a source copy kept after a move). The same
+    rule run_job applies to each job.
+    """
+    conn = get_db_connection(primary=True, shard=DEFAULT_SHARD)
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT user_id FROM tenant_directory
+        WHERE status <> 'active' OR shard <> %s
+    ''', (shard,))
+    user_ids = [str(row['user_id']) for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    conn.close()
+    return user_ids
+
+
+def _finish(shard, job_id, worker_id, sql, params):
+    conn = get_db_connection(primary=True, shard=shard)
+    cur = conn.cursor()
+    cur.execute(sql + ' WHERE id = %s AND locked_by = %s', params + (job_id, worker_id))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def retry_delay(attempt):
+    """Exponential backoff with jitter for the retry after `attempt` failed."""
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempt - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def run_job(shard, row, worker_id):
+    """
+    Run a claimed job inside an app context and record the outcome. Returns
+    the job's new status.
+    """
+    job_id = str(row['id'])
+    user_id = str(row['user_id'])
+
+    if row['kind'] not in HANDLERS:
+        _finish(shard, job_id, worker_id, '''
+            UPDATE jobs SET status = 'failed', error = %s, finished_at = NOW(), locked_by = NULL
+        ''', (f"No handler for job kind '{row['kind']}'",))
+        return 'failed'
+
+    # A tenant being moved must not be written to until the move ends
+    tenant_shard, status = tenant_status(user_id)
+    if status == 'moving':
+        _finish(shard, job_id, worker_id, '''
+            UPDATE jobs
+            SET status = 'queued', attempts = attempts - 1, locked_by = NULL,
+                run_at = NOW() + make_interval(secs => %s)
+        ''', (30,))
+        return 'queued'
+    if tenant_shard != shard:
+        # The source's copy of a moved tenant's job; the target has its own
+        _finish(shard, job_id, worker_id, '''
+            UPDATE jobs SET status = 'failed', error = %s, finished_at = NOW(), locked_by = NULL
+        ''', (f"Tenant moved to shard {tenant_shard}; the job runs there",))
+        return 'failed'
+
+    if row['attempts'] > row['max_attempts']:
+        # Claimed again after its lease expired on the last attempt
+        _finish(shard, job_id, worker_id, '''
+            UPDATE jobs SET status = 'failed', finished_at = NOW(), locked_by = NULL,
+                   error = COALESCE(error, 'Worker lost while running the job')
+        ''', ())
+        return 'failed'
+
+    handler, _ = HANDLERS[row['kind']]
+    g.user_id = user_id
+    g.shard = shard
+    context = JobContext(row, worker_id)
+    started = time.monotonic()
+    try:
+        result = handler(context, row['payload'])
+    except Exception as e:
+        permanent = isinstance(e, PermanentJobError) or row['attempts'] >= row['max_attempts']
+        logger.warning(f"Job {job_id} ({row['kind']}) attempt {row['attempts']} failed: {str(e)}")
+        error = f"{type(e).__name__}: {str(e)}"
+        if permanent:
+            logger.error(traceback.format_exc())
+            _finish(shard, job_id, worker_id, '''
+                UPDATE jobs SET status = 'failed', error = %s, finished_at = NOW(), locked_by = NULL
+            ''', (error,))
+            return 'failed'
+        _finish(shard, job_id, worker_id, '''
+            UPDATE jobs
+            SET status = 'queued', error = %s, locked_by = NULL,
+                run_at = NOW() + make_interval(secs => %s)
+        ''', (error, retry_delay(row['attempts'])))
+        return 'queued'
+    finally:
+        # Whatever the job changed must not be served from the cache
+        bump_user_namespace(user_id)
+
+    _finish(shard, job_id, worker_id, '''
+        UPDATE jobs
+        SET status = 'succeeded', result = %s, error = NULL, finished_at = NOW(), locked_by = NULL,
+            progress_done = COALESCE(progress_total, progress_done)
+    ''', (json.dumps(result, default=str) if result is not None else None,))
+    logger.info(f"Job {job_id} ({row['kind']}) succeeded in {time.monotonic() - started:.1f}s")
+    return 'succeeded'
+
+
+def prune_finished(cur):
+    """Delete finished jobs past their retention."""
+    cur.execute(
+        'DELETE FROM jobs WHERE finished_at < NOW() - make_interval(days => %s)',
+        (RETENTION_DAYS,)
+    )
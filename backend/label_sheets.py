@@ -0,0 +1,253 @@
+import io
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# =============================================================================
+# BARCODE LABEL SHEETS
+# =============================================================================
+#
+# Renders printable PDF sheets of barcode labels (title, copy number and
+# location under the barcode) for standard label stock. Pure functions of
+# their input, with no Flask or database imports, so they can run in a pool
+# of processes: each page is rendered on its own, then the pages are joined
+# into one document.
+#
+# Barcodes that are valid EAN-13 (13 digits with a correct check digit, as
+# printed on books) are drawn as EAN-13; anything else as Code 128.
+#
+# reportlab and pypdf are imported where they are used: only the processes
+# that actually render need them.
+
+POINTS_PER_INCH = 72.0
+POINTS_PER_MM = 72.0 / 25.4
+
+# Label stock: page size, grid and label size/position, all in points
+LAYOUTS = {
+    # Avery 5160 and compatibles: 30 labels of 2 5/8" x 1" on US Letter
+    'letter-30': {
+        'page': (8.5 * POINTS_PER_INCH, 11 * POINTS_PER_INCH),
+        'columns': 3, 'rows': 10,
+        'width': 2.625 * POINTS_PER_INCH, 'height': 1.0 * POINTS_PER_INCH,
+        'left': 0.1875 * POINTS_PER_INCH, 'top': 0.5 * POINTS_PER_INCH,
+        'gap_x': 0.125 * POINTS_PER_INCH, 'gap_y': 0.0,
+    },
+    # Avery L7160 and compatibles: 21 labels of 63.5 x 38.1 mm on A4
+    'a4-21': {
+        'page': (210 * POINTS_PER_MM, 297 * POINTS_PER_MM),
+        'columns': 3, 'rows': 7,
+        'width': 63.5 * POINTS_PER_MM, 'height': 38.1 * POINTS_PER_MM,
+        'left': 7.25 * POINTS_PER_MM, 'top': 15.15 * POINTS_PER_MM,
+        'gap_x': 2.5 * POINTS_PER_MM, 'gap_y': 0.0,
+    },
+}
+DEFAULT_LAYOUT = 'letter-30'
+PADDING = 4.0
+TEXT_SIZE = 6.5
+
+
+def per_page(layout):
+    return LAYOUTS[layout]['columns'] * LAYOUTS[layout]['rows']
+
+
+def ean13_check_digit(digits):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def symbology(value):
+    """'EAN13' for a valid EAN-13 (ISBN-13), otherwise 'Code128'."""
+    if len(value) == 13 and value.isdigit() and ean13_check_digit(value) == value[12]:
+        return 'EAN13'
+    return 'Code128'
+
+
+def label_lines(label):
+    """The human-readable lines printed under a label's barcode."""
+    lines = [label['title'] or '']
+    details = []
+    if label.get('copy_number') is not None:
+        details.append(f"Copy {label['copy_number']}")
+    if label.get('location'):
+        details.append(label['location'])
+    if details:
+        lines.append(' · '.join(details))
+    return lines
+
+
+def page_key(layout, labels, skip=0):
+    """Content hash of one page: same layout and labels, same PDF bytes."""
+    payload = json.dumps([layout, skip, [
+        [label['barcode'], label_lines(label)] for label in labels
+    ]], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def paginate(layout, labels, start_position=1):
+    """
+    Split labels into pages as (skip, labels) pairs. `start_position` (1-based)
+    leaves the first labels of the first sheet empty, for part-used sheets.
+    """
+    size = per_page(layout)
+    skip = min(max(start_position, 1), size) - 1
+    pages = [(skip, labels[:size - skip])]
+    for start in range(size - skip, len(labels), size):
+        pages.append((0, labels[start:start + size]))
+    return pages
+
+
+def _fit_text(canvas, text, width, font, size):
+    if canvas.stringWidth(text, font, size) <= width:
+        return text
+    while text and canvas.stringWidth(text + '…', font, size) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+# EAN-13 digit patterns (L; R is L inverted, G is R reversed) and the L/G
+# pattern of the left half, selected by the first digit
+EAN_L = ('0001101', '0011001', '0010011', '0111101', '0100011',
+         '0110001', '0101111', '0111011', '0110111', '0001011')
+EAN_PARITY = ('LLLLLL', 'LLGLGG', 'LLGGLG', 'LLGGGL', 'LGLLGG',
+              'LGGLLG', 'LGGGLL', 'LGLGLG', 'LGLGGL', 'LGGLGL')
+EAN_R = tuple(code.translate(str.maketrans('01', '10')) for code in EAN_L)
+EAN_G = tuple(code[::-1] for code in EAN_R)
+QUIET_MODULES = {'EAN13': 11, 'Code128': 10}
+MAX_BAR_WIDTH = 0.4 * POINTS_PER_MM
+BARCODE_TEXT_SIZE = 6.0
+
+
+def ean13_modules(value):
+    """Module string ('1' = bar) of a valid 13-digit EAN."""
+    digits = [int(d) for d in value]
+    left = ''.join(
+        EAN_L[d] if parity == 'L' else EAN_G[d]
+        for d, parity in zip(digits[1:7], EAN_PARITY[digits[0]])
+    )
+    right = ''.join(EAN_R[d] for d in digits[7:])
+    return '101' + left + '01010' + right + '101'
+
+
+def code128_modules(value):
+    """Module string ('1' = bar) of `value` in Code 128, using reportlab's encoder."""
+    from reportlab.graphics.barcode import code128
+
+    barcode = code128.Code128(value)
+    barcode.validate()
+    barcode.encode()
+    # reportlab writes element widths as letters: upper case bars, lower case
+    # spaces, 'A'/'a' one module wide
+    return ''.join(
+        ('1' if c.isupper() else '0') * (ord(c.lower()) - ord('a') + 1)
+        for c in barcode.decompose()
+    )
+
+
+def _draw_barcode(canvas, value, x, y, width, height):
+    """
+    Draw `value` centred in the box (x, y, width, height), digits below.
+    All bars are one filled path: reportlab's barcode widgets build a shape
+    object per bar, which made them most of the rendering time.
+    """
+    kind = symbology(value)
+    modules = ean13_modules(value) if kind == 'EAN13' else code128_modules(value)
+    bar_width = min(width / (len(modules) + 2 * QUIET_MODULES[kind]), MAX_BAR_WIDTH)
+    left = x + (width - len(modules) * bar_width) / 2
+    bars_bottom = y + BARCODE_TEXT_SIZE + 1
+
+    bars_height = y + height - bars_bottom
+    rects = []
+    start = None
+    for index, module in enumerate(modules + '0'):
+        if module == '1' and start is None:
+            start = index
+        elif module == '0' and start is not None:
+            rects.append(f'{left + start * bar_width:.3f} {bars_bottom:.2f} '
+                         f'{(index - start) * bar_width:.3f} {bars_height:.2f} re')
+            start = None
+    # One fill of all bars, written as PDF operators directly
+    canvas.addLiteral('\n'.join(rects) + '\nf')
+
+    canvas.setFont('Helvetica', BARCODE_TEXT_SIZE)
+    canvas.drawCentredString(x + width / 2, y, value)
+
+
+def render_page(layout, labels, skip=0):
+    """One sheet of labels as PDF bytes."""
+    from reportlab.pdfgen import canvas as pdfcanvas
+
+    spec = LAYOUTS[layout]
+    page_width, page_height = spec['page']
+    buffer = io.BytesIO()
+    canvas = pdfcanvas.Canvas(buffer, pagesize=spec['page'], pageCompression=1, invariant=1)
+    canvas.setTitle('Barcode labels')
+
+    text_lines = 2
+    text_height = text_lines * (TEXT_SIZE + 1)
+    for index, label in enumerate(labels, start=skip):
+        row, column = divmod(index, spec['columns'])
+        x = spec['left'] + column * (spec['width'] + spec['gap_x'])
+        top = page_height - spec['top'] - row * (spec['height'] + spec['gap_y'])
+        inner_width = spec['width'] - 2 * PADDING
+        bottom = top - spec['height'] + PADDING
+
+        canvas.setFont('Helvetica', TEXT_SIZE)
+        lines = label_lines(label)[:text_lines]
+        for line_number, line in enumerate(lines):
+            font = 'Helvetica-Bold' if line_number == 0 else 'Helvetica'
+            canvas.setFont(font, TEXT_SIZE)
+            text = _fit_text(canvas, line, inner_width, font, TEXT_SIZE)
+            canvas.drawCentredString(x + spec['width'] / 2, bottom + (text_lines - 1 - line_number) * (TEXT_SIZE + 1), text)
+
+        barcode_bottom = bottom + text_height
+        _draw_barcode(canvas, label['barcode'], x + PADDING, barcode_bottom,
+                      inner_width, top - PADDING - barcode_bottom)
+
+    canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+def _render_chunk(layout, pages):
+    """Worker entry point: render several (skip, labels) pages."""
+    return [render_page(layout, labels, skip) for skip, labels in pages]
+
+
+def render_pages(layout, pages, processes=1, chunk_pages=4, on_progress=None):
+    """
+    Render (skip, labels) pages, in `processes` worker processes when more
+    than one, and return their PDF bytes in order. Workers are spawned, not
+    forked, so they never inherit the caller's database connections.
+    `on_progress(done)` is called in this process as pages complete.
+    """
+    if processes <= 1 or len(pages) <= chunk_pages:
+        rendered = []
+        for skip, labels in pages:
+            rendered.append(render_page(layout, labels, skip))
+            if on_progress:
+                on_progress(len(rendered))
+        return rendered
+
+    chunks = [pages[i:i + chunk_pages] for i in range(0, len(pages), chunk_pages)]
+    context = multiprocessing.get_context('spawn')
+    rendered = []
+    with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), mp_context=context) as executor:
+        # map() keeps page order
+        for result in executor.map(_render_chunk, [layout] * len(chunks), chunks):
+            rendered.extend(result)
+            if on_progress:
+                on_progress(len(rendered))
+    return rendered
+
+
+def join_pages(page_pdfs):
+    """One PDF document from single-page PDFs."""
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for data in page_pdfs:
+        writer.append(PdfReader(io.BytesIO(data)))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
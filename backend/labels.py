@@ -0,0 +1,185 @@
+import os
+import time
+import json
+import hashlib
+import logging
+
+from db import get_db_connection
+from jobs import job, PermanentJobError
+from label_sheets import paginate, page_key, render_pages, join_pages
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# BARCODE LABELS
+# =============================================================================
+#
+# A label sheet is one label per selected copy (a selected book means all of
+# its copies), rendered by label_sheets.py and cached on disk by content:
+#
+#   <cache dir>/pages/<page hash>.pdf            one rendered sheet
+#   <cache dir>/documents/<user>/<doc hash>.pdf  the joined document
+#
+# A page's hash covers its layout and label text, so relabelling 5,000
+# copies after a few moved re-renders only the pages that changed, and the
+# same request twice is a file read. Small sheets render in the request;
+# larger ones go to a `barcode_labels` job that spreads the pages over
+# ZOELIBRARYAPP_LABEL_PROCESSES processes. Files not used for
+# ZOELIBRARYAPP_LABEL_CACHE_DAYS are pruned by the job worker.
+
+CACHE_DIR = os.getenv('ZOELIBRARYAPP_LABEL_CACHE_DIR', '/tmp/library-labels')
+PROCESSES = int(os.getenv('ZOELIBRARYAPP_LABEL_PROCESSES', '0')) or os.cpu_count() or 1
+INLINE_MAX_LABELS = int(os.getenv('ZOELIBRARYAPP_LABELS_INLINE_MAX', '300'))
+CACHE_DAYS = int(os.getenv('ZOELIBRARYAPP_LABEL_CACHE_DAYS', '7'))
+MAX_LABELS = 20000
+
+
+def select_labels(cur, user_id, book_ids=(), copy_ids=()):
+    """
+    Labels for the given books' copies and the given copies, in shelf order.
+    Returns (labels, skipped): copies of books without a barcode are skipped.
+    """
+    cur.execute('''
+        SELECT bc.id AS copy_id, b.barcode, b.title, bc.copy_number, bc.location
+        FROM book_copies bc
+        JOIN books b ON bc.book_id = b.id
+        WHERE bc.user_id = %s AND b.deleted_at IS NULL
+          AND (bc.book_id = ANY(%s::uuid[]) OR bc.id = ANY(%s::uuid[]))
+        ORDER BY bc.location NULLS LAST, b.title, bc.copy_number
+    ''', (user_id, list(book_ids), list(copy_ids)))
+    labels = []
+    skipped = 0
+    for row in cur.fetchall():
+        if not row['barcode']:
+            skipped += 1
+            continue
+        labels.append({
+            'barcode': row['barcode'],
+            'title': row['title'],
+            'copy_number': row['copy_number'],
+            'location': row['location'],
+        })
+    return labels, skipped
+
+
+def _page_path(key):
+    return os.path.join(CACHE_DIR, 'pages', f'{key}.pdf')
+
+
+def document_path(user_id, key):
+    return os.path.join(CACHE_DIR, 'documents', str(user_id), f'{key}.pdf')
+
+
+def document_url(key):
+    return f'/api/labels/{key}.pdf'
+
+
+def _write(path, data):
+    """Write atomically: readers never see a half-written PDF."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    os.utime(path)  # keep it from being pruned while in use
+    return data
+
+
+def plan_sheet(user_id, layout, labels, start_position=1):
+    """Pages, their hashes and the document hash for a sheet."""
+    pages = paginate(layout, labels, start_position)
+    page_keys = [page_key(layout, page_labels, skip) for skip, page_labels in pages]
+    key = hashlib.sha256(json.dumps([str(user_id), page_keys]).encode()).hexdigest()
+    return pages, page_keys, key
+
+
+def cached_sheet(user_id, key):
+    """True if the document is already rendered (and marks it recently used)."""
+    path = document_path(user_id, key)
+    if os.path.exists(path):
+        os.utime(path)
+        return True
+    return False
+
+
+def build_sheet(user_id, layout, labels, start_position=1, processes=1, on_progress=None):
+    """Render (or reuse) every page and the joined document; returns a summary."""
+    pages, page_keys, key = plan_sheet(user_id, layout, labels, start_position)
+    summary = {
+        'key': key,
+        'url': document_url(key),
+        'layout': layout,
+        'labels': len(labels),
+        'pages': len(pages),
+        'pages_rendered': 0,
+    }
+    if cached_sheet(user_id, key):
+        return summary
+
+    page_pdfs = [_read(_page_path(page_key)) for page_key in page_keys]
+    missing = [index for index, data in enumerate(page_pdfs) if data is None]
+    done = len(pages) - len(missing)
+    if on_progress:
+        on_progress(done, len(pages))
+
+    if missing:
+        rendered = render_pages(
+            layout, [pages[index] for index in missing], processes,
+            on_progress=(lambda count: on_progress(done + count, len(pages))) if on_progress else None,
+        )
+        for index, data in zip(missing, rendered):
+            page_pdfs[index] = data
+            _write(_page_path(page_keys[index]), data)
+
+    _write(document_path(user_id, key), join_pages(page_pdfs))
+    summary['pages_rendered'] = len(missing)
+    return summary
+
+
+def prune_label_cache():
+    """Delete cached pages and documents unused for CACHE_DAYS."""
+    cutoff = time.time() - CACHE_DAYS * 86400
+    removed = 0
+    for root, dirs, files in os.walk(CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+@job('barcode_labels', max_attempts=2)
+def barcode_labels_job(context, payload):
+    """Render a label sheet over the process pool; the result links to the PDF."""
+    conn = get_db_connection(primary=True)
+    cur = conn.cursor()
+    labels, skipped = select_labels(cur, context.user_id, payload.get('book_ids', []), payload.get('copy_ids', []))
+    conn.commit()
+    cur.close()
+    conn.close()
+    if not labels:
+        raise PermanentJobError('None of the selected copies has a barcode')
+
+    started = time.monotonic()
+    summary = build_sheet(
+        context.user_id, payload['layout'], labels, payload.get('start_position', 1),
+        processes=PROCESSES,
+        on_progress=lambda done, total: context.progress(done, total, 'Rendering label pages'),
+    )
+    summary['skipped'] = skipped
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    logger.info(f"Label sheet for {context.user_id}: {summary['labels']} labels, "
+                f"{summary['pages_rendered']}/{summary['pages']} pages rendered in {summary['seconds']} s")
+    return summary
@@ -0,0 +1,182 @@
+import os
+import time
+import queue
+import smtplib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SMTP POOL
+# =============================================================================
+#
+# Outgoing mail goes through a small pool of persistent SMTP connections:
+# the TCP/TLS handshake and login are paid once per connection rather than
+# once per message, and several messages are in flight at a time. A shared
+# token bucket caps the send rate so a large batch stays under the relay's
+# limits. Configured with ZOELIBRARYAPP_SMTP_*; with no host, mail is off.
+#
+# For development point ZOELIBRARYAPP_SMTP_HOST at a local sink (the
+# `mailpit` compose profile) instead of a real relay.
+
+
+def _env_bool(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def smtp_config():
+    """SMTP settings from the environment; host is None when mail is off."""
+    return {
+        'host': os.getenv('ZOELIBRARYAPP_SMTP_HOST', '').strip() or None,
+        'port': int(os.getenv('ZOELIBRARYAPP_SMTP_PORT', '25')),
+        'username': os.getenv('ZOELIBRARYAPP_SMTP_USER', '') or None,
+        'password': os.getenv('ZOELIBRARYAPP_SMTP_PASSWORD', '') or None,
+        'starttls': _env_bool('ZOELIBRARYAPP_SMTP_STARTTLS', 'false'),
+        'sender': os.getenv('ZOELIBRARYAPP_SMTP_FROM', 'library@localhost'),
+        'pool_size': int(os.getenv('ZOELIBRARYAPP_SMTP_POOL_SIZE', '4')),
+        'rate_per_second': float(os.getenv('ZOELIBRARYAPP_SMTP_RATE_PER_SECOND', '20')),
+    }
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting as needed; False if none came within `timeout` seconds."""
+        if not self.rate:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """Up to `size` persistent SMTP connections, opened on first use."""
+
+    def __init__(self, host, port, size=4, username=None, password=None, starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.sent = 0
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.starttls:
+            conn.starttls()
+            conn.ehlo()
+        if self.username:
+            conn.login(self.username, self.password or '')
+        with self._lock:
+            self.connects += 1
+        return conn
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def send(self, message):
+        """
+        Send an email.message.EmailMessage on a pooled connection. A connection
+        the server dropped while idle is reopened once; refused recipients
+        raise smtplib.SMTPRecipientsRefused.
+        """
+        conn = self._idle.get()
+        try:
+            for attempt in (1, 2):
+                if conn is None:
+                    conn = self._connect()
+                try:
+                    conn.send_message(message)
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    stale = True
+                except smtplib.SMTPException:
+                    # The session is still usable; clear the failed transaction
+                    try:
+                        conn.rset()
+                    except OSError:
+                        self._discard(conn)
+                        conn = None
+                    raise
+                except OSError:
+                    # Socket error (SMTPException is an OSError, so this comes last)
+                    stale = True
+                if stale:
+                    self._discard(conn)
+                    conn = None
+                    if attempt == 2:
+                        raise smtplib.SMTPServerDisconnected(f"Lost connection to {self.host}:{self.port}")
+                    logger.info(f"Reconnecting to SMTP server {self.host}:{self.port}")
+            with self._lock:
+                self.sent += 1
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        """QUIT every open connection."""
+        for _ in range(self.size):
+            conn = self._idle.get()
+            if conn is not None:
+                try:
+                    conn.quit()
+                except Exception:
+                    self._discard(conn)
+            self._idle.put(None)
+
+
+def pool_from_config(config=None):
+    config = config or smtp_config()
+    return SMTPPool(config['host'], config['port'], config['pool_size'],
+                    config['username'], config['password'], config['starttls'])
+
+
+def send_all(pool, items, limiter=None):
+    """
+    Send (key, message) pairs concurrently, one thread per pooled
+    connection. Yields (key, error) as each finishes; error is None on success.
+    """
+    def send(key, message):
+        if limiter is not None:
+            limiter.acquire()
+        pool.send(message)
+        return key
+
+    with ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix='smtp') as executor:
+        futures = {executor.submit(send, key, message): key for key, message in items}
+        for future in as_completed(futures):
+            try:
+                yield future.result(), None
+            except Exception as e:
+                yield futures[future], e
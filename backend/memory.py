@@ -0,0 +1,320 @@
+import os
+import re
+import random
+import threading
+import logging
+import tracemalloc
+import uuid
+from collections import deque
+
+from flask import request, jsonify, g, current_app, stream_with_context, has_request_context
+
+from auth import BATCH_AUTH_KEY
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# PER-REQUEST MEMORY ACCOUNTING
+# =============================================================================
+#
+# A worker's RSS rarely shrinks: memory freed after a big fetchall() and
+# jsonify() stays with the process until gunicorn recycles it. With
+# ZOELIBRARYAPP_MEMORY_TRACKING set, every request is measured and the
+# figures are kept per route (under `memory` in /api/metrics/worker):
+#
+#   rss          RSS growth over the request, and its peak (VmHWM, reset
+#                at the start of the request when no other is in flight)
+#   tracemalloc  also the peak of Python allocations; for a sample of
+#                requests (ZOELIBRARYAPP_MEMORY_SAMPLE_RATE) the top
+#                allocation sites still alive when the response is built
+#
+# Peaks are per process: with gthread, a request that overlapped others
+# includes their allocations too (flagged `overlapped`). Requests whose
+# peak passes ZOELIBRARYAPP_MEMORY_LOG_MB are logged. tracemalloc slows
+# allocation-heavy code down noticeably; use it while investigating, not
+# permanently. With tracking off (the default) no hook is installed.
+
+TRACKING = os.getenv('ZOELIBRARYAPP_MEMORY_TRACKING', 'off')
+if TRACKING not in ('off', 'rss', 'tracemalloc'):
+    raise ValueError(f"ZOELIBRARYAPP_MEMORY_TRACKING must be off, rss or tracemalloc, got {TRACKING!r}")
+LOG_BYTES = float(os.getenv('ZOELIBRARYAPP_MEMORY_LOG_MB', '32')) * 1024 * 1024
+SAMPLE_RATE = float(os.getenv('ZOELIBRARYAPP_MEMORY_SAMPLE_RATE', '0.01'))
+TOP_N = int(os.getenv('ZOELIBRARYAPP_MEMORY_TOP_N', '10'))
+TRACE_FRAMES = 1
+ROUTES_REPORTED = 10
+SAMPLES_KEPT = 20
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+_lock = threading.Lock()
+_active = 0
+_generation = 0
+_routes = {}
+_samples = deque(maxlen=SAMPLES_KEPT)
+_guard = {'streamed': 0, 'rejected': 0}
+
+
+def rss_bytes():
+    """Current resident set size (0 where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _rss_peak_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            match = re.search(r'^VmHWM:\s+(\d+) kB', f.read(), re.MULTILINE)
+        return int(match.group(1)) * 1024 if match else None
+    except OSError:
+        return None
+
+
+def _reset_peaks():
+    try:
+        # "5" resets VmHWM to the current RSS (Linux 4.0+)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+
+
+def _route():
+    rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    return f'{request.method} {rule}'
+
+
+def request_started():
+    """before_request hook (installed when tracking is on)."""
+    global _active, _generation
+    if request.environ.get(BATCH_AUTH_KEY):
+        # Batch sub-requests are measured as part of the batch request
+        return
+    if TRACKING == 'tracemalloc' and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+    with _lock:
+        alone = _active == 0
+        _active += 1
+        _generation += 1
+        generation = _generation
+    if alone:
+        _reset_peaks()
+    tracing = tracemalloc.is_tracing()
+    g._memory = {
+        'alone': alone,
+        'generation': generation,
+        'rss': rss_bytes(),
+        'traced': tracemalloc.get_traced_memory()[0] if tracing else None,
+        'snapshot': tracemalloc.take_snapshot() if tracing and random.random() < SAMPLE_RATE else None,
+    }
+
+
+def record_response(response):
+    """after_request hook: note the response size; diff a sampled request's snapshot."""
+    memo = g.get('_memory')
+    if memo is None:
+        return response
+    memo['response_bytes'] = None if response.is_streamed else response.calculate_content_length()
+    if memo['snapshot'] is not None:
+        stats = tracemalloc.take_snapshot().compare_to(memo.pop('snapshot'), 'lineno')
+        memo['top'] = [
+            {'site': str(stat.traceback[0]), 'bytes': stat.size_diff, 'blocks': stat.count_diff}
+            for stat in stats[:TOP_N] if stat.size_diff > 0
+        ]
+    return response
+
+
+def request_finished(exc=None):
+    """teardown_request hook: account the request to its route and log it if heavy."""
+    global _active
+    memo = g.pop('_memory', None)
+    if memo is None:
+        return
+    with _lock:
+        _active -= 1
+        overlapped = not memo['alone'] or _generation != memo['generation']
+
+    rss_delta = rss_bytes() - memo['rss']
+    peak = (_rss_peak_bytes() or 0) - memo['rss']
+    if memo['traced'] is not None:
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - memo['traced'])
+    peak = max(peak, rss_delta, 0)
+    response_bytes = memo.get('response_bytes') or g.pop('_streamed_bytes', None)
+    route = _route()
+
+    with _lock:
+        stats = _routes.setdefault(route, {
+            'requests': 0, 'peak_bytes_max': 0, 'peak_bytes_total': 0,
+            'rss_growth_bytes': 0, 'response_bytes_max': 0, 'over_threshold': 0,
+        })
+        stats['requests'] += 1
+        stats['peak_bytes_max'] = max(stats['peak_bytes_max'], peak)
+        stats['peak_bytes_total'] += peak
+        stats['rss_growth_bytes'] += max(rss_delta, 0)
+        stats['response_bytes_max'] = max(stats['response_bytes_max'], response_bytes or 0)
+        if peak >= LOG_BYTES:
+            stats['over_threshold'] += 1
+        if 'top' in memo:
+            _samples.append({'route': route, 'peak_bytes': peak, 'response_bytes': response_bytes,
+                             'overlapped': overlapped, 'top': memo['top']})
+
+    if peak >= LOG_BYTES:
+        sites = ''.join(f"\n    {site['bytes'] / 1024:10.1f} KB  {site['site']}" for site in memo.get('top', []))
+        logger.warning(
+            f"High memory request {route} ({request.full_path}): peak +{peak / 2**20:.1f} MB, "
+            f"RSS +{rss_delta / 2**20:.1f} MB, response {(response_bytes or 0) / 1024:.0f} KB"
+            f"{' (overlapped other requests)' if overlapped else ''}{sites}"
+        )
+
+
+def install(app):
+    """Register the accounting hooks on the app when tracking is on."""
+    if TRACKING == 'off':
+        return
+    app.before_request(request_started)
+    app.after_request(record_response)
+    app.teardown_request(request_finished)
+
+
+def memory_stats():
+    """RSS, guard counters and the heaviest routes for this worker."""
+    with _lock:
+        routes = sorted(_routes.items(), key=lambda item: item[1]['peak_bytes_max'], reverse=True)
+        heaviest = [
+            {'route': route, **stats, 'peak_bytes_avg': stats['peak_bytes_total'] // stats['requests']}
+            for route, stats in routes[:ROUTES_REPORTED]
+        ]
+        guard = dict(_guard)
+        samples = list(_samples)
+    return {
+        'tracking': TRACKING,
+        'rss_bytes': rss_bytes(),
+        'response_budget_bytes': RESPONSE_BUDGET_BYTES,
+        'guard': guard,
+        'routes': heaviest,
+        'samples': samples,
+    }
+
+# =============================================================================
+# RESPONSE MEMORY BUDGET
+# =============================================================================
+#
+# List endpoints return whole tables as one JSON array. Fetched with
+# fetchall() and encoded by jsonify(), a row costs several times its width:
+# libpq's copy, a Python dict of Python values, the JSON text and its bytes
+# are all alive at once. rows_response() reads the rows from a server-side
+# cursor, STREAM_CHUNK_ROWS at a time. A result that ends within the first
+# chunk is answered with jsonify() as before; no EXPLAIN is run first. A
+# longer one is sized from its first chunk's JSON; once the rows fetched
+# pass ZOELIBRARYAPP_RESPONSE_MEMORY_MB it streams the same JSON array,
+# rows already fetched first (or, with
+# ZOELIBRARYAPP_RESPONSE_OVER_BUDGET=reject, answers 413).
+
+RESPONSE_BUDGET_BYTES = int(float(os.getenv('ZOELIBRARYAPP_RESPONSE_MEMORY_MB', '64')) * 1024 * 1024)
+OVER_BUDGET = os.getenv('ZOELIBRARYAPP_RESPONSE_OVER_BUDGET', 'stream')
+if OVER_BUDGET not in ('stream', 'reject'):
+    raise ValueError(f"ZOELIBRARYAPP_RESPONSE_OVER_BUDGET must be stream or reject, got {OVER_BUDGET!r}")
+STREAM_CHUNK_ROWS = 1000
+# Measured per fetched-and-jsonified row: ~1 KB of dict and object headers,
+# plus about 7 bytes per byte of the row's JSON across the copies listed above
+ROW_OVERHEAD_BYTES = 1024
+WIDTH_FACTOR = 7
+
+
+def budget_rows(chunk):
+    """(rows, encoded chunk): how many rows like the chunk's fit the budget."""
+    encoded = ','.join(current_app.json.dumps(row, separators=(',', ':')) for row in chunk).encode()
+    row_bytes = ROW_OVERHEAD_BYTES + WIDTH_FACTOR * len(encoded) / len(chunk)
+    return int(RESPONSE_BUDGET_BYTES // row_bytes), encoded
+
+
+def rows_response(conn, cur, query, params=None):
+    """
+    The query's rows as a JSON array, like jsonify(cur.fetchall()), within
+    the response memory budget. Closes cur and conn (after the last chunk,
+    when streaming).
+    """
+    if RESPONSE_BUDGET_BYTES <= 0:
+        cur.execute(query, params)
+        result = cur.fetchall()
+        cur.close()
+        conn.close()
+        return jsonify(result)
+
+    stream = conn.cursor(name=f'rows_{uuid.uuid4().hex}')
+    try:
+        # Plan for the whole result, as fetchall() would, not the first rows
+        cur.execute('SET LOCAL cursor_tuple_fraction = 1.0')
+        cur.close()
+        stream.execute(query, params)
+        # Fetched before the response starts, so a failing query is still a 500
+        result = stream.fetchmany(STREAM_CHUNK_ROWS)
+        encoded = None
+        if len(result) == STREAM_CHUNK_ROWS:
+            limit, encoded = budget_rows(result)
+            while len(result) <= limit:
+                chunk = stream.fetchmany(STREAM_CHUNK_ROWS)
+                result.extend(chunk)
+                if len(chunk) < STREAM_CHUNK_ROWS:
+                    break
+    except Exception:
+        conn.close()
+        raise
+    if encoded is None or len(result) <= limit:
+        stream.close()
+        conn.close()
+        return jsonify(result)
+
+    if OVER_BUDGET == 'reject':
+        stream.close()
+        conn.close()
+        with _lock:
+            _guard['rejected'] += 1
+        logger.warning(f"Rejected {request.path}: over {len(result)} rows, past {limit} in budget")
+        return jsonify({
+            'error': 'Result too large; narrow it with a search',
+            'max_rows': limit,
+        }), 413
+
+    with _lock:
+        _guard['streamed'] += 1
+    logger.info(f"Streaming {request.path}: over {len(result)} rows, past {limit} in budget")
+    return current_app.response_class(stream_with_context(_stream_rows(conn, stream, encoded, result)),
+                                      mimetype='application/json')
+
+
+def _stream_rows(conn, stream, first, fetched):
+    """The JSON array: `first` (the encoded first chunk), the rest of `fetched`, then the cursor."""
+    dumps = current_app.json.dumps
+    fetched = [fetched[i:i + STREAM_CHUNK_ROWS] for i in range(STREAM_CHUNK_ROWS, len(fetched), STREAM_CHUNK_ROWS)]
+    chunk = b'[' + first
+    sent = len(chunk)
+    try:
+        yield chunk
+        prefix = b','
+        while True:
+            if fetched:
+                rows = fetched.pop(0)
+            else:
+                rows = stream.fetchmany(STREAM_CHUNK_ROWS)
+            if not rows:
+                break
+            chunk = prefix + ','.join(dumps(row, separators=(',', ':')) for row in rows).encode()
+            prefix = b','
+            sent += len(chunk)
+            yield chunk
+        # jsonify ends its body with a newline too
+        tail = b']\n'
+        sent += len(tail)
+        yield tail
+    except Exception as e:
+        # Headers are gone: all we can do is end the body early
+        logger.error(f"Error streaming rows: {str(e)}")
+    finally:
+        if has_request_context():
+            g._streamed_bytes = sent
+        stream.close()
+        conn.close()
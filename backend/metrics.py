@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+
+from flask import request
+
+from admission import admission_stats
+from deadlines import deadline_stats
+from statements import statement_stats
+from auth import BATCH_AUTH_KEY
+from cache import cache_stats
+from covers import thumbnail_cache
+from memory import memory_stats
+from change_feed import listener
+from db import pool_stats, replica_stats, shard_stats
+from server_config import load_server_config
+
+# =============================================================================
+# WORKER METRICS
+# =============================================================================
+#
+# Per-process counters. Each gunicorn worker keeps its own; a metrics request
+# is answered by whichever worker accepts it, so poll a few times to sample
+# all of them. The listen queue depth is read from the kernel and is shared
+# by every worker on the socket.
+
+_lock = threading.Lock()
+_in_flight = 0
+_peak_in_flight = 0
+_served = 0
+# Threads currently inside a request, for the sampling profiler (profiler.py)
+_request_threads = set()
+_started_at = time.time()
+_config = None
+
+
+def request_started():
+    global _in_flight, _peak_in_flight
+    if request.environ.get(BATCH_AUTH_KEY):
+        # Batch sub-requests run inside the batch request's own slot
+        return
+    with _lock:
+        _in_flight += 1
+        _peak_in_flight = max(_peak_in_flight, _in_flight)
+        _request_threads.add(threading.get_ident())
+
+
+def request_finished(exc=None):
+    global _in_flight, _served
+    if request.environ.get(BATCH_AUTH_KEY):
+        return
+    with _lock:
+        _in_flight -= 1
+        _served += 1
+        _request_threads.discard(threading.get_ident())
+
+
+def request_threads():
+    """Idents of the threads serving a request right now."""
+    with _lock:
+        return frozenset(_request_threads)
+
+
+def listen_queue_depth(port):
+    """
+    Connections accepted by the kernel but not yet picked up by a worker,
+    read from /proc/net/tcp (the rx_queue of a LISTEN socket is its backlog).
+    Returns None where /proc is unavailable.
+    """
+    port_hex = f':{int(port):04X}'
+    depth = None
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # fields: sl, local_address, rem_address, st, tx_queue:rx_queue, ...
+                    if fields[1].endswith(port_hex) and fields[3] == '0A':
+                        rx_queue = int(fields[4].split(':')[1], 16)
+                        depth = (depth or 0) + rx_queue
+        except OSError:
+            continue
+    return depth
+
+
+def worker_stats():
+    """Saturation and queue-depth snapshot for this worker."""
+    global _config
+    if _config is None:
+        _config = load_server_config()
+
+    with _lock:
+        in_flight, peak, served = _in_flight, _peak_in_flight, _served
+
+    return {
+        'pid': os.getpid(),
+        'worker_class': _config['worker_class'],
+        'threads': _config['threads'],
+        'in_flight': in_flight,
+        'peak_in_flight': peak,
+        'saturation': round(in_flight / _config['threads'], 3),
+        'requests_served': served,
+        'uptime_seconds': round(time.time() - _started_at, 1),
+        'db_pool': pool_stats(),
+        'db_replicas': replica_stats(),
+        'db_shards': shard_stats(),
+        'cache': cache_stats(),
+        'covers': thumbnail_cache.stats(),
+        'memory': memory_stats(),
+        'admission': admission_stats(),
+        'deadlines': deadline_stats(),
+        'prepared_statements': statement_stats(),
+        'change_feed': listener.stats(),
+        'listen_queue': listen_queue_depth(os.getenv('ZOELIBRARYAPP_BACKEND_PORT', '5002')),
+    }
@@ -0,0 +1,402 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from auth import is_admin
+from metrics import request_threads
+from server_config import load_server_config
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# PROFILING
+# =============================================================================
+#
+# Two tools for finding where a worker's time goes, both for admins only
+# (ZOELIBRARYAPP_ADMIN_EMAILS) and both free while unused:
+#
+#   * A statistical sampler. A thread wakes `hz` times a second, reads every
+#     thread's stack with sys._current_frames() and counts it; the result is
+#     flamegraph.pl / speedscope "collapsed stacks" ("a;b;c 42" per line).
+#     Nothing is hooked into the interpreter, so the cost is the sampler's
+#     own wake-ups, and only while it runs. By default only threads serving
+#     a request are sampled, so idle pool threads don't bury the answer.
+#
+#   * Per-request cProfile. An admin request carrying X-Profile runs under
+#     cProfile; the response names the saved profile in X-Profile-Id. When
+#     the header is absent the middleware costs one dict lookup.
+#
+# Another worker is asked to sample by writing requests/<pid>.json under
+# ZOELIBRARYAPP_PROFILE_DIR and sending it SAMPLE_SIGNAL; it writes
+# results/<run>.<pid>.json when done. Only workers that installed the
+# handler (they list themselves in workers/) are ever signalled: the
+# default action of a real-time signal is to terminate the process.
+
+PROFILE_DIR = os.getenv('ZOELIBRARYAPP_PROFILE_DIR', '/tmp/library-profiles')
+# Real-time signal gunicorn does not use
+SAMPLE_SIGNAL = signal.SIGRTMIN + 4 if hasattr(signal, 'SIGRTMIN') else None
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+DEFAULT_HZ = 100
+MAX_HZ = 1000
+MAX_SECONDS = 60
+# Time for signalled workers to write their results after the run
+RESULT_GRACE_SECONDS = 5
+RETENTION_SECONDS = 24 * 3600
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+# One sampler per process at a time
+_sampling = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """This worker is already sampling."""
+
+
+def _path(*parts):
+    return os.path.join(PROFILE_DIR, *parts)
+
+
+def _write_json(path, data):
+    """Write atomically, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _prune(directory):
+    """Remove files left behind longer than RETENTION_SECONDS ago."""
+    cutoff = time.time() - RETENTION_SECONDS
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def max_seconds():
+    """
+    Longest run this worker can take part in. A sync worker busy with the
+    sampling request sends no heartbeat, so stay inside its timeout.
+    """
+    config = load_server_config()
+    if config['worker_class'] == 'sync':
+        return max(1, min(MAX_SECONDS, config['timeout'] - RESULT_GRACE_SECONDS - 1))
+    return MAX_SECONDS
+
+# =============================================================================
+# SAMPLING PROFILER
+# =============================================================================
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(BACKEND_DIR + os.sep):
+        filename = filename[len(BACKEND_DIR) + 1:]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+def _thread_label(ident, names):
+    name = names.get(ident)
+    if name is None:
+        names.update((t.ident, t.name) for t in threading.enumerate())
+        name = names.get(ident, f'thread-{ident}')
+    # Pool threads are numbered; fold them into one root per pool
+    return re.sub(r'[-_]\d+$', '', name)
+
+
+def sample(seconds, hz=DEFAULT_HZ, all_threads=False):
+    """
+    Sample this process's stacks for `seconds`. Returns (stacks, samples):
+    a Counter of collapsed stacks (root first) and the number of wake-ups.
+    With all_threads every thread is sampled, under a root frame named
+    after the thread; otherwise only threads serving a request.
+    Raises ProfilerBusy if a run is already in progress here.
+    """
+    if not _sampling.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        labels = {}
+        names = {}
+        stacks = Counter()
+        samples = 0
+        next_at = time.monotonic()
+        deadline = next_at + seconds
+        while next_at < deadline:
+            busy = None if all_threads else request_threads()
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (busy is not None and ident not in busy):
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    frames.append(label)
+                    frame = frame.f_back
+                if all_threads:
+                    frames.append(_thread_label(ident, names))
+                frames.reverse()
+                stacks[';'.join(frames)] += 1
+            samples += 1
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind (GIL contention): skip the missed ticks, don't burst
+                next_at = time.monotonic()
+        return stacks, samples
+    finally:
+        _sampling.release()
+
+
+def collapsed(stacks):
+    """Collapsed-stack text, heaviest stacks first."""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+# =============================================================================
+# CROSS-WORKER SAMPLING
+# =============================================================================
+
+def _parent_pid(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # "pid (comm) state ppid ..."; comm may itself contain ')'
+            return int(f.read().rsplit(')', 1)[1].split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def install():
+    """
+    Called in each gunicorn worker after fork (app.warm_up): handle
+    SAMPLE_SIGNAL and list this worker as safe to signal.
+    """
+    if SAMPLE_SIGNAL is None:
+        return
+    signal.signal(SAMPLE_SIGNAL, _on_sample_signal)
+    os.makedirs(_path('workers'), exist_ok=True)
+    with open(_path('workers', str(os.getpid())), 'w'):
+        pass
+
+
+def uninstall():
+    """Called when a worker exits, so its pid is never signalled again."""
+    try:
+        os.unlink(_path('workers', str(os.getpid())))
+    except OSError:
+        pass
+
+
+def worker_pids():
+    """This worker and its live siblings that can be asked to sample."""
+    me, parent = os.getpid(), os.getppid()
+    pids = {me}
+    try:
+        names = os.listdir(_path('workers'))
+    except OSError:
+        names = []
+    for name in names:
+        if not name.isdigit():
+            continue
+        pid = int(name)
+        if pid == me:
+            continue
+        if _parent_pid(pid) == parent:
+            pids.add(pid)
+        else:
+            # Exited without uninstall (killed); the pid may be reused
+            try:
+                os.unlink(_path('workers', name))
+            except OSError:
+                pass
+    return sorted(pids)
+
+
+def _on_sample_signal(signum, frame):
+    path = _path('requests', f'{os.getpid()}.json')
+    try:
+        with open(path) as f:
+            run = json.load(f)
+        os.unlink(path)
+    except (OSError, ValueError):
+        return
+    # Handlers run on the main thread between bytecodes: hand off at once
+    threading.Thread(target=_sample_for, args=(run,), name='profiler', daemon=True).start()
+
+
+def _sample_for(run):
+    pid = os.getpid()
+    result = {'pid': pid}
+    try:
+        stacks, samples = sample(run['seconds'], run['hz'], run['all_threads'])
+        result.update(samples=samples, stacks=stacks)
+    except ProfilerBusy:
+        result['error'] = 'busy'
+    except Exception as e:
+        logger.error(f"Error sampling worker {pid}: {str(e)}")
+        result['error'] = str(e)
+    _write_json(_path('results', f"{run['id']}.{pid}.json"), result)
+
+
+def sample_workers(pids, seconds, hz=DEFAULT_HZ, all_threads=False):
+    """
+    Sample the given workers (this one included, if listed) for `seconds`
+    at once. Returns (stacks, workers): the merged Counter, and per pid the
+    number of samples or an error ('busy', 'no result').
+    """
+    me = os.getpid()
+    run = {'id': uuid.uuid4().hex, 'seconds': seconds, 'hz': hz, 'all_threads': all_threads}
+    _prune(_path('requests'))
+    _prune(_path('results'))
+
+    workers = {}
+    pending = set()
+    for pid in pids:
+        if pid == me:
+            continue
+        request_path = _path('requests', f'{pid}.json')
+        _write_json(request_path, run)
+        try:
+            os.kill(pid, SAMPLE_SIGNAL)
+            pending.add(pid)
+        except (OSError, TypeError) as e:
+            os.unlink(request_path)
+            workers[pid] = {'error': str(e)}
+
+    stacks = Counter()
+    if me in pids:
+        try:
+            local, samples = sample(seconds, hz, all_threads)
+            stacks.update(local)
+            workers[me] = {'samples': samples}
+        except ProfilerBusy:
+            workers[me] = {'error': 'busy'}
+    elif pending:
+        time.sleep(seconds)
+
+    deadline = time.monotonic() + RESULT_GRACE_SECONDS
+    while pending:
+        for pid in list(pending):
+            path = _path('results', f"{run['id']}.{pid}.json")
+            try:
+                with open(path) as f:
+                    result = json.load(f)
+                os.unlink(path)
+            except (OSError, ValueError):
+                continue
+            pending.discard(pid)
+            if 'error' in result:
+                workers[pid] = {'error': result['error']}
+            else:
+                stacks.update(result['stacks'])
+                workers[pid] = {'samples': result['samples']}
+        if pending and time.monotonic() >= deadline:
+            break
+        if pending:
+            time.sleep(0.1)
+    for pid in pending:
+        workers[pid] = {'error': 'no result'}
+    return stacks, workers
+
+# =============================================================================
+# PER-REQUEST CPROFILE
+# =============================================================================
+
+class RequestProfiler:
+    """
+    WSGI middleware: run an admin's request carrying an X-Profile header
+    under cProfile, save the profile and name it in X-Profile-Id. Streamed
+    bodies are produced after the call returns and are not included.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if PROFILE_HEADER not in environ or not is_admin(environ.get('HTTP_X_USER_EMAIL')):
+            return self.wsgi_app(environ, start_response)
+
+        profile_id = uuid.uuid4().hex
+        status = []
+
+        def start(response_status, headers, exc_info=None):
+            status.append(response_status)
+            headers.append(('X-Profile-Id', profile_id))
+            return start_response(response_status, headers, exc_info)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            return profile.runcall(self.wsgi_app, environ, start)
+        finally:
+            elapsed = time.perf_counter() - started
+            try:
+                _save_profile(profile_id, profile, {
+                    'id': profile_id,
+                    'method': environ.get('REQUEST_METHOD'),
+                    'path': environ.get('PATH_INFO'),
+                    'query': environ.get('QUERY_STRING') or None,
+                    'status': status[0] if status else None,
+                    'seconds': round(elapsed, 6),
+                    'pid': os.getpid(),
+                    'created_at': time.time(),
+                })
+            except Exception as e:
+                logger.error(f"Error saving request profile: {str(e)}")
+
+
+def _save_profile(profile_id, profile, meta):
+    directory = _path('profiles')
+    os.makedirs(directory, exist_ok=True)
+    _prune(directory)
+    profile.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+    _write_json(os.path.join(directory, f'{profile_id}.json'), meta)
+
+
+def profile_path(profile_id):
+    """Path of a saved .prof file (pstats format), or None."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = _path('profiles', f'{profile_id}.prof')
+    return path if os.path.exists(path) else None
+
+
+def profile_report(profile_id, sort='cumulative', limit=50):
+    """A saved profile's request details plus pstats text, or None."""
+    path = profile_path(profile_id)
+    if path is None:
+        return None
+    with open(_path('profiles', f'{profile_id}.json')) as f:
+        meta = json.load(f)
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    meta['stats'] = out.getvalue()
+    return meta
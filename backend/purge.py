@@ -0,0 +1,269 @@
+import os
+import time
+import logging
+
+from psycopg2.errors import LockNotAvailable
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SOFT-DELETE PURGER
+# =============================================================================
+#
+# Deleting a book or borrower only sets deleted_at
+# (database/migrations/add_soft_delete.sql). Deleting the rows at once would
+# cascade through every copy, checkout and follow-up they ever had, in one
+# transaction that holds row locks for as long as it runs. The job worker
+# calls purge_deleted() on each shard every
+# ZOELIBRARYAPP_PURGE_INTERVAL_SECONDS instead, and it removes what the
+# soft-deleted rows leave behind, leaf tables first:
+#
+#   checkouts of deleted books -> their copies -> the books
+#   checkouts of deleted borrowers -> the borrowers
+#
+# Each step deletes up to ZOELIBRARYAPP_PURGE_BATCH_SIZE rows per
+# transaction. A row is deleted only once nothing large still hangs off it,
+# so the remaining cascade stays bounded per batch (follow-ups, holds). Each
+# batch:
+#
+#   - runs with a short lock_timeout, and on a conflict gives way to
+#     circulation until the next pass;
+#   - is followed by a ZOELIBRARYAPP_PURGE_PAUSE_MS pause;
+#   - stops the pass after ZOELIBRARYAPP_PURGE_MAX_SECONDS.
+#
+# Tenants being moved, or living on another shard, are skipped
+# (jobs.tenants_away), as the job worker skips their jobs.
+#
+# Purged checkouts still leave sync tombstones, which analytics uses to drop
+# their loan facts. They are not announced on the change feed: clients
+# already saw the soft deletion.
+
+INTERVAL_SECONDS = int(os.getenv('ZOELIBRARYAPP_PURGE_INTERVAL_SECONDS', '60'))
+BATCH_SIZE = int(os.getenv('ZOELIBRARYAPP_PURGE_BATCH_SIZE', '500'))
+PAUSE_SECONDS = int(os.getenv('ZOELIBRARYAPP_PURGE_PAUSE_MS', '100')) / 1000
+MAX_SECONDS = float(os.getenv('ZOELIBRARYAPP_PURGE_MAX_SECONDS', '30'))
+LOCK_TIMEOUT_MS = 100
+# Session-level advisory lock: one purger per shard at a time
+LOCK_KEY = 0x70757267  # 'purg'
+
+# (summary key, DELETE of one batch of rows of tenants not in the first %s,
+# at most the second %s), in dependency order
+STEPS = (
+    ('book_checkouts', '''
+        DELETE FROM checkouts WHERE id IN (
+            SELECT co.id
+            FROM books b
+            JOIN book_copies bc ON bc.book_id = b.id
+            JOIN checkouts co ON co.copy_id = bc.id
+            WHERE b.deleted_at IS NOT NULL AND b.user_id <> ALL(%s::uuid[])
+            LIMIT %s
+        )
+    '''),
+    ('copies', '''
+        DELETE FROM book_copies WHERE id IN (
+            SELECT bc.id
+            FROM books b
+            JOIN book_copies bc ON bc.book_id = b.id
+            WHERE b.deleted_at IS NOT NULL AND b.user_id <> ALL(%s::uuid[])
+              AND NOT EXISTS (SELECT 1 FROM checkouts co WHERE co.copy_id = bc.id)
+            LIMIT %s
+        )
+    '''),
+    ('books', '''
+        DELETE FROM books WHERE id IN (
+            SELECT b.id
+            FROM books b
+            WHERE b.deleted_at IS NOT NULL AND b.user_id <> ALL(%s::uuid[])
+              AND NOT EXISTS (SELECT 1 FROM book_copies bc WHERE bc.book_id = b.id)
+            LIMIT %s
+        )
+    '''),
+    ('borrower_checkouts', '''
+        DELETE FROM checkouts WHERE id IN (
+            SELECT co.id
+            FROM borrowers br
+            JOIN checkouts co ON co.borrower_id = br.id
+            WHERE br.deleted_at IS NOT NULL AND br.user_id <> ALL(%s::uuid[])
+            LIMIT %s
+        )
+    '''),
+    ('borrowers', '''
+        DELETE FROM borrowers WHERE id IN (
+            SELECT br.id
+            FROM borrowers br
+            WHERE br.deleted_at IS NOT NULL AND br.user_id <> ALL(%s::uuid[])
+              AND NOT EXISTS (SELECT 1 FROM checkouts co WHERE co.borrower_id = br.id)
+            LIMIT %s
+        )
+    '''),
+)
+
+
+def _delete_batch(conn, cur, sql, params, purging=True):
+    """One batch in its own transaction; None if it gave way to a lock."""
+    try:
+        cur.execute('SET LOCAL lock_timeout = %s', (LOCK_TIMEOUT_MS,))
+        if purging:
+            cur.execute("SET LOCAL library.purging = 'on'")
+        cur.execute(sql, params)
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
+    except LockNotAvailable:
+        conn.rollback()
+        return None
+
+
+def _run_steps(conn, lock_key, steps, batch_size, pause, max_seconds, purging=True):
+    """
+    Run each (key, sql, params) step in batches under the session advisory
+    lock `lock_key`. Returns a summary, or None if another process holds it.
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT pg_try_advisory_lock(%s) AS locked', (lock_key,))
+    locked = cur.fetchone()['locked']
+    conn.commit()
+    if not locked:
+        cur.close()
+        return None
+
+    started = time.monotonic()
+    summary = {key: 0 for key, _, _ in steps}
+    summary.update({'batches': 0, 'lock_timeouts': 0, 'finished': True})
+    try:
+        for key, sql, params in steps:
+            while True:
+                if time.monotonic() - started > max_seconds:
+                    summary['finished'] = False
+                    break
+                deleted = _delete_batch(conn, cur, sql, params, purging)
+                if deleted is None:
+                    summary['lock_timeouts'] += 1
+                    break
+                summary[key] += deleted
+                summary['batches'] += 1
+                if deleted < batch_size:
+                    break
+                time.sleep(pause)
+            if not summary['finished']:
+                break
+    finally:
+        conn.rollback()
+        cur.execute('SELECT pg_advisory_unlock(%s)', (lock_key,))
+        conn.commit()
+        cur.close()
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return summary
+
+
+def purge_deleted(conn, batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, max_seconds=MAX_SECONDS, skip_users=()):
+    """
+    One pass on the connection's shard, committing per batch, leaving the
+    tenants in `skip_users` alone. Returns a summary, or None if another
+    process is purging the shard.
+    """
+    params = (list(skip_users), batch_size)
+    steps = [(key, sql, params) for key, sql in STEPS]
+    return _run_steps(conn, LOCK_KEY, steps, batch_size, pause, max_seconds)
+
+
+def pending_purge(cur):
+    """Soft-deleted books and borrowers not purged yet on the cursor's shard."""
+    cur.execute('''
+        SELECT (SELECT COUNT(*) FROM books WHERE deleted_at IS NOT NULL) AS books,
+               (SELECT COUNT(*) FROM borrowers WHERE deleted_at IS NOT NULL) AS borrowers
+    ''')
+    return cur.fetchone()
+
+# =============================================================================
+# RETENTION
+# =============================================================================
+#
+# Sync tombstones, idempotency keys and inventory audits expire by age. The
+# job worker deletes them on each shard every PRUNE_INTERVAL_SECONDS
+# (job_worker._prune), in the same batches as the purger and under its own
+# advisory lock, so one process does it per shard however many API workers
+# run. An audit's scans and results are deleted before the audit, so
+# deleting the audit no longer cascades through a large upload.
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('ZOELIBRARYAPP_SYNC_TOMBSTONE_DAYS', '30'))
+AUDIT_RETENTION_DAYS = int(os.getenv('ZOELIBRARYAPP_AUDIT_RETENTION_DAYS', '30'))
+# Open audits still take scans: kept until this long after their last one
+OPEN_AUDIT_RETENTION_DAYS = int(os.getenv('ZOELIBRARYAPP_OPEN_AUDIT_RETENTION_DAYS', '365'))
+RETENTION_LOCK_KEY = 0x72657465  # 'rete'
+
+# Finished and applied audits count from when they were closed, open ones
+# from their last scan
+EXPIRED_AUDIT = '''
+    ((a.status <> 'open'
+      AND COALESCE(a.applied_at, a.finished_at, a.updated_at) < NOW() - make_interval(days => %(closed_days)s))
+     OR (a.status = 'open'
+         AND a.updated_at < NOW() - make_interval(days => %(open_days)s)
+         AND NOT EXISTS (
+             SELECT 1 FROM audit_scans s
+             WHERE s.audit_id = a.id AND s.scanned_at >= NOW() - make_interval(days => %(open_days)s)
+         )))
+'''
+
+# (summary key, DELETE of one batch of at most %(batch_size)s rows), in
+# dependency order
+RETENTION_STEPS = (
+    ('sync_tombstones', '''
+        DELETE FROM sync_tombstones WHERE id IN (
+            SELECT id FROM sync_tombstones
+            WHERE deleted_at < NOW() - make_interval(days => %(tombstone_days)s)
+            LIMIT %(batch_size)s
+        )
+    '''),
+    ('idempotency_keys', '''
+        DELETE FROM idempotency_keys WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM idempotency_keys
+            WHERE expires_at < NOW()
+            LIMIT %(batch_size)s
+        ))
+    '''),
+    ('audit_scans', '''
+        DELETE FROM audit_scans WHERE id IN (
+            SELECT s.id
+            FROM inventory_audits a
+            JOIN audit_scans s ON s.audit_id = a.id
+            WHERE ''' + EXPIRED_AUDIT + '''
+            LIMIT %(batch_size)s
+        )
+    '''),
+    ('audit_results', '''
+        DELETE FROM audit_results WHERE id IN (
+            SELECT r.id
+            FROM inventory_audits a
+            JOIN audit_results r ON r.audit_id = a.id
+            WHERE ''' + EXPIRED_AUDIT + '''
+            LIMIT %(batch_size)s
+        )
+    '''),
+    ('audits', '''
+        DELETE FROM inventory_audits WHERE id IN (
+            SELECT a.id
+            FROM inventory_audits a
+            WHERE ''' + EXPIRED_AUDIT + '''
+              AND NOT EXISTS (SELECT 1 FROM audit_scans s WHERE s.audit_id = a.id)
+              AND NOT EXISTS (SELECT 1 FROM audit_results r WHERE r.audit_id = a.id)
+            LIMIT %(batch_size)s
+        )
+    '''),
+)
+
+
+def prune_retained(conn, batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, max_seconds=MAX_SECONDS):
+    """
+    Delete expired sync tombstones, idempotency keys and audits on the
+    connection's shard, committing per batch. Returns a summary, or None if
+    another process is pruning the shard.
+    """
+    params = {
+        'tombstone_days': TOMBSTONE_RETENTION_DAYS,
+        'closed_days': AUDIT_RETENTION_DAYS,
+        'open_days': OPEN_AUDIT_RETENTION_DAYS,
+        'batch_size': batch_size,
+    }
+    steps = [(key, sql, params) for key, sql in RETENTION_STEPS]
+    return _run_steps(conn, RETENTION_LOCK_KEY, steps, batch_size, pause, max_seconds, purging=False)
@@ -0,0 +1,152 @@
+import os
+import logging
+from itertools import groupby
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from flask import render_template
+
+from db import get_db_connection
+from jobs import job, PermanentJobError
+from mailer import smtp_config, pool_from_config, send_all, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# OVERDUE REMINDERS
+# =============================================================================
+#
+# The overdue_reminders job emails every borrower with overdue checkouts one
+# message listing their overdue books (templates/reminders/), sends them
+# through the SMTP pool (mailer.py) and marks each checkout's follow-up
+# Contacted, creating the follow-up if there is none. A checkout is
+# reminded again only after ZOELIBRARYAPP_REMINDER_INTERVAL_DAYS, and never
+# once its follow-up is Resolved or Escalated. Follow-ups are marked in
+# batches as sends complete, so a retried job does not email anyone twice.
+
+INTERVAL_DAYS = int(os.getenv('ZOELIBRARYAPP_REMINDER_INTERVAL_DAYS', '7'))
+MARK_BATCH_SIZE = 200
+REMINDER_REASON = 'Overdue reminder sent by email'
+
+
+def select_overdue(cur, user_id, checkout_ids=None):
+    """Overdue checkouts due a reminder, with borrower and book, grouped by borrower."""
+    sql = '''
+        SELECT co.id AS checkout_id, co.due_date,
+               (CURRENT_DATE - co.due_date) AS days_overdue,
+               b.title, b.author, bc.copy_number,
+               br.id AS borrower_id, br.first_name, br.last_name, br.email, br.phone,
+               u.email AS library_email
+        FROM checkouts co
+        JOIN borrowers br ON co.borrower_id = br.id
+        JOIN book_copies bc ON co.copy_id = bc.id
+        JOIN books b ON bc.book_id = b.id
+        JOIN users u ON co.user_id = u.id
+        LEFT JOIN LATERAL (
+            SELECT status, contacted_date
+            FROM follow_ups
+            WHERE checkout_id = co.id
+            ORDER BY created_at DESC
+            LIMIT 1
+        ) fu ON TRUE
+        WHERE co.user_id = %s
+          AND co.return_date IS NULL
+          AND co.due_date < CURRENT_DATE
+          AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+          AND br.email <> ''
+          AND (fu.status IS NULL
+               OR (fu.status IN ('Pending', 'Contacted')
+                   AND (fu.contacted_date IS NULL
+                        OR fu.contacted_date < NOW() - make_interval(days => %s))))
+    '''
+    params = [user_id, INTERVAL_DAYS]
+    if checkout_ids:
+        sql += ' AND co.id = ANY(%s::uuid[])'
+        params.append(list(checkout_ids))
+    sql += ' ORDER BY br.id, co.due_date'
+    cur.execute(sql, params)
+    return [list(rows) for _, rows in groupby(cur.fetchall(), key=lambda row: row['borrower_id'])]
+
+
+def render_reminder(items, sender):
+    """One EmailMessage for a borrower's overdue `items`."""
+    borrower = items[0]
+    context = {'borrower': borrower, 'items': items}
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = formataddr((f"{borrower['first_name']} {borrower['last_name']}", borrower['email']))
+    message['Reply-To'] = borrower['library_email']
+    message['Subject'] = render_template('reminders/overdue_subject.txt', **context).strip()
+    message.set_content(render_template('reminders/overdue.txt', **context))
+    message.add_alternative(render_template('reminders/overdue.html', **context), subtype='html')
+    return message
+
+
+def mark_contacted(cur, user_id, checkout_ids):
+    """Set the checkouts' follow-ups to Contacted now, creating missing ones."""
+    cur.execute('''
+        UPDATE follow_ups
+        SET status = 'Contacted', contacted_date = NOW()
+        WHERE user_id = %s AND checkout_id = ANY(%s::uuid[]) AND status IN ('Pending', 'Contacted')
+    ''', (user_id, checkout_ids))
+    cur.execute('''
+        INSERT INTO follow_ups (checkout_id, user_id, reason, status, contacted_date)
+        SELECT t.id, %s, %s, 'Contacted', NOW()
+        FROM unnest(%s::uuid[]) AS t(id)
+        WHERE NOT EXISTS (SELECT 1 FROM follow_ups fu WHERE fu.checkout_id = t.id)
+    ''', (user_id, REMINDER_REASON, checkout_ids))
+
+
+@job('overdue_reminders', max_attempts=3)
+def send_overdue_reminders(context, payload):
+    """Email overdue reminders (optionally only `checkout_ids`) and record the contact."""
+    config = smtp_config()
+    if not config['host']:
+        raise PermanentJobError('Email is not configured (ZOELIBRARYAPP_SMTP_HOST)')
+
+    conn = get_db_connection(primary=True)
+    cur = conn.cursor()
+    groups = select_overdue(cur, context.user_id, payload.get('checkout_ids'))
+    conn.commit()
+
+    total = len(groups)
+    context.progress(0, total, f'Sending {total} reminders', force=True)
+    messages = [(index, render_reminder(items, config['sender'])) for index, items in enumerate(groups)]
+
+    pool = pool_from_config(config)
+    limiter = RateLimiter(config['rate_per_second'])
+    sent = 0
+    failures = []
+    pending = []
+    try:
+        for index, error in send_all(pool, messages, limiter):
+            if error is not None:
+                failures.append({'email': groups[index][0]['email'], 'error': str(error)})
+                continue
+            sent += 1
+            pending.extend(str(item['checkout_id']) for item in groups[index])
+            if len(pending) >= MARK_BATCH_SIZE:
+                mark_contacted(cur, context.user_id, pending)
+                conn.commit()
+                pending = []
+            context.progress(sent + len(failures), total)
+    finally:
+        if pending:
+            mark_contacted(cur, context.user_id, pending)
+            conn.commit()
+        cur.close()
+        conn.close()
+        pool.close()
+
+    logger.info(f"Overdue reminders for {context.user_id}: {sent} sent, {len(failures)} failed")
+    if failures and not sent:
+        # Nothing got through (relay down?): let the job retry
+        raise RuntimeError(f"All {len(failures)} reminders failed: {failures[0]['error']}")
+
+    return {
+        'borrowers': total,
+        'sent': sent,
+        'failed': len(failures),
+        'failures': failures[:50],
+        'smtp_connections': pool.connects,
+    }
@@ -0,0 +1,28 @@
+from routes import system, books, copies, borrowers, circulation, wishlist, follow_ups, dashboard, events, sync, batch, jobs, audits, holds, labels, covers, analytics, profiler
+
+BLUEPRINTS = (
+    system.bp,
+    books.bp,
+    copies.bp,
+    borrowers.bp,
+    circulation.bp,
+    wishlist.bp,
+    follow_ups.bp,
+    dashboard.bp,
+    events.bp,
+    sync.bp,
+    batch.bp,
+    jobs.bp,
+    audits.bp,
+    holds.bp,
+    labels.bp,
+    covers.bp,
+    analytics.bp,
+    profiler.bp,
+)
+
+
+def register_blueprints(app):
+    """Attach every subsystem blueprint to the app."""
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
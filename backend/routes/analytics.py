@@ -0,0 +1,266 @@
+from flask import Blueprint, request, jsonify, g
+from datetime import date, timedelta
+import logging
+import uuid
+
+from analytics import SNAPSHOT_COLUMNS
+from auth import token_required
+from cache import cached_response, ANALYTICS
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('analytics', __name__)
+
+INTERVALS = ('day', 'week', 'month', 'year')
+DEFAULT_DAYS = 365
+MAX_LIMIT = 100
+
+
+def _cache_key():
+    """Cache key for an analytics response: endpoint and query string."""
+    return request.full_path
+
+
+def _date_range():
+    """(from, to) dates from ?from=&to= (YYYY-MM-DD, inclusive); the last year by default."""
+    to = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+    since = (date.fromisoformat(request.args['from']) if request.args.get('from')
+             else to - timedelta(days=DEFAULT_DAYS - 1))
+    if since > to:
+        raise ValueError('from must not be after to')
+    return since, to
+
+
+def _limit():
+    limit = int(request.args.get('limit', 10))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def _as_of(cur):
+    """When the rollups were last brought up to date (None before the first pass)."""
+    cur.execute('SELECT watermark FROM analytics_state')
+    row = cur.fetchone()
+    return row['watermark'].isoformat() if row and row['watermark'] else None
+
+
+def _avg_duration(row):
+    return round(row['loan_days'] / row['returns'], 1) if row['returns'] else None
+
+# =============================================================================
+# ANALYTICS ENDPOINTS
+# =============================================================================
+#
+# Every endpoint reads the rollup tables maintained by the job worker
+# (analytics.py), never the checkouts join; names for top-N lists are looked
+# up by primary key for the returned rows only. Figures are as of `as_of`.
+
+@bp.route('/api/analytics/loans', methods=['GET'])
+@token_required
+@cached_response(ANALYTICS, _cache_key)
+def get_loan_series():
+    """
+    Loans, returns and average loan duration per ?interval= (day, week,
+    month, year) between ?from= and ?to=, for the whole library or one
+    ?genre=, ?borrower_id= or ?book_id=.
+    """
+    try:
+        try:
+            since, to = _date_range()
+            interval = request.args.get('interval', 'month')
+            if interval not in INTERVALS:
+                raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+            dimension, key = 'all', ''
+            if request.args.get('genre'):
+                dimension, key = 'genre', request.args['genre']
+            for name, column in (('borrower', 'borrower_id'), ('book', 'book_id')):
+                if request.args.get(column):
+                    dimension, key = name, str(uuid.UUID(request.args[column]))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT to_char(date_trunc(%s, day), 'YYYY-MM-DD') AS period,
+                   SUM(loans)::int AS loans, SUM(returns)::int AS returns, SUM(loan_days)::bigint AS loan_days
+            FROM loan_rollups
+            WHERE user_id = %s AND dimension = %s AND key = %s AND day BETWEEN %s AND %s
+            GROUP BY 1
+            ORDER BY 1
+        ''', (interval, str(g.user_id), dimension, key, since, to))
+        series = cur.fetchall()
+        as_of = _as_of(cur)
+        cur.close()
+        conn.close()
+
+        totals = {
+            'loans': sum(row['loans'] for row in series),
+            'returns': sum(row['returns'] for row in series),
+            'loan_days': sum(row['loan_days'] for row in series),
+        }
+        for row in series + [totals]:
+            row['avg_duration_days'] = _avg_duration(row)
+
+        return jsonify({
+            'as_of': as_of,
+            'from': since.isoformat(),
+            'to': to.isoformat(),
+            'interval': interval,
+            'dimension': dimension,
+            'key': key or None,
+            'series': series,
+            'totals': totals,
+        })
+
+    except Exception as e:
+        logger.error(f"Error fetching loan analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/analytics/genres', methods=['GET'])
+@token_required
+@cached_response(ANALYTICS, _cache_key)
+def get_genre_breakdown():
+    """Loans, returns and average loan duration per genre between ?from= and ?to=."""
+    try:
+        try:
+            since, to = _date_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT key AS genre,
+                   SUM(loans)::int AS loans, SUM(returns)::int AS returns, SUM(loan_days)::bigint AS loan_days
+            FROM loan_rollups
+            WHERE user_id = %s AND dimension = 'genre' AND day BETWEEN %s AND %s
+            GROUP BY key
+            ORDER BY loans DESC, key
+        ''', (str(g.user_id), since, to))
+        genres = cur.fetchall()
+        as_of = _as_of(cur)
+        cur.close()
+        conn.close()
+
+        for row in genres:
+            row['avg_duration_days'] = _avg_duration(row)
+        return jsonify({'as_of': as_of, 'from': since.isoformat(), 'to': to.isoformat(), 'genres': genres})
+
+    except Exception as e:
+        logger.error(f"Error fetching genre analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/analytics/titles', methods=['GET'])
+@token_required
+@cached_response(ANALYTICS, _cache_key)
+def get_top_titles():
+    """Most-borrowed titles between ?from= and ?to= (?limit=, default 10)."""
+    try:
+        try:
+            since, to = _date_range()
+            limit = _limit()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT top.key::uuid AS book_id, top.loans, top.returns, top.loan_days, b.title, b.author
+            FROM (
+                SELECT key, SUM(loans)::int AS loans, SUM(returns)::int AS returns,
+                       SUM(loan_days)::bigint AS loan_days
+                FROM loan_rollups
+                WHERE user_id = %s AND dimension = 'book' AND day BETWEEN %s AND %s
+                GROUP BY key
+                ORDER BY loans DESC, key
+                LIMIT %s
+            ) top
+            LEFT JOIN books b ON b.id = top.key::uuid
+            ORDER BY top.loans DESC, b.title
+        ''', (str(g.user_id), since, to, limit))
+        titles = cur.fetchall()
+        as_of = _as_of(cur)
+        cur.close()
+        conn.close()
+
+        for row in titles:
+            row['avg_duration_days'] = _avg_duration(row)
+        return jsonify({'as_of': as_of, 'from': since.isoformat(), 'to': to.isoformat(), 'titles': titles})
+
+    except Exception as e:
+        logger.error(f"Error fetching title analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/analytics/borrowers', methods=['GET'])
+@token_required
+@cached_response(ANALYTICS, _cache_key)
+def get_top_borrowers():
+    """Borrowers with the most loans between ?from= and ?to= (?limit=, default 10)."""
+    try:
+        try:
+            since, to = _date_range()
+            limit = _limit()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT top.key::uuid AS borrower_id, top.loans, top.returns, top.loan_days,
+                   br.first_name, br.last_name
+            FROM (
+                SELECT key, SUM(loans)::int AS loans, SUM(returns)::int AS returns,
+                       SUM(loan_days)::bigint AS loan_days
+                FROM loan_rollups
+                WHERE user_id = %s AND dimension = 'borrower' AND day BETWEEN %s AND %s
+                GROUP BY key
+                ORDER BY loans DESC, key
+                LIMIT %s
+            ) top
+            LEFT JOIN borrowers br ON br.id = top.key::uuid
+            ORDER BY top.loans DESC, br.last_name, br.first_name
+        ''', (str(g.user_id), since, to, limit))
+        borrowers = cur.fetchall()
+        as_of = _as_of(cur)
+        cur.close()
+        conn.close()
+
+        for row in borrowers:
+            row['avg_duration_days'] = _avg_duration(row)
+        return jsonify({'as_of': as_of, 'from': since.isoformat(), 'to': to.isoformat(), 'borrowers': borrowers})
+
+    except Exception as e:
+        logger.error(f"Error fetching borrower analytics: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/analytics/trends', methods=['GET'])
+@token_required
+@cached_response(ANALYTICS, _cache_key)
+def get_dashboard_trends():
+    """Daily dashboard stat snapshots between ?from= and ?to=, for trend charts."""
+    try:
+        try:
+            since, to = _date_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT to_char(day, 'YYYY-MM-DD') AS day, {', '.join(SNAPSHOT_COLUMNS)}
+            FROM dashboard_snapshots
+            WHERE user_id = %s AND day BETWEEN %s AND %s
+            ORDER BY day
+        ''', (str(g.user_id), since, to))
+        snapshots = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify({'from': since.isoformat(), 'to': to.isoformat(), 'snapshots': snapshots})
+
+    except Exception as e:
+        logger.error(f"Error fetching dashboard trends: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,530 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+import uuid
+
+from auth import token_required
+from db import get_db_connection, use_primary
+from holds import allocate_copy, requeue_ready_hold
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('audits', __name__)
+
+# =============================================================================
+# INVENTORY AUDITS
+# =============================================================================
+#
+# A shelf audit is a session: create it, upload scanned barcodes per
+# location in numbered chunks (a retried chunk is ignored), then finish it.
+# Finishing diffs every scan against book_copies in one statement:
+#
+#   ok          copy found at its recorded location
+#   missing     shelved copy at an audited location that nobody scanned
+#   misplaced   copy found at a different location than recorded
+#   unexpected  scan matching no shelved copy: unknown barcode, more copies
+#               than exist, or a copy recorded as Checked Out or Lost
+#
+# Barcodes identify books, so a scan may add a copy_number to name the
+# copy; otherwise scans claim the book's copies at the scanned location
+# first and its copies elsewhere after that. Applying the result marks
+# missing copies Lost, moves misplaced copies and restores found Lost
+# copies, skipping any copy that changed after the audit finished.
+
+MAX_CHUNK_SCANS = 5000
+MISSING_STATUSES = ('Lost', 'Damaged')
+RESULT_KINDS = ('ok', 'missing', 'misplaced', 'unexpected')
+
+
+def _load_audit(cur, audit_id, lock=None):
+    """The user's audit, or None; `lock` is 'UPDATE' or 'SHARE' to lock its row."""
+    try:
+        uuid.UUID(audit_id)
+    except ValueError:
+        return None
+    cur.execute(
+        'SELECT * FROM inventory_audits WHERE id = %s AND user_id = %s' + (f' FOR {lock}' if lock else ''),
+        (audit_id, str(g.user_id))
+    )
+    return cur.fetchone()
+
+
+def _summary(cur, audit):
+    cur.execute('SELECT COUNT(*) AS scans FROM audit_scans WHERE audit_id = %s', (audit['id'],))
+    scans = cur.fetchone()['scans']
+    cur.execute('''
+        SELECT kind, reason, COUNT(*) AS count
+        FROM audit_results
+        WHERE audit_id = %s
+        GROUP BY kind, reason
+    ''', (audit['id'],))
+    results = {kind: 0 for kind in RESULT_KINDS}
+    reasons = {}
+    for row in cur.fetchall():
+        results[row['kind']] += row['count']
+        if row['reason']:
+            reasons[row['reason']] = row['count']
+    return dict(audit, scans=scans, results=results if audit['finished_at'] else None, reasons=reasons)
+
+
+@bp.route('/api/audits', methods=['GET'])
+@token_required
+def get_audits():
+    """List the user's audits, newest first."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT a.*, (SELECT COUNT(*) FROM audit_scans s WHERE s.audit_id = a.id) AS scans
+            FROM inventory_audits a
+            WHERE a.user_id = %s
+            ORDER BY a.created_at DESC
+            LIMIT 50
+        ''', (str(g.user_id),))
+
+        audits = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(audits)
+
+    except Exception as e:
+        logger.error(f"Error fetching audits: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits', methods=['POST'])
+@token_required
+def create_audit():
+    """Start an audit. `locations` lists shelves audited even if no scans arrive for them."""
+    try:
+        data = request.get_json(silent=True) or {}
+        locations = data.get('locations') or []
+        if not isinstance(locations, list) or not all(isinstance(loc, str) and loc for loc in locations):
+            return jsonify({'error': 'locations must be a list of location names'}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            INSERT INTO inventory_audits (user_id, name, locations)
+            VALUES (%s, %s, %s)
+            RETURNING *
+        ''', (str(g.user_id), data.get('name'), locations))
+
+        audit = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(audit), 201
+
+    except Exception as e:
+        logger.error(f"Error creating audit: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>', methods=['GET'])
+@token_required
+@use_primary
+def get_audit(audit_id):
+    """An audit with its scan count and, once finished, result counts."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        audit = _load_audit(cur, audit_id)
+        if not audit:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+
+        summary = _summary(cur, audit)
+        cur.close()
+        conn.close()
+
+        return jsonify(summary)
+
+    except Exception as e:
+        logger.error(f"Error fetching audit: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>', methods=['DELETE'])
+@token_required
+def delete_audit(audit_id):
+    """Delete an audit with its scans and results."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if not _load_audit(cur, audit_id):
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+
+        cur.execute('DELETE FROM inventory_audits WHERE id = %s', (audit_id,))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify({'message': 'Audit deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting audit: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>/scans', methods=['POST'])
+@token_required
+def add_audit_scans(audit_id):
+    """
+    Add one chunk of scans: {chunk, location, scans: [barcode | {barcode, copy_number}]}.
+    Chunks are numbered by the client; uploading a chunk again changes nothing.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        chunk = data.get('chunk')
+        location = (data.get('location') or '').strip()
+        scans = data.get('scans')
+        if not isinstance(chunk, int) or isinstance(chunk, bool) or chunk < 0:
+            return jsonify({'error': 'chunk must be a non-negative integer'}), 400
+        if not location:
+            return jsonify({'error': 'location is required'}), 400
+        if not isinstance(scans, list) or not scans:
+            return jsonify({'error': 'scans must be a non-empty list'}), 400
+        if len(scans) > MAX_CHUNK_SCANS:
+            return jsonify({'error': f'At most {MAX_CHUNK_SCANS} scans per chunk'}), 400
+
+        barcodes = []
+        copy_numbers = []
+        for scan in scans:
+            if isinstance(scan, dict):
+                barcode, copy_number = scan.get('barcode'), scan.get('copy_number')
+            else:
+                barcode, copy_number = scan, None
+            if not isinstance(barcode, str) or not barcode.strip() or len(barcode) > 100:
+                return jsonify({'error': f'Invalid barcode in scans: {barcode!r}'}), 400
+            if copy_number is not None and (not isinstance(copy_number, int) or isinstance(copy_number, bool)):
+                return jsonify({'error': f'Invalid copy_number for {barcode}'}), 400
+            barcodes.append(barcode.strip())
+            copy_numbers.append(copy_number)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Shared lock: finish_audit (FOR UPDATE) waits for the chunk to commit
+        audit = _load_audit(cur, audit_id, lock='SHARE')
+        if not audit:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+        if audit['status'] != 'open':
+            cur.close()
+            conn.close()
+            return jsonify({'error': f"Audit is {audit['status']}"}), 409
+
+        # One statement per chunk, whatever its size
+        cur.execute('''
+            INSERT INTO audit_scans (audit_id, user_id, chunk, position, location, barcode, copy_number)
+            SELECT %s, %s, %s, t.position, %s, t.barcode, t.copy_number
+            FROM unnest(%s::text[], %s::int[]) WITH ORDINALITY AS t(barcode, copy_number, position)
+            ON CONFLICT (audit_id, chunk, position) DO NOTHING
+        ''', (audit_id, str(g.user_id), chunk, location, barcodes, copy_numbers))
+        inserted = cur.rowcount
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify({'chunk': chunk, 'received': len(barcodes), 'inserted': inserted}), 201
+
+    except Exception as e:
+        logger.error(f"Error adding audit scans: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>/finish', methods=['POST'])
+@token_required
+def finish_audit(audit_id):
+    """Close the audit to scans and diff the scans against book_copies."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        audit = _load_audit(cur, audit_id, lock='UPDATE')
+        if not audit:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+        if audit['status'] == 'applied':
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit was already applied'}), 409
+
+        cur.execute('DELETE FROM audit_results WHERE audit_id = %s', (audit_id,))
+        cur.execute(DIFF_SQL, {'audit_id': audit_id, 'user_id': str(g.user_id)})
+        cur.execute('''
+            UPDATE inventory_audits
+            SET status = 'finished', finished_at = NOW()
+            WHERE id = %s
+            RETURNING *
+        ''', (audit_id,))
+        audit = cur.fetchone()
+        summary = _summary(cur, audit)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(summary)
+
+    except Exception as e:
+        logger.error(f"Error finishing audit: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>/results', methods=['GET'])
+@token_required
+@use_primary
+def get_audit_results(audit_id):
+    """Diff rows of a finished audit, with book titles (?kind=, ?limit=, ?after=<id>)."""
+    try:
+        kind = request.args.get('kind')
+        if kind is not None and kind not in RESULT_KINDS:
+            return jsonify({'error': f"kind must be one of {', '.join(RESULT_KINDS)}"}), 400
+        limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+        after = request.args.get('after', 0, type=int)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if not _load_audit(cur, audit_id):
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+
+        query = '''
+            SELECT r.*, b.title, b.author
+            FROM audit_results r
+            LEFT JOIN books b ON r.book_id = b.id
+            WHERE r.audit_id = %s AND r.id > %s
+        '''
+        params = [audit_id, after]
+        if kind:
+            query += ' AND r.kind = %s'
+            params.append(kind)
+        query += ' ORDER BY r.id LIMIT %s'
+        params.append(limit)
+
+        cur.execute(query, params)
+        results = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify({
+            'results': results,
+            'next_after': results[-1]['id'] if len(results) == limit else None,
+        })
+
+    except Exception as e:
+        logger.error(f"Error fetching audit results: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/audits/<audit_id>/apply', methods=['POST'])
+@token_required
+def apply_audit(audit_id):
+    """
+    Update book_copies from a finished audit in bulk. Options (all on by default):
+    missing_status ('Lost' or 'Damaged', null to skip), relocate_misplaced,
+    restore_found (found Lost copies go back where they were scanned, to the
+    next hold on the book or Available).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        missing_status = data.get('missing_status', 'Lost')
+        relocate_misplaced = data.get('relocate_misplaced', True)
+        restore_found = data.get('restore_found', True)
+        if missing_status is not None and missing_status not in MISSING_STATUSES:
+            return jsonify({'error': f"missing_status must be one of {', '.join(MISSING_STATUSES)} or null"}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        audit = _load_audit(cur, audit_id, lock='UPDATE')
+        if not audit:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Audit not found'}), 404
+        if audit['status'] != 'finished':
+            cur.close()
+            conn.close()
+            return jsonify({'error': f"Audit is {audit['status']}; finish it before applying"}), 409
+
+        updated = {'missing': 0, 'misplaced': 0, 'found': 0}
+        # Each update skips copies whose status or location changed since the diff
+        if missing_status:
+            cur.execute('''
+                UPDATE book_copies bc
+                SET status = %s
+                FROM audit_results r
+                WHERE r.audit_id = %s AND r.kind = 'missing'
+                  AND bc.id = r.copy_id AND bc.user_id = %s
+                  AND bc.status = r.status
+                  AND bc.location IS NOT DISTINCT FROM r.expected_location
+                RETURNING bc.id, r.status AS previous_status
+            ''', (missing_status, audit_id, str(g.user_id)))
+            missing = cur.fetchall()
+            updated['missing'] = len(missing)
+            # A Reserved copy that is gone: its hold waits for the next copy
+            for copy in missing:
+                if copy['previous_status'] == 'Reserved':
+                    requeue_ready_hold(cur, copy['id'])
+        if relocate_misplaced:
+            cur.execute('''
+                UPDATE book_copies bc
+                SET location = r.scanned_location
+                FROM audit_results r
+                WHERE r.audit_id = %s AND r.kind = 'misplaced'
+                  AND bc.id = r.copy_id AND bc.user_id = %s
+                  AND bc.status = r.status
+                  AND bc.location IS NOT DISTINCT FROM r.expected_location
+            ''', (audit_id, str(g.user_id)))
+            updated['misplaced'] = cur.rowcount
+        if restore_found:
+            cur.execute('''
+                UPDATE book_copies bc
+                SET status = 'Available', location = r.scanned_location
+                FROM audit_results r
+                WHERE r.audit_id = %s AND r.kind = 'unexpected' AND r.reason = 'lost'
+                  AND bc.id = r.copy_id AND bc.user_id = %s
+                  AND bc.status = 'Lost'
+                  AND bc.location IS NOT DISTINCT FROM r.expected_location
+                RETURNING bc.id, bc.book_id
+            ''', (audit_id, str(g.user_id)))
+            found = cur.fetchall()
+            updated['found'] = len(found)
+            # Back on the shelf only if no hold is waiting for the book
+            for copy in found:
+                allocate_copy(cur, str(g.user_id), copy['id'], copy['book_id'])
+
+        cur.execute('''
+            UPDATE inventory_audits
+            SET status = 'applied', applied_at = NOW()
+            WHERE id = %s
+        ''', (audit_id,))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify({'updated': updated})
+
+    except Exception as e:
+        logger.error(f"Error applying audit: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+# =============================================================================
+# AUDIT DIFF
+# =============================================================================
+#
+# Scans are matched to copies in three passes (each copy claimed at most
+# once), then matched scans, unmatched scans and unscanned shelved copies
+# are written to audit_results in one INSERT:
+#
+#   1. scans with a copy_number claim that copy
+#   2. other scans claim unclaimed copies of the book at the scanned
+#      location, shelved copies first
+#   3. the rest claim the book's remaining copies at any location
+
+DIFF_SQL = '''
+    WITH scans AS (
+        SELECT s.id, s.location, s.barcode, s.copy_number, b.id AS book_id
+        FROM audit_scans s
+        LEFT JOIN books b ON b.barcode = s.barcode AND b.user_id = %(user_id)s AND b.deleted_at IS NULL
+        WHERE s.audit_id = %(audit_id)s
+    ),
+    scope AS (
+        SELECT DISTINCT location FROM scans
+        UNION
+        SELECT unnest(locations) FROM inventory_audits WHERE id = %(audit_id)s
+    ),
+    copies AS (
+        SELECT bc.id, bc.book_id, bc.copy_number, bc.location, bc.status,
+               bc.status IN ('Checked Out', 'Lost') AS off_shelf
+        FROM book_copies bc
+        JOIN books bk ON bc.book_id = bk.id AND bk.deleted_at IS NULL
+        WHERE bc.user_id = %(user_id)s
+          AND (bc.book_id IN (SELECT book_id FROM scans WHERE book_id IS NOT NULL)
+               OR bc.location IN (SELECT location FROM scope))
+    ),
+    exact AS (
+        SELECT DISTINCT ON (c.id) s.id AS scan_id, c.id AS copy_id
+        FROM scans s
+        JOIN copies c ON c.book_id = s.book_id AND c.copy_number = s.copy_number
+        ORDER BY c.id, s.id
+    ),
+    loose AS (
+        SELECT s.id, s.book_id, s.location,
+               ROW_NUMBER() OVER (PARTITION BY s.book_id, s.location ORDER BY s.id) AS rn
+        FROM scans s
+        WHERE s.copy_number IS NULL AND s.book_id IS NOT NULL
+    ),
+    unclaimed AS (
+        SELECT c.id, c.book_id, c.location, c.off_shelf, c.copy_number,
+               ROW_NUMBER() OVER (PARTITION BY c.book_id, c.location ORDER BY c.off_shelf, c.copy_number) AS rn
+        FROM copies c
+        WHERE c.id NOT IN (SELECT copy_id FROM exact)
+    ),
+    in_place AS (
+        SELECT l.id AS scan_id, u.id AS copy_id
+        FROM loose l
+        JOIN unclaimed u ON u.book_id = l.book_id AND u.location = l.location AND u.rn = l.rn
+    ),
+    loose_rest AS (
+        SELECT l.id, l.book_id,
+               ROW_NUMBER() OVER (PARTITION BY l.book_id ORDER BY l.id) AS rn
+        FROM loose l
+        WHERE l.id NOT IN (SELECT scan_id FROM in_place)
+    ),
+    unclaimed_rest AS (
+        SELECT u.id, u.book_id,
+               ROW_NUMBER() OVER (PARTITION BY u.book_id ORDER BY u.off_shelf, u.copy_number) AS rn
+        FROM unclaimed u
+        WHERE u.id NOT IN (SELECT copy_id FROM in_place)
+    ),
+    elsewhere AS (
+        SELECT l.id AS scan_id, u.id AS copy_id
+        FROM loose_rest l
+        JOIN unclaimed_rest u ON u.book_id = l.book_id AND u.rn = l.rn
+    ),
+    matched AS (
+        SELECT scan_id, copy_id FROM exact
+        UNION ALL
+        SELECT scan_id, copy_id FROM in_place
+        UNION ALL
+        SELECT scan_id, copy_id FROM elsewhere
+    )
+    INSERT INTO audit_results
+        (audit_id, user_id, kind, reason, copy_id, book_id, barcode, copy_number, expected_location, scanned_location, status)
+    SELECT %(audit_id)s, %(user_id)s,
+           CASE WHEN c.off_shelf THEN 'unexpected'
+                WHEN c.location IS DISTINCT FROM s.location THEN 'misplaced'
+                ELSE 'ok' END,
+           CASE WHEN c.status = 'Checked Out' THEN 'checked_out'
+                WHEN c.status = 'Lost' THEN 'lost' END,
+           c.id, c.book_id, s.barcode, c.copy_number, c.location, s.location, c.status
+    FROM matched m
+    JOIN scans s ON s.id = m.scan_id
+    JOIN copies c ON c.id = m.copy_id
+    UNION ALL
+    SELECT %(audit_id)s, %(user_id)s, 'unexpected',
+           CASE WHEN s.book_id IS NULL THEN 'unknown_barcode'
+                WHEN s.copy_number IS NULL THEN 'extra_copy'
+                WHEN EXISTS (SELECT 1 FROM copies c
+                             WHERE c.book_id = s.book_id AND c.copy_number = s.copy_number) THEN 'duplicate_scan'
+                ELSE 'unknown_copy' END,
+           NULL, s.book_id, s.barcode, s.copy_number, NULL, s.location, NULL
+    FROM scans s
+    WHERE s.id NOT IN (SELECT scan_id FROM matched)
+    UNION ALL
+    SELECT %(audit_id)s, %(user_id)s, 'missing', NULL,
+           c.id, c.book_id, b.barcode, c.copy_number, c.location, NULL, c.status
+    FROM copies c
+    JOIN books b ON c.book_id = b.id
+    WHERE NOT c.off_shelf
+      AND c.location IN (SELECT location FROM scope)
+      AND c.id NOT IN (SELECT copy_id FROM matched)
+'''
@@ -0,0 +1,150 @@
+from flask import Blueprint, request, jsonify, g, current_app
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.test import EnvironBuilder
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+import logging
+
+from auth import token_required, BATCH_AUTH_KEY
+from db import shared_connection, pool_stats
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('batch', __name__)
+
+MAX_BATCH_ITEMS = 20
+MAX_PARALLEL_READS = 4
+BATCH_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Streaming and recursive routes cannot be batched
+EXCLUDED_PATHS = ('/api/batch', '/api/events')
+
+# =============================================================================
+# BATCH HELPERS
+# =============================================================================
+
+def validate_item(item):
+    """Return an error message for a malformed sub-request, or None."""
+    if not isinstance(item, dict):
+        return 'Each request must be an object'
+    method = str(item.get('method', 'GET')).upper()
+    path = item.get('path')
+    if method not in BATCH_METHODS:
+        return f'Unsupported method: {method}'
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        return 'path must start with /api/'
+    if path.split('?')[0].rstrip('/') in EXCLUDED_PATHS:
+        return f'{path} cannot be batched'
+    return None
+
+
+def build_environ(item, auth):
+    """WSGI environ for one sub-request, authenticated as the batch caller."""
+    headers = {'X-User-Email': auth[1]}
+    if item.get('idempotency_key'):
+        headers['Idempotency-Key'] = item['idempotency_key']
+    builder = EnvironBuilder(
+        path=item['path'],
+        method=str(item.get('method', 'GET')).upper(),
+        query_string=item.get('params'),
+        json=item.get('body'),
+        headers=headers,
+        environ_base={'REMOTE_ADDR': request.remote_addr},
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    environ[BATCH_AUTH_KEY] = auth
+    return environ
+
+
+def dispatch(app, environ):
+    """Run one sub-request through the app's routing, hooks and error handlers."""
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            logger.error(f"Error in batch sub-request {environ.get('PATH_INFO')}: {str(e)}")
+            response = app.make_response((jsonify({'error': 'Internal server error'}), 500))
+        body = response.get_json(silent=True)
+        if body is None:
+            body = response.get_data(as_text=True)
+        return {'status': response.status_code, 'body': body}
+
+
+def reset_shared(conn, result):
+    """
+    End whatever a sequential item left open on the shared connection. A
+    route that failed without rolling back leaves the transaction aborted,
+    and every later item would fail on it.
+    """
+    if conn.closed:
+        return
+    if result['status'] >= 400 or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+
+
+def spare_connections():
+    stats = pool_stats(g.shard)
+    return stats['size'] - stats['in_use'] if stats else 0
+
+# =============================================================================
+# BATCH ENDPOINT
+# =============================================================================
+
+@bp.route('/api/batch', methods=['POST'])
+@token_required
+def run_batch():
+    """
+    Run several API requests in one round trip. Body:
+    {"requests": [{"id", "method", "path", "params", "body", "idempotency_key"}]}.
+    Items run in order on one shared connection; consecutive GETs run
+    concurrently on spare pool connections when there are any. Returns
+    {"responses": [{"id", "status", "body"}]} in request order.
+    """
+    try:
+        data = request.json or {}
+        items = data.get('requests')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'requests must be a non-empty list'}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({'error': f'At most {MAX_BATCH_ITEMS} requests per batch'}), 400
+        for index, item in enumerate(items):
+            error = validate_item(item)
+            if error:
+                return jsonify({'error': f'requests[{index}]: {error}'}), 400
+
+        app = current_app._get_current_object()
+        auth = (str(g.user_id), g.user_email, g.shard)
+        results = [None] * len(items)
+
+        with shared_connection() as conn:
+            index = 0
+            while index < len(items):
+                # Collect a run of consecutive reads
+                end = index
+                while end < len(items) and str(items[end].get('method', 'GET')).upper() == 'GET':
+                    end += 1
+
+                parallel = min(end - index, MAX_PARALLEL_READS, spare_connections())
+                if parallel >= 2:
+                    # Each thread gets its own app context and pooled connection
+                    environs = [build_environ(items[i], auth) for i in range(index, end)]
+                    with ThreadPoolExecutor(max_workers=parallel) as executor:
+                        for offset, result in enumerate(executor.map(lambda e: dispatch(app, e), environs)):
+                            results[index + offset] = result
+                    index = end
+                else:
+                    # Reads without spare connections, and every write, run
+                    # in order on the shared connection
+                    results[index] = dispatch(app, build_environ(items[index], auth))
+                    reset_shared(conn, results[index])
+                    index += 1
+
+        return jsonify({'responses': [
+            {'id': item.get('id', index), **result}
+            for index, (item, result) in enumerate(zip(items, results))
+        ]})
+
+    except Exception as e:
+        logger.error(f"Error running batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
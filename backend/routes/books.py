@@ -0,0 +1,364 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+
+from psycopg2.errors import UniqueViolation
+
+from auth import token_required
+from cache import cached_response, BOOK_LISTS, BARCODES
+from db import get_db_connection
+from helpers import sanitize_input
+from holds import cancel_book_holds
+from isbn import InvalidIsbn, find_duplicates, isbn_forms, isbn_key, normalize_isbn
+from jobs import job, enqueue, accepted
+from memory import rows_response
+from statements import PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('books', __name__)
+
+BOOK_BY_BARCODE = PreparedStatement('book_by_barcode', '''
+    SELECT b.*,
+           COUNT(DISTINCT bc.id) as total_copies,
+           COUNT(DISTINCT CASE WHEN bc.status = 'Available'
+                 THEN bc.id END) as available_copies,
+           json_agg(
+               json_build_object(
+                   'id', bc.id,
+                   'copy_number', bc.copy_number,
+                   'status', bc.status,
+                   'condition', bc.condition,
+                   'location', bc.location
+               ) ORDER BY bc.copy_number
+           ) FILTER (WHERE bc.id IS NOT NULL) as copies
+    FROM books b
+    LEFT JOIN book_copies bc ON b.id = bc.book_id
+    WHERE b.barcode = %s AND b.user_id = %s AND b.deleted_at IS NULL
+    GROUP BY b.id
+''')
+# A scanned ISBN/EAN of a book registered without that barcode; books the
+# backfill left unkeyed (duplicates) are matched on the ISBN as stored
+BOOK_BY_ISBN_KEY = PreparedStatement('book_by_isbn_key', BOOK_BY_BARCODE.sql.replace(
+    'b.barcode = %s', '(b.isbn_key = %s OR (b.isbn_key IS NULL AND b.isbn = ANY(%s)))'))
+ISBN_KEY_CONSTRAINT = 'idx_books_isbn_key'
+
+
+def _duplicate_isbn(cur, e, key):
+    """409 for an insert/update that hit another live book's ISBN, else re-raise."""
+    if e.diag.constraint_name != ISBN_KEY_CONSTRAINT:
+        raise e
+    cur.connection.rollback()
+    cur.execute('''
+        SELECT id FROM books WHERE user_id = %s AND isbn_key = %s AND deleted_at IS NULL
+    ''', (str(g.user_id), key))
+    existing = cur.fetchone()
+    return jsonify({
+        'error': 'A book with this ISBN already exists',
+        'book_id': str(existing['id']) if existing else None,
+    }), 409
+
+# =============================================================================
+# BOOKS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/books', methods=['GET'])
+@token_required
+@cached_response(BOOK_LISTS, lambda: request.args.get('search', '').strip().lower())
+def get_books():
+    """Get all books for the current user."""
+    try:
+        search = request.args.get('search', '').strip()
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        search_key = normalize_isbn(search)
+        if search_key:
+            # An ISBN in any form: the key instead of LIKEs over the isbn,
+            # title and author; unkeyed books by the ISBN as stored
+            query, params = '''
+                SELECT b.*,
+                       COUNT(DISTINCT bc.id) as total_copies,
+                       COUNT(DISTINCT CASE WHEN bc.status = 'Available' THEN bc.id END) as available_copies
+                FROM books b
+                LEFT JOIN book_copies bc ON b.id = bc.book_id
+                WHERE b.user_id = %s AND b.deleted_at IS NULL
+                  AND (b.isbn_key = %s
+                       OR (b.isbn_key IS NULL AND b.isbn = ANY(%s))
+                       OR LOWER(b.barcode) LIKE LOWER(%s))
+                GROUP BY b.id
+                ORDER BY b.title ASC
+            ''', (str(g.user_id), search_key, isbn_forms(search, search_key), f'%{search}%')
+        elif search:
+            query, params = '''
+                SELECT b.*,
+                       COUNT(DISTINCT bc.id) as total_copies,
+                       COUNT(DISTINCT CASE WHEN bc.status = 'Available' THEN bc.id END) as available_copies
+                FROM books b
+                LEFT JOIN book_copies bc ON b.id = bc.book_id
+                WHERE b.user_id = %s AND b.deleted_at IS NULL
+                  AND (LOWER(b.title) LIKE LOWER(%s)
+                       OR LOWER(b.author) LIKE LOWER(%s)
+                       OR LOWER(b.isbn) LIKE LOWER(%s)
+                       OR LOWER(b.barcode) LIKE LOWER(%s))
+                GROUP BY b.id
+                ORDER BY b.title ASC
+            ''', (str(g.user_id), f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%')
+        else:
+            query, params = '''
+                SELECT b.*,
+                       COUNT(DISTINCT bc.id) as total_copies,
+                       COUNT(DISTINCT CASE WHEN bc.status = 'Available' THEN bc.id END) as available_copies
+                FROM books b
+                LEFT JOIN book_copies bc ON b.id = bc.book_id
+                WHERE b.user_id = %s AND b.deleted_at IS NULL
+                GROUP BY b.id
+                ORDER BY b.title ASC
+            ''', (str(g.user_id),)
+
+        return rows_response(conn, cur, query, params)
+
+    except Exception as e:
+        logger.error(f"Error fetching books: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books/<book_id>', methods=['GET'])
+@token_required
+def get_book(book_id):
+    """Get a specific book by ID with copy information."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT b.*,
+                   COUNT(DISTINCT bc.id) as total_copies,
+                   COUNT(DISTINCT CASE WHEN bc.status = 'Available' THEN bc.id END) as available_copies
+            FROM books b
+            LEFT JOIN book_copies bc ON b.id = bc.book_id
+            WHERE b.id = %s AND b.user_id = %s AND b.deleted_at IS NULL
+            GROUP BY b.id
+        ''', (book_id, str(g.user_id)))
+
+        book = cur.fetchone()
+        cur.close()
+        conn.close()
+
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+
+        return jsonify(book)
+
+    except Exception as e:
+        logger.error(f"Error fetching book: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books', methods=['POST'])
+@token_required
+def create_book():
+    """Create a new book."""
+    try:
+        data = request.json
+        try:
+            key = isbn_key(data.get('isbn'))
+        except InvalidIsbn as e:
+            return jsonify({'error': str(e)}), 400
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        try:
+            cur.execute('''
+                INSERT INTO books (user_id, title, author, isbn, isbn_key, barcode, publisher, publication_year,
+                                 genre, description, language, pages)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING *
+            ''', (
+                str(g.user_id),
+                data.get('title'),
+                data.get('author'),
+                sanitize_input(data.get('isbn')),
+                key,
+                sanitize_input(data.get('barcode')),
+                sanitize_input(data.get('publisher')),
+                sanitize_input(data.get('publication_year'), 'int'),
+                sanitize_input(data.get('genre')),
+                sanitize_input(data.get('description')),
+                data.get('language', 'English'),
+                sanitize_input(data.get('pages'), 'int')
+            ))
+        except UniqueViolation as e:
+            response = _duplicate_isbn(cur, e, key)
+            cur.close()
+            conn.close()
+            return response
+
+        book = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(book), 201
+
+    except Exception as e:
+        logger.error(f"Error creating book: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books/<book_id>', methods=['PUT'])
+@token_required
+def update_book(book_id):
+    """Update an existing book."""
+    try:
+        data = request.json
+        try:
+            key = isbn_key(data.get('isbn'))
+        except InvalidIsbn as e:
+            return jsonify({'error': str(e)}), 400
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        try:
+            cur.execute('''
+                UPDATE books
+                SET title = %s, author = %s, isbn = %s, isbn_key = %s, barcode = %s, publisher = %s,
+                    publication_year = %s, genre = %s, description = %s,
+                    language = %s, pages = %s
+                WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+                RETURNING *
+            ''', (
+                data.get('title'),
+                data.get('author'),
+                sanitize_input(data.get('isbn')),
+                key,
+                sanitize_input(data.get('barcode')),
+                sanitize_input(data.get('publisher')),
+                sanitize_input(data.get('publication_year'), 'int'),
+                sanitize_input(data.get('genre')),
+                sanitize_input(data.get('description')),
+                data.get('language'),
+                sanitize_input(data.get('pages'), 'int'),
+                book_id,
+                str(g.user_id)
+            ))
+        except UniqueViolation as e:
+            response = _duplicate_isbn(cur, e, key)
+            cur.close()
+            conn.close()
+            return response
+
+        book = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+
+        return jsonify(book)
+
+    except Exception as e:
+        logger.error(f"Error updating book: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books/<book_id>', methods=['DELETE'])
+@token_required
+def delete_book(book_id):
+    """
+    Delete a book. It disappears at once; its copies and checkout history
+    are removed later by the purger (purge.py), a batch at a time.
+    """
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        deleted = soft_delete_book(cur, book_id, str(g.user_id))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Book not found'}), 404
+
+        return jsonify({'message': 'Book deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting book: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def soft_delete_book(cur, book_id, user_id):
+    """Mark a live book deleted and cancel its holds. Returns False if there was none."""
+    cur.execute('''
+        UPDATE books SET deleted_at = NOW()
+        WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+        RETURNING id
+    ''', (book_id, user_id))
+    if not cur.fetchone():
+        return False
+    cancel_book_holds(cur, book_id)
+    return True
+
+@job('delete_book')
+def delete_book_job(context, payload):
+    """Delete jobs queued before soft deletion: now the same as the route."""
+    book_id = payload['book_id']
+    conn = get_db_connection(primary=True)
+    cur = conn.cursor()
+    try:
+        deleted = soft_delete_book(cur, book_id, context.user_id)
+        conn.commit()
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+    return {'book_id': book_id, 'deleted': deleted}
+
+@bp.route('/api/books/by-barcode/<barcode>', methods=['GET'])
+@token_required
+@cached_response(BARCODES, lambda barcode: barcode)
+def get_book_by_barcode(barcode):
+    """Get book by barcode (or a scanned ISBN in any form) with copy availability information."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        BOOK_BY_BARCODE.execute(cur, (barcode, str(g.user_id)))
+
+        book = cur.fetchone()
+        key = None if book else normalize_isbn(barcode)
+        if key:
+            BOOK_BY_ISBN_KEY.execute(cur, (key, isbn_forms(barcode, key), str(g.user_id)))
+            book = cur.fetchone()
+        cur.close()
+        conn.close()
+
+        if not book:
+            return jsonify({'error': 'Book not found'}), 404
+
+        return jsonify(book)
+
+    except Exception as e:
+        logger.error(f"Error fetching book by barcode: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books/duplicates', methods=['POST'])
+@token_required
+def report_duplicate_books():
+    """Queue a report of books that share an ISBN in any of its forms: 202 with the job."""
+    try:
+        return accepted(enqueue('isbn_duplicates', {}))
+
+    except Exception as e:
+        logger.error(f"Error queueing duplicate report: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@job('isbn_duplicates', max_attempts=2)
+def isbn_duplicates_job(context, payload):
+    """Group the library's books by canonical ISBN; the result lists groups of two or more."""
+    conn = get_db_connection(primary=True)
+    cur = conn.cursor()
+    try:
+        return find_duplicates(cur, context.user_id,
+                               on_progress=lambda done, total: context.progress(done, total, 'Reading the catalogue'))
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
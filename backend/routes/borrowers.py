@@ -0,0 +1,231 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+
+from auth import token_required
+from db import get_db_connection
+from holds import cancel_borrower_holds
+from memory import rows_response
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('borrowers', __name__)
+
+# =============================================================================
+# BORROWERS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/borrowers', methods=['GET'])
+@token_required
+def get_borrowers():
+    """Get all borrowers with optional search."""
+    try:
+        search = request.args.get('search', '').strip()
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if search:
+            query, params = '''
+                SELECT b.*,
+                       COUNT(DISTINCT CASE WHEN co.status = 'Checked Out' THEN co.id END) as active_checkouts
+                FROM borrowers b
+                LEFT JOIN checkouts co ON b.id = co.borrower_id
+                WHERE b.user_id = %s AND b.deleted_at IS NULL
+                  AND (LOWER(b.first_name) LIKE LOWER(%s)
+                       OR LOWER(b.last_name) LIKE LOWER(%s)
+                       OR LOWER(b.email) LIKE LOWER(%s))
+                GROUP BY b.id
+                ORDER BY b.last_name ASC, b.first_name ASC
+            ''', (str(g.user_id), f'%{search}%', f'%{search}%', f'%{search}%')
+        else:
+            query, params = '''
+                SELECT b.*,
+                       COUNT(DISTINCT CASE WHEN co.status = 'Checked Out' THEN co.id END) as active_checkouts
+                FROM borrowers b
+                LEFT JOIN checkouts co ON b.id = co.borrower_id
+                WHERE b.user_id = %s AND b.deleted_at IS NULL
+                GROUP BY b.id
+                ORDER BY b.last_name ASC, b.first_name ASC
+            ''', (str(g.user_id),)
+
+        return rows_response(conn, cur, query, params)
+
+    except Exception as e:
+        logger.error(f"Error fetching borrowers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/borrowers/autocomplete', methods=['GET'])
+@token_required
+def autocomplete_borrowers():
+    """Autocomplete borrowers by name for quick selection."""
+    try:
+        query = request.args.get('q', '').strip()
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT id, first_name, last_name, email, phone
+            FROM borrowers
+            WHERE user_id = %s AND deleted_at IS NULL
+              AND (LOWER(first_name) LIKE LOWER(%s) OR LOWER(last_name) LIKE LOWER(%s))
+            ORDER BY last_name ASC, first_name ASC
+            LIMIT 10
+        ''', (str(g.user_id), f'%{query}%', f'%{query}%'))
+
+        borrowers = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(borrowers)
+
+    except Exception as e:
+        logger.error(f"Error autocompleting borrowers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/borrowers/<borrower_id>', methods=['GET'])
+@token_required
+def get_borrower(borrower_id):
+    """Get a specific borrower."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT b.*,
+                   COUNT(DISTINCT CASE WHEN co.status = 'Checked Out' THEN co.id END) as active_checkouts,
+                   COUNT(DISTINCT CASE WHEN co.status = 'Returned' THEN co.id END) as total_checkouts
+            FROM borrowers b
+            LEFT JOIN checkouts co ON b.id = co.borrower_id
+            WHERE b.id = %s AND b.user_id = %s AND b.deleted_at IS NULL
+            GROUP BY b.id
+        ''', (borrower_id, str(g.user_id)))
+
+        borrower = cur.fetchone()
+        cur.close()
+        conn.close()
+
+        if not borrower:
+            return jsonify({'error': 'Borrower not found'}), 404
+
+        return jsonify(borrower)
+
+    except Exception as e:
+        logger.error(f"Error fetching borrower: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/borrowers', methods=['POST'])
+@token_required
+def create_borrower():
+    """Create a new borrower."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            INSERT INTO borrowers (user_id, first_name, last_name, email, phone, alt_phone, address)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING *
+        ''', (
+            str(g.user_id),
+            data.get('first_name'),
+            data.get('last_name'),
+            data.get('email'),
+            data.get('phone'),
+            data.get('alt_phone'),
+            data.get('address')
+        ))
+
+        borrower = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(borrower), 201
+
+    except Exception as e:
+        logger.error(f"Error creating borrower: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/borrowers/<borrower_id>', methods=['PUT'])
+@token_required
+def update_borrower(borrower_id):
+    """Update a borrower."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE borrowers
+            SET first_name = %s, last_name = %s, email = %s,
+                phone = %s, alt_phone = %s, address = %s
+            WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+            RETURNING *
+        ''', (
+            data.get('first_name'),
+            data.get('last_name'),
+            data.get('email'),
+            data.get('phone'),
+            data.get('alt_phone'),
+            data.get('address'),
+            borrower_id,
+            str(g.user_id)
+        ))
+
+        borrower = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not borrower:
+            return jsonify({'error': 'Borrower not found'}), 404
+
+        return jsonify(borrower)
+
+    except Exception as e:
+        logger.error(f"Error updating borrower: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/borrowers/<borrower_id>', methods=['DELETE'])
+@token_required
+def delete_borrower(borrower_id):
+    """
+    Delete a borrower. They disappear at once and their open holds are
+    cancelled; their checkout history is removed later by the purger.
+    """
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Check for active checkouts
+        cur.execute('''
+            SELECT id FROM checkouts
+            WHERE borrower_id = %s AND status = 'Checked Out'
+        ''', (borrower_id,))
+
+        if cur.fetchone():
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Cannot delete borrower with active checkouts'}), 400
+
+        cur.execute('''
+            UPDATE borrowers SET deleted_at = NOW()
+            WHERE id = %s AND user_id = %s AND deleted_at IS NULL
+            RETURNING id
+        ''', (borrower_id, str(g.user_id)))
+
+        deleted = cur.fetchone()
+        if deleted:
+            cancel_borrower_holds(cur, str(g.user_id), borrower_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Borrower not found'}), 404
+
+        return jsonify({'message': 'Borrower deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting borrower: {str(e)}")
+        return jsonify({'error': str(e)}), 500
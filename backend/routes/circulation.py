@@ -0,0 +1,285 @@
+from flask import Blueprint, request, jsonify, g
+from datetime import datetime, timedelta
+import logging
+
+from auth import token_required
+from db import get_db_connection
+from helpers import sanitize_input
+from holds import allocate_copy, ready_hold_for_copy, fulfil_hold
+from memory import rows_response
+from statements import PreparedStatement
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('circulation', __name__)
+
+# The desk's scan-and-checkout and return paths (statements.py)
+COPY_STATUS = PreparedStatement('copy_status', '''
+    SELECT bc.status,
+           EXISTS (
+               SELECT 1 FROM borrowers br
+               WHERE br.id = %s AND br.user_id = bc.user_id AND br.deleted_at IS NULL
+           ) AS borrower_found
+    FROM book_copies bc
+    JOIN books b ON bc.book_id = b.id
+    WHERE bc.id = %s AND bc.user_id = %s AND b.deleted_at IS NULL
+''')
+INSERT_CHECKOUT = PreparedStatement('insert_checkout', '''
+    INSERT INTO checkouts (copy_id, borrower_id, user_id, due_date, notes)
+    VALUES (%s, %s, %s, %s, %s)
+    RETURNING *
+''')
+MARK_COPY_CHECKED_OUT = PreparedStatement('mark_copy_checked_out', '''
+    UPDATE book_copies
+    SET status = 'Checked Out'
+    WHERE id = %s
+''')
+ACTIVE_CHECKOUT = PreparedStatement('active_checkout', '''
+    SELECT co.copy_id, bc.book_id
+    FROM checkouts co
+    JOIN book_copies bc ON co.copy_id = bc.id
+    WHERE co.id = %s AND co.user_id = %s AND co.status = 'Checked Out'
+''')
+RETURN_CHECKOUT = PreparedStatement('return_checkout', '''
+    UPDATE checkouts
+    SET status = 'Returned', return_date = CURRENT_TIMESTAMP
+    WHERE id = %s
+    RETURNING *
+''')
+
+# =============================================================================
+# CHECKOUTS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/checkouts', methods=['GET'])
+@token_required
+def get_checkouts():
+    """Get all active checkouts."""
+    try:
+        search = request.args.get('search', '').strip()
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if search:
+            query, params = '''
+                SELECT co.*,
+                       b.title, b.author, b.isbn, b.barcode,
+                       bc.copy_number, bc.condition, bc.location, bc.notes as copy_notes,
+                       br.first_name, br.last_name, br.email, br.phone,
+                       EXTRACT(DAY FROM (CURRENT_TIMESTAMP - co.checkout_date)) as days_checked_out
+                FROM checkouts co
+                JOIN book_copies bc ON co.copy_id = bc.id
+                JOIN books b ON bc.book_id = b.id
+                JOIN borrowers br ON co.borrower_id = br.id
+                WHERE co.user_id = %s AND co.status = 'Checked Out'
+                  AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+                  AND (LOWER(b.title) LIKE LOWER(%s)
+                       OR LOWER(br.first_name) LIKE LOWER(%s)
+                       OR LOWER(br.last_name) LIKE LOWER(%s)
+                       OR b.barcode LIKE %s)
+                ORDER BY co.checkout_date ASC
+            ''', (str(g.user_id), f'%{search}%', f'%{search}%', f'%{search}%', f'%{search}%')
+        else:
+            query, params = '''
+                SELECT co.*,
+                       b.title, b.author, b.isbn, b.barcode,
+                       bc.copy_number, bc.condition, bc.location, bc.notes as copy_notes,
+                       br.first_name, br.last_name, br.email, br.phone,
+                       EXTRACT(DAY FROM (CURRENT_TIMESTAMP - co.checkout_date)) as days_checked_out
+                FROM checkouts co
+                JOIN book_copies bc ON co.copy_id = bc.id
+                JOIN books b ON bc.book_id = b.id
+                JOIN borrowers br ON co.borrower_id = br.id
+                WHERE co.user_id = %s AND co.status = 'Checked Out'
+                  AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+                ORDER BY co.checkout_date ASC
+            ''', (str(g.user_id),)
+
+        return rows_response(conn, cur, query, params)
+
+    except Exception as e:
+        logger.error(f"Error fetching checkouts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/checkouts', methods=['POST'])
+@token_required
+def create_checkout():
+    """Create a new checkout."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Verify copy is available
+        COPY_STATUS.execute(cur, (data.get('borrower_id'), data.get('copy_id'), str(g.user_id)))
+
+        copy = cur.fetchone()
+        if not copy:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book copy not found'}), 404
+        if not copy['borrower_found']:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Borrower not found'}), 404
+
+        # A Reserved copy can only go to the borrower whose hold it is waiting for
+        hold = None
+        if copy['status'] == 'Reserved':
+            hold = ready_hold_for_copy(cur, data.get('copy_id'))
+            if not hold or str(hold['borrower_id']) != str(data.get('borrower_id')):
+                cur.close()
+                conn.close()
+                return jsonify({'error': 'Book copy is reserved for another borrower'}), 400
+        elif copy['status'] != 'Available':
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book copy is not available'}), 400
+
+        # Calculate due date (default 14 days)
+        due_days = sanitize_input(data.get('due_days', 14), 'int') or 14
+        due_date = datetime.now() + timedelta(days=due_days)
+
+        # Create checkout
+        INSERT_CHECKOUT.execute(cur, (
+            data.get('copy_id'),
+            data.get('borrower_id'),
+            str(g.user_id),
+            due_date.date(),
+            data.get('notes')
+        ))
+
+        checkout = cur.fetchone()
+        if hold:
+            fulfil_hold(cur, hold['id'], checkout['id'])
+
+        # Update copy status
+        MARK_COPY_CHECKED_OUT.execute(cur, (data.get('copy_id'),))
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(checkout), 201
+
+    except Exception as e:
+        logger.error(f"Error creating checkout: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/checkouts/<checkout_id>/return', methods=['PUT'])
+@token_required
+def return_checkout(checkout_id):
+    """Mark a checkout as returned and pass the copy to the next hold, if any."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Get checkout info
+        ACTIVE_CHECKOUT.execute(cur, (checkout_id, str(g.user_id)))
+
+        checkout = cur.fetchone()
+        if not checkout:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Active checkout not found'}), 404
+
+        # Update checkout
+        RETURN_CHECKOUT.execute(cur, (checkout_id,))
+
+        updated = cur.fetchone()
+
+        # The copy goes to the next hold on the book, or back on the shelf
+        updated['hold_id'] = allocate_copy(cur, str(g.user_id), checkout['copy_id'], checkout['book_id'])
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(updated)
+
+    except Exception as e:
+        logger.error(f"Error returning checkout: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/checkouts/<checkout_id>', methods=['DELETE'])
+@token_required
+def delete_checkout(checkout_id):
+    """Delete a checkout record."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            DELETE FROM checkouts
+            WHERE id = %s AND user_id = %s
+            RETURNING id
+        ''', (checkout_id, str(g.user_id)))
+
+        deleted = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Checkout not found'}), 404
+
+        return jsonify({'message': 'Checkout deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting checkout: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# CHECKOUT HISTORY ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/checkout-history', methods=['GET'])
+@token_required
+def get_checkout_history():
+    """Get checkout history with optional filters."""
+    try:
+        book_id = request.args.get('book_id')
+        borrower_id = request.args.get('borrower_id')
+        search = request.args.get('search', '').strip()
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        query = '''
+            SELECT co.*,
+                   b.title, b.author, b.isbn,
+                   bc.copy_number,
+                   br.first_name, br.last_name, br.email,
+                   EXTRACT(DAY FROM (COALESCE(co.return_date, CURRENT_TIMESTAMP) - co.checkout_date)) as duration_days
+            FROM checkouts co
+            JOIN book_copies bc ON co.copy_id = bc.id
+            JOIN books b ON bc.book_id = b.id
+            JOIN borrowers br ON co.borrower_id = br.id
+            WHERE co.user_id = %s AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+        '''
+
+        params = [str(g.user_id)]
+
+        if book_id:
+            query += ' AND b.id = %s'
+            params.append(book_id)
+
+        if borrower_id:
+            query += ' AND br.id = %s'
+            params.append(borrower_id)
+
+        if search:
+            query += ''' AND (LOWER(b.title) LIKE LOWER(%s)
+                           OR LOWER(b.author) LIKE LOWER(%s)
+                           OR LOWER(br.first_name) LIKE LOWER(%s)
+                           OR LOWER(br.last_name) LIKE LOWER(%s))'''
+            search_param = f'%{search}%'
+            params.extend([search_param, search_param, search_param, search_param])
+
+        query += ' ORDER BY co.checkout_date DESC'
+
+        return rows_response(conn, cur, query, params)
+
+    except Exception as e:
+        logger.error(f"Error fetching checkout history: {str(e)}")
+        return jsonify({'error': str(e)}), 500
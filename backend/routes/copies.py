@@ -0,0 +1,218 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+
+from auth import token_required
+from db import get_db_connection
+from holds import requeue_ready_hold, shelve_copy
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('copies', __name__)
+
+# =============================================================================
+# BOOK COPIES ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/books/<book_id>/copies', methods=['GET'])
+@token_required
+def get_book_copies(book_id):
+    """Get all copies of a specific book."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT bc.*, b.title, b.author,
+                   CASE
+                       WHEN co.id IS NOT NULL AND co.status = 'Checked Out'
+                       THEN json_build_object(
+                           'id', co.id,
+                           'borrower_name', br.first_name || ' ' || br.last_name,
+                           'borrower_email', br.email,
+                           'checkout_date', co.checkout_date,
+                           'due_date', co.due_date
+                       )
+                       ELSE NULL
+                   END as checkout_info
+            FROM book_copies bc
+            JOIN books b ON bc.book_id = b.id
+            LEFT JOIN checkouts co ON bc.id = co.copy_id AND co.status = 'Checked Out'
+            LEFT JOIN borrowers br ON co.borrower_id = br.id
+            WHERE bc.book_id = %s AND bc.user_id = %s AND b.deleted_at IS NULL
+            ORDER BY bc.copy_number ASC
+        ''', (book_id, str(g.user_id)))
+
+        copies = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(copies)
+
+    except Exception as e:
+        logger.error(f"Error fetching book copies: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/book-copies', methods=['POST'])
+@token_required
+def create_book_copy():
+    """Create a new book copy. An Available one goes to the book's next hold first."""
+    try:
+        data = request.json
+        status = data.get('status', 'Available')
+        if status == 'Reserved':
+            return jsonify({'error': 'Copies are reserved by the hold queue'}), 400
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Get next copy number (no row if the book is gone)
+        cur.execute('''
+            SELECT COALESCE(MAX(bc.copy_number), 0) + 1 as next_number
+            FROM books b
+            LEFT JOIN book_copies bc ON bc.book_id = b.id
+            WHERE b.id = %s AND b.user_id = %s AND b.deleted_at IS NULL
+            GROUP BY b.id
+        ''', (data.get('book_id'), str(g.user_id)))
+
+        book = cur.fetchone()
+        if not book:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book not found'}), 404
+        next_number = book['next_number']
+
+        cur.execute('''
+            INSERT INTO book_copies (book_id, user_id, copy_number, condition, location, status, notes)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING *
+        ''', (
+            data.get('book_id'),
+            str(g.user_id),
+            next_number,
+            data.get('condition', 'Good'),
+            data.get('location'),
+            status,
+            data.get('notes')
+        ))
+
+        copy = cur.fetchone()
+        if status == 'Available' and shelve_copy(cur, str(g.user_id), copy['id'], copy['book_id']):
+            cur.execute('SELECT * FROM book_copies WHERE id = %s', (copy['id'],))
+            copy = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(copy), 201
+
+    except Exception as e:
+        logger.error(f"Error creating book copy: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/book-copies/<copy_id>', methods=['PUT'])
+@token_required
+def update_book_copy(copy_id):
+    """
+    Update a book copy. A Reserved copy given another status puts its hold
+    back at the head of the queue; one set Available goes to the next hold.
+    """
+    try:
+        data = request.json
+        status = data.get('status')
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT status FROM book_copies
+            WHERE id = %s AND user_id = %s
+            FOR UPDATE
+        ''', (copy_id, str(g.user_id)))
+        current = cur.fetchone()
+        if not current:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book copy not found'}), 404
+        if status == 'Reserved' and current['status'] != 'Reserved':
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Copies are reserved by the hold queue'}), 400
+
+        cur.execute('''
+            UPDATE book_copies
+            SET condition = %s, location = %s, status = %s, notes = %s
+            WHERE id = %s AND user_id = %s
+            RETURNING *
+        ''', (
+            data.get('condition'),
+            data.get('location'),
+            status,
+            data.get('notes'),
+            copy_id,
+            str(g.user_id)
+        ))
+
+        copy = cur.fetchone()
+        if status == 'Available':
+            # Back to the same hold if it was Reserved, else the next one
+            if shelve_copy(cur, str(g.user_id), copy['id'], copy['book_id']):
+                cur.execute('SELECT * FROM book_copies WHERE id = %s', (copy['id'],))
+                copy = cur.fetchone()
+        elif current['status'] == 'Reserved' and status != 'Reserved':
+            requeue_ready_hold(cur, copy['id'])
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(copy)
+
+    except Exception as e:
+        logger.error(f"Error updating book copy: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/book-copies/<copy_id>', methods=['DELETE'])
+@token_required
+def delete_book_copy(copy_id):
+    """Delete a book copy."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Check if copy is currently checked out
+        cur.execute('''
+            SELECT id FROM checkouts
+            WHERE copy_id = %s AND status = 'Checked Out'
+        ''', (copy_id,))
+
+        if cur.fetchone():
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Cannot delete a copy that is currently checked out'}), 400
+
+        cur.execute('''
+            SELECT status FROM book_copies
+            WHERE id = %s AND user_id = %s
+            FOR UPDATE
+        ''', (copy_id, str(g.user_id)))
+        copy = cur.fetchone()
+        if copy and copy['status'] == 'Reserved':
+            # Its Ready hold waits for the next copy instead
+            requeue_ready_hold(cur, copy_id)
+
+        cur.execute('''
+            DELETE FROM book_copies
+            WHERE id = %s AND user_id = %s
+            RETURNING id
+        ''', (copy_id, str(g.user_id)))
+
+        deleted = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Book copy not found'}), 404
+
+        return jsonify({'message': 'Book copy deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting book copy: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,70 @@
+from flask import Blueprint, request, jsonify, current_app
+import logging
+
+from covers import (ACCEL_PREFIX, SIZES, DEFAULT_SIZE, CoverUnavailable,
+                    resolve_cover, object_path, thumbnail_cache, load_thumbnail)
+from isbn import normalize_isbn
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('covers', __name__)
+
+# A thumbnail's bytes never change under its hash; an ISBN could get a
+# better cover, so browsers keep it for 30 days and then revalidate by ETag
+COVER_MAX_AGE = 30 * 86400
+MISSING_MAX_AGE = 86400
+
+# =============================================================================
+# COVER IMAGE ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/covers/<isbn>.jpg', methods=['GET'])
+def get_cover(isbn):
+    """
+    Cover thumbnail for an ISBN (?size=s|m|l). Not behind token_required:
+    covers are public images, not tenant data, and <img> tags cannot send
+    X-User-Email. Only valid ISBNs reach the provider.
+    """
+    size = request.args.get('size', DEFAULT_SIZE)
+    if size not in SIZES:
+        return jsonify({'error': f"size must be one of {', '.join(SIZES)}"}), 400
+    isbn13 = normalize_isbn(isbn)
+    if not isbn13:
+        return jsonify({'error': 'Invalid ISBN'}), 400
+
+    try:
+        try:
+            digest = resolve_cover(isbn13)
+        except CoverUnavailable as e:
+            logger.warning(f"Cover for {isbn13} unavailable: {str(e)}")
+            response = jsonify({'error': 'Cover temporarily unavailable'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '30'
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        if not digest:
+            response = jsonify({'error': 'No cover for this ISBN'})
+            response.status_code = 404
+            response.headers['Cache-Control'] = f'public, max-age={MISSING_MAX_AGE}'
+            return response
+
+        etag = f'{digest[:32]}-{size}'
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            data = thumbnail_cache.get((digest, size))
+            if data is None and ACCEL_PREFIX:
+                # nginx sends the file itself (sendfile); the worker is done
+                response = current_app.response_class(mimetype='image/jpeg')
+                response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + object_path(digest, size)
+            else:
+                response = current_app.response_class(
+                    data if data is not None else load_thumbnail(digest, size), mimetype='image/jpeg'
+                )
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={COVER_MAX_AGE}'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error fetching cover: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,102 @@
+from flask import Blueprint, jsonify, g
+import logging
+
+from auth import token_required
+from cache import cached_response, DASHBOARD
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('dashboard', __name__)
+
+# =============================================================================
+# DASHBOARD / STATS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/dashboard/stats', methods=['GET'])
+@token_required
+@cached_response(DASHBOARD)
+def get_dashboard_stats():
+    """Get dashboard statistics."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Total books
+        cur.execute('''
+            SELECT COUNT(*) as total FROM books WHERE user_id = %s AND deleted_at IS NULL
+        ''', (str(g.user_id),))
+        total_books = cur.fetchone()['total']
+
+        # Total copies
+        cur.execute('''
+            SELECT COUNT(*) as total FROM book_copies bc
+            JOIN books b ON bc.book_id = b.id
+            WHERE bc.user_id = %s AND b.deleted_at IS NULL
+        ''', (str(g.user_id),))
+        total_copies = cur.fetchone()['total']
+
+        # Available copies
+        cur.execute('''
+            SELECT COUNT(*) as total FROM book_copies bc
+            JOIN books b ON bc.book_id = b.id
+            WHERE bc.user_id = %s AND bc.status = 'Available' AND b.deleted_at IS NULL
+        ''', (str(g.user_id),))
+        available_copies = cur.fetchone()['total']
+
+        # Active checkouts
+        cur.execute('''
+            SELECT COUNT(*) as total FROM checkouts co
+            JOIN book_copies bc ON co.copy_id = bc.id
+            JOIN books b ON bc.book_id = b.id
+            WHERE co.user_id = %s AND co.status = 'Checked Out' AND b.deleted_at IS NULL
+        ''', (str(g.user_id),))
+        active_checkouts = cur.fetchone()['total']
+
+        # Total borrowers
+        cur.execute('''
+            SELECT COUNT(*) as total FROM borrowers WHERE user_id = %s AND deleted_at IS NULL
+        ''', (str(g.user_id),))
+        total_borrowers = cur.fetchone()['total']
+
+        # Overdue checkouts
+        cur.execute('''
+            SELECT COUNT(*) as total FROM checkouts co
+            JOIN book_copies bc ON co.copy_id = bc.id
+            JOIN books b ON bc.book_id = b.id
+            WHERE co.user_id = %s AND co.status = 'Checked Out' AND co.due_date < CURRENT_DATE
+              AND b.deleted_at IS NULL
+        ''', (str(g.user_id),))
+        overdue_checkouts = cur.fetchone()['total']
+
+        # Wishlist items
+        cur.execute('''
+            SELECT COUNT(*) as total FROM book_wishlist
+            WHERE user_id = %s AND status = 'Requested'
+        ''', (str(g.user_id),))
+        wishlist_items = cur.fetchone()['total']
+
+        # Pending follow-ups
+        cur.execute('''
+            SELECT COUNT(*) as total FROM follow_ups
+            WHERE user_id = %s AND status IN ('Pending', 'Contacted')
+        ''', (str(g.user_id),))
+        pending_follow_ups = cur.fetchone()['total']
+
+        cur.close()
+        conn.close()
+
+        return jsonify({
+            'total_books': total_books,
+            'total_copies': total_copies,
+            'available_copies': available_copies,
+            'active_checkouts': active_checkouts,
+            'total_borrowers': total_borrowers,
+            'overdue_checkouts': overdue_checkouts,
+            'wishlist_items': wishlist_items,
+            'pending_follow_ups': pending_follow_ups
+        })
+
+    except Exception as e:
+        logger.error(f"Error fetching dashboard stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
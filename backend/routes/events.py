@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context
+import logging
+
+from auth import token_required
+from change_feed import event_stream, latest_event_id, can_hold_stream, parse_event_id
+from db import use_primary
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('events', __name__)
+
+# =============================================================================
+# CHANGE FEED ENDPOINT
+# =============================================================================
+
+@bp.route('/api/events', methods=['GET'])
+@token_required
+@use_primary
+def stream_events():
+    """
+    Stream the user's changes as Server-Sent Events. Resumes after the
+    Last-Event-ID header (or ?last_event_id=). When the worker has no thread
+    to spare the response only replays missed events and closes, and the
+    client polls again after the retry interval.
+    """
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        last_id = None
+        reset_reason = None
+        if last_event_id:
+            try:
+                last_id = parse_event_id(last_event_id, g.shard)
+            except ValueError:
+                return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+            if last_id is None:
+                # Issued by the shard this library was moved from
+                reset_reason = 'library moved'
+        if last_id is None:
+            last_id = latest_event_id()
+
+        hold = can_hold_stream()
+        retry_ms = 3000 if hold else 10000
+
+        response = Response(
+            stream_with_context(event_stream(str(g.user_id), g.shard, last_id, hold, retry_ms, reset_reason)),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error opening event stream: {str(e)}")
+        return jsonify({'error': str(e)}), 500
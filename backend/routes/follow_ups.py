@@ -0,0 +1,211 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+
+from auth import token_required
+from db import get_db_connection, use_primary
+from jobs import enqueue, accepted
+from mailer import smtp_config
+from reminders import select_overdue
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('follow_ups', __name__)
+
+# =============================================================================
+# FOLLOW UPS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/follow-ups', methods=['GET'])
+@token_required
+def get_follow_ups():
+    """Get all follow-ups ordered by checkout date (oldest first)."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT fu.*,
+                   co.checkout_date, co.due_date,
+                   b.title, b.author,
+                   bc.copy_number,
+                   br.first_name, br.last_name, br.email, br.phone,
+                   EXTRACT(DAY FROM (CURRENT_TIMESTAMP - co.checkout_date)) as days_checked_out
+            FROM follow_ups fu
+            JOIN checkouts co ON fu.checkout_id = co.id
+            JOIN book_copies bc ON co.copy_id = bc.id
+            JOIN books b ON bc.book_id = b.id
+            JOIN borrowers br ON co.borrower_id = br.id
+            WHERE fu.user_id = %s AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+            ORDER BY co.checkout_date ASC, fu.status ASC
+        ''', (str(g.user_id),))
+
+        follow_ups = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(follow_ups)
+
+    except Exception as e:
+        logger.error(f"Error fetching follow-ups: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/follow-ups', methods=['POST'])
+@token_required
+def create_follow_up():
+    """Create a follow-up for a checkout."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Check if follow-up already exists
+        cur.execute('''
+            SELECT id FROM follow_ups
+            WHERE checkout_id = %s AND user_id = %s
+        ''', (data.get('checkout_id'), str(g.user_id)))
+
+        if cur.fetchone():
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Follow-up already exists for this checkout'}), 400
+
+        cur.execute('''
+            INSERT INTO follow_ups (checkout_id, user_id, reason)
+            VALUES (%s, %s, %s)
+            RETURNING *
+        ''', (
+            data.get('checkout_id'),
+            str(g.user_id),
+            data.get('reason')
+        ))
+
+        follow_up = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(follow_up), 201
+
+    except Exception as e:
+        logger.error(f"Error creating follow-up: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/follow-ups/<follow_up_id>', methods=['PUT'])
+@token_required
+def update_follow_up(follow_up_id):
+    """Update a follow-up."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE follow_ups
+            SET status = %s, contacted_date = %s, resolution_notes = %s
+            WHERE id = %s AND user_id = %s
+            RETURNING *
+        ''', (
+            data.get('status'),
+            data.get('contacted_date'),
+            data.get('resolution_notes'),
+            follow_up_id,
+            str(g.user_id)
+        ))
+
+        follow_up = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not follow_up:
+            return jsonify({'error': 'Follow-up not found'}), 404
+
+        return jsonify(follow_up)
+
+    except Exception as e:
+        logger.error(f"Error updating follow-up: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/follow-ups/<follow_up_id>', methods=['DELETE'])
+@token_required
+def delete_follow_up(follow_up_id):
+    """Delete a follow-up."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            DELETE FROM follow_ups
+            WHERE id = %s AND user_id = %s
+            RETURNING id
+        ''', (follow_up_id, str(g.user_id)))
+
+        deleted = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Follow-up not found'}), 404
+
+        return jsonify({'message': 'Follow-up deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting follow-up: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# OVERDUE REMINDERS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/follow-ups/reminders', methods=['GET'])
+@token_required
+@use_primary
+def preview_reminders():
+    """Borrowers and checkouts the next reminder run would email."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        groups = select_overdue(cur, str(g.user_id))
+        cur.close()
+        conn.close()
+
+        return jsonify({
+            'email_configured': smtp_config()['host'] is not None,
+            'borrowers': len(groups),
+            'checkouts': sum(len(items) for items in groups),
+            'recipients': [
+                {
+                    'borrower_id': items[0]['borrower_id'],
+                    'name': f"{items[0]['first_name']} {items[0]['last_name']}",
+                    'email': items[0]['email'],
+                    'checkout_ids': [item['checkout_id'] for item in items],
+                }
+                for items in groups
+            ],
+        })
+
+    except Exception as e:
+        logger.error(f"Error previewing reminders: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/follow-ups/reminders', methods=['POST'])
+@token_required
+def send_reminders():
+    """
+    Queue an overdue_reminders job: email every borrower with overdue books
+    (or only the given checkout_ids) and mark their follow-ups Contacted.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        checkout_ids = data.get('checkout_ids')
+        if checkout_ids is not None and not isinstance(checkout_ids, list):
+            return jsonify({'error': 'checkout_ids must be a list'}), 400
+        if smtp_config()['host'] is None:
+            return jsonify({'error': 'Email is not configured on this server'}), 503
+
+        return accepted(enqueue('overdue_reminders', {'checkout_ids': checkout_ids}))
+
+    except Exception as e:
+        logger.error(f"Error queueing reminders: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,258 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+import uuid
+
+from psycopg2.errors import UniqueViolation
+
+from auth import token_required
+from db import get_db_connection, use_primary
+from holds import (HOLD_COLUMNS, OPEN_STATUSES, get_hold, queue_stats, enqueue_hold,
+                   allocate_available, close_hold)
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('holds', __name__)
+
+HOLD_STATUSES = ('Waiting', 'Ready', 'Fulfilled', 'Cancelled', 'Expired')
+OPEN_HOLD_CONSTRAINT = 'idx_holds_open_borrower'
+
+
+def _valid_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+# =============================================================================
+# HOLDS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/holds', methods=['GET'])
+@token_required
+def get_holds():
+    """Open holds with queue positions (?book_id=, ?borrower_id=, ?status=)."""
+    try:
+        status = request.args.get('status')
+        if status is not None and status not in HOLD_STATUSES:
+            return jsonify({'error': f"status must be one of {', '.join(HOLD_STATUSES)}"}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        query = f'''
+            SELECT {HOLD_COLUMNS}, b.title, b.author, br.first_name, br.last_name, bc.copy_number
+            FROM holds h
+            JOIN books b ON h.book_id = b.id
+            JOIN borrowers br ON h.borrower_id = br.id
+            LEFT JOIN book_copies bc ON h.copy_id = bc.id
+            WHERE h.user_id = %s AND b.deleted_at IS NULL AND br.deleted_at IS NULL
+        '''
+        params = [str(g.user_id)]
+        if status:
+            query += ' AND h.status = %s'
+            params.append(status)
+        else:
+            query += ' AND h.status = ANY(%s)'
+            params.append(list(OPEN_STATUSES))
+        for column in ('book_id', 'borrower_id'):
+            value = request.args.get(column)
+            if value:
+                if not _valid_uuid(value):
+                    cur.close()
+                    conn.close()
+                    return jsonify({'error': f'Invalid {column}'}), 400
+                query += f' AND h.{column} = %s'
+                params.append(value)
+        query += ' ORDER BY h.status, h.expires_at, b.title, h.ticket LIMIT 500'
+
+        cur.execute(query, params)
+        holds = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(holds)
+
+    except Exception as e:
+        logger.error(f"Error fetching holds: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/holds/<hold_id>', methods=['GET'])
+@token_required
+@use_primary
+def get_hold_detail(hold_id):
+    """One hold with its position and the length of its book's queue."""
+    if not _valid_uuid(hold_id):
+        return jsonify({'error': 'Hold not found'}), 404
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        hold = get_hold(cur, str(g.user_id), hold_id)
+        if hold:
+            hold['queue'] = queue_stats(cur, hold['book_id'])
+        cur.close()
+        conn.close()
+
+        if not hold:
+            return jsonify({'error': 'Hold not found'}), 404
+
+        return jsonify(hold)
+
+    except Exception as e:
+        logger.error(f"Error fetching hold: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/holds', methods=['POST'])
+@token_required
+def create_hold():
+    """
+    Place a hold for a borrower at the back of the book's queue. If a copy
+    is on the shelf it is reserved for the queue's head straight away.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        book_id = data.get('book_id')
+        borrower_id = data.get('borrower_id')
+        if not _valid_uuid(book_id) or not _valid_uuid(borrower_id):
+            return jsonify({'error': 'book_id and borrower_id are required'}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT
+                (SELECT id FROM books WHERE id = %s AND user_id = %s AND deleted_at IS NULL) AS book_id,
+                (SELECT id FROM borrowers WHERE id = %s AND user_id = %s AND deleted_at IS NULL) AS borrower_id,
+                (SELECT id FROM holds
+                 WHERE book_id = %s AND borrower_id = %s AND status IN ('Waiting', 'Ready')) AS open_hold
+        ''', (book_id, str(g.user_id), borrower_id, str(g.user_id), book_id, borrower_id))
+        found = cur.fetchone()
+        if not found['book_id'] or not found['borrower_id']:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book or borrower not found'}), 404
+        if found['open_hold']:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Borrower already has a hold on this book', 'hold_id': found['open_hold']}), 409
+
+        try:
+            hold_id = enqueue_hold(cur, str(g.user_id), book_id, borrower_id, data.get('notes'))
+        except UniqueViolation as e:
+            # The same hold placed concurrently got in first
+            if e.diag.constraint_name != OPEN_HOLD_CONSTRAINT:
+                raise
+            conn.rollback()
+            cur.execute('''
+                SELECT id FROM holds
+                WHERE book_id = %s AND borrower_id = %s AND status IN ('Waiting', 'Ready')
+            ''', (book_id, borrower_id))
+            existing = cur.fetchone()
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Borrower already has a hold on this book',
+                            'hold_id': existing['id'] if existing else None}), 409
+        allocate_available(cur, str(g.user_id), book_id)
+        hold = get_hold(cur, str(g.user_id), hold_id)
+        hold['queue'] = queue_stats(cur, book_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(hold), 201
+
+    except Exception as e:
+        logger.error(f"Error creating hold: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/holds/<hold_id>/cancel', methods=['PUT'])
+@token_required
+def cancel_hold(hold_id):
+    """Cancel an open hold; a copy waiting for pickup goes to the next hold."""
+    if not _valid_uuid(hold_id):
+        return jsonify({'error': 'Hold not found'}), 404
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        closed = close_hold(cur, str(g.user_id), hold_id, 'Cancelled')
+        if not closed:
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Open hold not found'}), 404
+
+        hold = get_hold(cur, str(g.user_id), hold_id)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(hold)
+
+    except Exception as e:
+        logger.error(f"Error cancelling hold: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/books/<book_id>/holds', methods=['GET'])
+@token_required
+def get_book_holds(book_id):
+    """
+    A book's waiting queue in order, paged by ticket (?after=<ticket>&limit=),
+    with the hold a copy is waiting to be collected for. Cancelling a hold
+    moves later tickets up by one, so a cancel between two pages makes the
+    next page skip one hold; page again from the start for an exact list.
+    """
+    if not _valid_uuid(book_id):
+        return jsonify({'error': 'Book not found'}), 404
+
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        after = request.args.get('after', 0, type=int)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('SELECT id FROM books WHERE id = %s AND user_id = %s AND deleted_at IS NULL', (book_id, str(g.user_id)))
+        if not cur.fetchone():
+            cur.close()
+            conn.close()
+            return jsonify({'error': 'Book not found'}), 404
+
+        queue = queue_stats(cur, book_id)
+        cur.execute('''
+            SELECT h.id, h.borrower_id, h.ticket, h.created_at, h.notes,
+                   h.ticket - %s + 1 AS position,
+                   br.first_name, br.last_name, br.email
+            FROM holds h
+            JOIN borrowers br ON h.borrower_id = br.id
+            WHERE h.book_id = %s AND h.status = 'Waiting' AND h.ticket > %s
+            ORDER BY h.ticket
+            LIMIT %s
+        ''', (queue['head_ticket'] or 0, book_id, after, limit))
+        waiting = cur.fetchall()
+
+        cur.execute('''
+            SELECT h.id, h.borrower_id, h.copy_id, h.ready_at, h.expires_at,
+                   bc.copy_number, br.first_name, br.last_name
+            FROM holds h
+            JOIN borrowers br ON h.borrower_id = br.id
+            LEFT JOIN book_copies bc ON h.copy_id = bc.id
+            WHERE h.book_id = %s AND h.status = 'Ready'
+            ORDER BY h.expires_at
+        ''', (book_id,))
+        ready = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify({
+            'waiting_count': queue['waiting'],
+            'waiting': waiting,
+            'ready': ready,
+            'next_after': waiting[-1]['ticket'] if len(waiting) == limit else None,
+        })
+
+    except Exception as e:
+        logger.error(f"Error fetching book holds: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,77 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+import uuid
+
+from auth import token_required
+from db import get_db_connection, use_primary
+from jobs import serialize_job
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('jobs', __name__)
+
+# =============================================================================
+# JOBS ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/jobs', methods=['GET'])
+@token_required
+@use_primary
+def get_jobs():
+    """The user's most recent background jobs (?status= to filter)."""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        status = request.args.get('status')
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        query = 'SELECT * FROM jobs WHERE user_id = %s'
+        params = [str(g.user_id)]
+        if status:
+            query += ' AND status = %s'
+            params.append(status)
+        query += ' ORDER BY created_at DESC LIMIT %s'
+        params.append(limit)
+
+        cur.execute(query, params)
+        jobs = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify([serialize_job(job) for job in jobs])
+
+    except Exception as e:
+        logger.error(f"Error fetching jobs: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+@token_required
+@use_primary
+def get_job(job_id):
+    """Status, progress and result of one background job."""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({'error': 'Job not found'}), 404
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('SELECT * FROM jobs WHERE id = %s AND user_id = %s', (job_id, str(g.user_id)))
+        job = cur.fetchone()
+        cur.close()
+        conn.close()
+
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        response = jsonify(serialize_job(job))
+        if job['status'] in ('queued', 'running'):
+            response.headers['Retry-After'] = '1'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error fetching job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,109 @@
+from flask import Blueprint, request, jsonify, g, send_file
+import logging
+import re
+import uuid
+
+from auth import token_required
+from db import get_db_connection
+from jobs import enqueue, accepted
+from labels import (INLINE_MAX_LABELS, MAX_LABELS, select_labels, plan_sheet, cached_sheet,
+                    build_sheet, document_path, document_url)
+from label_sheets import LAYOUTS, DEFAULT_LAYOUT, per_page
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('labels', __name__)
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _uuid_list(value, name):
+    if value is None:
+        return []
+    if not isinstance(value, list) or len(value) > MAX_LABELS:
+        raise ValueError(f'{name} must be a list of at most {MAX_LABELS} ids')
+    try:
+        return [str(uuid.UUID(str(item))) for item in value]
+    except ValueError:
+        raise ValueError(f'{name} contains an invalid id')
+
+# =============================================================================
+# BARCODE LABEL ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/labels', methods=['POST'])
+@token_required
+def create_label_sheet():
+    """
+    Barcode label sheet for {book_ids, copy_ids, layout, start_position}.
+    Answers with the PDF's URL when it is cached or small enough to render
+    now; otherwise 202 with the rendering job, whose result has the URL.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            book_ids = _uuid_list(data.get('book_ids'), 'book_ids')
+            copy_ids = _uuid_list(data.get('copy_ids'), 'copy_ids')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not book_ids and not copy_ids:
+            return jsonify({'error': 'Select books (book_ids) or copies (copy_ids)'}), 400
+        layout = data.get('layout') or DEFAULT_LAYOUT
+        if layout not in LAYOUTS:
+            return jsonify({'error': f"layout must be one of {', '.join(LAYOUTS)}"}), 400
+        start_position = data.get('start_position', 1)
+        if not isinstance(start_position, int) or not 1 <= start_position <= per_page(layout):
+            return jsonify({'error': f'start_position must be between 1 and {per_page(layout)}'}), 400
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        labels, skipped = select_labels(cur, str(g.user_id), book_ids, copy_ids)
+        cur.close()
+        conn.close()
+
+        if not labels:
+            return jsonify({'error': 'None of the selected copies has a barcode', 'skipped': skipped}), 400
+        if len(labels) > MAX_LABELS:
+            return jsonify({'error': f'At most {MAX_LABELS} labels per sheet'}), 400
+
+        pages, _, key = plan_sheet(str(g.user_id), layout, labels, start_position)
+        if cached_sheet(str(g.user_id), key):
+            return jsonify({
+                'key': key, 'url': document_url(key), 'layout': layout,
+                'labels': len(labels), 'pages': len(pages), 'pages_rendered': 0, 'skipped': skipped,
+            })
+
+        if len(labels) > INLINE_MAX_LABELS:
+            return accepted(enqueue('barcode_labels', {
+                'book_ids': book_ids,
+                'copy_ids': copy_ids,
+                'layout': layout,
+                'start_position': start_position,
+            }))
+
+        summary = build_sheet(str(g.user_id), layout, labels, start_position)
+        summary['skipped'] = skipped
+        return jsonify(summary)
+
+    except Exception as e:
+        logger.error(f"Error creating label sheet: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/labels/<key>.pdf', methods=['GET'])
+@token_required
+def get_label_sheet(key):
+    """A rendered label sheet (PDF)."""
+    if not KEY_PATTERN.match(key):
+        return jsonify({'error': 'Label sheet not found'}), 404
+
+    try:
+        path = document_path(str(g.user_id), key)
+        try:
+            return send_file(path, mimetype='application/pdf', download_name='labels.pdf',
+                             max_age=3600, conditional=True)
+        except FileNotFoundError:
+            return jsonify({'error': 'Label sheet not found (it may have expired; request it again)'}), 404
+
+    except Exception as e:
+        logger.error(f"Error fetching label sheet: {str(e)}")
+        return jsonify({'error': str(e)}), 500
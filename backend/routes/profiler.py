@@ -0,0 +1,112 @@
+from flask import Blueprint, request, jsonify, current_app, send_file
+import logging
+import os
+
+from auth import token_required, admin_required
+from profiler import (DEFAULT_HZ, MAX_HZ, SORT_KEYS, ProfilerBusy, collapsed, max_seconds,
+                      profile_path, profile_report, sample_workers, worker_pids)
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('profiler', __name__)
+
+# =============================================================================
+# SAMPLING PROFILER ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/admin/profiler/workers', methods=['GET'])
+@token_required
+@admin_required
+def get_profiler_workers():
+    """Worker pids that can be sampled, and the answering worker's own."""
+    return jsonify({'pid': os.getpid(), 'workers': worker_pids(), 'max_seconds': max_seconds()})
+
+@bp.route('/api/admin/profiler/sample', methods=['POST'])
+@token_required
+@admin_required
+def sample_profile():
+    """
+    Sample worker stacks for `seconds` and answer with collapsed stacks
+    (text/plain, for flamegraph.pl or speedscope; ?format=json wraps them
+    with per-worker sample counts). Body: seconds (default 10), hz (default
+    100), worker ('all', 'self' or a pid from /workers; default 'all') and
+    all_threads (default false: only threads serving a request). The
+    request returns when the run ends.
+    """
+    try:
+        try:
+            data = request.get_json(silent=True) or {}
+            limit = max_seconds()
+            seconds = float(data.get('seconds', 10))
+            if not 0 < seconds <= limit:
+                raise ValueError(f'seconds must be between 0 and {limit}')
+            hz = int(data.get('hz', DEFAULT_HZ))
+            if not 1 <= hz <= MAX_HZ:
+                raise ValueError(f'hz must be between 1 and {MAX_HZ}')
+            worker = str(data.get('worker', 'all'))
+            available = worker_pids()
+            if worker == 'all':
+                pids = available
+            elif worker == 'self':
+                pids = [os.getpid()]
+            elif worker.isdigit() and int(worker) in available:
+                pids = [int(worker)]
+            else:
+                raise ValueError(f"worker must be 'all', 'self' or one of {available}")
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            stacks, workers = sample_workers(pids, seconds, hz, bool(data.get('all_threads')))
+        except ProfilerBusy:
+            return jsonify({'error': 'A profile is already running in this worker'}), 409
+
+        if request.args.get('format') == 'json':
+            return jsonify({'seconds': seconds, 'hz': hz, 'workers': workers, 'stacks': collapsed(stacks)})
+        response = current_app.response_class(collapsed(stacks), mimetype='text/plain')
+        response.headers['X-Profile-Workers'] = ', '.join(
+            f"{pid}={result.get('samples', result.get('error'))}" for pid, result in sorted(workers.items())
+        )
+        return response
+
+    except Exception as e:
+        logger.error(f"Error sampling workers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# REQUEST PROFILE ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@token_required
+@admin_required
+def get_request_profile(profile_id):
+    """
+    A request profile captured with the X-Profile header: request details
+    and pstats text (?sort=cumulative|tottime|calls, ?limit=50), or the raw
+    .prof file for snakeviz and friends with ?format=prof.
+    """
+    try:
+        if request.args.get('format') == 'prof':
+            path = profile_path(profile_id)
+            if path is None:
+                return jsonify({'error': 'Profile not found'}), 404
+            return send_file(path, mimetype='application/octet-stream',
+                             download_name=f'{profile_id}.prof', as_attachment=True)
+
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in SORT_KEYS:
+            return jsonify({'error': f"sort must be one of {', '.join(SORT_KEYS)}"}), 400
+        try:
+            limit = int(request.args.get('limit', 50))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+
+        report = profile_report(profile_id, sort, limit)
+        if report is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return jsonify(report)
+
+    except Exception as e:
+        logger.error(f"Error fetching request profile: {str(e)}")
+        return jsonify({'error': str(e)}), 500
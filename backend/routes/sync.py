@@ -0,0 +1,189 @@
+from flask import Blueprint, request, jsonify, g
+from datetime import datetime
+import base64
+import json
+import logging
+
+from auth import token_required
+from purge import TOMBSTONE_RETENTION_DAYS
+from db import get_db_connection, use_primary
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('sync', __name__)
+
+# Response key and table, in the order pages walk them; deletions come last
+SYNC_TABLES = (
+    ('books', 'books'),
+    ('copies', 'book_copies'),
+    ('borrowers', 'borrowers'),
+    ('checkouts', 'checkouts'),
+    ('wishlist', 'book_wishlist'),
+    ('follow_ups', 'follow_ups'),
+)
+TABLE_KEYS = {table: key for key, table in SYNC_TABLES}
+# Soft-deleted rows are sent as tombstones, not as changed rows
+LIVE_FILTERS = {
+    'books': 'deleted_at IS NULL',
+    'borrowers': 'deleted_at IS NULL',
+    'book_copies': '''NOT EXISTS (SELECT 1 FROM books b
+                                  WHERE b.id = book_copies.book_id AND b.deleted_at IS NOT NULL)''',
+}
+TOMBSTONE_STAGE = len(SYNC_TABLES)
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+
+# =============================================================================
+# SYNC HELPERS
+# =============================================================================
+
+def encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    if not 0 <= state['stage'] <= TOMBSTONE_STAGE:
+        raise ValueError('stage out of range')
+    return state
+
+
+def safe_watermark(cur):
+    """
+    Watermark for the next sync, and the oldest watermark tombstones still
+    cover. updated_at is the writing transaction's start time, so a
+    transaction still open now can commit rows stamped earlier than NOW();
+    the watermark is held back to the oldest open transaction so the next
+    sync (updated_at >= watermark) still sees them.
+    """
+    cur.execute('''
+        SELECT LEAST(
+                   NOW(),
+                   (SELECT MIN(xact_start) FROM pg_stat_activity
+                    WHERE datname = current_database()
+                      AND backend_type = 'client backend'
+                      AND pid <> pg_backend_pid())
+               )::timestamp AS watermark,
+               (NOW() - make_interval(days => %s))::timestamp AS horizon
+    ''', (TOMBSTONE_RETENTION_DAYS,))
+    row = cur.fetchone()
+    return row['watermark'], row['horizon']
+
+
+def fetch_stage(cur, stage, since, after, limit):
+    """One keyset page of changed rows (or tombstones) for a stage."""
+    params = [str(g.user_id)]
+    if stage == TOMBSTONE_STAGE:
+        sql = 'SELECT id, table_name, row_id, deleted_at FROM sync_tombstones WHERE user_id = %s AND deleted_at >= %s'
+        params.append(since)
+        if after:
+            sql += ' AND (deleted_at, id) > (%s, %s)'
+            params.extend(after)
+        sql += ' ORDER BY deleted_at, id LIMIT %s'
+    else:
+        table = SYNC_TABLES[stage][1]
+        sql = f'SELECT * FROM {table} WHERE user_id = %s'
+        if table in LIVE_FILTERS:
+            sql += f' AND {LIVE_FILTERS[table]}'
+        if since is not None:
+            sql += ' AND updated_at >= %s'
+            params.append(since)
+        if after:
+            sql += ' AND (updated_at, id) > (%s, %s)'
+            params.extend(after)
+        sql += ' ORDER BY updated_at, id LIMIT %s'
+    params.append(limit)
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+# =============================================================================
+# SYNC ENDPOINT
+# =============================================================================
+
+@bp.route('/api/sync', methods=['GET'])
+@token_required
+@use_primary
+def sync_changes():
+    """
+    Rows inserted or updated since a watermark, plus deleted ids, in pages.
+    Start with ?since=<watermark from the last sync> (or nothing for a full
+    sync), follow next_cursor until it is null, then store the returned
+    watermark. full=true means the client should replace its local data.
+    """
+    try:
+        limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        token = request.args.get('cursor')
+        if token:
+            try:
+                state = decode_cursor(token)
+            except (ValueError, KeyError, TypeError):
+                cur.close()
+                conn.close()
+                return jsonify({'error': 'Invalid cursor'}), 400
+        else:
+            since = request.args.get('since') or None
+            if since is not None:
+                try:
+                    since = datetime.fromisoformat(since)
+                except ValueError:
+                    cur.close()
+                    conn.close()
+                    return jsonify({'error': 'Invalid since watermark'}), 400
+
+            watermark, horizon = safe_watermark(cur)
+            # Deletions older than the tombstone horizon are gone: resync fully
+            if since is not None and since < horizon:
+                since = None
+            state = {
+                'since': since.isoformat() if since else None,
+                'watermark': watermark.isoformat(),
+                'stage': 0,
+                'after': None,
+            }
+
+        since = datetime.fromisoformat(state['since']) if state['since'] else None
+        last_stage = TOMBSTONE_STAGE if since is not None else TOMBSTONE_STAGE - 1
+
+        changes = {}
+        deleted = []
+        remaining = limit
+        while state['stage'] <= last_stage and remaining > 0:
+            rows = fetch_stage(cur, state['stage'], since, state['after'], remaining)
+            remaining -= len(rows)
+
+            if state['stage'] == TOMBSTONE_STAGE:
+                deleted.extend({'table': TABLE_KEYS[row['table_name']], 'id': row['row_id']} for row in rows)
+                last_key = [rows[-1]['deleted_at'].isoformat(), rows[-1]['id']] if rows else None
+            else:
+                for row in rows:
+                    row.pop('user_id', None)
+                if rows:
+                    changes.setdefault(SYNC_TABLES[state['stage']][0], []).extend(rows)
+                last_key = [rows[-1]['updated_at'].isoformat(), str(rows[-1]['id'])] if rows else None
+
+            if remaining > 0:
+                # Stage exhausted
+                state['stage'] += 1
+                state['after'] = None
+            else:
+                state['after'] = last_key
+
+        cur.close()
+        conn.close()
+
+        done = state['stage'] > last_stage
+        return jsonify({
+            'full': since is None,
+            'changes': changes,
+            'deleted': deleted,
+            'next_cursor': None if done else encode_cursor(state),
+            'watermark': state['watermark'] if done else None,
+        })
+
+    except Exception as e:
+        logger.error(f"Error syncing changes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
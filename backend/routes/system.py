@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, g
+import logging
+
+from auth import token_required
+from db import get_db_connection, use_primary
+from metrics import worker_stats
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('system', __name__)
+
+# =============================================================================
+# HEALTH CHECK ENDPOINT
+# =============================================================================
+
+@bp.route('/api/health', methods=['GET'])
+@use_primary
+def health_check():
+    """Health check endpoint for container orchestration."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.close()
+        return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+
+# =============================================================================
+# USER ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/user', methods=['GET'])
+@token_required
+def get_current_user():
+    """Get current authenticated user information."""
+    return jsonify({
+        'id': str(g.user_id),
+        'email': g.user_email
+    })
+
+# =============================================================================
+# WORKER METRICS ENDPOINT
+# =============================================================================
+
+@bp.route('/api/metrics/worker', methods=['GET'])
+@token_required
+def get_worker_metrics():
+    """Saturation, connection pool and listen queue stats for the answering worker."""
+    return jsonify(worker_stats())
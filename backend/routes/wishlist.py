@@ -0,0 +1,146 @@
+from flask import Blueprint, request, jsonify, g
+import logging
+
+from auth import token_required
+from db import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('wishlist', __name__)
+
+# =============================================================================
+# WISHLIST ENDPOINTS
+# =============================================================================
+
+@bp.route('/api/wishlist', methods=['GET'])
+@token_required
+def get_wishlist():
+    """Get all wishlist items."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            SELECT * FROM book_wishlist
+            WHERE user_id = %s
+            ORDER BY
+                CASE priority
+                    WHEN 'High' THEN 1
+                    WHEN 'Medium' THEN 2
+                    WHEN 'Low' THEN 3
+                END,
+                created_at DESC
+        ''', (str(g.user_id),))
+
+        wishlist = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(wishlist)
+
+    except Exception as e:
+        logger.error(f"Error fetching wishlist: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/wishlist', methods=['POST'])
+@token_required
+def create_wishlist_item():
+    """Add item to wishlist."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            INSERT INTO book_wishlist (user_id, title, author, isbn, requested_by, request_notes, priority)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING *
+        ''', (
+            str(g.user_id),
+            data.get('title'),
+            data.get('author'),
+            data.get('isbn'),
+            data.get('requested_by'),
+            data.get('request_notes'),
+            data.get('priority', 'Medium')
+        ))
+
+        item = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return jsonify(item), 201
+
+    except Exception as e:
+        logger.error(f"Error creating wishlist item: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/wishlist/<item_id>', methods=['PUT'])
+@token_required
+def update_wishlist_item(item_id):
+    """Update wishlist item."""
+    try:
+        data = request.json
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            UPDATE book_wishlist
+            SET title = %s, author = %s, isbn = %s, requested_by = %s,
+                request_notes = %s, priority = %s, status = %s
+            WHERE id = %s AND user_id = %s
+            RETURNING *
+        ''', (
+            data.get('title'),
+            data.get('author'),
+            data.get('isbn'),
+            data.get('requested_by'),
+            data.get('request_notes'),
+            data.get('priority'),
+            data.get('status'),
+            item_id,
+            str(g.user_id)
+        ))
+
+        item = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not item:
+            return jsonify({'error': 'Wishlist item not found'}), 404
+
+        return jsonify(item)
+
+    except Exception as e:
+        logger.error(f"Error updating wishlist item: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/api/wishlist/<item_id>', methods=['DELETE'])
+@token_required
+def delete_wishlist_item(item_id):
+    """Delete wishlist item."""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute('''
+            DELETE FROM book_wishlist
+            WHERE id = %s AND user_id = %s
+            RETURNING id
+        ''', (item_id, str(g.user_id)))
+
+        deleted = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if not deleted:
+            return jsonify({'error': 'Wishlist item not found'}), 404
+
+        return jsonify({'message': 'Wishlist item deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting wishlist item: {str(e)}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,89 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SERVER CONFIGURATION
+# =============================================================================
+#
+# Worker, thread and pool sizes are derived from how many PostgreSQL
+# connections the app may hold, rather than from CPU count alone:
+#
+#   pool_size   connections per worker = threads per worker (a request holds
+#               at most one connection at a time)
+#   workers     CPU-based default, capped so workers * (pool_size + 1) stays
+#               within ZOELIBRARYAPP_DB_CONNECTION_BUDGET; the extra connection
+#               is the worker's change-feed listener (change_feed.py)
+#   threads     1 for sync workers; for gthread, sized from the fraction of
+#               request time spent waiting on I/O (ZOELIBRARYAPP_IO_WAIT_RATIO)
+#
+# Any value can be pinned explicitly with its environment variable.
+# See guides/05-PERFORMANCE-TUNING.md for measured guidance.
+
+WORKER_CLASSES = ('sync', 'gthread')
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def load_server_config():
+    """Derive gunicorn and pool settings from the environment."""
+    cpu_count = os.cpu_count() or 1
+
+    worker_class = os.getenv('ZOELIBRARYAPP_WORKER_CLASS', 'sync')
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"ZOELIBRARYAPP_WORKER_CLASS must be one of {WORKER_CLASSES}, got {worker_class!r}")
+
+    # A thread only helps while another is blocked on I/O: at ratio r, one
+    # core can keep about 1 / (1 - r) requests in flight
+    io_wait_ratio = min(max(_env_float('ZOELIBRARYAPP_IO_WAIT_RATIO', 0.5), 0.0), 0.95)
+    if worker_class == 'gthread':
+        threads = _env_int('ZOELIBRARYAPP_THREADS', max(2, min(16, round(1 / (1 - io_wait_ratio)))))
+    else:
+        threads = 1
+
+    pool_size = _env_int('ZOELIBRARYAPP_DB_POOL_SIZE', threads)
+    connection_budget = _env_int('ZOELIBRARYAPP_DB_CONNECTION_BUDGET', 90)
+
+    # Threads already overlap I/O, so gthread needs fewer processes
+    default_workers = cpu_count * 2 + 1 if worker_class == 'sync' else cpu_count + 1
+    connections_per_worker = pool_size + 1
+    workers = _env_int('ZOELIBRARYAPP_WORKERS', min(default_workers, max(1, connection_budget // connections_per_worker)))
+
+    if workers * connections_per_worker > connection_budget:
+        logger.warning(
+            f"{workers} workers x {connections_per_worker} connections exceeds the connection budget "
+            f"of {connection_budget}; requests will queue for connections"
+        )
+
+    timeout = _env_int('ZOELIBRARYAPP_WORKER_TIMEOUT', 30)
+
+    # An open event stream occupies a thread; keep one free for ordinary
+    # requests. Sync workers (one thread) answer /api/events in poll mode.
+    max_event_streams = _env_int('ZOELIBRARYAPP_EVENTS_MAX_STREAMS', threads - 1)
+
+    return {
+        'worker_class': worker_class,
+        'workers': workers,
+        'threads': threads,
+        'pool_size': pool_size,
+        # Give up on a pool slot well before gunicorn kills the worker
+        'pool_timeout': _env_float('ZOELIBRARYAPP_DB_POOL_TIMEOUT', min(5.0, timeout / 3)),
+        'connection_budget': connection_budget,
+        'io_wait_ratio': io_wait_ratio,
+        'timeout': timeout,
+        'graceful_timeout': _env_int('ZOELIBRARYAPP_GRACEFUL_TIMEOUT', timeout),
+        'keepalive': _env_int('ZOELIBRARYAPP_KEEPALIVE', 5),
+        'max_requests': _env_int('ZOELIBRARYAPP_MAX_REQUESTS', 1000),
+        'max_requests_jitter': _env_int('ZOELIBRARYAPP_MAX_REQUESTS_JITTER', 200),
+        'max_event_streams': max_event_streams,
+        'event_stream_seconds': _env_int('ZOELIBRARYAPP_EVENTS_STREAM_SECONDS', 300),
+    }
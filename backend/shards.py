@@ -0,0 +1,62 @@
+import os
+
+# =============================================================================
+# SHARDS
+# =============================================================================
+#
+# Tenants (users) can live on different PostgreSQL databases. The 'default'
+# shard is ZOELIBRARYAPP_DB_HOST/PORT/NAME: it holds every user's identity
+# and the tenant_directory table mapping each user to a shard. Users without
+# a directory row live on the default shard.
+#
+# Further shards are listed in ZOELIBRARYAPP_DB_SHARDS as comma-separated
+# name=host[:port][/dbname]; they share the default's user and password and
+# are initialised with the same database/sql_init.sql. New tenants are placed
+# on ZOELIBRARYAPP_DB_NEW_TENANT_SHARD. Tenants are moved between shards with
+# tools/move_tenant.py.
+#
+# token_required sets g.shard for each request; db.get_db_connection() then
+# hands out connections from that shard's pool.
+
+DEFAULT_SHARD = 'default'
+
+# Tenant-owned tables in foreign-key order (parents first)
+TENANT_TABLES = (
+    'borrowers',
+    'books',
+    'book_copies',
+    'checkouts',
+    'hold_queues',
+    'holds',
+    'book_wishlist',
+    'follow_ups',
+    'jobs',
+)
+
+
+def shard_addresses():
+    """{name: (host, port, dbname)} for every configured shard, default first."""
+    default_port = os.getenv('ZOELIBRARYAPP_DB_PORT')
+    default_name = os.getenv('ZOELIBRARYAPP_DB_NAME')
+    addresses = {DEFAULT_SHARD: (os.getenv('ZOELIBRARYAPP_DB_HOST'), default_port, default_name)}
+
+    for entry in os.getenv('ZOELIBRARYAPP_DB_SHARDS', '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, location = entry.partition('=')
+        location, _, dbname = location.partition('/')
+        host, _, port = location.partition(':')
+        if not name or not host:
+            raise ValueError(f"Invalid ZOELIBRARYAPP_DB_SHARDS entry: {entry!r}")
+        addresses[name.strip()] = (host, port or default_port, dbname or default_name)
+
+    return addresses
+
+
+def new_tenant_shard():
+    """Shard that newly created users are placed on."""
+    shard = os.getenv('ZOELIBRARYAPP_DB_NEW_TENANT_SHARD', '') or DEFAULT_SHARD
+    if shard not in shard_addresses():
+        raise ValueError(f"ZOELIBRARYAPP_DB_NEW_TENANT_SHARD names an unknown shard: {shard}")
+    return shard
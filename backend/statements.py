@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+import logging
+
+from psycopg2.errors import FeatureNotSupported, InvalidSqlStatementName
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# PREPARED STATEMENTS
+# =============================================================================
+#
+# The hottest queries (user lookup, barcode lookup, the checkout and return
+# statements) have fixed SQL, so Postgres parsing and planning them on every
+# call is wasted work. Declared as PreparedStatement, each one is PREPAREd
+# the first time it runs on a connection, and later calls on that
+# connection send only `EXECUTE name (params)`.
+#
+# The connection object records which statements it has prepared. Pooled
+# connections keep their statements across checkouts. A replacement
+# connection, opened after the old one was closed or broken, starts empty
+# and prepares them again. PREPARE is not undone by a rollback.
+#
+# After five executions Postgres may switch a statement to a generic plan
+# that it keeps (pg_prepared_statements shows generic_plans and custom_plans).
+#
+# Turn this off (ZOELIBRARYAPP_PREPARED_STATEMENTS=off) behind any pooler in
+# transaction mode. SQL-level PREPARE lives in one server session, and the
+# pooler may send the next EXECUTE to another. PgBouncer's
+# max_prepared_statements (1.21+) tracks protocol-level statements only, not
+# these.
+
+ENABLED = os.getenv('ZOELIBRARYAPP_PREPARED_STATEMENTS', 'on').lower() not in ('off', 'false', '0')
+
+_registry = []
+
+
+class PreparedStatement:
+    """A named SQL statement, %s placeholders, prepared once per connection."""
+
+    def __init__(self, name, sql):
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', name):
+            raise ValueError(f"Prepared statement name must be a lowercase identifier: {name!r}")
+        self.name = name
+        self.sql = sql
+        self.params = sql.count('%s')
+        numbers = iter(range(1, self.params + 1))
+        self._prepare = f'PREPARE {name} AS ' + re.sub(r'%s', lambda m: f'${next(numbers)}', sql)
+        self._execute = f"EXECUTE {name} ({', '.join(['%s'] * self.params)})" if self.params else f'EXECUTE {name}'
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.prepares = 0
+        self.errors = 0
+        _registry.append(self)
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def execute(self, cur, params=()):
+        """Run the statement on `cur` with `params`; fetch results from cur as usual."""
+        if not ENABLED:
+            cur.execute(self.sql, params)
+            return
+        conn = cur.connection
+        prepared = getattr(conn, '_prepared', None)
+        if prepared is None:
+            # New connection, or one whose statements went stale: start clean
+            if getattr(conn, '_prepared_stale', False):
+                cur.execute('DEALLOCATE ALL')
+                conn._prepared_stale = False
+            prepared = conn._prepared = set()
+        if self.name not in prepared:
+            cur.execute(self._prepare)
+            prepared.add(self.name)
+            self._count('prepares')
+        try:
+            cur.execute(self._execute, params)
+        except (InvalidSqlStatementName, FeatureNotSupported) as e:
+            # The session lost its statements (DISCARD ALL, a pooler swapping
+            # server connections), or a migration changed a table under a
+            # RETURNING * / SELECT * ("cached plan must not change result
+            # type"). This request fails; the connection prepares afresh.
+            conn._prepared = None
+            conn._prepared_stale = True
+            self._count('errors')
+            logger.warning(f"Prepared statement {self.name} is stale on its connection: {str(e).strip()}")
+            raise
+        self._count('executions')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'prepares': self.prepares,
+                'errors': self.errors,
+                'hit_ratio': round(1 - self.prepares / self.executions, 3) if self.executions else None,
+            }
+
+
+def statement_stats():
+    """Per-statement executions and prepares for this worker; a hit reused a prepared statement."""
+    executions = sum(statement.executions for statement in _registry)
+    prepares = sum(statement.prepares for statement in _registry)
+    return {
+        'enabled': ENABLED,
+        'hit_ratio': round(1 - prepares / executions, 3) if executions else None,
+        'statements': {statement.name: statement.stats() for statement in _registry},
+    }
+
+
+def server_plan_stats(cur):
+    """Generic and custom plan counts for the statements prepared on this cursor's connection (PG 14+)."""
+    cur.execute('''
+        SELECT name, generic_plans, custom_plans
+        FROM pg_prepared_statements
+        ORDER BY name
+    ''')
+    return cur.fetchall()
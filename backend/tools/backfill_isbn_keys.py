@@ -0,0 +1,56 @@
+"""
+Fill books.isbn_key for books saved before the column existed.
+
+Run once per deployment after database/migrations/add_isbn_key.sql, while
+the API keeps serving: each batch of --batch-size books is keyed in its
+own short transaction with triggers off (session_replication_role, as in
+move_tenant.py), so updated_at, sync and the change feed do not move. Books
+saved meanwhile are keyed by the API. Where a library has the same ISBN on
+several books, the first one reached keeps the key; the others are left
+without one and show up in the duplicate report (POST /api/books/duplicates).
+
+Safe to run again; it only looks at books without a key. Run from the
+backend directory with the usual ZOELIBRARYAPP_DB_* variables:
+
+    python tools/backfill_isbn_keys.py
+    python tools/backfill_isbn_keys.py --shard shard2 --batch-size 500
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv  # noqa: E402
+
+from db import connect_direct  # noqa: E402
+from isbn import BACKFILL_BATCH_SIZE, backfill_isbn_keys  # noqa: E402
+from shards import shard_addresses  # noqa: E402
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shard', help='only this shard (default: every shard)')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument('--pause-ms', type=int, default=50, help='pause between batches (default 50)')
+    args = parser.parse_args()
+
+    shards = [args.shard] if args.shard else list(shard_addresses())
+    for shard in shards:
+        started = time.monotonic()
+        conn = connect_direct(shard)
+        summary = backfill_isbn_keys(
+            conn, args.batch_size, args.pause_ms / 1000,
+            on_batch=lambda s: print(f"  {shard}: {s['scanned']} scanned, {s['keyed']} keyed", end='\r'),
+        )
+        conn.close()
+        print(f"  {shard}: {summary['scanned']} books scanned, {summary['keyed']} keyed, "
+              f"{summary['duplicates']} duplicates, {summary['not_isbn']} not an ISBN "
+              f"({time.monotonic() - started:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Move a tenant (one user's library) to another shard.
+
+The move runs online; the tenant's writes are refused (503, Retry-After)
+only for the short freeze at the end:
+
+  1. copy     the tenant's rows from a REPEATABLE READ snapshot of the source
+              with COPY, noting a watermark T0 taken in the same snapshot
+  2. freeze   mark the directory row 'moving' and wait for in-flight
+              requests that resolved the old shard to finish
+  3. delta    re-copy rows with updated_at >= T0 (soft-deleted ones
+              included) and apply the deletions recorded in sync_tombstones
+              since T0 of rows no longer on the source
+  4. verify   compare row counts and an id/updated_at checksum per table,
+              then rebuild the tenant's analytics rollups on the target
+  5. cutover  point the directory at the target shard
+
+The source copy is kept unless --purge-source is given (change events are
+not moved: clients get a 'reset' and refetch). Run from the backend
+directory with the usual ZOELIBRARYAPP_DB_* variables:
+
+    python tools/move_tenant.py --list
+    python tools/move_tenant.py --email librarian@example.com --to shard2
+    python tools/move_tenant.py --email librarian@example.com --to default --purge-source
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import psycopg2.extensions  # noqa: E402
+
+from analytics import rebuild_tenant  # noqa: E402
+from cache import USERS, MemoryCache, get_cache  # noqa: E402
+from db import connect_direct  # noqa: E402
+from shards import DEFAULT_SHARD, TENANT_TABLES, shard_addresses  # noqa: E402
+
+# Per-tenant bookkeeping copied alongside the tenant tables
+EXTRA_TABLES = ('sync_tombstones', 'idempotency_keys', 'dashboard_snapshots')
+# Audits are working data: purged with the source, not moved
+AUDIT_TABLES = ('audit_results', 'audit_scans', 'inventory_audits')
+# Derived from checkouts: purged with the source and rebuilt on the target
+ANALYTICS_TABLES = ('loan_rollups', 'loan_facts')
+# Children first: triggers (and so ON DELETE CASCADE) are off while purging
+PURGE_ORDER = (tuple(reversed(TENANT_TABLES)) + EXTRA_TABLES + AUDIT_TABLES + ANALYTICS_TABLES
+               + ('change_events',))
+
+
+def table_columns(cur, table):
+    """Column names of `table`, minus columns filled by the target itself."""
+    cur.execute('''
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+        ORDER BY ordinal_position
+    ''', (table,))
+    columns = [row['column_name'] for row in cur.fetchall()]
+    if table == 'sync_tombstones':
+        # BIGSERIAL ids are per shard
+        columns.remove('id')
+    return columns
+
+
+def copy_rows(source_cur, target_cur, table, columns, where, params, into=None):
+    """Stream matching rows from source to target (or a temp table) with COPY."""
+    column_list = ', '.join(columns)
+    query = source_cur.mogrify(f'SELECT {column_list} FROM {table} WHERE {where}', params).decode()
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+        source_cur.copy_expert(f'COPY ({query}) TO STDOUT', buffer)
+        buffer.seek(0)
+        target_cur.copy_expert(f'COPY {into or table} ({column_list}) FROM STDIN', buffer)
+    return target_cur.rowcount
+
+
+def set_status(default_cur, user_id, shard, status):
+    default_cur.execute('''
+        INSERT INTO tenant_directory (user_id, shard, status)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (user_id) DO UPDATE SET shard = EXCLUDED.shard, status = EXCLUDED.status
+    ''', (user_id, shard, status))
+
+
+def forget_cached_user(email):
+    """Make every worker re-read the tenant's directory row."""
+    get_cache().delete(USERS.key(email))
+
+
+def purge_tenant(cur, user_id, include_user):
+    """Delete a tenant's rows on one shard, triggers off (no tombstones or events)."""
+    cur.execute('SET session_replication_role = replica')
+    for table in PURGE_ORDER:
+        cur.execute(f'DELETE FROM {table} WHERE user_id = %s', (user_id,))
+    if include_user:
+        cur.execute('DELETE FROM users WHERE id = %s', (user_id,))
+    cur.execute('SET session_replication_role = DEFAULT')
+
+
+def checksums(cur, user_id):
+    """{table: (row count, md5 of ids and updated_at)} for a tenant on one shard."""
+    result = {}
+    for table in TENANT_TABLES:
+        cur.execute(f'''
+            SELECT COUNT(*) AS rows,
+                   md5(COALESCE(string_agg(id::text || '@' || updated_at::text, ',' ORDER BY id), '')) AS digest
+            FROM {table} WHERE user_id = %s
+        ''', (user_id,))
+        row = cur.fetchone()
+        result[table] = (row['rows'], row['digest'])
+    return result
+
+
+def list_tenants(default_cur):
+    default_cur.execute('''
+        SELECT COALESCE(d.shard, %s) AS shard, COUNT(*) AS tenants,
+               COUNT(*) FILTER (WHERE d.status = 'moving') AS moving
+        FROM users u
+        LEFT JOIN tenant_directory d ON d.user_id = u.id
+        GROUP BY 1 ORDER BY 1
+    ''', (DEFAULT_SHARD,))
+    counts = {row['shard']: row for row in default_cur.fetchall()}
+    for shard in shard_addresses():
+        row = counts.pop(shard, {'tenants': 0, 'moving': 0})
+        print(f"  {shard:<20} {row['tenants']:>8} tenants   {row['moving']} moving")
+    for shard, row in counts.items():
+        print(f"  {shard:<20} {row['tenants']:>8} tenants   NOT CONFIGURED")
+
+
+def move_tenant(email, target, drain_seconds, purge_source):
+    shards = shard_addresses()
+    if target not in shards:
+        sys.exit(f"Unknown shard '{target}'; configured: {', '.join(shards)}")
+    if isinstance(get_cache(), MemoryCache):
+        print("warning: memory:// cache is per process; running workers will not see the move until their USERS entry expires")
+
+    default_conn = connect_direct(DEFAULT_SHARD)
+    default_cur = default_conn.cursor()
+    default_cur.execute('''
+        SELECT u.id, COALESCE(d.shard, %s) AS shard, COALESCE(d.status, 'active') AS status
+        FROM users u
+        LEFT JOIN tenant_directory d ON d.user_id = u.id
+        WHERE u.email = %s
+    ''', (DEFAULT_SHARD, email))
+    user = default_cur.fetchone()
+    default_conn.commit()
+    if user is None:
+        sys.exit(f"No user with email {email}")
+    user_id, source = str(user['id']), user['shard']
+    if source == target:
+        sys.exit(f"{email} already lives on shard '{target}'")
+    if user['status'] == 'moving':
+        print(f"warning: {email} was left 'moving' by an earlier run; continuing")
+
+    source_conn = connect_direct(source)
+    target_conn = connect_direct(target)
+    source_cur = source_conn.cursor()
+    target_cur = target_conn.cursor()
+
+    # -- 1. Bulk copy from a consistent snapshot ---------------------------------
+    started = time.monotonic()
+    purge_tenant(target_cur, user_id, include_user=False)
+    target_cur.execute('SET session_replication_role = replica')
+    target_cur.execute('''
+        INSERT INTO users (id, email, username)
+        SELECT %s, %s, %s
+        ON CONFLICT (email) DO UPDATE SET id = EXCLUDED.id
+    ''', (user_id, email, email.split('@')[0]))
+
+    source_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ)
+    # Same rule as /api/sync: transactions open now may commit rows stamped
+    # earlier than NOW(), so T0 is held back to the oldest of them
+    source_cur.execute('''
+        SELECT LEAST(
+                   NOW(),
+                   (SELECT MIN(xact_start) FROM pg_stat_activity
+                    WHERE datname = current_database()
+                      AND backend_type = 'client backend'
+                      AND pid <> pg_backend_pid())
+               )::timestamp AS t0
+    ''')
+    t0 = source_cur.fetchone()['t0']
+
+    columns = {}
+    for table in TENANT_TABLES + EXTRA_TABLES:
+        columns[table] = table_columns(target_cur, table)
+        if table == 'sync_tombstones':
+            # Later ones are copied with the delta
+            where, params = 'user_id = %s AND deleted_at < %s', (user_id, t0)
+        else:
+            where, params = 'user_id = %s', (user_id,)
+        copied = copy_rows(source_cur, target_cur, table, columns[table], where, params)
+        print(f"  copied {copied:>8} {table}")
+    source_conn.commit()
+    target_cur.execute('SET session_replication_role = DEFAULT')
+    target_conn.commit()
+    print(f"Bulk copy done in {time.monotonic() - started:.1f}s (T0 {t0})")
+
+    # -- 2. Freeze ---------------------------------------------------------------
+    frozen = time.monotonic()
+    set_status(default_cur, user_id, source, 'moving')
+    default_conn.commit()
+    forget_cached_user(email)
+    # Requests that authenticated before the freeze may still be writing
+    time.sleep(drain_seconds)
+    forget_cached_user(email)
+
+    try:
+        # -- 3. Delta since T0 ---------------------------------------------------
+        source_conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED)
+        # Job workers skip a moving tenant, but one may already be running
+        source_cur.execute('''
+            SELECT COUNT(*) AS running FROM jobs
+            WHERE user_id = %s AND status = 'running' AND locked_until > NOW()
+        ''', (user_id,))
+        if source_cur.fetchone()['running']:
+            raise RuntimeError('the tenant has background jobs running; retry when they finish')
+
+        target_cur.execute('SET session_replication_role = replica')
+        # Deletions first: a row deleted and recreated since T0 under the same
+        # natural key (barcode, ISBN) would otherwise collide with the new
+        # row's upsert. Soft deletes leave tombstones too, but their rows are
+        # still on the source and come over with the delta: delete only rows
+        # gone
+        deletions = 0
+        for table in reversed(TENANT_TABLES):
+            source_cur.execute(f'''
+                SELECT t.row_id FROM sync_tombstones t
+                WHERE t.user_id = %s AND t.deleted_at >= %s AND t.table_name = %s
+                  AND NOT EXISTS (SELECT 1 FROM {table} r WHERE r.id = t.row_id)
+            ''', (user_id, t0, table))
+            row_ids = [str(row['row_id']) for row in source_cur.fetchall()]
+            if row_ids:
+                target_cur.execute(f'DELETE FROM {table} WHERE user_id = %s AND id = ANY(%s::uuid[])', (user_id, row_ids))
+                deletions += len(row_ids)
+        for table in TENANT_TABLES:
+            column_list = columns[table]
+            target_cur.execute(f'CREATE TEMP TABLE delta_{table} (LIKE {table}) ON COMMIT DROP')
+            changed = copy_rows(source_cur, target_cur, table, column_list,
+                                'user_id = %s AND updated_at >= %s', (user_id, t0), into=f'delta_{table}')
+            updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in column_list if c != 'id')
+            target_cur.execute(f'''
+                INSERT INTO {table} ({', '.join(column_list)})
+                SELECT {', '.join(column_list)} FROM delta_{table}
+                ON CONFLICT (id) DO UPDATE SET {updates}
+            ''')
+            print(f"  delta  {changed:>8} {table}")
+
+        copy_rows(source_cur, target_cur, 'sync_tombstones', columns['sync_tombstones'],
+                  'user_id = %s AND deleted_at >= %s', (user_id, t0))
+        print(f"  delta  {deletions:>8} deletions")
+
+        target_cur.execute('CREATE TEMP TABLE delta_idempotency_keys (LIKE idempotency_keys) ON COMMIT DROP')
+        copy_rows(source_cur, target_cur, 'idempotency_keys', columns['idempotency_keys'],
+                  'user_id = %s AND created_at >= %s', (user_id, t0), into='delta_idempotency_keys')
+        target_cur.execute('''
+            INSERT INTO idempotency_keys SELECT * FROM delta_idempotency_keys
+            ON CONFLICT (user_id, idempotency_key) DO UPDATE
+                SET request_hash = EXCLUDED.request_hash,
+                    status_code = EXCLUDED.status_code,
+                    content_type = EXCLUDED.content_type,
+                    response_body = EXCLUDED.response_body,
+                    created_at = EXCLUDED.created_at,
+                    locked_until = EXCLUDED.locked_until,
+                    expires_at = EXCLUDED.expires_at
+        ''')
+        target_cur.execute('SET session_replication_role = DEFAULT')
+        source_conn.commit()
+        target_conn.commit()
+
+        # -- 4. Verify -----------------------------------------------------------
+        expected = checksums(source_cur, user_id)
+        actual = checksums(target_cur, user_id)
+        source_conn.commit()
+        target_conn.commit()
+        mismatched = [table for table in TENANT_TABLES if expected[table] != actual[table]]
+        if mismatched:
+            raise RuntimeError(f"verification failed for {', '.join(mismatched)}")
+
+        # The target's analytics watermark is past the copied rows' updated_at
+        loans = rebuild_tenant(target_cur, user_id)
+        target_conn.commit()
+        print(f"  rebuilt analytics for {loans} loans")
+
+        # -- 5. Cutover ----------------------------------------------------------
+        default_cur.execute('''
+            UPDATE tenant_directory SET shard = %s, status = 'active', moved_at = NOW()
+            WHERE user_id = %s
+        ''', (target, user_id))
+        default_conn.commit()
+        forget_cached_user(email)
+    except Exception as e:
+        source_conn.rollback()
+        target_conn.rollback()
+        default_conn.rollback()
+        set_status(default_cur, user_id, source, 'active')
+        default_conn.commit()
+        forget_cached_user(email)
+        # The job worker's analytics pass skipped the tenant while it was moving
+        try:
+            rebuild_tenant(source_cur, user_id)
+            source_conn.commit()
+        except Exception as rebuild_error:
+            print(f"  could not rebuild analytics on '{source}': {str(rebuild_error)}")
+        sys.exit(f"Move aborted, {email} stays on '{source}': {str(e)}")
+
+    print(f"Moved {email} from '{source}' to '{target}' (writes frozen {time.monotonic() - frozen:.1f}s)")
+
+    if purge_source:
+        purge_tenant(source_cur, user_id, include_user=source != DEFAULT_SHARD)
+        source_conn.commit()
+        print(f"Purged {email} from '{source}'")
+
+    for conn in (source_conn, target_conn, default_conn):
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help='show tenant counts per shard and exit')
+    parser.add_argument('--email', help='email of the user whose library is moved')
+    parser.add_argument('--to', dest='target', help='target shard name')
+    parser.add_argument('--drain-seconds', type=float, default=5.0,
+                        help='wait after freezing for in-flight writes (default 5)')
+    parser.add_argument('--purge-source', action='store_true',
+                        help="delete the tenant's rows from the source shard after cutover")
+    args = parser.parse_args()
+
+    if args.list:
+        conn = connect_direct(DEFAULT_SHARD)
+        list_tenants(conn.cursor())
+        conn.close()
+        return
+    if not args.email or not args.target:
+        parser.error('--email and --to are required (or use --list)')
+    move_tenant(args.email, args.target, args.drain_seconds, args.purge_source)
+
+
+if __name__ == '__main__':
+    main()
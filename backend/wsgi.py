@@ -0,0 +1,5 @@
+from app import create_app
+
+# Entry point for gunicorn (wsgi:app). With preload_app the master builds
+# the app once and workers inherit it on fork.
+app = create_app()
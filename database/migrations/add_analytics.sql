@@ -0,0 +1,65 @@
+-- Migration: Add circulation analytics rollups
+-- Date: 2026-10-19
+-- Purpose: Daily loan rollups and dashboard snapshots, maintained incrementally by the job worker
+
+-- =============================================================================
+-- ANALYTICS (Circulation rollups)
+-- =============================================================================
+-- /api/analytics reads only these tables. The job worker maintains them:
+-- loan_facts holds one narrow row per checkout as last rolled up, and each
+-- pass replaces the facts of checkouts changed (updated_at) or deleted
+-- (sync_tombstones) since analytics_state.watermark, then recomputes the
+-- loan_rollups rows of just the (tenant, day) pairs those facts touched.
+-- Loans count on their checkout day; returns and loan days (whole days
+-- from checkout to return) count on the same day, so average loan
+-- duration is loan_days / returns.
+CREATE TABLE IF NOT EXISTS loan_facts (
+    checkout_id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    book_id UUID NOT NULL,
+    borrower_id UUID NOT NULL,
+    genre VARCHAR(100) NOT NULL,
+    returned BOOLEAN NOT NULL,
+    duration_days INT
+);
+
+CREATE INDEX IF NOT EXISTS idx_loan_facts_user_day ON loan_facts(user_id, day);
+
+-- dimension: 'all' (key ''), 'genre' (key = genre), 'borrower' or 'book' (key = id)
+CREATE TABLE IF NOT EXISTS loan_rollups (
+    user_id UUID NOT NULL,
+    dimension VARCHAR(10) NOT NULL CHECK (dimension IN ('all', 'genre', 'borrower', 'book')),
+    key VARCHAR(100) NOT NULL,
+    day DATE NOT NULL,
+    loans INT NOT NULL,
+    returns INT NOT NULL,
+    loan_days BIGINT NOT NULL,
+    PRIMARY KEY (user_id, dimension, day, key)
+);
+
+-- One row per tenant per day, taken by the first pass of the day
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    total_books INT NOT NULL,
+    total_copies INT NOT NULL,
+    available_copies INT NOT NULL,
+    active_checkouts INT NOT NULL,
+    overdue_checkouts INT NOT NULL,
+    total_borrowers INT NOT NULL,
+    wishlist_items INT NOT NULL,
+    pending_follow_ups INT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+
+-- One row per shard: how far the rollups have been brought
+CREATE TABLE IF NOT EXISTS analytics_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    watermark TIMESTAMP,
+    snapshot_day DATE,
+    refreshed_at TIMESTAMP
+);
+
+-- Shard-wide scan of changed checkouts for each pass
+CREATE INDEX IF NOT EXISTS idx_checkouts_updated_at ON checkouts(updated_at);
@@ -0,0 +1,81 @@
+-- Migration: Add change feed events and triggers
+-- Date: 2026-10-19
+-- Purpose: Let the backend stream per-user changes to clients (/api/events) with resume
+
+-- =============================================================================
+-- CHANGE EVENTS (Real-time change feed)
+-- =============================================================================
+-- Every insert, update and delete on the tables below is recorded as a compact
+-- per-user event and announced with NOTIFY on the library_changes channel.
+-- The backend streams events to clients at /api/events; the table lets a
+-- client that reconnects resume from its last event id.
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    table_name VARCHAR(63) NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    row_id UUID NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_user_id ON change_events(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events(created_at);
+
+CREATE OR REPLACE FUNCTION record_change_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    rec RECORD;
+    event_id BIGINT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    INSERT INTO change_events (user_id, table_name, operation, row_id)
+    VALUES (rec.user_id, TG_TABLE_NAME, TG_OP, rec.id)
+    RETURNING id INTO event_id;
+
+    -- Delivered to listeners when the transaction commits
+    PERFORM pg_notify('library_changes', json_build_object(
+        'id', event_id,
+        'user_id', rec.user_id,
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row_id', rec.id
+    )::text);
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_change ON books;
+CREATE TRIGGER record_books_change
+    AFTER INSERT OR UPDATE OR DELETE ON books
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_book_copies_change ON book_copies;
+CREATE TRIGGER record_book_copies_change
+    AFTER INSERT OR UPDATE OR DELETE ON book_copies
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_checkouts_change ON checkouts;
+CREATE TRIGGER record_checkouts_change
+    AFTER INSERT OR UPDATE OR DELETE ON checkouts
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_borrowers_change ON borrowers;
+CREATE TRIGGER record_borrowers_change
+    AFTER INSERT OR UPDATE OR DELETE ON borrowers
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_follow_ups_change ON follow_ups;
+CREATE TRIGGER record_follow_ups_change
+    AFTER INSERT OR UPDATE OR DELETE ON follow_ups
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
@@ -0,0 +1,59 @@
+-- Migration: Add hold queues
+-- Date: 2026-10-19
+-- Purpose: FIFO holds per book, allocated a copy when one is returned
+
+-- =============================================================================
+-- HOLDS (Reservation queue)
+-- =============================================================================
+-- Each book's waiting holds carry dense tickets: hold_queues.last_ticket is
+-- the newest, cancelling a waiting hold moves the later ones up by one, so a
+-- hold's queue position is its ticket minus the lowest waiting ticket plus
+-- one (two index lookups, whatever the queue length). A returned copy goes
+-- to the lowest waiting ticket (SELECT ... FOR UPDATE SKIP LOCKED) and is
+-- Reserved for ZOELIBRARYAPP_HOLD_PICKUP_DAYS.
+CREATE TABLE IF NOT EXISTS hold_queues (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    book_id UUID NOT NULL UNIQUE REFERENCES books(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    last_ticket BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_hold_queues_updated_at ON hold_queues;
+CREATE TRIGGER update_hold_queues_updated_at
+    BEFORE UPDATE ON hold_queues
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TABLE IF NOT EXISTS holds (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    book_id UUID NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    borrower_id UUID NOT NULL REFERENCES borrowers(id) ON DELETE CASCADE,
+    ticket BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Waiting' CHECK (status IN ('Waiting', 'Ready', 'Fulfilled', 'Cancelled', 'Expired')),
+    copy_id UUID REFERENCES book_copies(id) ON DELETE SET NULL,
+    checkout_id UUID REFERENCES checkouts(id) ON DELETE SET NULL,
+    ready_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    closed_at TIMESTAMP,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_holds_updated_at ON holds;
+CREATE TRIGGER update_holds_updated_at
+    BEFORE UPDATE ON holds
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- The queue itself: head lookup, position and keyset paging
+CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds(book_id, ticket) WHERE status = 'Waiting';
+-- One open hold per borrower and book
+CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_open_borrower ON holds(book_id, borrower_id) WHERE status IN ('Waiting', 'Ready');
+CREATE INDEX IF NOT EXISTS idx_holds_ready_copy ON holds(copy_id) WHERE status = 'Ready';
+CREATE INDEX IF NOT EXISTS idx_holds_ready_expires ON holds(expires_at) WHERE status = 'Ready';
+CREATE INDEX IF NOT EXISTS idx_holds_borrower_id ON holds(borrower_id);
+CREATE INDEX IF NOT EXISTS idx_holds_user_updated ON holds(user_id, updated_at, id);
@@ -0,0 +1,24 @@
+-- Migration: Add idempotency keys table
+-- Date: 2026-10-19
+-- Purpose: Let scanners retry write requests (Idempotency-Key header) without repeating the write
+
+-- =============================================================================
+-- IDEMPOTENCY KEYS (Safe retries of write requests)
+-- =============================================================================
+-- One row per (user, Idempotency-Key). status_code is NULL while the first
+-- request is still running; afterwards the stored response is replayed to
+-- retries until expires_at, when the backend prunes the row.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INT,
+    content_type VARCHAR(255),
+    response_body BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
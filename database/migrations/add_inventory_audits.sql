@@ -0,0 +1,62 @@
+-- Migration: Add inventory audit tables
+-- Date: 2026-10-19
+-- Purpose: Shelf audits that upload scanned barcodes in chunks and diff them against book_copies
+
+-- =============================================================================
+-- INVENTORY AUDITS (Shelf audits)
+-- =============================================================================
+-- An audit session collects scanned barcodes per location in chunks
+-- (audit_scans), then diffs them against book_copies in one statement into
+-- audit_results: copies missing from their location, copies found at another
+-- location, and scans that match no shelved copy. Results can be applied to
+-- book_copies in bulk. Audits are pruned after ZOELIBRARYAPP_AUDIT_RETENTION_DAYS.
+CREATE TABLE IF NOT EXISTS inventory_audits (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name VARCHAR(255),
+    locations TEXT[] NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'finished', 'applied')),
+    finished_at TIMESTAMP,
+    applied_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_inventory_audits_updated_at ON inventory_audits;
+CREATE TRIGGER update_inventory_audits_updated_at
+    BEFORE UPDATE ON inventory_audits
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_inventory_audits_user_id ON inventory_audits(user_id, created_at);
+
+-- (audit_id, chunk, position) makes a retried chunk upload a no-op
+CREATE TABLE IF NOT EXISTS audit_scans (
+    id BIGSERIAL PRIMARY KEY,
+    audit_id UUID NOT NULL REFERENCES inventory_audits(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    chunk INT NOT NULL,
+    position INT NOT NULL,
+    location VARCHAR(100),
+    barcode VARCHAR(100) NOT NULL,
+    copy_number INT,
+    scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (audit_id, chunk, position)
+);
+
+CREATE TABLE IF NOT EXISTS audit_results (
+    id BIGSERIAL PRIMARY KEY,
+    audit_id UUID NOT NULL REFERENCES inventory_audits(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('ok', 'missing', 'misplaced', 'unexpected')),
+    reason VARCHAR(30),
+    copy_id UUID,
+    book_id UUID,
+    barcode VARCHAR(100),
+    copy_number INT,
+    expected_location VARCHAR(100),
+    scanned_location VARCHAR(100),
+    status VARCHAR(50)
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_results_audit_kind ON audit_results(audit_id, kind, id);
@@ -0,0 +1,17 @@
+-- Migration: Canonical ISBN key for books
+-- Date: 2026-10-19
+-- Purpose: Match ISBN-10, ISBN-13 and hyphenated forms of the same book; one live book per ISBN per library
+
+-- ISBN-13 of books.isbn, computed by the API (backend/isbn.py) on every write
+ALTER TABLE books ADD COLUMN IF NOT EXISTS isbn_key VARCHAR(13);
+
+-- Exact-match searches and scans, and no second live book with the same ISBN
+CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn_key
+  ON books(user_id, isbn_key) WHERE isbn_key IS NOT NULL AND deleted_at IS NULL;
+
+COMMENT ON COLUMN books.isbn_key IS 'ISBN-13 of books.isbn in any valid form (ISBN-10, hyphenated, EAN with add-on); NULL when isbn is not an ISBN. Set by the API on every write.';
+
+-- Existing books are keyed in batches afterwards (the first of any
+-- duplicates keeps the key; POST /api/books/duplicates reports the rest):
+--
+--   python tools/backfill_isbn_keys.py
@@ -0,0 +1,45 @@
+-- Migration: Add jobs table
+-- Date: 2026-10-19
+-- Purpose: Run long operations (e.g. deleting books with long histories) off the request path
+
+-- =============================================================================
+-- JOBS (Background job queue)
+-- =============================================================================
+-- Long-running operations are queued here by the API (202 Accepted) and run
+-- by backend/job_worker.py, which claims rows with FOR UPDATE SKIP LOCKED.
+-- A running job holds a lease (locked_until) that progress updates extend;
+-- if its worker dies the job is claimed again once the lease expires.
+-- Failed attempts are retried with exponential backoff (run_at) until
+-- max_attempts. Finished jobs are pruned after ZOELIBRARYAPP_JOBS_RETENTION_DAYS.
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(63) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMP,
+    progress_done BIGINT NOT NULL DEFAULT 0,
+    progress_total BIGINT,
+    progress_message TEXT,
+    result JSONB,
+    error TEXT,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_jobs_updated_at ON jobs;
+CREATE TRIGGER update_jobs_updated_at
+    BEFORE UPDATE ON jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Claim order for workers: only unfinished jobs are indexed
+CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(run_at) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at) WHERE finished_at IS NOT NULL;
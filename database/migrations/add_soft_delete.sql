@@ -0,0 +1,95 @@
+-- Migration: Soft deletion of books and borrowers
+-- Date: 2026-10-19
+-- Purpose: Deletes return at once; a background purger removes the rows and their history in small batches
+
+-- =============================================================================
+-- SOFT DELETION (Books and borrowers)
+-- =============================================================================
+-- DELETE /api/books/<id> and /api/borrowers/<id> only set deleted_at. Every
+-- read filters on deleted_at IS NULL, served by the partial indexes below.
+-- The job worker's purger (backend/purge.py) then deletes the checkouts,
+-- copies and rows in batches of ZOELIBRARYAPP_PURGE_BATCH_SIZE, each in its
+-- own short transaction with a lock timeout, so the ON DELETE CASCADE chain
+-- never runs over a whole history in one go.
+ALTER TABLE books ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+ALTER TABLE borrowers ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+-- Live rows per tenant (replacing the plain user_id indexes)
+DROP INDEX IF EXISTS idx_books_user_id;
+CREATE INDEX IF NOT EXISTS idx_books_live_user ON books(user_id, title) WHERE deleted_at IS NULL;
+DROP INDEX IF EXISTS idx_borrowers_user_id;
+CREATE INDEX IF NOT EXISTS idx_borrowers_live_user ON borrowers(user_id, last_name, first_name) WHERE deleted_at IS NULL;
+
+-- A deleted book's barcode can be given to a new book straight away
+DROP INDEX IF EXISTS idx_books_barcode_unique;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_books_barcode_unique
+  ON books(barcode) WHERE barcode IS NOT NULL AND deleted_at IS NULL;
+
+-- The purger's queue
+CREATE INDEX IF NOT EXISTS idx_books_deleted_at ON books(deleted_at) WHERE deleted_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_borrowers_deleted_at ON borrowers(deleted_at) WHERE deleted_at IS NOT NULL;
+
+-- Sync clients learn of a soft deletion at once (a book's copies go with it);
+-- the purge later records the same ids again, which clients ignore
+CREATE OR REPLACE FUNCTION record_soft_delete_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (user_id, table_name, row_id)
+    VALUES (NEW.user_id, TG_TABLE_NAME, NEW.id);
+    IF TG_TABLE_NAME = 'books' THEN
+        INSERT INTO sync_tombstones (user_id, table_name, row_id)
+        SELECT user_id, 'book_copies', id FROM book_copies WHERE book_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_soft_delete ON books;
+CREATE TRIGGER record_books_soft_delete
+    AFTER UPDATE OF deleted_at ON books
+    FOR EACH ROW
+    WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION record_soft_delete_tombstone();
+
+DROP TRIGGER IF EXISTS record_borrowers_soft_delete ON borrowers;
+CREATE TRIGGER record_borrowers_soft_delete
+    AFTER UPDATE OF deleted_at ON borrowers
+    FOR EACH ROW
+    WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION record_soft_delete_tombstone();
+
+-- Change feed clients already saw the soft deletion (an UPDATE event), so
+-- the purger (SET LOCAL library.purging = 'on') records no events for the
+-- rows it removes
+CREATE OR REPLACE FUNCTION record_change_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    rec RECORD;
+    event_id BIGINT;
+BEGIN
+    IF current_setting('library.purging', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    INSERT INTO change_events (user_id, table_name, operation, row_id)
+    VALUES (rec.user_id, TG_TABLE_NAME, TG_OP, rec.id)
+    RETURNING id INTO event_id;
+
+    -- Delivered to listeners when the transaction commits
+    PERFORM pg_notify('library_changes', json_build_object(
+        'id', event_id,
+        'user_id', rec.user_id,
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row_id', rec.id
+    )::text);
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
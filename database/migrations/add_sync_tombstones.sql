@@ -0,0 +1,74 @@
+-- Migration: Add sync tombstones and (user_id, updated_at) indexes
+-- Date: 2026-10-19
+-- Purpose: Let offline-capable clients pull only what changed since their last sync (/api/sync)
+
+-- =============================================================================
+-- SYNC TOMBSTONES (Delta sync)
+-- =============================================================================
+-- /api/sync returns rows changed since a watermark using (user_id, updated_at)
+-- indexes, and deletions from this table. Rows older than
+-- ZOELIBRARYAPP_SYNC_TOMBSTONE_DAYS are pruned by the backend; a client whose
+-- watermark is older than that is told to do a full resync.
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    table_name VARCHAR(63) NOT NULL,
+    row_id UUID NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_deleted ON sync_tombstones(user_id, deleted_at, id);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at ON sync_tombstones(deleted_at);
+
+CREATE OR REPLACE FUNCTION record_sync_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (user_id, table_name, row_id)
+    VALUES (OLD.user_id, TG_TABLE_NAME, OLD.id);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_tombstone ON books;
+CREATE TRIGGER record_books_tombstone
+    AFTER DELETE ON books
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_book_copies_tombstone ON book_copies;
+CREATE TRIGGER record_book_copies_tombstone
+    AFTER DELETE ON book_copies
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_borrowers_tombstone ON borrowers;
+CREATE TRIGGER record_borrowers_tombstone
+    AFTER DELETE ON borrowers
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_checkouts_tombstone ON checkouts;
+CREATE TRIGGER record_checkouts_tombstone
+    AFTER DELETE ON checkouts
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_book_wishlist_tombstone ON book_wishlist;
+CREATE TRIGGER record_book_wishlist_tombstone
+    AFTER DELETE ON book_wishlist
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_follow_ups_tombstone ON follow_ups;
+CREATE TRIGGER record_follow_ups_tombstone
+    AFTER DELETE ON follow_ups
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+-- Keyset paging for /api/sync: (user_id, updated_at) with id as tie-breaker
+CREATE INDEX IF NOT EXISTS idx_books_user_updated ON books(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_book_copies_user_updated ON book_copies(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_borrowers_user_updated ON borrowers(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_checkouts_user_updated ON checkouts(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_book_wishlist_user_updated ON book_wishlist(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_ups_user_updated ON follow_ups(user_id, updated_at, id);
@@ -0,0 +1,27 @@
+-- Migration: Add tenant directory
+-- Date: 2026-10-19
+-- Purpose: Record which shard each tenant lives on so libraries can be spread across PostgreSQL nodes
+
+-- =============================================================================
+-- TENANT DIRECTORY (Sharding)
+-- =============================================================================
+-- Maps each user to the shard (PostgreSQL database) holding their library.
+-- Lives on the default shard only; users without a row are on 'default'.
+-- status is 'moving' while tools/move_tenant.py copies the tenant to another
+-- shard, during which the backend rejects the tenant's writes with 503.
+CREATE TABLE IF NOT EXISTS tenant_directory (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    shard VARCHAR(63) NOT NULL DEFAULT 'default',
+    status VARCHAR(20) NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'moving')),
+    moved_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_tenant_directory_updated_at ON tenant_directory;
+CREATE TRIGGER update_tenant_directory_updated_at
+    BEFORE UPDATE ON tenant_directory
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_tenant_directory_shard ON tenant_directory(shard);
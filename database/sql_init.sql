@@ -43,6 +43,7 @@ CREATE TABLE IF NOT EXISTS borrowers (
     phone VARCHAR(50) NOT NULL,
     alt_phone VARCHAR(50),
     address TEXT,
+    deleted_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -53,7 +54,9 @@ CREATE TRIGGER update_borrowers_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
-CREATE INDEX IF NOT EXISTS idx_borrowers_user_id ON borrowers(user_id);
+-- Reads only see live rows; the purger's queue is the deleted ones
+CREATE INDEX IF NOT EXISTS idx_borrowers_live_user ON borrowers(user_id, last_name, first_name) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_borrowers_deleted_at ON borrowers(deleted_at) WHERE deleted_at IS NOT NULL;
 CREATE INDEX IF NOT EXISTS idx_borrowers_name ON borrowers(first_name, last_name);
 CREATE INDEX IF NOT EXISTS idx_borrowers_email ON borrowers(email);
 
@@ -66,6 +69,7 @@ CREATE TABLE IF NOT EXISTS books (
     title VARCHAR(500) NOT NULL,
     author VARCHAR(255) NOT NULL,
     isbn VARCHAR(50),
+    isbn_key VARCHAR(13),
     barcode VARCHAR(100),
     publisher VARCHAR(255),
     publication_year INT,
@@ -73,6 +77,7 @@ CREATE TABLE IF NOT EXISTS books (
     description TEXT,
     language VARCHAR(50) DEFAULT 'English',
     pages INT,
+    deleted_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -83,14 +88,18 @@ CREATE TRIGGER update_books_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
-CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id);
+CREATE INDEX IF NOT EXISTS idx_books_live_user ON books(user_id, title) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_books_deleted_at ON books(deleted_at) WHERE deleted_at IS NOT NULL;
 CREATE INDEX IF NOT EXISTS idx_books_title ON books(title);
 CREATE INDEX IF NOT EXISTS idx_books_author ON books(author);
 CREATE INDEX IF NOT EXISTS idx_books_isbn ON books(isbn);
+-- One live book per canonical ISBN-13 per library (backend/isbn.py)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn_key ON books(user_id, isbn_key) WHERE isbn_key IS NOT NULL AND deleted_at IS NULL;
 CREATE INDEX IF NOT EXISTS idx_books_barcode ON books(barcode);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_books_barcode_unique ON books(barcode) WHERE barcode IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_books_barcode_unique ON books(barcode) WHERE barcode IS NOT NULL AND deleted_at IS NULL;
 
 COMMENT ON COLUMN books.barcode IS 'Barcode identifier (ISBN, UPC, EAN, or custom barcode). Used for scanner integration during book registration, checkout, and check-in operations.';
+COMMENT ON COLUMN books.isbn_key IS 'ISBN-13 of books.isbn in any valid form (ISBN-10, hyphenated, EAN with add-on); NULL when isbn is not an ISBN. Set by the API on every write.';
 
 -- =============================================================================
 -- BOOK COPIES TABLE (Individual physical copies)
@@ -199,6 +208,458 @@ CREATE INDEX IF NOT EXISTS idx_follow_ups_checkout_id ON follow_ups(checkout_id)
 CREATE INDEX IF NOT EXISTS idx_follow_ups_user_id ON follow_ups(user_id);
 CREATE INDEX IF NOT EXISTS idx_follow_ups_status ON follow_ups(status);
 
+-- =============================================================================
+-- CHANGE EVENTS (Real-time change feed)
+-- =============================================================================
+-- Every insert, update and delete on the tables below is recorded as a compact
+-- per-user event and announced with NOTIFY on the library_changes channel.
+-- The backend streams events to clients at /api/events; the table lets a
+-- client that reconnects resume from its last event id.
+CREATE TABLE IF NOT EXISTS change_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    table_name VARCHAR(63) NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    row_id UUID NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_events_user_id ON change_events(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_change_events_created_at ON change_events(created_at);
+
+CREATE OR REPLACE FUNCTION record_change_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    rec RECORD;
+    event_id BIGINT;
+BEGIN
+    -- The purger's deletions were announced as the soft deletion (purge.py)
+    IF current_setting('library.purging', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    INSERT INTO change_events (user_id, table_name, operation, row_id)
+    VALUES (rec.user_id, TG_TABLE_NAME, TG_OP, rec.id)
+    RETURNING id INTO event_id;
+
+    -- Delivered to listeners when the transaction commits
+    PERFORM pg_notify('library_changes', json_build_object(
+        'id', event_id,
+        'user_id', rec.user_id,
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'row_id', rec.id
+    )::text);
+
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_change ON books;
+CREATE TRIGGER record_books_change
+    AFTER INSERT OR UPDATE OR DELETE ON books
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_book_copies_change ON book_copies;
+CREATE TRIGGER record_book_copies_change
+    AFTER INSERT OR UPDATE OR DELETE ON book_copies
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_checkouts_change ON checkouts;
+CREATE TRIGGER record_checkouts_change
+    AFTER INSERT OR UPDATE OR DELETE ON checkouts
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_borrowers_change ON borrowers;
+CREATE TRIGGER record_borrowers_change
+    AFTER INSERT OR UPDATE OR DELETE ON borrowers
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+DROP TRIGGER IF EXISTS record_follow_ups_change ON follow_ups;
+CREATE TRIGGER record_follow_ups_change
+    AFTER INSERT OR UPDATE OR DELETE ON follow_ups
+    FOR EACH ROW
+    EXECUTE FUNCTION record_change_event();
+
+-- =============================================================================
+-- SYNC TOMBSTONES (Delta sync)
+-- =============================================================================
+-- /api/sync returns rows changed since a watermark using (user_id, updated_at)
+-- indexes, and deletions from this table. Rows older than
+-- ZOELIBRARYAPP_SYNC_TOMBSTONE_DAYS are pruned by the backend; a client whose
+-- watermark is older than that is told to do a full resync.
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    table_name VARCHAR(63) NOT NULL,
+    row_id UUID NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_deleted ON sync_tombstones(user_id, deleted_at, id);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at ON sync_tombstones(deleted_at);
+
+CREATE OR REPLACE FUNCTION record_sync_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (user_id, table_name, row_id)
+    VALUES (OLD.user_id, TG_TABLE_NAME, OLD.id);
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_tombstone ON books;
+CREATE TRIGGER record_books_tombstone
+    AFTER DELETE ON books
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_book_copies_tombstone ON book_copies;
+CREATE TRIGGER record_book_copies_tombstone
+    AFTER DELETE ON book_copies
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_borrowers_tombstone ON borrowers;
+CREATE TRIGGER record_borrowers_tombstone
+    AFTER DELETE ON borrowers
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_checkouts_tombstone ON checkouts;
+CREATE TRIGGER record_checkouts_tombstone
+    AFTER DELETE ON checkouts
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_book_wishlist_tombstone ON book_wishlist;
+CREATE TRIGGER record_book_wishlist_tombstone
+    AFTER DELETE ON book_wishlist
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+DROP TRIGGER IF EXISTS record_follow_ups_tombstone ON follow_ups;
+CREATE TRIGGER record_follow_ups_tombstone
+    AFTER DELETE ON follow_ups
+    FOR EACH ROW
+    EXECUTE FUNCTION record_sync_tombstone();
+
+-- Keyset paging for /api/sync: (user_id, updated_at) with id as tie-breaker
+CREATE INDEX IF NOT EXISTS idx_books_user_updated ON books(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_book_copies_user_updated ON book_copies(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_borrowers_user_updated ON borrowers(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_checkouts_user_updated ON checkouts(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_book_wishlist_user_updated ON book_wishlist(user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_follow_ups_user_updated ON follow_ups(user_id, updated_at, id);
+
+-- =============================================================================
+-- IDEMPOTENCY KEYS (Safe retries of write requests)
+-- =============================================================================
+-- One row per (user, Idempotency-Key). status_code is NULL while the first
+-- request is still running; afterwards the stored response is replayed to
+-- retries until expires_at, when the backend prunes the row.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INT,
+    content_type VARCHAR(255),
+    response_body BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+-- =============================================================================
+-- TENANT DIRECTORY (Sharding)
+-- =============================================================================
+-- Maps each user to the shard (PostgreSQL database) holding their library.
+-- Lives on the default shard only; users without a row are on 'default'.
+-- status is 'moving' while tools/move_tenant.py copies the tenant to another
+-- shard, during which the backend rejects the tenant's writes with 503.
+CREATE TABLE IF NOT EXISTS tenant_directory (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    shard VARCHAR(63) NOT NULL DEFAULT 'default',
+    status VARCHAR(20) NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'moving')),
+    moved_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_tenant_directory_updated_at ON tenant_directory;
+CREATE TRIGGER update_tenant_directory_updated_at
+    BEFORE UPDATE ON tenant_directory
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_tenant_directory_shard ON tenant_directory(shard);
+
+-- =============================================================================
+-- JOBS (Background job queue)
+-- =============================================================================
+-- Long-running operations are queued here by the API (202 Accepted) and run
+-- by backend/job_worker.py, which claims rows with FOR UPDATE SKIP LOCKED.
+-- A running job holds a lease (locked_until) that progress updates extend;
+-- if its worker dies the job is claimed again once the lease expires.
+-- Failed attempts are retried with exponential backoff (run_at) until
+-- max_attempts. Finished jobs are pruned after ZOELIBRARYAPP_JOBS_RETENTION_DAYS.
+CREATE TABLE IF NOT EXISTS jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(63) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(255),
+    locked_until TIMESTAMP,
+    progress_done BIGINT NOT NULL DEFAULT 0,
+    progress_total BIGINT,
+    progress_message TEXT,
+    result JSONB,
+    error TEXT,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_jobs_updated_at ON jobs;
+CREATE TRIGGER update_jobs_updated_at
+    BEFORE UPDATE ON jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- Claim order for workers: only unfinished jobs are indexed
+CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(run_at) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at) WHERE finished_at IS NOT NULL;
+
+-- =============================================================================
+-- INVENTORY AUDITS (Shelf audits)
+-- =============================================================================
+-- An audit session collects scanned barcodes per location in chunks
+-- (audit_scans), then diffs them against book_copies in one statement into
+-- audit_results: copies missing from their location, copies found at another
+-- location, and scans that match no shelved copy. Results can be applied to
+-- book_copies in bulk. Audits are pruned after ZOELIBRARYAPP_AUDIT_RETENTION_DAYS.
+CREATE TABLE IF NOT EXISTS inventory_audits (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name VARCHAR(255),
+    locations TEXT[] NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'finished', 'applied')),
+    finished_at TIMESTAMP,
+    applied_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_inventory_audits_updated_at ON inventory_audits;
+CREATE TRIGGER update_inventory_audits_updated_at
+    BEFORE UPDATE ON inventory_audits
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_inventory_audits_user_id ON inventory_audits(user_id, created_at);
+
+-- (audit_id, chunk, position) makes a retried chunk upload a no-op
+CREATE TABLE IF NOT EXISTS audit_scans (
+    id BIGSERIAL PRIMARY KEY,
+    audit_id UUID NOT NULL REFERENCES inventory_audits(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    chunk INT NOT NULL,
+    position INT NOT NULL,
+    location VARCHAR(100),
+    barcode VARCHAR(100) NOT NULL,
+    copy_number INT,
+    scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (audit_id, chunk, position)
+);
+
+CREATE TABLE IF NOT EXISTS audit_results (
+    id BIGSERIAL PRIMARY KEY,
+    audit_id UUID NOT NULL REFERENCES inventory_audits(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL,
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('ok', 'missing', 'misplaced', 'unexpected')),
+    reason VARCHAR(30),
+    copy_id UUID,
+    book_id UUID,
+    barcode VARCHAR(100),
+    copy_number INT,
+    expected_location VARCHAR(100),
+    scanned_location VARCHAR(100),
+    status VARCHAR(50)
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_results_audit_kind ON audit_results(audit_id, kind, id);
+
+-- =============================================================================
+-- HOLDS (Reservation queue)
+-- =============================================================================
+-- Each book's waiting holds carry dense tickets: hold_queues.last_ticket is
+-- the newest, cancelling a waiting hold moves the later ones up by one, so a
+-- hold's queue position is its ticket minus the lowest waiting ticket plus
+-- one (two index lookups, whatever the queue length). A returned copy goes
+-- to the lowest waiting ticket (SELECT ... FOR UPDATE SKIP LOCKED) and is
+-- Reserved for ZOELIBRARYAPP_HOLD_PICKUP_DAYS.
+CREATE TABLE IF NOT EXISTS hold_queues (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    book_id UUID NOT NULL UNIQUE REFERENCES books(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    last_ticket BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_hold_queues_updated_at ON hold_queues;
+CREATE TRIGGER update_hold_queues_updated_at
+    BEFORE UPDATE ON hold_queues
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+CREATE TABLE IF NOT EXISTS holds (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    book_id UUID NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    borrower_id UUID NOT NULL REFERENCES borrowers(id) ON DELETE CASCADE,
+    ticket BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'Waiting' CHECK (status IN ('Waiting', 'Ready', 'Fulfilled', 'Cancelled', 'Expired')),
+    copy_id UUID REFERENCES book_copies(id) ON DELETE SET NULL,
+    checkout_id UUID REFERENCES checkouts(id) ON DELETE SET NULL,
+    ready_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    closed_at TIMESTAMP,
+    notes TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP TRIGGER IF EXISTS update_holds_updated_at ON holds;
+CREATE TRIGGER update_holds_updated_at
+    BEFORE UPDATE ON holds
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- The queue itself: head lookup, position and keyset paging
+CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds(book_id, ticket) WHERE status = 'Waiting';
+-- One open hold per borrower and book
+CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_open_borrower ON holds(book_id, borrower_id) WHERE status IN ('Waiting', 'Ready');
+CREATE INDEX IF NOT EXISTS idx_holds_ready_copy ON holds(copy_id) WHERE status = 'Ready';
+CREATE INDEX IF NOT EXISTS idx_holds_ready_expires ON holds(expires_at) WHERE status = 'Ready';
+CREATE INDEX IF NOT EXISTS idx_holds_borrower_id ON holds(borrower_id);
+CREATE INDEX IF NOT EXISTS idx_holds_user_updated ON holds(user_id, updated_at, id);
+
+-- =============================================================================
+-- ANALYTICS (Circulation rollups)
+-- =============================================================================
+-- /api/analytics reads only these tables. The job worker maintains them:
+-- loan_facts holds one narrow row per checkout as last rolled up, and each
+-- pass replaces the facts of checkouts changed (updated_at) or deleted
+-- (sync_tombstones) since analytics_state.watermark, then recomputes the
+-- loan_rollups rows of just the (tenant, day) pairs those facts touched.
+-- Loans count on their checkout day; returns and loan days (whole days
+-- from checkout to return) count on the same day, so average loan
+-- duration is loan_days / returns.
+CREATE TABLE IF NOT EXISTS loan_facts (
+    checkout_id UUID PRIMARY KEY,
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    book_id UUID NOT NULL,
+    borrower_id UUID NOT NULL,
+    genre VARCHAR(100) NOT NULL,
+    returned BOOLEAN NOT NULL,
+    duration_days INT
+);
+
+CREATE INDEX IF NOT EXISTS idx_loan_facts_user_day ON loan_facts(user_id, day);
+
+-- dimension: 'all' (key ''), 'genre' (key = genre), 'borrower' or 'book' (key = id)
+CREATE TABLE IF NOT EXISTS loan_rollups (
+    user_id UUID NOT NULL,
+    dimension VARCHAR(10) NOT NULL CHECK (dimension IN ('all', 'genre', 'borrower', 'book')),
+    key VARCHAR(100) NOT NULL,
+    day DATE NOT NULL,
+    loans INT NOT NULL,
+    returns INT NOT NULL,
+    loan_days BIGINT NOT NULL,
+    PRIMARY KEY (user_id, dimension, day, key)
+);
+
+-- One row per tenant per day, taken by the first pass of the day
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+    user_id UUID NOT NULL,
+    day DATE NOT NULL,
+    total_books INT NOT NULL,
+    total_copies INT NOT NULL,
+    available_copies INT NOT NULL,
+    active_checkouts INT NOT NULL,
+    overdue_checkouts INT NOT NULL,
+    total_borrowers INT NOT NULL,
+    wishlist_items INT NOT NULL,
+    pending_follow_ups INT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+
+-- One row per shard: how far the rollups have been brought
+CREATE TABLE IF NOT EXISTS analytics_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    watermark TIMESTAMP,
+    snapshot_day DATE,
+    refreshed_at TIMESTAMP
+);
+
+-- Shard-wide scan of changed checkouts for each pass
+CREATE INDEX IF NOT EXISTS idx_checkouts_updated_at ON checkouts(updated_at);
+
+-- =============================================================================
+-- SOFT DELETION (Books and borrowers)
+-- =============================================================================
+-- DELETE /api/books/<id> and /api/borrowers/<id> only set deleted_at; every
+-- read filters on deleted_at IS NULL. The job worker's purger (backend/
+-- purge.py) deletes the rows and their history in small batches later.
+-- Sync clients learn of a soft deletion at once (a book's copies go with it).
+CREATE OR REPLACE FUNCTION record_soft_delete_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_tombstones (user_id, table_name, row_id)
+    VALUES (NEW.user_id, TG_TABLE_NAME, NEW.id);
+    IF TG_TABLE_NAME = 'books' THEN
+        INSERT INTO sync_tombstones (user_id, table_name, row_id)
+        SELECT user_id, 'book_copies', id FROM book_copies WHERE book_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS record_books_soft_delete ON books;
+CREATE TRIGGER record_books_soft_delete
+    AFTER UPDATE OF deleted_at ON books
+    FOR EACH ROW
+    WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION record_soft_delete_tombstone();
+
+DROP TRIGGER IF EXISTS record_borrowers_soft_delete ON borrowers;
+CREATE TRIGGER record_borrowers_soft_delete
+    AFTER UPDATE OF deleted_at ON borrowers
+    FOR EACH ROW
+    WHEN (OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION record_soft_delete_tombstone();
+
 -- =============================================================================
 -- INDEXES
 -- =============================================================================
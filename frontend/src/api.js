@@ -5,24 +5,49 @@ const api = axios.create({
   baseURL: import.meta.env.PROD ? '' : (import.meta.env.VITE_ZOELIBRARYAPP_API_URL || 'http://localhost:5002'),
 })
 
+// Primary WAL position of this client's latest write; reads ask for a
+// replica that has caught up to it (read-your-writes)
+let lastWriteLsn = null
+
 // Request interceptor to add auth header
 api.interceptors.request.use((config) => {
   const userEmail = localStorage.getItem('userEmail')
   if (userEmail) {
     config.headers['X-User-Email'] = userEmail
   }
+  // One key per logical write; a retry that reuses this config reuses the key
+  if (['post', 'put', 'patch', 'delete'].includes(config.method) && !config.headers['Idempotency-Key'] && window.crypto?.randomUUID) {
+    config.headers['Idempotency-Key'] = window.crypto.randomUUID()
+  }
+  if (lastWriteLsn) {
+    config.headers['X-Read-After-LSN'] = lastWriteLsn
+  }
   return config
 })
 
 // Response interceptor for error handling
 api.interceptors.response.use(
-  (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
+  (response) => {
+    if (response.headers['x-write-lsn']) {
+      lastWriteLsn = response.headers['x-write-lsn']
+    }
+    return response
+  },
+  async (error) => {
+    const { config, response } = error
+    if (response?.status === 401) {
       localStorage.removeItem('userEmail')
       localStorage.removeItem('accessToken')
       window.location.reload()
     }
+    // Rate limited or shed under load: wait as told and try again, twice at
+    // most (a retried write reuses its Idempotency-Key)
+    const retryAfter = Number(response?.headers['retry-after'])
+    if ([429, 503].includes(response?.status) && retryAfter > 0 && retryAfter <= 10 && (config?._retries || 0) < 2) {
+      config._retries = (config._retries || 0) + 1
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000))
+      return api(config)
+    }
     return Promise.reject(error)
   }
 )
@@ -44,6 +69,13 @@ export const getBookByBarcode = (barcode) => api.get(`/api/books/by-barcode/${ba
 export const createBook = (data) => api.post('/api/books', data)
 export const updateBook = (id, data) => api.put(`/api/books/${id}`, data)
 export const deleteBook = (id) => api.delete(`/api/books/${id}`)
+// Books sharing an ISBN in any form; runs as a background job,
+// resolves with { groups: [{ isbn_key, books }], duplicate_groups, ... }
+export const findDuplicateBooks = async ({ onProgress } = {}) => {
+  const response = await api.post('/api/books/duplicates')
+  const job = await waitForJob(response.data.job.id, { onProgress })
+  return job.result
+}
 
 // Book Copies
 export const getBookCopies = (bookId) => api.get(`/api/books/${bookId}/copies`)
@@ -80,7 +112,151 @@ export const createFollowUp = (data) => api.post('/api/follow-ups', data)
 export const updateFollowUp = (id, data) => api.put(`/api/follow-ups/${id}`, data)
 export const deleteFollowUp = (id) => api.delete(`/api/follow-ups/${id}`)
 
+// Overdue reminders: preview who would be emailed, then queue the job
+export const getReminderPreview = () => api.get('/api/follow-ups/reminders')
+export const sendOverdueReminders = (checkoutIds = null) => api.post('/api/follow-ups/reminders', { checkout_ids: checkoutIds })
+
 // Dashboard Stats
 export const getDashboardStats = () => api.get('/api/dashboard/stats')
 
+// Background jobs
+export const getJobs = (params = {}) => api.get('/api/jobs', { params })
+export const getJob = (id) => api.get(`/api/jobs/${id}`)
+
+// Poll a job until it finishes; resolves with the job, rejects if it failed
+export const waitForJob = async (id, { intervalMs = 1000, onProgress } = {}) => {
+  for (;;) {
+    const { data: job } = await getJob(id)
+    if (onProgress) onProgress(job)
+    if (job.status === 'succeeded') return job
+    if (job.status === 'failed') throw new Error(job.error || 'Job failed')
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
+
+// Barcode labels: a PDF sheet for { book_ids, copy_ids, layout, start_position }.
+// Large sheets render in a background job; resolves with { url, pages, ... }
+export const createLabelSheet = async (selection, { onProgress } = {}) => {
+  const response = await api.post('/api/labels', selection)
+  if (response.status === 202) {
+    const job = await waitForJob(response.data.job.id, { onProgress })
+    return job.result
+  }
+  return response.data
+}
+
+// Fetch a sheet with the auth headers and open it in a new tab for printing
+export const openLabelSheet = async (url) => {
+  const response = await api.get(url, { responseType: 'blob' })
+  window.open(URL.createObjectURL(response.data), '_blank')
+}
+
+// Cover thumbnails are plain image URLs (no auth header needed), cached by the browser
+export const coverUrl = (isbn, size = 's') =>
+  `${api.defaults.baseURL}/api/covers/${encodeURIComponent(isbn.replace(/[\s-]/g, ''))}.jpg?size=${size}`
+
+// Analytics: read from daily rollups refreshed by the job worker (as_of in each response)
+export const getLoanAnalytics = (params = {}) => api.get('/api/analytics/loans', { params })
+export const getGenreAnalytics = (params = {}) => api.get('/api/analytics/genres', { params })
+export const getTopTitles = (params = {}) => api.get('/api/analytics/titles', { params })
+export const getTopBorrowers = (params = {}) => api.get('/api/analytics/borrowers', { params })
+export const getDashboardTrends = (params = {}) => api.get('/api/analytics/trends', { params })
+
+// Holds: FIFO queue per book; a returned copy is reserved for the next hold
+export const getHolds = (params = {}) => api.get('/api/holds', { params })
+export const getHold = (id) => api.get(`/api/holds/${id}`)
+export const createHold = (data) => api.post('/api/holds', data)
+export const cancelHold = (id) => api.put(`/api/holds/${id}/cancel`)
+export const getBookHolds = (bookId, params = {}) => api.get(`/api/books/${bookId}/holds`, { params })
+
+// Inventory audits: create, upload scans per location in chunks, finish, apply
+export const createAudit = (data) => api.post('/api/audits', data)
+export const getAudits = () => api.get('/api/audits')
+export const getAudit = (id) => api.get(`/api/audits/${id}`)
+export const deleteAudit = (id) => api.delete(`/api/audits/${id}`)
+export const finishAudit = (id) => api.post(`/api/audits/${id}/finish`)
+export const getAuditResults = (id, params = {}) => api.get(`/api/audits/${id}/results`, { params })
+export const applyAudit = (id, options = {}) => api.post(`/api/audits/${id}/apply`, options)
+
+// Upload `scans` (barcodes or { barcode, copy_number }) for one location,
+// AUDIT_CHUNK_SIZE at a time; chunk numbers continue from `firstChunk`
+export const AUDIT_CHUNK_SIZE = 1000
+export const uploadAuditScans = async (id, location, scans, firstChunk = 0) => {
+  let chunk = firstChunk
+  for (let start = 0; start < scans.length; start += AUDIT_CHUNK_SIZE, chunk += 1) {
+    await api.post(`/api/audits/${id}/scans`, {
+      chunk,
+      location,
+      scans: scans.slice(start, start + AUDIT_CHUNK_SIZE),
+    })
+  }
+  return chunk
+}
+
+// Batch: run several requests in one round trip
+// e.g. batch([{ id: 'stats', path: '/api/dashboard/stats' }, { id: 'checkouts', path: '/api/checkouts' }])
+export const batch = (requests) => api.post('/api/batch', { requests })
+
+// Delta sync: pass { since: watermark } or { cursor: next_cursor }
+export const syncChanges = (params = {}) => api.get('/api/sync', { params })
+
+// Change feed (Server-Sent Events). EventSource cannot send the auth header,
+// so the stream is read with fetch. Calls onEvent(type, data) for 'change',
+// 'reset' (refetch everything) and 'ready'; returns a function that stops it.
+// A resumed stream re-sends recent changes that may have committed out of
+// order; ones already delivered are skipped.
+export const subscribeToChanges = (onEvent) => {
+  const controller = new AbortController()
+  let lastEventId = null
+  let retryMs = 3000
+  const delivered = new Set()
+
+  const dispatch = (block) => {
+    let type = 'message'
+    const data = []
+    for (const line of block.split('\n')) {
+      if (line.startsWith('id: ')) lastEventId = line.slice(4)
+      else if (line.startsWith('event: ')) type = line.slice(7)
+      else if (line.startsWith('data: ')) data.push(line.slice(6))
+      else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7))
+    }
+    if (!data.length) return
+    const payload = JSON.parse(data.join('\n'))
+    if (type === 'change') {
+      if (delivered.has(payload.id)) return
+      delivered.add(payload.id)
+      if (delivered.size > 1000) delivered.delete(delivered.values().next().value)
+    } else if (type === 'reset') {
+      delivered.clear()
+    }
+    onEvent(type, payload)
+  }
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const headers = { 'X-User-Email': localStorage.getItem('userEmail') || '' }
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId
+        const response = await fetch(`${api.defaults.baseURL}/api/events`, { headers, signal: controller.signal })
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffer = ''
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += value
+          const blocks = buffer.split('\n\n')
+          buffer = blocks.pop()
+          blocks.forEach(dispatch)
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs))
+    }
+  }
+
+  connect()
+  return () => controller.abort()
+}
+
 export default api
@@ -0,0 +1,33 @@
+import { useState } from 'react'
+import { coverUrl } from '../api'
+
+/**
+ * BookCover Component
+ *
+ * Shows a book's cover thumbnail from the backend cover store. Renders
+ * nothing when the book has no ISBN or no cover is available, so it can sit
+ * in any list without leaving an empty frame.
+ *
+ * @param {string} isbn - The book's ISBN (ISBN-10 or ISBN-13)
+ * @param {string} size - Thumbnail size: 's' (60x90), 'm' (120x180) or 'l' (240x360)
+ * @param {string} className - Extra classes for the image
+ */
+function BookCover({ isbn, size = 's', className = '' }) {
+  const [failed, setFailed] = useState(false)
+
+  if (!isbn || failed) {
+    return null
+  }
+
+  return (
+    <img
+      src={coverUrl(isbn, size)}
+      alt=""
+      loading="lazy"
+      onError={() => setFailed(true)}
+      className={`rounded shadow object-cover flex-shrink-0 ${className}`}
+    />
+  )
+}
+
+export default BookCover
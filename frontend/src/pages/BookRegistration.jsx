@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react'
 import { getBooks, createBook, createBookCopy, getBookCopies, getBookByBarcode } from '../api'
 import BarcodeScanner from '../components/BarcodeScanner'
+import BookCover from '../components/BookCover'
 import { BookIcon, PlusIcon, XIcon } from '../components/Icons'
 
 function BookRegistration() {
@@ -183,7 +184,8 @@ function BookRegistration() {
           <div className="space-y-4">
             {books.map((book) => (
               <div key={book.id} className="bg-gray-700 rounded-lg p-4">
-                <div className="flex justify-between items-start">
+                <div className="flex justify-between items-start gap-4">
+                  <BookCover isbn={book.isbn} size="s" className="w-12" />
                   <div className="flex-1">
                     <h3 className="text-lg font-semibold text-white">{book.title}</h3>
                     <p className="text-gray-400">by {book.author}</p>
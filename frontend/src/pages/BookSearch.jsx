@@ -1,7 +1,8 @@
 import { useState, useEffect } from 'react'
-import { getBooks, getBookCopies, updateBook, createBookCopy, createWishlistItem, createFollowUp, getBookByBarcode } from '../api'
+import { getBooks, getBookCopies, updateBook, createBookCopy, createWishlistItem, createFollowUp, getBookByBarcode, createLabelSheet, openLabelSheet } from '../api'
 import { formatDistanceToNow } from 'date-fns'
 import BarcodeScanner from '../components/BarcodeScanner'
+import BookCover from '../components/BookCover'
 import { SearchIcon, StarIcon, EditIcon, BellIcon, BookIcon } from '../components/Icons'
 
 function BookSearch() {
@@ -17,6 +18,7 @@ function BookSearch() {
   const [showAddCopyModal, setShowAddCopyModal] = useState(false)
   const [selectedCheckout, setSelectedCheckout] = useState(null)
   const [selectedBook, setSelectedBook] = useState(null)
+  const [labelStatus, setLabelStatus] = useState(null)
   const [wishlistData, setWishlistData] = useState({
     title: '',
     author: '',
@@ -54,6 +56,20 @@ function BookSearch() {
     }
   }
 
+  const handlePrintLabels = async (bookIds) => {
+    try {
+      setLabelStatus('Preparing labels...')
+      const sheet = await createLabelSheet({ book_ids: bookIds }, {
+        onProgress: (job) => job.progress.total && setLabelStatus(`Rendering page ${job.progress.done} of ${job.progress.total}...`)
+      })
+      await openLabelSheet(sheet.url)
+      setLabelStatus(sheet.skipped ? `${sheet.skipped} copies skipped (no barcode)` : null)
+    } catch (error) {
+      console.error('Error creating labels:', error)
+      setLabelStatus(error.response?.data?.error || 'Could not create labels')
+    }
+  }
+
   const loadCopies = async (bookId) => {
     try {
       const response = await getBookCopies(bookId)
@@ -263,13 +279,25 @@ function BookSearch() {
       {/* Results */}
       {books.length > 0 && (
         <div className="card">
-          <h2 className="text-xl font-semibold text-white mb-4">
-            {books.length} book{books.length !== 1 ? 's' : ''} found
-          </h2>
+          <div className="flex items-center justify-between mb-4">
+            <h2 className="text-xl font-semibold text-white">
+              {books.length} book{books.length !== 1 ? 's' : ''} found
+            </h2>
+            <div className="flex items-center gap-3">
+              {labelStatus && <span className="text-sm text-gray-400">{labelStatus}</span>}
+              <button
+                onClick={() => handlePrintLabels(books.filter(b => b.barcode).map(b => b.id))}
+                className="btn-secondary text-sm"
+              >
+                🏷️ Labels for All
+              </button>
+            </div>
+          </div>
           <div className="space-y-4">
             {books.map((book) => (
               <div key={book.id} className="bg-gray-700 rounded-lg p-4">
-                <div className="flex justify-between items-start mb-3">
+                <div className="flex justify-between items-start gap-4 mb-3">
+                  <BookCover isbn={book.isbn} size="m" className="w-20" />
                   <div className="flex-1">
                     <h3 className="text-lg font-semibold text-white">{book.title}</h3>
                     <p className="text-gray-400">by {book.author}</p>
@@ -313,6 +341,14 @@ function BookSearch() {
                   >
                     ➕ Add Copy
                   </button>
+                  {book.barcode && (
+                    <button
+                      onClick={() => handlePrintLabels([book.id])}
+                      className="btn-secondary text-sm"
+                    >
+                      🏷️ Labels
+                    </button>
+                  )}
                 </div>
 
                 {/* Copies List */}
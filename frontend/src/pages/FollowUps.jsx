@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { getFollowUps, updateFollowUp, deleteFollowUp } from '../api'
+import { getFollowUps, updateFollowUp, deleteFollowUp, getReminderPreview, sendOverdueReminders, waitForJob } from '../api'
 import { formatDistanceToNow, format } from 'date-fns'
 import { TrashIcon } from '../components/Icons'
 
@@ -8,6 +8,8 @@ function FollowUps() {
   const [loading, setLoading] = useState(true)
   const [showModal, setShowModal] = useState(false)
   const [selectedFollowUp, setSelectedFollowUp] = useState(null)
+  const [reminders, setReminders] = useState(null)
+  const [reminderProgress, setReminderProgress] = useState(null)
   const [updateData, setUpdateData] = useState({
     status: '',
     contacted_date: '',
@@ -16,8 +18,34 @@ function FollowUps() {
 
   useEffect(() => {
     loadFollowUps()
+    loadReminderPreview()
   }, [])
 
+  const loadReminderPreview = async () => {
+    try {
+      const response = await getReminderPreview()
+      setReminders(response.data)
+    } catch (error) {
+      console.error('Error loading reminder preview:', error)
+    }
+  }
+
+  const handleSendReminders = async () => {
+    if (!confirm(`Email overdue reminders to ${reminders.borrowers} borrower${reminders.borrowers !== 1 ? 's' : ''}?`)) return
+
+    try {
+      const response = await sendOverdueReminders()
+      const job = await waitForJob(response.data.job.id, { onProgress: setReminderProgress })
+      alert(`Reminders sent: ${job.result.sent}` + (job.result.failed ? `, failed: ${job.result.failed}` : ''))
+      loadFollowUps()
+      loadReminderPreview()
+    } catch (error) {
+      alert('Error sending reminders: ' + error.message)
+    } finally {
+      setReminderProgress(null)
+    }
+  }
+
   const loadFollowUps = async () => {
     try {
       setLoading(true)
@@ -92,9 +120,18 @@ function FollowUps() {
   return (
     <div className="space-y-6">
       {/* Page Header */}
-      <div>
-        <h1 className="text-3xl font-bold text-white">Follow Ups</h1>
-        <p className="text-gray-400 mt-1">Books requiring follow-up (oldest first)</p>
+      <div className="flex flex-col md:flex-row md:items-end md:justify-between gap-4">
+        <div>
+          <h1 className="text-3xl font-bold text-white">Follow Ups</h1>
+          <p className="text-gray-400 mt-1">Books requiring follow-up (oldest first)</p>
+        </div>
+        {reminders?.email_configured && reminders.borrowers > 0 && (
+          <button onClick={handleSendReminders} disabled={reminderProgress !== null} className="btn-primary">
+            {reminderProgress
+              ? `Sending ${reminderProgress.progress.done}/${reminderProgress.progress.total ?? '…'}`
+              : `Email overdue reminders (${reminders.borrowers})`}
+          </button>
+        )}
       </div>
 
       {/* Follow-ups List */}
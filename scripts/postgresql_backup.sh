@@ -3,6 +3,17 @@
 ################################################################################
 # PostgreSQL Backup Script for Google Drive
 # Backs up PostgreSQL database from Docker container to Google Drive via rclone
+#
+# Usage: ./postgresql_backup.sh [sql|full|base|incremental]
+#
+# Modes (default: ZOELIBRARYAPP_BACKUP_MODE, or sql):
+#   sql          Single plain-SQL dump compressed with gzip (original behaviour)
+#   full         Directory-format pg_dump with N parallel jobs and per-table
+#                zstd compression; restore with postgresql_restore.sh (pg_restore -j)
+#   base         Physical base backup (pg_basebackup) streamed through zstd -T0;
+#                starting point for WAL replay
+#   incremental  Ships only the WAL segments archived since the last run
+#                (requires ZOELIBRARYAPP_DB_ARCHIVE_MODE=on)
 ################################################################################
 
 # Prevent script from being sourced (which would close terminal on exit)
@@ -39,14 +50,25 @@ echo "Project root: $PROJECT_ROOT"
 set -o pipefail
 
 # Configuration
-CONTAINER_NAME="postgres_library_app"
+BACKUP_MODE="${1:-${ZOELIBRARYAPP_BACKUP_MODE:-sql}}"
+CONTAINER_NAME="${ZOELIBRARYAPP_DB_CONTAINER:-postgres_library_app}"
 DB_NAME="${ZOELIBRARYAPP_DB_NAME:-}"
 DB_USER="${ZOELIBRARYAPP_DB_USER:-}"
 BACKUP_DIR="$PROJECT_ROOT/backups"
-RCLONE_REMOTE="gdrive_backup:LibraryApp_Backups"
+# Path where BACKUP_DIR is mounted inside the PostgreSQL container
+CONTAINER_BACKUP_DIR="/backups"
+# Any rclone remote, or a plain local directory (e.g. /mnt/usb/backups) for testing
+RCLONE_REMOTE="${ZOELIBRARYAPP_BACKUP_REMOTE:-gdrive_backup:LibraryApp_Backups}"
+BACKUP_JOBS="${ZOELIBRARYAPP_BACKUP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+ZSTD_LEVEL="${ZOELIBRARYAPP_BACKUP_ZSTD_LEVEL:-3}"
 TIMESTAMP=$(date +"%Y%m%d_%H%M%S")
 BACKUP_FILE="library_app_backup_${TIMESTAMP}.sql"
 BACKUP_FILE_GZ="${BACKUP_FILE}.gz"
+FULL_BACKUP_NAME="library_app_full_${TIMESTAMP}"
+BASE_BACKUP_FILE="library_app_base_${TIMESTAMP}.tar.zst"
+# Names the first WAL segment the base backup needs; uploaded next to it
+BASE_START_WAL_FILE="library_app_base_${TIMESTAMP}.start_wal"
+WAL_DIR="$BACKUP_DIR/wal"
 
 # Create backup directory first
 mkdir -p "$BACKUP_DIR"
@@ -79,11 +101,254 @@ print_info() {
     log_message "INFO: $1"
 }
 
+# Stage timing: call stage_start before a stage and stage_end <name> <path>
+# after it to log elapsed time, output size and throughput.
+stage_start() {
+    STAGE_STARTED_AT=$(date +%s.%N)
+}
+
+stage_end() {
+    local stage="$1"
+    local path="$2"
+    local bytes=0
+    if [ -n "$path" ] && [ -e "$path" ]; then
+        bytes=$(du -sb "$path" | cut -f1)
+    fi
+    local stats
+    stats=$(awk -v start="$STAGE_STARTED_AT" -v end="$(date +%s.%N)" -v bytes="$bytes" 'BEGIN {
+        elapsed = end - start
+        mib = bytes / 1048576
+        rate = elapsed > 0 ? mib / elapsed : 0
+        printf "%.2fs, %.1f MiB, %.1f MiB/s", elapsed, mib, rate
+    }')
+    print_info "[stats] $stage: $stats"
+}
+
+# Run psql inside the container and print the bare result
+db_query() {
+    docker exec "$CONTAINER_NAME" psql -U "$DB_USER" -d "$DB_NAME" -tAc "$1"
+}
+
+################################################################################
+# Backup modes
+################################################################################
+
+backup_sql() {
+    # Create database dump
+    print_info "Creating database dump..."
+    stage_start
+    if docker exec "$CONTAINER_NAME" pg_dump -U "$DB_USER" -d "$DB_NAME" > "$BACKUP_DIR/$BACKUP_FILE"; then
+        print_success "Database dump created: $BACKUP_FILE"
+    else
+        print_error "Failed to create database dump"
+        exit 1
+    fi
+    stage_end "dump" "$BACKUP_DIR/$BACKUP_FILE"
+
+    # Check if dump file is not empty
+    if [ ! -s "$BACKUP_DIR/$BACKUP_FILE" ]; then
+        print_error "Backup file is empty!"
+        rm -f "$BACKUP_DIR/$BACKUP_FILE"
+        exit 1
+    fi
+
+    FILE_SIZE=$(du -h "$BACKUP_DIR/$BACKUP_FILE" | cut -f1)
+    print_info "Backup file size: $FILE_SIZE"
+
+    # Compress backup file
+    print_info "Compressing backup file..."
+    stage_start
+    if gzip "$BACKUP_DIR/$BACKUP_FILE"; then
+        print_success "Backup compressed: $BACKUP_FILE_GZ"
+    else
+        print_error "Failed to compress backup"
+        exit 1
+    fi
+    stage_end "compress" "$BACKUP_DIR/$BACKUP_FILE_GZ"
+
+    COMPRESSED_SIZE=$(du -h "$BACKUP_DIR/$BACKUP_FILE_GZ" | cut -f1)
+    print_info "Compressed file size: $COMPRESSED_SIZE"
+
+    # Upload to Google Drive
+    print_info "Uploading to $RCLONE_REMOTE..."
+    stage_start
+    if rclone copy "$BACKUP_DIR/$BACKUP_FILE_GZ" "$RCLONE_REMOTE" --progress; then
+        print_success "Backup uploaded successfully"
+    else
+        print_error "Failed to upload backup"
+        exit 1
+    fi
+    stage_end "upload" "$BACKUP_DIR/$BACKUP_FILE_GZ"
+
+    # Verify upload
+    print_info "Verifying upload..."
+    if rclone lsf "$RCLONE_REMOTE" | grep -q "$BACKUP_FILE_GZ"; then
+        print_success "Backup verified on $RCLONE_REMOTE"
+    else
+        print_error "Backup verification failed"
+        exit 1
+    fi
+
+    BACKUP_RESULT="$BACKUP_FILE_GZ"
+}
+
+backup_full() {
+    # Directory format dumps each table to its own file, so pg_dump can run
+    # one worker per table and compress each stream with zstd as it goes.
+    local server_major
+    server_major=$(docker exec "$CONTAINER_NAME" pg_dump --version | grep -oE '[0-9]+' | head -1)
+    if [ -z "$server_major" ] || [ "$server_major" -lt 16 ]; then
+        print_error "Full mode needs pg_dump 16+ for zstd compression (found: ${server_major:-unknown})"
+        exit 1
+    fi
+
+    local db_bytes
+    db_bytes=$(db_query "SELECT pg_database_size(current_database())")
+    print_info "Database size: $(awk -v b="$db_bytes" 'BEGIN { printf "%.1f MiB", b / 1048576 }')"
+
+    print_info "Creating parallel directory dump ($BACKUP_JOBS jobs, zstd:$ZSTD_LEVEL)..."
+    stage_start
+    if docker exec "$CONTAINER_NAME" pg_dump -U "$DB_USER" -d "$DB_NAME" \
+            --format=directory --jobs="$BACKUP_JOBS" --compress="zstd:$ZSTD_LEVEL" \
+            --file="$CONTAINER_BACKUP_DIR/$FULL_BACKUP_NAME"; then
+        print_success "Database dump created: $FULL_BACKUP_NAME/"
+    else
+        print_error "Failed to create database dump"
+        rm -rf "${BACKUP_DIR:?}/$FULL_BACKUP_NAME"
+        exit 1
+    fi
+    stage_end "dump" "$BACKUP_DIR/$FULL_BACKUP_NAME"
+
+    if [ ! -s "$BACKUP_DIR/$FULL_BACKUP_NAME/toc.dat" ]; then
+        print_error "Dump directory has no table of contents!"
+        rm -rf "${BACKUP_DIR:?}/$FULL_BACKUP_NAME"
+        exit 1
+    fi
+
+    print_info "Uploading to $RCLONE_REMOTE/full/$FULL_BACKUP_NAME..."
+    stage_start
+    if rclone copy "$BACKUP_DIR/$FULL_BACKUP_NAME" "$RCLONE_REMOTE/full/$FULL_BACKUP_NAME" \
+            --transfers "$BACKUP_JOBS" --progress; then
+        print_success "Backup uploaded successfully"
+    else
+        print_error "Failed to upload backup"
+        exit 1
+    fi
+    stage_end "upload" "$BACKUP_DIR/$FULL_BACKUP_NAME"
+
+    print_info "Verifying upload..."
+    local local_count remote_count
+    local_count=$(find "$BACKUP_DIR/$FULL_BACKUP_NAME" -type f | wc -l)
+    remote_count=$(rclone lsf "$RCLONE_REMOTE/full/$FULL_BACKUP_NAME" --files-only | wc -l)
+    if [ "$local_count" -eq "$remote_count" ]; then
+        print_success "Backup verified on $RCLONE_REMOTE ($remote_count files)"
+    else
+        print_error "Backup verification failed ($local_count local files, $remote_count remote)"
+        exit 1
+    fi
+
+    BACKUP_RESULT="full/$FULL_BACKUP_NAME"
+}
+
+backup_base() {
+    # -X fetch bundles the WAL needed to make the base consistent on its own;
+    # later WAL from incremental runs rolls it forward.
+    # The backup's checkpoint comes after this position, so WAL from this
+    # segment on is enough to roll it forward
+    db_query "SELECT pg_walfile_name(pg_current_wal_lsn())" > "$BACKUP_DIR/$BASE_START_WAL_FILE"
+
+    print_info "Streaming physical base backup through zstd -T0..."
+    stage_start
+    if docker exec "$CONTAINER_NAME" pg_basebackup -U "$DB_USER" -D - -Ft -X fetch -c fast \
+            | zstd -T0 -"$ZSTD_LEVEL" -q -o "$BACKUP_DIR/$BASE_BACKUP_FILE"; then
+        print_success "Base backup created: $BASE_BACKUP_FILE"
+    else
+        print_error "Failed to create base backup"
+        rm -f "$BACKUP_DIR/$BASE_BACKUP_FILE" "$BACKUP_DIR/$BASE_START_WAL_FILE"
+        exit 1
+    fi
+    stage_end "basebackup" "$BACKUP_DIR/$BASE_BACKUP_FILE"
+
+    print_info "Uploading to $RCLONE_REMOTE/base..."
+    stage_start
+    if rclone copy "$BACKUP_DIR/$BASE_START_WAL_FILE" "$RCLONE_REMOTE/base" \
+            && rclone copy "$BACKUP_DIR/$BASE_BACKUP_FILE" "$RCLONE_REMOTE/base" --progress; then
+        print_success "Base backup uploaded successfully"
+    else
+        print_error "Failed to upload base backup"
+        exit 1
+    fi
+    stage_end "upload" "$BACKUP_DIR/$BASE_BACKUP_FILE"
+
+    if rclone lsf "$RCLONE_REMOTE/base" | grep -q "$BASE_BACKUP_FILE"; then
+        print_success "Base backup verified on $RCLONE_REMOTE"
+    else
+        print_error "Base backup verification failed"
+        exit 1
+    fi
+
+    BACKUP_RESULT="base/$BASE_BACKUP_FILE"
+}
+
+backup_incremental() {
+    local archive_mode
+    archive_mode=$(db_query "SHOW archive_mode")
+    if [ "$archive_mode" != "on" ]; then
+        print_error "WAL archiving is off; set ZOELIBRARYAPP_DB_ARCHIVE_MODE=on and restart postgres"
+        exit 1
+    fi
+
+    # Close the current segment so everything written up to now is archived
+    print_info "Switching WAL segment..."
+    db_query "SELECT pg_switch_wal()" > /dev/null
+    sleep 2
+
+    mkdir -p "$WAL_DIR"
+    local pending
+    pending=$(find "$WAL_DIR" -maxdepth 1 -type f ! -name "*.zst" ! -name "*.tmp" | wc -l)
+    print_info "New WAL files since last run: $pending"
+
+    if [ "$pending" -gt 0 ]; then
+        print_info "Compressing WAL segments..."
+        stage_start
+        find "$WAL_DIR" -maxdepth 1 -type f ! -name "*.zst" ! -name "*.tmp" -print0 \
+            | xargs -0 -r -P "$BACKUP_JOBS" -n 16 zstd -q --rm -"$ZSTD_LEVEL"
+        stage_end "compress" "$WAL_DIR"
+    fi
+
+    # rclone copy skips files already on the remote, so only new segments move
+    print_info "Uploading new WAL to $RCLONE_REMOTE/wal..."
+    stage_start
+    if rclone copy "$WAL_DIR" "$RCLONE_REMOTE/wal" --include "*.zst" --transfers "$BACKUP_JOBS"; then
+        print_success "WAL uploaded successfully"
+    else
+        print_error "Failed to upload WAL"
+        exit 1
+    fi
+    stage_end "upload" "$WAL_DIR"
+
+    BACKUP_RESULT="wal/ ($pending new segments)"
+}
+
+################################################################################
+# Main
+################################################################################
+
 # Start backup process
+BACKUP_STARTED_AT=$(date +%s)
 log_message "========================================="
-log_message "Starting backup process"
+log_message "Starting backup process (mode: $BACKUP_MODE)"
 print_info "Starting PostgreSQL backup..."
 
+case "$BACKUP_MODE" in
+    sql|full|base|incremental) ;;
+    *)
+        print_error "Unknown backup mode: $BACKUP_MODE"
+        print_error "Usage: $0 [sql|full|base|incremental]"
+        exit 1
+        ;;
+esac
+
 # Validate required environment variables
 if [ -z "$DB_NAME" ] || [ -z "$DB_USER" ]; then
     print_error "Missing required environment variables!"
@@ -104,79 +369,79 @@ fi
 
 print_success "PostgreSQL container is running"
 
-# Create database dump
-print_info "Creating database dump..."
-if docker exec "$CONTAINER_NAME" pg_dump -U "$DB_USER" -d "$DB_NAME" > "$BACKUP_DIR/$BACKUP_FILE"; then
-    print_success "Database dump created: $BACKUP_FILE"
-else
-    print_error "Failed to create database dump"
-    exit 1
-fi
-
-# Check if dump file is not empty
-if [ ! -s "$BACKUP_DIR/$BACKUP_FILE" ]; then
-    print_error "Backup file is empty!"
-    rm -f "$BACKUP_DIR/$BACKUP_FILE"
+if [ "$BACKUP_MODE" != "sql" ] && ! command -v zstd > /dev/null; then
+    print_error "zstd is not installed (apt-get install zstd)"
     exit 1
 fi
 
-FILE_SIZE=$(du -h "$BACKUP_DIR/$BACKUP_FILE" | cut -f1)
-print_info "Backup file size: $FILE_SIZE"
+case "$BACKUP_MODE" in
+    sql) backup_sql ;;
+    full) backup_full ;;
+    base) backup_base ;;
+    incremental) backup_incremental ;;
+esac
 
-# Compress backup file
-print_info "Compressing backup file..."
-if gzip "$BACKUP_DIR/$BACKUP_FILE"; then
-    print_success "Backup compressed: $BACKUP_FILE_GZ"
-else
-    print_error "Failed to compress backup"
-    exit 1
+# Clean up local backups older than 7 days
+print_info "Cleaning up old local backups (older than 7 days)..."
+find "$BACKUP_DIR" -maxdepth 1 -name "library_app_backup_*.sql.gz" -type f -mtime +7 -delete
+find "$BACKUP_DIR" -maxdepth 1 -name "library_app_base_*.tar.zst" -type f -mtime +7 -delete
+find "$BACKUP_DIR" -maxdepth 1 -name "library_app_base_*.start_wal" -type f -mtime +7 -delete
+find "$BACKUP_DIR" -maxdepth 1 -name "library_app_full_*" -type d -mtime +7 -exec rm -rf {} +
+if [ -d "$WAL_DIR" ]; then
+    find "$WAL_DIR" -maxdepth 1 -name "*.zst" -type f -mtime +7 -delete
 fi
+print_success "Old local backups cleaned up"
 
-COMPRESSED_SIZE=$(du -h "$BACKUP_DIR/$BACKUP_FILE_GZ" | cut -f1)
-print_info "Compressed file size: $COMPRESSED_SIZE"
+# Optional: Clean up old backups on the remote (keep last 30 days)
+print_info "Cleaning up old remote backups (older than 30 days)..."
+rclone delete "$RCLONE_REMOTE" --min-age 30d \
+    --include "library_app_backup_*.sql.gz" \
+    --include "full/**"
+rclone rmdirs "$RCLONE_REMOTE/full" --leave-root 2>/dev/null
 
-# Upload to Google Drive
-print_info "Uploading to Google Drive..."
-if rclone copy "$BACKUP_DIR/$BACKUP_FILE_GZ" "$RCLONE_REMOTE" --progress; then
-    print_success "Backup uploaded to Google Drive successfully"
+# The newest base backup is kept whatever its age, and so is the WAL from
+# its start segment on: without them there is nothing to replay onto
+NEWEST_BASE=$(rclone lsf "$RCLONE_REMOTE/base" --files-only --include "library_app_base_*.tar.zst" 2>/dev/null | sort | tail -n 1)
+if [ -n "$NEWEST_BASE" ]; then
+    rclone delete "$RCLONE_REMOTE/base" --min-age 30d \
+        --filter "- ${NEWEST_BASE}" \
+        --filter "- ${NEWEST_BASE%.tar.zst}.start_wal" \
+        --filter "+ library_app_base_*" \
+        --filter "- *"
+    START_WAL=$(rclone cat "$RCLONE_REMOTE/base/${NEWEST_BASE%.tar.zst}.start_wal" 2>/dev/null | tr -d '[:space:]')
+    if [ -n "$START_WAL" ]; then
+        # Segment names sort in WAL order; timeline history files are kept
+        OLD_WAL_LIST=$(mktemp)
+        rclone lsf "$RCLONE_REMOTE/wal" --files-only --min-age 30d \
+            | awk -v start="$START_WAL" 'substr($0, 1, 24) < start && $0 !~ /\.history/' > "$OLD_WAL_LIST"
+        if [ -s "$OLD_WAL_LIST" ]; then
+            rclone delete "$RCLONE_REMOTE/wal" --files-from "$OLD_WAL_LIST"
+        fi
+        rm -f "$OLD_WAL_LIST"
+    else
+        print_info "No start segment recorded for $NEWEST_BASE; keeping all remote WAL"
+    fi
 else
-    print_error "Failed to upload backup to Google Drive"
-    exit 1
+    print_info "No base backup on the remote; keeping all remote WAL"
 fi
-
-# Verify upload
-print_info "Verifying upload..."
-if rclone lsf "$RCLONE_REMOTE" | grep -q "$BACKUP_FILE_GZ"; then
-    print_success "Backup verified on Google Drive"
-else
-    print_error "Backup verification failed"
-    exit 1
-fi
-
-# Clean up local backups older than 7 days
-print_info "Cleaning up old local backups (older than 7 days)..."
-find "$BACKUP_DIR" -name "library_app_backup_*.sql.gz" -type f -mtime +7 -delete
-print_success "Old local backups cleaned up"
-
-# Optional: Clean up old backups on Google Drive (keep last 30 days)
-print_info "Cleaning up old Google Drive backups (older than 30 days)..."
-rclone delete "$RCLONE_REMOTE" --min-age 30d --include "library_app_backup_*.sql.gz"
-print_success "Old Google Drive backups cleaned up"
+print_success "Old remote backups cleaned up"
 
 # Calculate total backup time
+BACKUP_ELAPSED=$(( $(date +%s) - BACKUP_STARTED_AT ))
 log_message "Backup completed successfully"
 print_success "Backup process completed!"
-print_info "Backup file: $BACKUP_FILE_GZ"
-print_info "Location: Google Drive -> LibraryApp_Backups"
+print_info "Backup: $BACKUP_RESULT"
+print_info "Location: $RCLONE_REMOTE"
+print_info "[stats] total: ${BACKUP_ELAPSED}s"
 
 # Send summary to log
 echo "==========================================" >> "$LOG_FILE"
 echo "" >> "$LOG_FILE"
 
-# Upload log file to Google Drive
-print_info "Uploading log file to Google Drive..."
+# Upload log file to the remote
+print_info "Uploading log file to $RCLONE_REMOTE/logs/..."
 if rclone copy "$LOG_FILE" "$RCLONE_REMOTE/logs/"; then
-    print_success "Log file uploaded to Google Drive (LibraryApp_Backups/logs/)"
+    print_success "Log file uploaded ($RCLONE_REMOTE/logs/)"
 else
-    print_error "Failed to upload log file to Google Drive"
-fi
\ No newline at end of file
+    print_error "Failed to upload log file"
+fi
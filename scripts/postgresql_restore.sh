@@ -0,0 +1,380 @@
+#!/bin/bash
+
+################################################################################
+# PostgreSQL Restore Script
+# Restores a backup made by postgresql_backup.sh into the Docker container,
+# verifies it and reports how long each phase took.
+#
+# Usage: ./postgresql_restore.sh <backup_name> [target_db]
+#   backup_name  library_app_full_<timestamp>        (directory dump, "full" mode)
+#                library_app_backup_<timestamp>.sql.gz (plain dump, "sql" mode)
+#   target_db    database to restore into (default: ZOELIBRARYAPP_DB_NAME)
+#
+# Directory dumps are restored in three phases: schema, table data with
+# N parallel jobs, then indexes/constraints with N parallel jobs once the
+# data is in. Table files stay zstd-compressed on disk; pg_restore
+# decompresses them as it reads. Plain dumps are streamed from the remote
+# through the decompressor straight into psql.
+#
+# Afterwards the script checks row counts against the dump and that copy
+# statuses agree with active checkouts, and exits non-zero on a mismatch.
+#
+# Set ZOELIBRARYAPP_BACKUP_REMOTE to a local directory to restore from a
+# directory target instead of Google Drive.
+################################################################################
+
+# Prevent script from being sourced (which would close terminal on exit)
+if [[ "${BASH_SOURCE[0]}" != "${0}" ]]; then
+    echo "ERROR: Do not source this script! Run it with: ./postgresql_restore.sh"
+    return 1 2>/dev/null || exit 1
+fi
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+DETECTED_PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
+
+if [ -f "$DETECTED_PROJECT_ROOT/.env" ]; then
+    set -a
+    source "$DETECTED_PROJECT_ROOT/.env"
+    set +a
+elif [ -f "$DETECTED_PROJECT_ROOT/env.sh" ]; then
+    source "$DETECTED_PROJECT_ROOT/env.sh"
+fi
+
+PROJECT_ROOT="${PROJECT_ROOT:-$DETECTED_PROJECT_ROOT}"
+
+set -o pipefail
+
+# Configuration
+BACKUP_NAME="${1:-}"
+CONTAINER_NAME="${ZOELIBRARYAPP_DB_CONTAINER:-postgres_library_app}"
+DB_NAME="${ZOELIBRARYAPP_DB_NAME:-}"
+DB_USER="${ZOELIBRARYAPP_DB_USER:-}"
+TARGET_DB="${2:-$DB_NAME}"
+BACKUP_DIR="$PROJECT_ROOT/backups"
+CONTAINER_BACKUP_DIR="/backups"
+RCLONE_REMOTE="${ZOELIBRARYAPP_BACKUP_REMOTE:-gdrive_backup:LibraryApp_Backups}"
+RESTORE_JOBS="${ZOELIBRARYAPP_BACKUP_JOBS:-$(nproc 2>/dev/null || echo 2)}"
+# Session settings for the restore connections: more memory for index builds,
+# no waiting on WAL flush for every committed table
+RESTORE_PGOPTIONS="-c maintenance_work_mem=${ZOELIBRARYAPP_RESTORE_MAINTENANCE_WORK_MEM:-512MB} -c synchronous_commit=off"
+
+mkdir -p "$BACKUP_DIR"
+LOG_FILE="$BACKUP_DIR/restore_log.txt"
+EXPECTED_COUNTS="$(mktemp)"
+ACTUAL_COUNTS="$(mktemp)"
+trap 'rm -f "$EXPECTED_COUNTS" "$ACTUAL_COUNTS"' EXIT
+
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m'
+
+log_message() {
+    echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a "$LOG_FILE"
+}
+
+print_success() {
+    echo -e "${GREEN}✓ $1${NC}"
+    log_message "SUCCESS: $1"
+}
+
+print_error() {
+    echo -e "${RED}✗ $1${NC}"
+    log_message "ERROR: $1"
+}
+
+print_info() {
+    echo -e "${YELLOW}ℹ $1${NC}"
+    log_message "INFO: $1"
+}
+
+stage_start() {
+    STAGE_STARTED_AT=$(date +%s.%N)
+}
+
+stage_end() {
+    local stage="$1"
+    local path="$2"
+    local bytes=0
+    if [ -n "$path" ] && [ -e "$path" ]; then
+        bytes=$(du -sb "$path" | cut -f1)
+    fi
+    local stats
+    stats=$(awk -v start="$STAGE_STARTED_AT" -v end="$(date +%s.%N)" -v bytes="$bytes" 'BEGIN {
+        elapsed = end - start
+        mib = bytes / 1048576
+        rate = elapsed > 0 ? mib / elapsed : 0
+        printf "%.2fs, %.1f MiB, %.1f MiB/s", elapsed, mib, rate
+    }')
+    print_info "[stats] $stage: $stats"
+}
+
+admin_query() {
+    docker exec "$CONTAINER_NAME" psql -U "$DB_USER" -d postgres -v ON_ERROR_STOP=1 -tAc "$1"
+}
+
+target_query() {
+    docker exec "$CONTAINER_NAME" psql -U "$DB_USER" -d "$TARGET_DB" -v ON_ERROR_STOP=1 -tAF ' ' -c "$1"
+}
+
+run_pg_restore() {
+    docker exec -e PGOPTIONS="$RESTORE_PGOPTIONS" "$CONTAINER_NAME" \
+        pg_restore -U "$DB_USER" -d "$TARGET_DB" --no-owner --exit-on-error "$@" "$CONTAINER_DUMP"
+}
+
+# Print "<table> <rows>" for every table in a plain SQL dump read from stdin
+count_copy_rows() {
+    awk '
+        /^COPY / { table = $2; sub(/^[^.]*\./, "", table); rows[table] = 0; in_copy = 1; next }
+        in_copy && /^\\\.$/ { in_copy = 0; next }
+        in_copy { rows[table]++ }
+        END { for (t in rows) print t, rows[t] }
+    '
+}
+
+# Print "<table> <rows>" for every table in a directory dump by reading
+# each compressed data file once (one COPY row per line)
+count_directory_rows() {
+    docker exec "$CONTAINER_NAME" pg_restore -l "$CONTAINER_DUMP" \
+        | awk '$4 == "TABLE" && $5 == "DATA" { sub(";", "", $1); print $1, $7 }' \
+        | while read -r dump_id table; do
+            local file rows
+            file=$(ls "$LOCAL_DUMP/$dump_id".dat* 2>/dev/null | head -1)
+            case "$file" in
+                *.zst) rows=$(zstd -dc "$file" | grep -cv '^\\\.$') ;;
+                *.gz) rows=$(gzip -dc "$file" | grep -cv '^\\\.$') ;;
+                *.lz4) rows=$(lz4 -dc "$file" | grep -cv '^\\\.$') ;;
+                "") rows=0 ;;
+                *) rows=$(grep -cv '^\\\.$' "$file") ;;
+            esac
+            echo "$table ${rows:-0}"
+        done
+}
+
+recreate_target_db() {
+    if [ "$TARGET_DB" = "$DB_NAME" ] && [ -t 0 ]; then
+        read -r -p "This will REPLACE database '$TARGET_DB'. Continue? [y/N] " answer
+        if [ "$answer" != "y" ] && [ "$answer" != "Y" ]; then
+            print_info "Restore cancelled"
+            exit 1
+        fi
+    fi
+
+    print_info "Recreating database $TARGET_DB..."
+    if ! admin_query "DROP DATABASE IF EXISTS \"$TARGET_DB\" WITH (FORCE)" > /dev/null \
+            || ! admin_query "CREATE DATABASE \"$TARGET_DB\"" > /dev/null; then
+        print_error "Failed to recreate database $TARGET_DB"
+        exit 1
+    fi
+}
+
+################################################################################
+# Restore methods
+################################################################################
+
+restore_directory() {
+    # Fetch the dump directory unless it is still on local disk
+    LOCAL_DUMP="$BACKUP_DIR/$BACKUP_NAME"
+    if [ -s "$LOCAL_DUMP/toc.dat" ]; then
+        print_info "Using local copy: $LOCAL_DUMP"
+    else
+        LOCAL_DUMP="$BACKUP_DIR/restore/$BACKUP_NAME"
+        print_info "Downloading $BACKUP_NAME from $RCLONE_REMOTE ($RESTORE_JOBS transfers)..."
+        stage_start
+        if rclone copy "$RCLONE_REMOTE/full/$BACKUP_NAME" "$LOCAL_DUMP" --transfers "$RESTORE_JOBS"; then
+            print_success "Backup downloaded"
+        else
+            print_error "Failed to download backup"
+            exit 1
+        fi
+        stage_end "download" "$LOCAL_DUMP"
+    fi
+
+    if [ ! -s "$LOCAL_DUMP/toc.dat" ]; then
+        print_error "$LOCAL_DUMP is not a directory-format dump (no toc.dat)"
+        exit 1
+    fi
+    CONTAINER_DUMP="$CONTAINER_BACKUP_DIR/${LOCAL_DUMP#"$BACKUP_DIR"/}"
+
+    recreate_target_db
+
+    # Expected row counts are read from the dump while the data loads
+    count_directory_rows > "$EXPECTED_COUNTS" &
+    local counter_pid=$!
+
+    print_info "Restoring schema..."
+    stage_start
+    if ! run_pg_restore --section=pre-data; then
+        print_error "Schema restore failed"
+        exit 1
+    fi
+    stage_end "schema" ""
+
+    print_info "Loading table data ($RESTORE_JOBS parallel jobs)..."
+    stage_start
+    if ! run_pg_restore --section=data --jobs="$RESTORE_JOBS"; then
+        print_error "Data restore failed"
+        exit 1
+    fi
+    stage_end "data" "$LOCAL_DUMP"
+
+    print_info "Building indexes and constraints ($RESTORE_JOBS parallel jobs)..."
+    stage_start
+    if ! run_pg_restore --section=post-data --jobs="$RESTORE_JOBS"; then
+        print_error "Index/constraint restore failed"
+        exit 1
+    fi
+    stage_end "indexes" ""
+
+    wait "$counter_pid"
+}
+
+restore_sql_stream() {
+    local decompress
+    case "$BACKUP_NAME" in
+        *.gz) decompress="gzip -dc" ;;
+        *.zst) decompress="zstd -dc" ;;
+        *) decompress="cat" ;;
+    esac
+
+    local source_cmd
+    if [ -f "$BACKUP_DIR/$BACKUP_NAME" ]; then
+        print_info "Using local copy: $BACKUP_DIR/$BACKUP_NAME"
+        source_cmd=(cat "$BACKUP_DIR/$BACKUP_NAME")
+    else
+        print_info "Streaming $BACKUP_NAME from $RCLONE_REMOTE"
+        source_cmd=(rclone cat "$RCLONE_REMOTE/$BACKUP_NAME")
+    fi
+
+    recreate_target_db
+
+    # Download, decompression, row counting and replay run as one pipeline;
+    # nothing uncompressed touches the disk. Plain dumps already create
+    # indexes and constraints after the data.
+    print_info "Replaying SQL dump..."
+    stage_start
+    if ! "${source_cmd[@]}" \
+            | $decompress \
+            | tee >(count_copy_rows > "$EXPECTED_COUNTS") \
+            | docker exec -i -e PGOPTIONS="$RESTORE_PGOPTIONS" "$CONTAINER_NAME" \
+                psql -q -U "$DB_USER" -d "$TARGET_DB" -v ON_ERROR_STOP=1 > /dev/null; then
+        print_error "SQL restore failed"
+        exit 1
+    fi
+    stage_end "replay" ""
+    wait
+}
+
+################################################################################
+# Verification
+################################################################################
+
+verify_restore() {
+    local failures=0
+
+    print_info "Updating planner statistics..."
+    stage_start
+    docker exec "$CONTAINER_NAME" vacuumdb -U "$DB_USER" -d "$TARGET_DB" \
+        --analyze-only --jobs="$RESTORE_JOBS" --quiet
+    stage_end "analyze" ""
+
+    print_info "Verifying row counts..."
+    local union=""
+    local table
+    for table in $(awk '{ print $1 }' "$EXPECTED_COUNTS"); do
+        union="${union:+$union UNION ALL }SELECT '$table', COUNT(*) FROM \"$table\""
+    done
+    if [ -n "$union" ]; then
+        target_query "$union" > "$ACTUAL_COUNTS"
+    fi
+
+    local expected actual
+    while read -r table expected; do
+        actual=$(awk -v t="$table" '$1 == t { print $2 }' "$ACTUAL_COUNTS")
+        if [ "$actual" = "$expected" ]; then
+            log_message "  $table: $actual rows"
+        else
+            print_error "  $table: expected $expected rows, found ${actual:-none}"
+            failures=$((failures + 1))
+        fi
+    done < <(sort "$EXPECTED_COUNTS")
+
+    print_info "Verifying copy status against active checkouts..."
+    local orphaned_status missing_status double_loans
+    orphaned_status=$(target_query "
+        SELECT COUNT(*) FROM book_copies bc
+        WHERE bc.status = 'Checked Out'
+          AND NOT EXISTS (SELECT 1 FROM checkouts co
+                          WHERE co.copy_id = bc.id AND co.status IN ('Checked Out', 'Overdue'))")
+    missing_status=$(target_query "
+        SELECT COUNT(*) FROM checkouts co
+        JOIN book_copies bc ON co.copy_id = bc.id
+        WHERE co.status IN ('Checked Out', 'Overdue') AND bc.status <> 'Checked Out'")
+    double_loans=$(target_query "
+        SELECT COUNT(*) FROM (
+            SELECT copy_id FROM checkouts
+            WHERE status IN ('Checked Out', 'Overdue')
+            GROUP BY copy_id HAVING COUNT(*) > 1
+        ) d")
+
+    if [ "${orphaned_status:-x}" != "0" ]; then
+        print_error "  $orphaned_status copies marked Checked Out have no active checkout"
+        failures=$((failures + 1))
+    fi
+    if [ "${missing_status:-x}" != "0" ]; then
+        print_error "  $missing_status active checkouts point at copies not marked Checked Out"
+        failures=$((failures + 1))
+    fi
+    if [ "${double_loans:-x}" != "0" ]; then
+        print_error "  $double_loans copies have more than one active checkout"
+        failures=$((failures + 1))
+    fi
+
+    return "$failures"
+}
+
+################################################################################
+# Main
+################################################################################
+
+if [ -z "$BACKUP_NAME" ]; then
+    echo "Usage: $0 <backup_name> [target_db]"
+    echo "Recent backups on $RCLONE_REMOTE:"
+    rclone lsf "$RCLONE_REMOTE/full" --dirs-only 2>/dev/null | sed 's#/$##' | tail -5
+    rclone lsf "$RCLONE_REMOTE" --files-only --include "library_app_backup_*" 2>/dev/null | tail -5
+    exit 1
+fi
+
+if [ -z "$TARGET_DB" ] || [ -z "$DB_USER" ]; then
+    print_error "Missing required environment variables!"
+    print_error "Please ensure ZOELIBRARYAPP_DB_NAME and ZOELIBRARYAPP_DB_USER are set."
+    exit 1
+fi
+
+if ! docker ps | grep -q "$CONTAINER_NAME"; then
+    print_error "PostgreSQL container '$CONTAINER_NAME' is not running!"
+    print_error "Start it with: docker-compose up -d postgres"
+    exit 1
+fi
+
+RESTORE_STARTED_AT=$(date +%s)
+log_message "========================================="
+log_message "Starting restore of $BACKUP_NAME into $TARGET_DB"
+
+case "$BACKUP_NAME" in
+    *.sql|*.sql.gz|*.sql.zst) restore_sql_stream ;;
+    *) restore_directory ;;
+esac
+
+verify_restore
+VERIFY_FAILURES=$?
+
+RESTORE_ELAPSED=$(( $(date +%s) - RESTORE_STARTED_AT ))
+print_info "[stats] total: ${RESTORE_ELAPSED}s"
+echo "==========================================" >> "$LOG_FILE"
+
+if [ "$VERIFY_FAILURES" -ne 0 ]; then
+    print_error "Restore of $BACKUP_NAME into $TARGET_DB finished with $VERIFY_FAILURES verification failure(s)"
+    exit 1
+fi
+print_success "Restore of $BACKUP_NAME into $TARGET_DB completed and verified in ${RESTORE_ELAPSED}s"